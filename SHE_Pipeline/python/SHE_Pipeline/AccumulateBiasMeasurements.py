@@ -0,0 +1,156 @@
+""" @file AccumulateBiasMeasurements.py
+
+    Created 19 October 2026
+
+    Main program for folding batch bias measurements into a persistent accumulator store, and reporting the
+    combined bias from it.
+"""
+
+__updated__ = "2026-10-19"
+
+# Copyright (C) 2012-2020 Euclid Science Ground Segment
+#
+# This library is free software; you can redistribute it and/or modify it under the terms of the GNU Lesser General
+# Public License as published by the Free Software Foundation; either version 3.0 of the License, or (at your option)
+# any later version.
+#
+# This library is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY; without even the implied
+# warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU Lesser General Public License for more
+# details.
+#
+# You should have received a copy of the GNU Lesser General Public License along with this library; if not, write to
+# the Free Software Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA
+
+import argparse
+import os
+
+import SHE_Pipeline
+from EL_PythonUtils.utilities import get_arguments_string
+from ElementsKernel.Logging import getLogger
+from SHE_Pipeline.bias_accumulator import (BiasAccumulatorStore, read_bias_statistics_listfile_accumulators,
+                                           split_accumulator_key, )
+
+
+def defineSpecificProgramOptions():
+    """
+    @brief
+        Defines options for this program.
+
+    @return
+        An ArgumentParser.
+    """
+
+    logger = getLogger(__name__)
+
+    logger.debug('#')
+    logger.debug('# Entering SHE_Pipeline_AccumulateBias defineSpecificProgramOptions()')
+    logger.debug('#')
+
+    parser = argparse.ArgumentParser()
+
+    parser.add_argument('--accumulator', type=str, required=True,
+                        help='Filename of the bias accumulator store. Will be created if it does not exist.')
+    parser.add_argument('--tag', type=str,
+                        help='TAG of the sensitivity-testing run the bias statistics belong to.')
+    parser.add_argument('--bias_statistics', type=str, nargs='*',
+                        help='Listfiles of shear bias statistics products (e.g. '
+                             'data/shear_bias_measurement_list.json), one per batch, to fold into the store. Each is '
+                             'identified as a batch by the name of its workdir (the parent of the directory holding '
+                             'the listfile) unless --batch_ids is supplied.')
+    parser.add_argument('--batch_ids', type=str, nargs='*',
+                        help='IDs to record for each of the --bias_statistics listfiles, in the same order.')
+    parser.add_argument('--merge', type=str, nargs='*',
+                        help='Other bias accumulator stores to merge into this one.')
+    parser.add_argument('--report', action='store_true',
+                        help='If set, will log the combined bias estimates for the tag (or all tags if none given).')
+
+    parser.add_argument('--workdir', type=str, default='.')
+
+    logger.debug('# Exiting SHE_Pipeline_AccumulateBias defineSpecificProgramOptions()')
+
+    return parser
+
+
+def mainMethod(args):
+    """
+    @brief
+        The "main" method for this program, fold bias statistics into an accumulator store.
+
+    @details
+        This method is the entry point to the program. In this sense, it is
+        similar to a main (and it is why it is called mainMethod()).
+    """
+
+    logger = getLogger(__name__)
+
+    logger.debug('#')
+    logger.debug('# Entering SHE_Pipeline_AccumulateBias mainMethod()')
+    logger.debug('#')
+
+    exec_cmd = get_arguments_string(
+        args,
+        cmd="E-Run SHE_Pipeline " + SHE_Pipeline.__version__ + " SHE_Pipeline_AccumulateBias",
+        store_true=["profile", "debug", "report"],
+        )
+    logger.info('Execution command for this step:')
+    logger.info(exec_cmd)
+
+    store = BiasAccumulatorStore(os.path.join(args.workdir, args.accumulator))
+
+    for other_filename in args.merge or []:
+        logger.info("Merging bias accumulator store %s", other_filename)
+        store.merge_from(os.path.join(args.workdir, other_filename))
+
+    bias_statistics_listfiles = args.bias_statistics or []
+    if bias_statistics_listfiles:
+        if args.tag is None:
+            raise ValueError("--tag must be supplied when folding in bias statistics.")
+        batch_workdirs = [os.path.dirname(os.path.dirname(os.path.abspath(os.path.join(args.workdir, listfile))))
+                          for listfile in bias_statistics_listfiles]
+        batch_ids = args.batch_ids
+        if batch_ids is None:
+            batch_ids = [os.path.basename(batch_workdir) for batch_workdir in batch_workdirs]
+        elif len(batch_ids) != len(bias_statistics_listfiles):
+            raise ValueError("--batch_ids must have one entry for each of --bias_statistics.")
+
+        for listfile, batch_workdir, batch_id in zip(bias_statistics_listfiles, batch_workdirs, batch_ids):
+            # The data files of the statistics products are symlinked into the data directory of their batch's
+            # workdir, so they're read relative to that
+            accumulators = read_bias_statistics_listfile_accumulators(os.path.join(args.workdir, listfile),
+                                                                      workdir=batch_workdir)
+            store.fold_in(args.tag, accumulators, batch_id=batch_id)
+
+    if args.report:
+        tags = [args.tag] if args.tag is not None else store.get_tags()
+        for tag in tags:
+            logger.info("Combined bias for tag %s from %s batches:", tag, len(store.get_batches(tag)))
+            for key, estimate in sorted(store.get_bias_estimates(tag).items()):
+                method, component, bin_label = split_accumulator_key(key)
+                if estimate is None:
+                    logger.info("  %s %s [%s]: insufficient statistics", method, component, bin_label)
+                    continue
+                logger.info("  %s %s [%s]: m = %.3e +/- %.3e, c = %.3e +/- %.3e", method, component, bin_label,
+                            estimate.m, estimate.m_err, estimate.c, estimate.c_err)
+
+    logger.debug('# Exiting SHE_Pipeline_AccumulateBias mainMethod()')
+
+    return
+
+
+def main():
+    """
+    @brief
+        Alternate entry point for non-Elements execution.
+    """
+
+    parser = defineSpecificProgramOptions()
+
+    args = parser.parse_args()
+
+    mainMethod(args)
+
+    return
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,137 @@
+""" @file BenchmarkOrchestration.py
+
+    Created 19 October 2026
+
+    Main program for benchmarking the overhead of SHE_Pipeline_RunBiasParallel, by running it with synthetic stages
+    in place of the science code.
+"""
+
+__updated__ = "2026-10-19"
+
+# Copyright (C) 2012-2020 Euclid Science Ground Segment
+#
+# This library is free software; you can redistribute it and/or modify it under the terms of the GNU Lesser General
+# Public License as published by the Free Software Foundation; either version 3.0 of the License, or (at your option)
+# any later version.
+#
+# This library is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY; without even the implied
+# warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU Lesser General Public License for more
+# details.
+#
+# You should have received a copy of the GNU Lesser General Public License along with this library; if not, write to
+# the Free Software Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA
+
+import argparse
+import shlex
+
+import SHE_Pipeline
+from EL_PythonUtils.utilities import get_arguments_string
+from ElementsKernel.Logging import getLogger
+from SHE_Pipeline.orchestration_benchmark import (BENCHMARK_EXECUTORS, DEFAULT_RESULTS_FILENAME, get_stage_specs,
+                                                  run_benchmark, )
+
+
+def defineSpecificProgramOptions():
+    """
+    @brief
+        Defines options for this program.
+
+    @return
+        An ArgumentParser.
+    """
+
+    logger = getLogger(__name__)
+
+    logger.debug('#')
+    logger.debug('# Entering SHE_Pipeline_BenchmarkOrchestration defineSpecificProgramOptions()')
+    logger.debug('#')
+
+    parser = argparse.ArgumentParser()
+
+    parser.add_argument('--number_simulations', type=int, nargs='+', default=[8],
+                        help='Numbers of simulations to run.')
+    parser.add_argument('--number_threads', type=int, nargs='+', default=[1, 2, 4],
+                        help='Numbers of threads to run the simulations with.')
+    parser.add_argument('--data_files_per_product', type=int, nargs='+', default=[1],
+                        help='Numbers of data files each product (including the training data and MDB) points to.')
+    parser.add_argument('--repeats', type=int, default=1,
+                        help='Number of times to run each combination of the above.')
+    parser.add_argument('--stage_sleep', type=str, nargs='*',
+                        help='Time in seconds for which the stand-in for each stage sleeps, as pairs of stage and '
+                             'time.')
+    parser.add_argument('--stage_cpu', type=str, nargs='*',
+                        help='CPU time in seconds which the stand-in for each stage uses, as pairs of stage and '
+                             'time.')
+    parser.add_argument('--stage_file_size', type=str, nargs='*',
+                        help='Size in MB of each data file written by the stand-in for each stage, as pairs of '
+                             'stage and size.')
+    parser.add_argument('--executor', type=str, default="fork", choices=BENCHMARK_EXECUTORS,
+                        help='Executor to run the simulations with.')
+    parser.add_argument('--run_args', type=str, default="",
+                        help='Further arguments of SHE_Pipeline_RunBiasParallel to run with, as a single quoted '
+                             'string, e.g. "--intermediate_storage disk --seeds_per_task 4".')
+    parser.add_argument('--keep_workdirs', action='store_true',
+                        help='If set, the workdir of each run will be kept rather than deleted.')
+    parser.add_argument('--output', type=str, default=DEFAULT_RESULTS_FILENAME,
+                        help='Filename, within the workdir, to write the results to.')
+
+    parser.add_argument('--workdir', type=str, default='.',
+                        help='Directory in which to create the workdir of each run.')
+
+    logger.debug('# Exiting SHE_Pipeline_BenchmarkOrchestration defineSpecificProgramOptions()')
+
+    return parser
+
+
+def mainMethod(args):
+    """
+    @brief
+        The "main" method for this program, run the benchmark.
+
+    @details
+        This method is the entry point to the program. In this sense, it is
+        similar to a main (and it is why it is called mainMethod()).
+    """
+
+    logger = getLogger(__name__)
+
+    logger.debug('#')
+    logger.debug('# Entering SHE_Pipeline_BenchmarkOrchestration mainMethod()')
+    logger.debug('#')
+
+    exec_cmd = get_arguments_string(
+        args,
+        cmd="E-Run SHE_Pipeline " + SHE_Pipeline.__version__ + " SHE_Pipeline_BenchmarkOrchestration",
+        store_true=["profile", "debug", "keep_workdirs"],
+        )
+    logger.info('Execution command for this step:')
+    logger.info(exec_cmd)
+
+    stage_specs = get_stage_specs(args.stage_sleep, args.stage_cpu, args.stage_file_size)
+
+    run_benchmark(args.workdir, args.number_simulations, args.number_threads, args.data_files_per_product,
+                  stage_specs, repeats=args.repeats, executor=args.executor, run_args=shlex.split(args.run_args),
+                  keep_workdirs=args.keep_workdirs, results_filename=args.output)
+
+    logger.debug('# Exiting SHE_Pipeline_BenchmarkOrchestration mainMethod()')
+
+    return
+
+
+def main():
+    """
+    @brief
+        Alternate entry point for non-Elements execution.
+    """
+
+    parser = defineSpecificProgramOptions()
+
+    args = parser.parse_args()
+
+    mainMethod(args)
+
+    return
+
+
+if __name__ == "__main__":
+    main()
@@ -5,7 +5,7 @@
     Main program for calling one of the pipelines.
 """
 
-__updated__ = "2020-11-04"
+__updated__ = "2026-10-19"
 
 # Copyright (C) 2012-2020 Euclid Science Ground Segment
 #
@@ -70,9 +70,147 @@ def defineSpecificProgramOptions():
                         help="Number of threads to use. This might be curtailed if > number available. " +
                              "0 (default) will result in using all but one available cpu.")
 
+    parser.add_argument('--threads_per_process', type=int, default=None,
+                        help="Number of threads each worker process may use in native libraries (OpenMP, BLAS, " +
+                             "FFTW). Default is the number of available CPUs divided by the number of processes. If " +
+                             "set while number_threads isn't, the number of processes is chosen to fill the " +
+                             "available CPUs.")
+
+    parser.add_argument('--worker_placement', type=str, default="none", choices=("none", "numa"),
+                        help="Placement of worker processes: none (default) leaves it to the OS; numa pins each " +
+                             "worker to threads_per_process CPUs of one NUMA node, spreading workers across nodes " +
+                             "as read from /sys, and binds its memory to that node if libnuma is available.")
+
+    parser.add_argument('--executor', type=str, default="fork",
+                        choices=("fork", "forkserver", "futures", "mpi", "serial"),
+                        help="Backend used to run simulations: a multiprocessing pool with workers started by fork " +
+                             "(default) or forkserver, a concurrent.futures process pool (futures), the other " +
+                             "processes of an MPI job (mpi, which must be launched with e.g. mpirun or srun), or " +
+                             "this process (serial, for debugging).")
+
+    parser.add_argument('--intermediate_storage', type=str, default="memory", choices=("memory", "disk"),
+                        help="Where the intermediate products of each simulation (images, PSFs, detections tables, " +
+                             "shear estimates) are written: memory (default) runs its stages in a copy of the " +
+                             "workdir under --memory_root, so that only the final products are written to disk; " +
+                             "disk writes them to the workdir, e.g. for debugging.")
+
+    parser.add_argument('--memory_root', type=str, default="/dev/shm",
+                        help="Directory on a memory-backed filesystem in which intermediate products are held " +
+                             "(default /dev/shm).")
+
+    parser.add_argument('--io_limits', type=str, default=None,
+                        help="JSON file of a site's limits on I/O-heavy stages, e.g. " +
+                             "AUX/SHE_Pipeline/io_limits_shared_fs.json, with keys stage_concurrency (dict of " +
+                             "stage to the maximum number of workers in it at once), bandwidth_mb_per_s and burst_mb.")
+    parser.add_argument('--stage_concurrency', type=str, nargs='*',
+                        help="Maximum number of workers in each I/O-heavy stage at once (must be in pairs of stage " +
+                             "number, where stage is one of simulate_images, estimate_shear, measure_statistics, or " +
+                             "cleanup_bias_measurement), overriding those in io_limits. Other stages are unlimited.")
+    parser.add_argument('--io_bandwidth', type=float, default=None,
+                        help="Limit in MB/s on the storage I/O of workers in throttled stages, overriding that in " +
+                             "io_limits.")
+
+    parser.add_argument('--memory_profiles', type=str, nargs='*', default=None,
+                        help="Memory profiles to compare, e.g. default thp no_thp jemalloc. Simulations are shared " +
+                             "between the profiles, which are run in turn with workers started in each profile's " +
+                             "environment, and the wall time, page faults and peak memory of each stage are " +
+                             "reported for each in memory_profile_report.json in the workdir.")
+
+    parser.add_argument('--memory_profiles_file', type=str, default=None,
+                        help="JSON file defining further memory profiles, as a dict of profile name to a dict " +
+                             "with an \"environment\" dict and optionally \"thp_disable\".")
+
+    parser.add_argument('--shear_estimate_cache', type=str, default=None,
+                        help="Directory of a cache of shear estimates, keyed by the content of each method's input " +
+                             "images, training data and settings, and shared between runs. Only methods whose " +
+                             "inputs aren't in the cache are run. Disabled by default.")
+    parser.add_argument('--shear_estimate_cache_size', type=float, default=50.,
+                        help="Maximum size in GB of the shear estimate cache, beyond which the least recently used " +
+                             "estimates are evicted (default 50).")
+
+    parser.add_argument('--remote_file_cache', type=str, default=None,
+                        help="Directory of a cache of remote (WEB/) input files, such as the MDB and its data files, " +
+                             "shared by all workers and runs on a node so that each file is fetched only once. " +
+                             "Disabled by default.")
+    parser.add_argument('--remote_file_cache_size', type=float, default=10.,
+                        help="Maximum size in GB of the remote file cache, beyond which the least recently used " +
+                             "files are evicted (default 10).")
+    parser.add_argument('--offline', action='store_true',
+                        help="If set, remote input files are only taken from the remote file cache, and never " +
+                             "fetched.")
+
     parser.add_argument('--est_shear_only', type=str, default=None,
                         help="Curtail pipeline after shear estimates (1) or do full pipeline (0).")
 
+    # Adaptive stopping arguments
+    parser.add_argument('--target_m_precision', type=float, default=None,
+                        help="If set, interim bias uncertainties will be calculated as simulations complete, and " +
+                             "no further simulations will be scheduled once the uncertainty on m is at most this " +
+                             "value for all methods, shear components, and bins.")
+    parser.add_argument('--target_c_precision', type=float, default=None,
+                        help="If set along with target_m_precision, the uncertainty on c must also reach at most " +
+                             "this value before scheduling is stopped.")
+    parser.add_argument('--precision_check_interval', type=int, default=None,
+                        help="Number of simulations to complete between checks of the interim bias precision. " +
+                             "Default is the number of threads.")
+    parser.add_argument('--prioritise_bins', action='store_true',
+                        help="If set along with target_m_precision, simulations from rows of the simulation plan " +
+                             "which feed the bins furthest from the target precision will be scheduled first.")
+
+    # Failure handling arguments
+    parser.add_argument('--max_retries', type=int, default=0,
+                        help="Number of times to retry a simulation which fails, before it is quarantined and not " +
+                             "run again. Default 0.")
+    parser.add_argument('--retry_backoff', type=float, default=0.,
+                        help="Time in seconds to wait before the first retry of a failed simulation, doubling for " +
+                             "each subsequent retry. Default 0.")
+    parser.add_argument('--max_failures', type=int, default=None,
+                        help="If set, no further simulations will be scheduled once more than this many have been " +
+                             "quarantined.")
+
+    # Task granularity arguments
+    parser.add_argument('--seeds_per_task', type=int, default=1,
+                        help="Number of consecutive simulations from the same row of the simulation plan to group " +
+                             "into each worker task, run in turn in a shared workdir. Grouping small simulations " +
+                             "amortises the per-task overhead. Default 1.")
+
+    # Task ordering arguments
+    parser.add_argument('--task_ordering', type=str, default="longest_first", choices=("longest_first", "listfile"),
+                        help="Order in which to run simulations: longest_first (default) runs those with the " +
+                             "highest expected cost first, as predicted from the simulation plan and recorded " +
+                             "timings; listfile runs them in the order of the simulation configurations listfile.")
+    parser.add_argument('--timing_records', type=str, default=None,
+                        help="File in which per-stage timings of simulations are recorded, used to refine the cost " +
+                             "model. Should be shared between the batches of a campaign (e.g. in its archive " +
+                             "directory) for them to learn from each other's timings. Default is " +
+                             "simulation_timings.json in the workdir, which is only seen by reruns there.")
+
+    # Timeout and speculative execution arguments
+    parser.add_argument('--soft_timeouts', type=str, nargs='*',
+                        help="Soft time limits in seconds for stages of each simulation (must be in pairs of stage " +
+                             "seconds, where stage is one of simulate_images, estimate_shear, measure_statistics, " +
+                             "cleanup_bias_measurement, or default). A warning is logged when a stage exceeds its " +
+                             "limit, and the simulation becomes a candidate for speculative execution.")
+    parser.add_argument('--hard_timeouts', type=str, nargs='*',
+                        help="Hard time limits in seconds for stages of each simulation, in the same format as " +
+                             "soft_timeouts. A stage which exceeds its limit is killed, and the simulation is " +
+                             "treated as having failed.")
+    parser.add_argument('--speculative_execution', action='store_true',
+                        help="If set, once all simulations have been scheduled, idle workers will run copies of the " +
+                             "slowest outstanding simulations in fresh workdirs, using whichever copy finishes first.")
+
+    # Walltime arguments
+    parser.add_argument('--walltime', type=str, default=None,
+                        help="Walltime available to this run, measured from when it starts, in any of the formats " +
+                             "accepted by sbatch -t (e.g. '8:00:00' or '0-8:0:0'). No simulations will be " +
+                             "scheduled which aren't expected to complete within it.")
+    parser.add_argument('--deadline', type=str, default=None,
+                        help="Alternative to walltime: the time by which this run must finish, either as an ISO " +
+                             "8601 datetime or as seconds since the epoch.")
+    parser.add_argument('--deadline_reserve', type=float, default=600.,
+                        help="Time in seconds to reserve before the walltime or deadline for merging outputs and " +
+                             "measuring the final bias. Default 600.")
+
     parser.add_argument('--workdir', type=str, )
     parser.add_argument('--logdir', type=str, )
 
@@ -80,6 +218,14 @@ def defineSpecificProgramOptions():
     parser.add_argument('--she_bias_measurements', type=str, default='she_bias_measurements.xml',
                         help='Desired filename of the final output bias measurements')
 
+    parser.add_argument('--bias_accumulator', type=str, default=None,
+                        help="If set, the bias statistics of all completed simulations will be folded into this " +
+                             "persistent accumulator store, to be combined with those of other batches.")
+    parser.add_argument('--accumulator_tag', type=str, default=None,
+                        help="TAG under which to store this run's bias statistics in the accumulator store.")
+    parser.add_argument('--accumulator_batch_id', type=str, default=None,
+                        help="ID of this batch in the accumulator store. Default is the workdir's name.")
+
     logger.debug('# Exiting SHE_Pipeline_Run defineSpecificProgramOptions()')
 
     return parser
@@ -104,7 +250,7 @@ def mainMethod(args):
     exec_cmd = get_arguments_string(
         args,
         cmd="E-Run SHE_Pipeline " + SHE_Pipeline.__version__ + " SHE_Pipeline_RunBiasParallel",
-        store_true=["profile", "debug", "cluster"],
+        store_true=["profile", "debug", "cluster", "prioritise_bins", "speculative_execution", "offline"],
         )
     logger.info('Execution command for this step:')
     logger.info(exec_cmd)
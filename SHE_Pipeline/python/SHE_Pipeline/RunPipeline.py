@@ -25,7 +25,7 @@ import argparse
 import SHE_Pipeline
 from EL_PythonUtils.utilities import get_arguments_string
 from ElementsKernel.Logging import getLogger
-from SHE_Pipeline.run_pipeline import run_pipeline_from_args
+from SHE_Pipeline.run_pipeline import default_sweep_results, run_pipeline_from_args
 
 
 def defineSpecificProgramOptions():
@@ -71,11 +71,32 @@ def defineSpecificProgramOptions():
     parser.add_argument('--skip_file_setup', action='store_true',
                         help="If set, will not try to sort out issues with file locations " +
                              "or move AUX files to the work directory.")
+    parser.add_argument('--remote_file_cache', type=str, default=None,
+                        help="Directory of a cache of remote (WEB/) input files, such as the MDB and its data files, " +
+                             "shared by all runs on a node so that each file is fetched only once. Disabled by " +
+                             "default.")
+    parser.add_argument('--remote_file_cache_size', type=float, default=10.,
+                        help="Maximum size in GB of the remote file cache, beyond which the least recently used " +
+                             "files are evicted (default 10).")
+    parser.add_argument('--offline', action='store_true',
+                        help="If set, remote input files are only taken from the remote file cache, and never " +
+                             "fetched.")
 
     # Input arguments for the bias measurement pipeline
     parser.add_argument('--plan_args', type=str, nargs='*',
                         help='Arguments to write to simulation plan (must be in pairs of key value)')
 
+    # Input arguments for a parameter sweep of the Scaling Experiments pipeline
+    parser.add_argument('--sweep', type=str, nargs='*',
+                        help='Pipeline config keys to sweep over and their comma-separated values, running the ' +
+                             'pipeline locally for each combination (must be in pairs of key values, e.g. ' +
+                             '"HDF5 0,1 batchsize 10,20")')
+    parser.add_argument('--sweep_concurrency', type=int, default=1,
+                        help="Maximum number of points of the sweep to run at once (default 1).")
+    parser.add_argument('--sweep_results', type=str, default=default_sweep_results,
+                        help="Filename, relative to the workdir, of the table comparing the wall times of the " +
+                             "points of the sweep (default " + default_sweep_results + ").")
+
     parser.add_argument('--workdir', type=str, )
     parser.add_argument('--logdir', type=str, )
 
@@ -103,7 +124,8 @@ def mainMethod(args):
     exec_cmd = get_arguments_string(
         args,
         cmd="E-Run SHE_Pipeline " + SHE_Pipeline.__version__ + " SHE_Pipeline_Run",
-        store_true=["profile", "debug", "cluster", "use_debug_server_config", "dry_run", "skip_file_setup"],
+        store_true=["profile", "debug", "cluster", "use_debug_server_config", "dry_run", "skip_file_setup",
+                    "offline"],
         )
     logger.info('Execution command for this step:')
     logger.info(exec_cmd)
@@ -0,0 +1,350 @@
+""" @file bias_accumulator.py
+
+    Created 19 October 2026
+
+    Persistent, mergeable store of shear bias statistics, accumulated over independent batch runs.
+"""
+
+__updated__ = "2026-10-19"
+
+# Copyright (C) 2012-2020 Euclid Science Ground Segment
+#
+# This library is free software; you can redistribute it and/or modify it under the terms of the GNU Lesser General
+# Public License as published by the Free Software Foundation; either version 3.0 of the License, or (at your option)
+# any later version.
+#
+# This library is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY; without even the implied
+# warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU Lesser General Public License for more
+# details.
+#
+# You should have received a copy of the GNU Lesser General Public License along with this library; if not, write to
+# the Free Software Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA
+
+import json
+import math
+import os
+from collections import namedtuple
+
+from SHE_PPT.file_io import read_listfile, read_xml_product
+from SHE_PPT.logging import getLogger
+
+from .pipeline_utilities import file_lock, write_json_atomically
+
+ACCUMULATOR_FORMAT_VERSION = 1
+
+DEFAULT_BIN = "tot"
+
+SHEAR_COMPONENTS = ("g1", "g2")
+
+DEFAULT_METHODS = ("KSB", "REGAUSS", "MomentsML", "LensMC")
+
+KEY_SEPARATOR = ":"
+
+logger = getLogger(__name__)
+
+# Combined bias estimate for one method, shear component, and bin
+BiasEstimate = namedtuple("BiasEstimate", "m m_err c c_err mc_covar weight")
+
+
+def get_accumulator_key(method, component, bin_label=DEFAULT_BIN):
+    """ Gets the key used in the store for a given method, shear component, and bin.
+    """
+    return KEY_SEPARATOR.join((method, component, str(bin_label)))
+
+
+def split_accumulator_key(key):
+    """ Inverse of get_accumulator_key.
+
+    @return: method, component, bin_label
+    @rtype:  tuple(str, str, str)
+    """
+    method, component, bin_label = key.split(KEY_SEPARATOR, 2)
+    return method, component, bin_label
+
+
+class LinregressAccumulator(object):
+    """ Sufficient statistics for a weighted linear regression of measured on true shear, g_meas = (1+m) g_true + c.
+
+        These are stored as weighted sums rather than means, so that accumulators from independent runs can be
+        combined exactly by addition, in any order.
+    """
+
+    __slots__ = ("w", "wx", "wx2", "wy", "wxy", "n")
+
+    def __init__(self, w=0., wx=0., wx2=0., wy=0., wxy=0., n=0):
+        self.w = w
+        self.wx = wx
+        self.wx2 = wx2
+        self.wy = wy
+        self.wxy = wxy
+        self.n = n
+
+    def add_statistics(self, w, xm, x2m, ym, xym):
+        """ Adds linear regression statistics stored as a total weight plus weighted means (the format of
+            SHE_PPT's LinregressStatistics).
+        """
+
+        if w is None or not w > 0:
+            return
+
+        self.w += w
+        self.wx += w * xm
+        self.wx2 += w * x2m
+        self.wy += w * ym
+        self.wxy += w * xym
+        self.n += 1
+
+    def merge(self, other):
+        """ Adds the statistics of another accumulator to this one.
+        """
+        self.w += other.w
+        self.wx += other.wx
+        self.wx2 += other.wx2
+        self.wy += other.wy
+        self.wxy += other.wxy
+        self.n += other.n
+        return self
+
+    def __iadd__(self, other):
+        return self.merge(other)
+
+    def get_bias_estimate(self):
+        """ Calculates the bias and its uncertainty from the accumulated statistics.
+
+        @return: The bias estimate, or None if there are insufficient statistics to calculate one
+        @rtype:  BiasEstimate
+        """
+
+        delta = self.w * self.wx2 - self.wx ** 2
+        if not (self.w > 0 and delta > 0):
+            return None
+
+        slope = (self.w * self.wxy - self.wx * self.wy) / delta
+        intercept = (self.wx2 * self.wy - self.wx * self.wxy) / delta
+
+        return BiasEstimate(m=slope - 1.,
+                            m_err=math.sqrt(self.w / delta),
+                            c=intercept,
+                            c_err=math.sqrt(self.wx2 / delta),
+                            mc_covar=-self.wx / delta,
+                            weight=self.w)
+
+    def to_dict(self):
+        return {attr: getattr(self, attr) for attr in self.__slots__}
+
+    @classmethod
+    def from_dict(cls, d):
+        return cls(**{attr: d[attr] for attr in cls.__slots__ if attr in d})
+
+
+def combine_accumulator_dicts(target, source):
+    """ Merges a dict of key: LinregressAccumulator into another in place.
+    """
+    for key, accumulator in source.items():
+        if key in target:
+            target[key].merge(accumulator)
+        else:
+            target[key] = LinregressAccumulator().merge(accumulator)
+    return target
+
+
+def read_bias_statistics_accumulators(filename, workdir=".", methods=DEFAULT_METHODS):
+    """ Reads a shear bias statistics product (as output for each simulation) into a dict of accumulators, one per
+        method, shear component, and bin.
+
+        The product may provide statistics for each method either as a (g1, g2) pair for all objects, or as a dict
+        of such pairs keyed by bin.
+
+    @return: Accumulators, keyed by get_accumulator_key
+    @rtype:  dict(str: LinregressAccumulator)
+    """
+
+    p = read_xml_product(filename, workdir=workdir)
+
+    accumulators = {}
+    for method in methods:
+        try:
+            method_bias_statistics = p.get_method_bias_statistics(method, workdir=workdir)
+        except Exception as e:
+            logger.debug("No bias statistics for method %s in %s: %s", method, filename, e)
+            continue
+        if method_bias_statistics is None:
+            continue
+
+        if isinstance(method_bias_statistics, dict):
+            binned_statistics = method_bias_statistics.items()
+        else:
+            binned_statistics = ((DEFAULT_BIN, method_bias_statistics),)
+
+        for bin_label, component_statistics in binned_statistics:
+            for component, statistics in zip(SHEAR_COMPONENTS, component_statistics):
+                if statistics is None:
+                    continue
+                accumulator = LinregressAccumulator()
+                accumulator.add_statistics(statistics.w, statistics.xm, statistics.x2m, statistics.ym,
+                                           statistics.xym)
+                if accumulator.n > 0:
+                    accumulators[get_accumulator_key(method, component, bin_label)] = accumulator
+
+    return accumulators
+
+
+def read_bias_statistics_listfile_accumulators(listfile, workdir=".", methods=DEFAULT_METHODS):
+    """ Reads all the shear bias statistics products in a listfile (e.g. the shear_bias_measurement_list.json of a
+        run of SHE_Pipeline_RunBiasParallel) and combines them into a dict of accumulators, one per method, shear
+        component, and bin.
+
+    @return: Accumulators, keyed by get_accumulator_key
+    @rtype:  dict(str: LinregressAccumulator)
+    """
+
+    accumulators = {}
+    for filename in read_listfile(os.path.join(workdir, listfile)):
+        combine_accumulator_dicts(accumulators,
+                                  read_bias_statistics_accumulators(filename, workdir=workdir, methods=methods))
+
+    return accumulators
+
+
+class BiasPrecisionMonitor(object):
+    """ Accumulates bias statistics as they become available, and checks the resulting precision of the bias
+        estimates against a target.
+    """
+
+    def __init__(self, m_target, c_target=None):
+
+        if not m_target > 0:
+            raise ValueError(f"Target precision for m must be positive, but is {m_target}.")
+        if c_target is not None and not c_target > 0:
+            raise ValueError(f"Target precision for c must be positive, but is {c_target}.")
+
+        self.m_target = m_target
+        self.c_target = c_target
+        self.accumulators = {}
+
+    def add(self, accumulators):
+        combine_accumulator_dicts(self.accumulators, accumulators)
+
+    def get_precision_shortfalls(self):
+        """ Gets the ratio of the current uncertainty to the target for each method, shear component, and bin
+            (using the worse of m and c if both have targets). Values <= 1 mean the target has been reached.
+
+        @return: Ratios keyed by get_accumulator_key
+        @rtype:  dict(str: float)
+        """
+
+        shortfalls = {}
+        for key, accumulator in self.accumulators.items():
+            estimate = accumulator.get_bias_estimate()
+            if estimate is None:
+                shortfalls[key] = math.inf
+                continue
+            shortfall = estimate.m_err / self.m_target
+            if self.c_target is not None:
+                shortfall = max(shortfall, estimate.c_err / self.c_target)
+            shortfalls[key] = shortfall
+
+        return shortfalls
+
+    def target_met(self):
+        shortfalls = self.get_precision_shortfalls()
+        return len(shortfalls) > 0 and all(shortfall <= 1. for shortfall in shortfalls.values())
+
+
+class BiasAccumulatorStore(object):
+    """ A JSON file holding accumulated bias statistics, keyed by TAG and then by method, shear component, and bin.
+
+        All modifications are made while holding an exclusive lock on a companion lock file, and written through
+        a temporary file which is renamed into place, so that concurrent batch jobs can safely fold in their
+        results and readers always see a complete store. The IDs of all batches folded in are recorded, so that a
+        batch can't be counted twice (e.g. if its job is rerun).
+    """
+
+    def __init__(self, filename):
+        self.filename = os.path.abspath(filename)
+
+    def _read(self):
+        if not os.path.exists(self.filename):
+            return {"version": ACCUMULATOR_FORMAT_VERSION, "tags": {}}
+        with open(self.filename, "r") as fi:
+            contents = json.load(fi)
+        if contents.get("version") != ACCUMULATOR_FORMAT_VERSION:
+            raise ValueError(f"Bias accumulator store {self.filename} has unsupported format version "
+                             f"{contents.get('version')}.")
+        return contents
+
+    def _write(self, contents):
+        write_json_atomically(self.filename, contents)
+
+    @staticmethod
+    def _fold_tag(contents, tag, accumulators, batch_ids):
+        tag_contents = contents["tags"].setdefault(tag, {"batches": [], "accumulators": {}})
+
+        already_folded = set(tag_contents["batches"]).intersection(batch_ids)
+        if already_folded:
+            logger.warning("Batch(es) %s already folded in for tag %s; skipping.", sorted(already_folded), tag)
+            return False
+
+        stored = {key: LinregressAccumulator.from_dict(d) for key, d in tag_contents["accumulators"].items()}
+        combine_accumulator_dicts(stored, accumulators)
+
+        tag_contents["accumulators"] = {key: accumulator.to_dict() for key, accumulator in stored.items()}
+        tag_contents["batches"].extend(sorted(batch_ids))
+        return True
+
+    def fold_in(self, tag, accumulators, batch_id):
+        """ Atomically adds the statistics from one batch to the store.
+
+        @return: True if the batch was folded in, False if it had already been
+        @rtype:  bool
+        """
+
+        with file_lock(self.filename):
+            contents = self._read()
+            folded = self._fold_tag(contents, tag, accumulators, {str(batch_id)})
+            if folded:
+                self._write(contents)
+
+        if folded:
+            logger.info("Folded batch %s into bias accumulator store %s for tag %s.", batch_id, self.filename, tag)
+        return folded
+
+    def merge_from(self, other_filename):
+        """ Atomically merges all tags of another store into this one. Raises a ValueError if any batch is present
+            in both, since its statistics can't then be separated out again.
+        """
+
+        with open(other_filename, "r") as fi:
+            other_contents = json.load(fi)
+
+        with file_lock(self.filename):
+            contents = self._read()
+            for tag, other_tag_contents in other_contents["tags"].items():
+                batch_ids = set(other_tag_contents["batches"])
+                overlap = batch_ids.intersection(contents["tags"].get(tag, {}).get("batches", []))
+                if overlap:
+                    raise ValueError(f"Cannot merge {other_filename} into {self.filename}: batch(es) "
+                                     f"{sorted(overlap)} of tag {tag} are present in both.")
+                accumulators = {key: LinregressAccumulator.from_dict(d)
+                                for key, d in other_tag_contents["accumulators"].items()}
+                self._fold_tag(contents, tag, accumulators, batch_ids)
+            self._write(contents)
+
+    def get_tags(self):
+        return sorted(self._read()["tags"])
+
+    def get_batches(self, tag):
+        return list(self._read()["tags"].get(tag, {}).get("batches", []))
+
+    def get_accumulators(self, tag):
+        """ @return: Accumulators for a tag, keyed by get_accumulator_key
+            @rtype:  dict(str: LinregressAccumulator)
+        """
+        tag_contents = self._read()["tags"].get(tag, {"accumulators": {}})
+        return {key: LinregressAccumulator.from_dict(d) for key, d in tag_contents["accumulators"].items()}
+
+    def get_bias_estimates(self, tag):
+        """ @return: The combined bias estimates for a tag, keyed by get_accumulator_key
+            @rtype:  dict(str: BiasEstimate)
+        """
+        return {key: accumulator.get_bias_estimate() for key, accumulator in self.get_accumulators(tag).items()}
@@ -0,0 +1,296 @@
+""" @file bias_packaging.py
+
+    Created 19 October 2026
+
+    Packaging of the bias measurements of a sensitivity-testing campaign, with the data files they point to, into a
+    single compressed archive. Files are streamed straight into the archive rather than copied together first, files
+    shared between TAGs are stored only once, and the archive is compressed in parallel.
+"""
+
+__updated__ = "2026-10-19"
+
+# Copyright (C) 2012-2020 Euclid Science Ground Segment
+#
+# This library is free software; you can redistribute it and/or modify it under the terms of the GNU Lesser General
+# Public License as published by the Free Software Foundation; either version 3.0 of the License, or (at your option)
+# any later version.
+#
+# This library is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY; without even the implied
+# warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU Lesser General Public License for more
+# details.
+#
+# You should have received a copy of the GNU Lesser General Public License along with this library; if not, write to
+# the Free Software Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA
+
+from collections import deque, namedtuple
+from concurrent.futures import ThreadPoolExecutor
+import hashlib
+import io
+import json
+import os
+import struct
+import tarfile
+import time
+import zlib
+
+from SHE_PPT.file_io import read_xml_product
+from SHE_PPT.logging import getLogger
+
+from . import pipeline_utilities as pu
+from .product_catalog import get_catalogued_data_filenames
+from .shared_inputs import find_data_file, get_data_search_path
+
+DEFAULT_PRODUCT_FILENAME = "shear_bias_measurements.xml"
+DEFAULT_COMPRESSLEVEL = 6
+DEFAULT_PACKAGING_THREADS = 4
+
+# Size of the blocks of the archive compressed in parallel, and of the preceding data each block's compression is
+# primed with, so that matches across block boundaries aren't lost
+BLOCK_SIZE = 1024 ** 2
+DICTIONARY_SIZE = 32 * 1024
+
+CHUNK_SIZE = 1024 ** 2
+
+MANIFEST_ARCNAME = "manifest.json"
+
+# The TAG whose measurements are archived under each name, as in sort_bias_measurements.sh. The PSF sensitivity
+# TAGs have no runs of their own, and are archived with the measurements of the fiducial TAG
+SENSITIVITY_TAG_RENAMES = (("Ep0Pp0Sp0", "Ep0Pp0Sp0Tp0"),
+                           ("Em2Pp0Sp0", "Em2Pp0Sp0Tp0"),
+                           ("Em1Pp0Sp0", "Em1Pp0Sp0Tp0"),
+                           ("Ep1Pp0Sp0", "Ep1Pp0Sp0Tp0"),
+                           ("Ep2Pp0Sp0", "Ep2Pp0Sp0Tp0"),
+                           ("Ep0Pp0Sm2", "Ep0Pp0Sm2Tp0"),
+                           ("Ep0Pp0Sm1", "Ep0Pp0Sm1Tp0"),
+                           ("Ep0Pp0Sp1", "Ep0Pp0Sp1Tp0"),
+                           ("Ep0Pp0Sp2", "Ep0Pp0Sp2Tp0"),
+                           ("Ep0Pp0Sp0", "Ep0Pm2Sp0Tp0"),
+                           ("Ep0Pp0Sp0", "Ep0Pm1Sp0Tp0"),
+                           ("Ep0Pp0Sp0", "Ep0Pp1Sp0Tp0"),
+                           ("Ep0Pp0Sp0", "Ep0Pp2Sp0Tp0"),
+                           ("Tm2", "Ep0Pp0Sp0Tm2"),
+                           ("Tm1", "Ep0Pp0Sp0Tm1"),
+                           ("Tp1", "Ep0Pp0Sp0Tp1"),
+                           ("Tp2", "Ep0Pp0Sp0Tp2"),
+                           ("CO", "CO"),
+                           ("WB", "WB"),
+                           ("COWB", "COWB"),)
+
+# A file to archive: its name in the archive, and its qualified filename
+archive_entry_tuple = namedtuple("archive_entry_tuple", "arcname filename")
+
+logger = getLogger(__name__)
+
+
+class ParallelGzipWriter(object):
+    """ Writable file-like object which gzip-compresses what's written to it into another file, compressing blocks in
+        a pool of threads in the way pigz does. Each block is compressed as raw deflate data primed with the end of
+        the block before it, and flushed to a byte boundary, so that the compressed blocks concatenate into a single
+        standard gzip member.
+    """
+
+    def __init__(self, fileobj, compresslevel=DEFAULT_COMPRESSLEVEL, number_threads=DEFAULT_PACKAGING_THREADS,
+                 block_size=BLOCK_SIZE):
+
+        self.fileobj = fileobj
+        self.compresslevel = compresslevel
+        self.number_threads = number_threads
+        self.block_size = block_size
+
+        self._buffer = bytearray()
+        self._dictionary = b""
+        self._crc = 0
+        self._size = 0
+        self._pending = deque()
+        self._executor = ThreadPoolExecutor(max_workers=number_threads, thread_name_prefix="compress")
+        self._closed = False
+
+        # Header with no name, extra flags or OS information
+        self.fileobj.write(b"\x1f\x8b\x08\x00" + struct.pack("<I", int(time.time())) + b"\x00\xff")
+
+    def _compress_block(self, block, dictionary, last):
+        if dictionary:
+            compressor = zlib.compressobj(self.compresslevel, zlib.DEFLATED, -zlib.MAX_WBITS, zdict=dictionary)
+        else:
+            compressor = zlib.compressobj(self.compresslevel, zlib.DEFLATED, -zlib.MAX_WBITS)
+        return compressor.compress(block) + compressor.flush(zlib.Z_FINISH if last else zlib.Z_SYNC_FLUSH)
+
+    def _submit_block(self, block, last=False):
+
+        self._crc = zlib.crc32(block, self._crc)
+        self._size += len(block)
+        self._pending.append(self._executor.submit(self._compress_block, block, self._dictionary, last))
+        self._dictionary = block[-DICTIONARY_SIZE:]
+
+        # Write out finished blocks in order, bounding the number held in memory
+        while self._pending and (len(self._pending) > 2 * self.number_threads or self._pending[0].done()):
+            self.fileobj.write(self._pending.popleft().result())
+
+    def write(self, data):
+        if self._closed:
+            raise ValueError("write to closed ParallelGzipWriter")
+        self._buffer += data
+        while len(self._buffer) >= self.block_size:
+            block = bytes(self._buffer[:self.block_size])
+            del self._buffer[:self.block_size]
+            self._submit_block(block)
+        return len(data)
+
+    def close(self):
+        """ Compresses what remains to be written, and writes the gzip trailer. The underlying file isn't closed.
+        """
+        if self._closed:
+            return
+        try:
+            self._submit_block(bytes(self._buffer), last=True)
+            self._buffer = bytearray()
+            while self._pending:
+                self.fileobj.write(self._pending.popleft().result())
+            self.fileobj.write(struct.pack("<II", self._crc & 0xffffffff, self._size & 0xffffffff))
+        finally:
+            self._executor.shutdown()
+            self._closed = True
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+def get_product_data_filenames(qualified_filename):
+    """ Gets the data files a product points to, from its directory's product catalogue if it has one, or else by
+        reading it.
+    """
+    data_filenames = get_catalogued_data_filenames(qualified_filename)
+    if data_filenames is None:
+        data_filenames = read_xml_product(qualified_filename).get_all_filenames()
+    return [data_filename for data_filename in data_filenames
+            if not (data_filename is None or data_filename in ("", "None", "data/None"))]
+
+
+def get_archive_entries(root_dir, product_filename=DEFAULT_PRODUCT_FILENAME, tag_renames=SENSITIVITY_TAG_RENAMES):
+    """ Gets the files to archive: the product of each TAG, named for the TAG it's archived as, and the data files
+        it points to, in the data directory. TAGs without a product are skipped.
+
+    @rtype: list<archive_entry_tuple>
+    """
+
+    product_root, product_ext = os.path.splitext(product_filename)
+
+    entries = []
+    sources = {}
+    for tag, new_tag in tag_renames:
+
+        qualified_product_filename = os.path.join(root_dir, tag, product_filename)
+        if not os.path.isfile(qualified_product_filename):
+            logger.warning("No %s found for TAG %s; skipping it.", product_filename, tag)
+            continue
+
+        tag_entries = [archive_entry_tuple(f"{product_root}_{new_tag}{product_ext}", qualified_product_filename)]
+
+        data_search_path = get_data_search_path(qualified_product_filename, "")
+        for data_filename in get_product_data_filenames(qualified_product_filename):
+            arcname = os.path.normpath(os.path.join("data", os.path.basename(data_filename)))
+            tag_entries.append(archive_entry_tuple(arcname, find_data_file(data_filename, data_search_path)))
+
+        # Skip the same file being found again under the same name
+        for entry in tag_entries:
+            source = os.path.realpath(entry.filename)
+            if sources.get(entry.arcname) == source:
+                continue
+            sources[entry.arcname] = source
+            entries.append(entry)
+
+    return entries
+
+
+def get_file_digest(filename):
+    hasher = hashlib.sha256()
+    with open(filename, "rb") as fi:
+        for chunk in iter(lambda: fi.read(CHUNK_SIZE), b""):
+            hasher.update(chunk)
+    return hasher.hexdigest()
+
+
+def get_manifest_filename(output_filename):
+    """ Gets the filename of the manifest written next to an archive, e.g. "x.manifest.json" for "x.tar.gz".
+    """
+    root = output_filename
+    for ext in (".gz", ".tgz", ".tar"):
+        if root.endswith(ext):
+            root = root[:-len(ext)]
+    return root + ".manifest.json"
+
+
+def package_bias_measurements(root_dir, output_filename, product_filename=DEFAULT_PRODUCT_FILENAME,
+                              tag_renames=SENSITIVITY_TAG_RENAMES, number_threads=DEFAULT_PACKAGING_THREADS,
+                              compresslevel=DEFAULT_COMPRESSLEVEL):
+    """ Writes the products of each TAG and their data files to a gzipped tar archive. Each file's contents are stored
+        once, with any other files with the same contents stored as hard links to it, and a manifest of all files is
+        written both into the archive and next to it.
+
+    @return: The manifest
+    @rtype:  dict
+    """
+
+    entries = get_archive_entries(root_dir, product_filename=product_filename, tag_renames=tag_renames)
+
+    with ThreadPoolExecutor(max_workers=number_threads, thread_name_prefix="digest") as executor:
+        digests = list(executor.map(get_file_digest, [entry.filename for entry in entries]))
+
+    files = []
+    arcname_digests = {}
+    digest_arcnames = {}
+    for entry, digest in zip(entries, digests):
+        if entry.arcname in arcname_digests:
+            if arcname_digests[entry.arcname] != digest:
+                raise ValueError(f"Files with different contents would be archived as {entry.arcname}, including "
+                                 f"{entry.filename}.")
+            continue
+        arcname_digests[entry.arcname] = digest
+        files.append({"name": entry.arcname,
+                      "source": entry.filename,
+                      "size": os.path.getsize(entry.filename),
+                      "sha256": digest,
+                      "link": digest_arcnames.get(digest)})
+        digest_arcnames.setdefault(digest, entry.arcname)
+
+    manifest = {"root_dir": os.path.abspath(root_dir),
+                "tags": {new_tag: tag for tag, new_tag in tag_renames},
+                "files": files,
+                "number_stored": sum(1 for file in files if file["link"] is None),
+                "bytes_deduplicated": sum(file["size"] for file in files if file["link"] is not None)}
+
+    start_time = time.monotonic()
+    tmp_filename = f"{output_filename}.{os.getpid()}.tmp"
+    with open(tmp_filename, "wb") as fo:
+        with ParallelGzipWriter(fo, compresslevel=compresslevel, number_threads=number_threads) as writer:
+            with tarfile.open(fileobj=writer, mode="w|", format=tarfile.PAX_FORMAT) as tar:
+                for file in files:
+                    # The file's details are taken from the open file, so that a symlinked data file is archived
+                    # as the file it points to
+                    with open(file["source"], "rb") as fi:
+                        tarinfo = tar.gettarinfo(arcname=file["name"], fileobj=fi)
+                        if file["link"] is not None:
+                            tarinfo.type = tarfile.LNKTYPE
+                            tarinfo.linkname = file["link"]
+                            tarinfo.size = 0
+                            tar.addfile(tarinfo)
+                            continue
+                        tar.addfile(tarinfo, fi)
+
+                manifest_data = json.dumps(manifest, indent=1, sort_keys=True).encode()
+                tarinfo = tarfile.TarInfo(MANIFEST_ARCNAME)
+                tarinfo.size = len(manifest_data)
+                tarinfo.mtime = int(time.time())
+                tar.addfile(tarinfo, io.BytesIO(manifest_data))
+    os.replace(tmp_filename, output_filename)
+
+    pu.write_json_atomically(get_manifest_filename(output_filename), manifest)
+
+    logger.info("Archived %s files (%s stored, %.1f MB deduplicated) to %s in %.1f s.", len(files),
+                manifest["number_stored"], manifest["bytes_deduplicated"] / 1024 ** 2, output_filename,
+                time.monotonic() - start_time)
+
+    return manifest
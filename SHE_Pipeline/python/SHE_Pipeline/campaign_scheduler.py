@@ -0,0 +1,431 @@
+""" @file campaign_scheduler.py
+
+    Created 19 October 2026
+
+    Scheduler for campaigns of sensitivity-testing jobs, each running the bias measurement pipeline for one batch of
+    seeds and one TAG, which submits the jobs not yet completed through an interchangeable backend while keeping the
+    number of its own jobs in the queue within a limit.
+"""
+
+__updated__ = "2026-10-19"
+
+# Copyright (C) 2012-2020 Euclid Science Ground Segment
+#
+# This library is free software; you can redistribute it and/or modify it under the terms of the GNU Lesser General
+# Public License as published by the Free Software Foundation; either version 3.0 of the License, or (at your option)
+# any later version.
+#
+# This library is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY; without even the implied
+# warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU Lesser General Public License for more
+# details.
+#
+# You should have received a copy of the GNU Lesser General Public License along with this library; if not, write to
+# the Free Software Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA
+
+from collections import namedtuple
+from datetime import datetime
+import getpass
+import json
+import os
+import subprocess
+import time
+
+from SHE_PPT.logging import getLogger
+
+from . import pipeline_utilities as pu
+
+CAMPAIGN_BACKENDS = ("sbatch", "local", "stub")
+
+# File in the archive directory of a job whose presence shows that it completed
+COMPLETION_FILENAME = "shear_bias_measurements_final.xml"
+
+# Settings of a campaign: where jobs' outputs are archived and logged, the batches and TAGs to run, how seeds are
+# assigned to batches, and how jobs are submitted
+campaign_config_tuple = namedtuple("campaign_config_tuple", ["archive_dir",
+                                                             "workspace_root",
+                                                             "logdir",
+                                                             "scriptdir",
+                                                             "batch_start",
+                                                             "batch_end",
+                                                             "tags",
+                                                             "queue",
+                                                             "job_script",
+                                                             "job_limit",
+                                                             "poll_interval",
+                                                             "retry_interval",
+                                                             "seed_start",
+                                                             "seeds_per_batch",
+                                                             "num_galaxies_per_seed",
+                                                             "num_threads",
+                                                             "template_prefix",
+                                                             "template_postfix",
+                                                             "submit_args",
+                                                             "killfile"])
+
+# Default values of the optional settings of a campaign. Intervals are in seconds
+DEFAULT_CAMPAIGN_CONFIG = {"queue": None,
+                           "job_script": "run_bias_measurement_pipeline.sh",
+                           "job_limit": 200,
+                           "poll_interval": 60.,
+                           "retry_interval": 8 * 3600.,
+                           "seed_start": 1,
+                           "seeds_per_batch": 96,
+                           "num_galaxies_per_seed": 16,
+                           "num_threads": 8,
+                           "template_prefix": "",
+                           "template_postfix": "Template.conf",
+                           "submit_args": [],
+                           "killfile": None, }
+
+logger = getLogger(__name__)
+
+
+def read_campaign_config(filename):
+    """ Reads the settings of a campaign from a JSON file, with keys as in campaign_config_tuple, e.g.:
+
+            {"archive_dir": "/ceph/ral/sens_archive",
+             "workspace_root": "/ceph/ral/sens_workdirs/sens_",
+             "logdir": "/ceph/ral/sens_logs",
+             "scriptdir": "/ceph/home/user/sens_testing_scripts",
+             "batch_start": 100001,
+             "batch_end": 101000,
+             "tags": ["Ep0Pp0Sp0", "Ep1Pp0Sp0"],
+             "queue": "ral",
+             "job_limit": 200}
+
+        Keys in DEFAULT_CAMPAIGN_CONFIG are optional.
+
+    @rtype: campaign_config_tuple
+    """
+
+    with open(filename, "r") as fi:
+        contents = json.load(fi)
+
+    unknown_keys = set(contents) - set(campaign_config_tuple._fields)
+    if unknown_keys:
+        raise ValueError(f"Unrecognised keys in campaign config {filename}: {sorted(unknown_keys)}")
+    missing_keys = set(campaign_config_tuple._fields) - set(contents) - set(DEFAULT_CAMPAIGN_CONFIG)
+    if missing_keys:
+        raise ValueError(f"Missing keys in campaign config {filename}: {sorted(missing_keys)}")
+
+    config = campaign_config_tuple(**{**DEFAULT_CAMPAIGN_CONFIG, **contents})
+    if config.batch_end < config.batch_start:
+        raise ValueError(f"Invalid batch range {config.batch_start} to {config.batch_end} in campaign config.")
+    if config.job_limit < 1:
+        raise ValueError("Invalid job_limit in campaign config: Must be at least 1.")
+
+    return config
+
+
+def get_seed_range(config, batch):
+    """ Gets the inclusive range of model and noise seeds simulated in a batch.
+
+    @rtype: tuple(int, int)
+    """
+    seed_min = config.seed_start + config.seeds_per_batch * batch
+    return seed_min, seed_min + config.seeds_per_batch - 1
+
+
+def get_completion_filename(config, tag, batch):
+    return os.path.join(config.archive_dir, tag, f"sens_{batch}", f"sens_{batch}_{tag}", COMPLETION_FILENAME)
+
+
+def get_job_name(tag, batch):
+    return f"sens_testing_{tag}_{batch}"
+
+
+def get_job_command(config, tag, batch):
+    """ Gets the command which runs the job for a TAG and batch, with the arguments of run_bias_measurement_pipeline.sh.
+
+    @rtype: list<str>
+    """
+    return [os.path.join(config.scriptdir, config.job_script), str(config.seed_start), str(config.seeds_per_batch),
+            str(config.num_galaxies_per_seed), tag, str(batch), str(config.num_threads), config.archive_dir,
+            config.workspace_root, config.scriptdir, config.template_prefix, config.template_postfix]
+
+
+def _to_ranges(values):
+    """ Compresses a set of integers to a sorted list of inclusive [first, last] ranges.
+    """
+    ranges = []
+    for value in sorted(values):
+        if ranges and value == ranges[-1][1] + 1:
+            ranges[-1][1] = value
+        else:
+            ranges.append([value, value])
+    return ranges
+
+
+def _from_ranges(ranges):
+    return {value for first, last in ranges for value in range(first, last + 1)}
+
+
+class CampaignState(object):
+    """ State of a campaign, saved to a JSON file: the batches completed for each TAG (stored as ranges), and the jobs
+        submitted by the scheduler which haven't yet been seen to finish, keyed by job ID.
+    """
+
+    def __init__(self, filename):
+
+        self.filename = filename
+
+        self.completed = {}
+        self.jobs = {}
+        if os.path.exists(filename):
+            with open(filename, "r") as fi:
+                contents = json.load(fi)
+            self.completed = {tag: _from_ranges(ranges) for tag, ranges in contents["completed"].items()}
+            self.jobs = contents["jobs"]
+
+    def is_completed(self, tag, batch):
+        return batch in self.completed.get(tag, ())
+
+    def set_completed(self, tag, batch):
+        self.completed.setdefault(tag, set()).add(batch)
+
+    def save(self):
+        pu.write_json_atomically(self.filename, {"completed": {tag: _to_ranges(batches)
+                                                               for tag, batches in self.completed.items()},
+                                                 "jobs": self.jobs})
+
+
+class SbatchBackend(object):
+    """ Backend which submits jobs to Slurm with sbatch, and finds which are still queued or running with a single
+        call to squeue.
+    """
+
+    def __init__(self, queue=None, submit_args=()):
+        self.queue = queue
+        self.submit_args = list(submit_args)
+
+    def submit(self, command, name, stdout_filename, stderr_filename, num_threads):
+        sbatch_command = ["sbatch", "--parsable", "-N", "1", "-n", str(num_threads), "-J", name,
+                          "-o", stdout_filename, "-e", stderr_filename]
+        if self.queue:
+            sbatch_command += ["-p", self.queue]
+        output = subprocess.run(sbatch_command + self.submit_args + command, check=True, stdout=subprocess.PIPE,
+                                universal_newlines=True).stdout
+        return output.strip().split(";")[0]
+
+    def get_active_jobs(self, job_ids):
+        try:
+            output = subprocess.run(["squeue", "-h", "-o", "%i", "-u", getpass.getuser()], check=True,
+                                    stdout=subprocess.PIPE, universal_newlines=True).stdout
+        except (OSError, subprocess.CalledProcessError) as e:
+            # Assume nothing has finished, rather than risk exceeding the job limit
+            logger.warning("Can't get queued jobs from squeue: %s", e)
+            return set(job_ids)
+        return set(job_ids) & set(output.split())
+
+
+class LocalBackend(object):
+    """ Backend which runs each job as a subprocess on this machine. Jobs submitted by a previous scheduler are taken
+        to have finished.
+    """
+
+    def __init__(self):
+        self._processes = {}
+
+    def submit(self, command, name, stdout_filename, stderr_filename, num_threads):
+        with open(stdout_filename, "a") as stdout, open(stderr_filename, "a") as stderr:
+            process = subprocess.Popen(command, stdout=stdout, stderr=stderr)
+        job_id = f"local_{process.pid}"
+        self._processes[job_id] = process
+        return job_id
+
+    def get_active_jobs(self, job_ids):
+        return {job_id for job_id in job_ids
+                if job_id in self._processes and self._processes[job_id].poll() is None}
+
+
+class StubBackend(object):
+    """ Backend for testing, which doesn't run anything. Each job stays active for a number of checks of the active
+        jobs, then finishes by calling run_job with its command, if given.
+    """
+
+    def __init__(self, job_duration=1, run_job=None):
+        self.job_duration = job_duration
+        self.run_job = run_job
+        self.submitted = []
+        self.max_active = 0
+        self._remaining_checks = {}
+
+    def submit(self, command, name, stdout_filename, stderr_filename, num_threads):
+        job_id = f"stub_{len(self.submitted)}"
+        self.submitted.append((job_id, command))
+        self._remaining_checks[job_id] = self.job_duration
+        self.max_active = max(self.max_active, len(self._remaining_checks))
+        return job_id
+
+    def get_active_jobs(self, job_ids):
+        commands = dict(self.submitted)
+        for job_id in list(self._remaining_checks):
+            self._remaining_checks[job_id] -= 1
+            if self._remaining_checks[job_id] <= 0:
+                del self._remaining_checks[job_id]
+                if self.run_job is not None:
+                    self.run_job(commands[job_id])
+        return set(job_ids) & set(self._remaining_checks)
+
+
+def create_backend(backend, config):
+    """ Creates a backend (one of CAMPAIGN_BACKENDS) for submitting the jobs of a campaign.
+    """
+    if backend == "sbatch":
+        return SbatchBackend(queue=config.queue, submit_args=config.submit_args)
+    if backend == "local":
+        return LocalBackend()
+    if backend == "stub":
+        return StubBackend()
+    raise ValueError(f"Unrecognised campaign backend: {backend}. Allowed values are: {CAMPAIGN_BACKENDS}")
+
+
+class CampaignScheduler(object):
+    """ Submits the jobs of a campaign which haven't completed, through a backend. Batches already completed are
+        recorded in the campaign's state, so the archive is only checked for batches not yet known to be complete.
+        The scheduler tracks the jobs it has submitted, so that at most job_limit are active at once, and a job is
+        only resubmitted once it has finished without completing.
+    """
+
+    def __init__(self, config, backend, state_filename, sleep=time.sleep):
+        self.config = config
+        self.backend = backend
+        self.state = CampaignState(state_filename)
+        self.sleep = sleep
+        self.number_failed = 0
+
+    def stop_requested(self):
+        return self.config.killfile is not None and not os.path.exists(self.config.killfile)
+
+    def _scan_archive(self):
+        """ Records as completed all batches in the archive which have completed, listing each TAG's directory once
+            and only checking batches not already known to be complete.
+        """
+
+        batches = range(self.config.batch_start, self.config.batch_end + 1)
+        for tag in self.config.tags:
+            tag_dir = os.path.join(self.config.archive_dir, tag)
+            if not os.path.isdir(tag_dir):
+                continue
+            with os.scandir(tag_dir) as entries:
+                for entry in entries:
+                    if not entry.name.startswith("sens_"):
+                        continue
+                    try:
+                        batch = int(entry.name[len("sens_"):])
+                    except ValueError:
+                        continue
+                    if (batch in batches and not self.state.is_completed(tag, batch) and
+                            os.path.exists(get_completion_filename(self.config, tag, batch))):
+                        self.state.set_completed(tag, batch)
+
+    def get_remaining(self):
+        """ Gets the (TAG, batch) pairs not yet completed, in order of batch.
+
+        @rtype: list<tuple(str, int)>
+        """
+        self._scan_archive()
+        return [(tag, batch) for batch in range(self.config.batch_start, self.config.batch_end + 1)
+                for tag in self.config.tags if not self.state.is_completed(tag, batch)]
+
+    def refresh_jobs(self):
+        """ Checks which submitted jobs have finished, and whether each completed.
+        """
+
+        active_job_ids = self.backend.get_active_jobs(list(self.state.jobs))
+        for job_id in [job_id for job_id in self.state.jobs if job_id not in active_job_ids]:
+            job = self.state.jobs.pop(job_id)
+            if os.path.exists(get_completion_filename(self.config, job["tag"], job["batch"])):
+                self.state.set_completed(job["tag"], job["batch"])
+            else:
+                logger.warning("Job %s for TAG %s and batch %s finished without completing; it will be resubmitted.",
+                               job_id, job["tag"], job["batch"])
+                self.number_failed += 1
+        self.state.save()
+
+    def submit(self, tag, batch):
+
+        os.makedirs(os.path.join(self.config.archive_dir, tag), exist_ok=True)
+
+        name = get_job_name(tag, batch)
+        job_id = self.backend.submit(get_job_command(self.config, tag, batch), name,
+                                     os.path.join(self.config.logdir, name + ".out"),
+                                     os.path.join(self.config.logdir, name + ".err"),
+                                     self.config.num_threads)
+
+        seed_min, seed_max = get_seed_range(self.config, batch)
+        self.state.jobs[job_id] = {"tag": tag,
+                                   "batch": batch,
+                                   "seed_min": seed_min,
+                                   "seed_max": seed_max,
+                                   "submitted": datetime.now().isoformat(timespec="seconds")}
+        self.state.save()
+
+        logger.info("Submitted job %s for TAG %s and batch %s (seeds %s to %s).", job_id, tag, batch, seed_min,
+                    seed_max)
+
+    def run_pass(self):
+        """ Submits a job for each (TAG, batch) pair which hasn't completed and has no active job, waiting while the
+            job limit is reached.
+
+        @return: Number of jobs submitted, or None if stopped
+        @rtype:  int
+        """
+
+        self.refresh_jobs()
+        remaining = self.get_remaining()
+        active_pairs = {(job["tag"], job["batch"]) for job in self.state.jobs.values()}
+
+        logger.info("%s jobs remaining, of which %s are active.", len(remaining), len(active_pairs))
+
+        number_submitted = 0
+        for tag, batch in remaining:
+            if (tag, batch) in active_pairs:
+                continue
+            while len(self.state.jobs) >= self.config.job_limit:
+                if self.stop_requested():
+                    return None
+                self.sleep(self.config.poll_interval)
+                self.refresh_jobs()
+            if self.stop_requested():
+                return None
+            self.submit(tag, batch)
+            number_submitted += 1
+
+        return number_submitted
+
+    def run(self, single_pass=False):
+        """ Submits jobs in passes until all have completed, waiting between passes until the active jobs have
+            finished or the retry interval has passed. Stops early if the killfile (created here) is deleted.
+
+        @return: Whether all jobs have completed
+        @rtype:  bool
+        """
+
+        if self.config.killfile is not None:
+            open(self.config.killfile, "a").close()
+
+        while True:
+
+            number_failed_before = self.number_failed
+            number_submitted = self.run_pass()
+            if number_submitted is None:
+                logger.info("Killfile %s deleted; stopping.", self.config.killfile)
+                return False
+
+            if not self.state.jobs and not self.get_remaining():
+                logger.info("All jobs have completed.")
+                return True
+            if single_pass:
+                return False
+
+            # Wait for the active jobs to finish, and if any failed, until the retry interval has passed before
+            # resubmitting them
+            wait_start = time.monotonic()
+            while ((self.state.jobs or self.number_failed > number_failed_before) and
+                   time.monotonic() - wait_start < self.config.retry_interval):
+                if self.stop_requested():
+                    logger.info("Killfile %s deleted; stopping.", self.config.killfile)
+                    return False
+                self.sleep(self.config.poll_interval)
+                self.refresh_jobs()
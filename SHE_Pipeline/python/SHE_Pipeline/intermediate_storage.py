@@ -0,0 +1,144 @@
+""" @file intermediate_storage.py
+
+    Created 19 October 2026
+
+    Storage of the intermediate products of a simulation in memory, so that they're handed from one stage to the next
+    without being written to disk.
+"""
+
+__updated__ = "2026-10-19"
+
+# Copyright (C) 2012-2020 Euclid Science Ground Segment
+#
+# This library is free software; you can redistribute it and/or modify it under the terms of the GNU Lesser General
+# Public License as published by the Free Software Foundation; either version 3.0 of the License, or (at your option)
+# any later version.
+#
+# This library is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY; without even the implied
+# warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU Lesser General Public License for more
+# details.
+#
+# You should have received a copy of the GNU Lesser General Public License along with this library; if not, write to
+# the Free Software Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA
+
+from contextlib import contextmanager
+import os
+import shutil
+import tempfile
+
+from SHE_PPT.file_io import read_xml_product
+from SHE_PPT.logging import getLogger
+
+INTERMEDIATE_STORAGE_MODES = ("memory", "disk")
+
+# Shared-memory filesystem, whose files are held in RAM
+DEFAULT_MEMORY_ROOT = "/dev/shm"
+
+# Prefix of the workdir copies made in memory
+MEMORY_WORKDIR_PREFIX = "she_sim_"
+
+logger = getLogger(__name__)
+
+
+def check_memory_root(memory_root=DEFAULT_MEMORY_ROOT):
+    """ Checks whether a directory can be used to hold intermediate products in memory.
+
+    @return: Whether it can be used
+    @rtype:  bool
+    """
+    return os.path.isdir(memory_root) and os.access(memory_root, os.W_OK | os.X_OK)
+
+
+def _symlink_entries(source_dir, target_dir, exclude=()):
+    for entry in os.listdir(source_dir):
+        if entry not in exclude:
+            os.symlink(os.path.join(source_dir, entry), os.path.join(target_dir, entry))
+
+
+def get_memory_workdir_prefix():
+    """ Gets a prefix for the workdir copies made in memory by the simulations of this run, including the pid of the
+        process running it, so that they can be told apart from those of other runs sharing the memory root.
+    """
+    return f"{MEMORY_WORKDIR_PREFIX}{os.getpid()}_"
+
+
+def remove_memory_workdirs(memory_root, prefix):
+    """ Removes any workdir copies with the given prefix left in the memory root. A worker which is killed (e.g.
+        after a hard timeout, or on termination of its pool) doesn't remove its own copy, so this must be called
+        once the workers using the prefix have exited, so that the copies don't fill the memory.
+
+    @return: Number of copies removed
+    @rtype:  int
+    """
+
+    number_removed = 0
+    for entry in os.listdir(memory_root):
+        qualified_entry = os.path.join(memory_root, entry)
+        if entry.startswith(prefix) and os.path.isdir(qualified_entry) and not os.path.islink(qualified_entry):
+            shutil.rmtree(qualified_entry, ignore_errors=True)
+            number_removed += 1
+
+    if number_removed > 0:
+        logger.info("Removed %s workdir copies left in %s by killed workers.", number_removed, memory_root)
+
+    return number_removed
+
+
+@contextmanager
+def memory_workdir(workdir, memory_root=DEFAULT_MEMORY_ROOT, products=(), prefix=MEMORY_WORKDIR_PREFIX):
+    """ Creates a copy of a workdir in memory for the duration of this context, in which the stages of a simulation
+        can be run so that the products they write are held in memory. Everything in the workdir (its inputs,
+        cache, logdir, etc.) is symlinked from the copy, except for the data directory, which is created in memory
+        with symlinks to the inputs in the workdir's data directory (except for any left over from a previous run
+        under the names of the given products, which would otherwise be written through the symlinks). The copy is
+        removed on leaving the context, so any products which are wanted must be moved to the workdir with
+        move_product_to_workdir first. If the process is killed within the context, the copy is left behind, to be
+        removed with remove_memory_workdirs.
+
+    @return: Path to the copy of the workdir
+    @rtype:  str
+    """
+
+    scratch_workdir = tempfile.mkdtemp(prefix=prefix, dir=memory_root)
+    try:
+        _symlink_entries(workdir, scratch_workdir, exclude=("data",))
+        os.mkdir(os.path.join(scratch_workdir, "data"))
+        _symlink_entries(os.path.join(workdir, "data"), os.path.join(scratch_workdir, "data"),
+                         exclude=[os.path.basename(product) for product in products])
+
+        yield scratch_workdir
+    finally:
+        shutil.rmtree(scratch_workdir, ignore_errors=True)
+
+
+def move_product_to_workdir(product_filename, scratch_workdir, workdir):
+    """ Moves a data product, and the data files it points to, from a workdir copy created by memory_workdir to the
+        workdir itself, replacing any existing files. Products which weren't written (e.g. those of shear estimation
+        methods which weren't run) are skipped.
+    """
+
+    if not os.path.exists(os.path.join(scratch_workdir, product_filename)):
+        logger.debug("Product %s was not written, so will not be moved to the workdir", product_filename)
+        return
+
+    filenames = [product_filename]
+    p = read_xml_product(product_filename, workdir=scratch_workdir)
+    for data_filename in p.get_all_filenames():
+        if data_filename is None or data_filename in ("", "None", "data/None", "data/"):
+            continue
+        filenames.append(data_filename)
+
+    for filename in filenames:
+        qualified_scratch_filename = os.path.join(scratch_workdir, filename)
+        # Files which are symlinked in from the workdir are already there
+        if os.path.islink(qualified_scratch_filename):
+            continue
+        if not os.path.exists(qualified_scratch_filename):
+            logger.warning("Expected file %s does not exist", qualified_scratch_filename)
+            continue
+
+        qualified_filename = os.path.join(workdir, filename)
+        os.makedirs(os.path.dirname(qualified_filename), exist_ok=True)
+        if os.path.lexists(qualified_filename):
+            os.remove(qualified_filename)
+        shutil.move(qualified_scratch_filename, qualified_filename)
@@ -0,0 +1,282 @@
+""" @file io_throttle.py
+
+    Created 19 October 2026
+
+    Throttling of the I/O-heavy stages of simulations run by the workers of the parallel bias measurement pipeline,
+    through limits on the number of workers in each stage at once and a token bucket limiting their I/O bandwidth.
+"""
+
+__updated__ = "2026-10-19"
+
+# Copyright (C) 2012-2020 Euclid Science Ground Segment
+#
+# This library is free software; you can redistribute it and/or modify it under the terms of the GNU Lesser General
+# Public License as published by the Free Software Foundation; either version 3.0 of the License, or (at your option)
+# any later version.
+#
+# This library is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY; without even the implied
+# warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU Lesser General Public License for more
+# details.
+#
+# You should have received a copy of the GNU Lesser General Public License along with this library; if not, write to
+# the Free Software Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA
+
+from collections import namedtuple
+from contextlib import contextmanager
+import fcntl
+import json
+import multiprocessing
+import os
+import tempfile
+import time
+
+from SHE_PPT.logging import getLogger
+
+from .simulation_scheduler import report_stage
+
+# Limits on I/O: the maximum number of workers in each stage at once, keyed by stage, and the bandwidth in bytes/s
+# and burst size in bytes of the token bucket (None if bandwidth isn't limited)
+io_limits_tuple = namedtuple("io_limits_tuple", "stage_concurrency bandwidth burst")
+
+MB = 1024 ** 2
+
+# Interval in seconds at which a worker waiting for the token bucket to refill, or for a place in a stage, checks
+# again
+THROTTLE_POLL_INTERVAL = 0.1
+
+# Offset in the throttle's lock file of the byte locked while updating the token bucket
+BUCKET_LOCK_OFFSET = 0
+
+logger = getLogger(__name__)
+
+
+def read_io_limits(filename):
+    """ Reads I/O limits for a site from a JSON file, in the format:
+
+            {"stage_concurrency": {"simulate_images": 8, "estimate_shear": 8},
+             "bandwidth_mb_per_s": 500,
+             "burst_mb": 2000}
+
+        All keys are optional. The burst size defaults to one second of bandwidth.
+
+    @rtype: io_limits_tuple
+    """
+
+    with open(filename, "r") as fi:
+        contents = json.load(fi)
+
+    return get_io_limits(stage_concurrency=contents.get("stage_concurrency"),
+                         bandwidth_mb_per_s=contents.get("bandwidth_mb_per_s"),
+                         burst_mb=contents.get("burst_mb"))
+
+
+def get_io_limits(stage_concurrency=None, bandwidth_mb_per_s=None, burst_mb=None, base_limits=None):
+    """ Gets I/O limits, overriding those in base_limits (e.g. read from a site's file) with any which are given.
+
+    @return: The limits, or None if nothing is limited
+    @rtype:  io_limits_tuple
+    """
+
+    if base_limits is None:
+        base_limits = io_limits_tuple({}, None, None)
+
+    merged_stage_concurrency = dict(base_limits.stage_concurrency)
+    for stage, max_workers in (stage_concurrency or {}).items():
+        if int(max_workers) < 1:
+            raise ValueError(f"Concurrency limit for stage {stage} must be at least 1.")
+        merged_stage_concurrency[stage] = int(max_workers)
+
+    bandwidth, burst = base_limits.bandwidth, base_limits.burst
+    if bandwidth_mb_per_s is not None:
+        if bandwidth_mb_per_s <= 0:
+            raise ValueError("I/O bandwidth limit must be positive.")
+        bandwidth, burst = bandwidth_mb_per_s * MB, None
+    if burst_mb is not None:
+        burst = burst_mb * MB
+    if bandwidth is not None and burst is None:
+        burst = bandwidth
+
+    if not merged_stage_concurrency and bandwidth is None:
+        return None
+
+    return io_limits_tuple(merged_stage_concurrency, bandwidth, burst)
+
+
+def _read_storage_io_bytes():
+    """ Gets the number of bytes this process has caused to be read from and written to storage (rather than
+        served from or absorbed by the page cache of a memory-backed filesystem), or None if this isn't available.
+    """
+    try:
+        with open("/proc/self/io", "r") as fi:
+            counters = dict(line.split(":") for line in fi if ":" in line)
+        return int(counters["read_bytes"]) + int(counters["write_bytes"])
+    except (OSError, KeyError, ValueError):
+        return None
+
+
+class IOThrottle(object):
+    """ Limits shared by all workers of an executor on the number of workers in each I/O-heavy stage at once, and on
+        the I/O bandwidth they use in those stages. Stages without a concurrency limit aren't throttled, unless only
+        bandwidth is limited, in which case all stages are.
+
+        The bandwidth limit is a token bucket which refills at the limit, up to the burst size. A worker can enter
+        a throttled stage only while the bucket isn't empty, and once the stage finishes, the bytes it read and
+        wrote are taken from the bucket (which may leave it in debt, delaying the next workers).
+
+        A worker's place in a stage, and its hold on the bucket while updating it, are fcntl locks on byte ranges of
+        a lock file: the first byte for the bucket, then a byte for each place in each throttled stage. The kernel
+        releases these when a worker exits, so a worker killed within a stage (e.g. after a hard timeout) doesn't
+        keep its place.
+
+        Must be created before the workers are started, from the multiprocessing context used to start them, and
+        removed once they have exited.
+    """
+
+    def __init__(self, io_limits, context=multiprocessing):
+
+        self.io_limits = io_limits
+
+        # Offset in the lock file of the first place in each throttled stage
+        self._stage_offsets = {}
+        offset = 1
+        for stage, max_workers in io_limits.stage_concurrency.items():
+            self._stage_offsets[stage] = offset
+            offset += max_workers
+
+        lock_fd, self._lock_filename = tempfile.mkstemp(prefix="she_io_throttle_", suffix=".lock")
+        os.close(lock_fd)
+
+        # Each process opens the lock file itself, since fcntl locks belong to the process
+        self._lock_fd = None
+        self._lock_fd_pid = None
+
+        if io_limits.bandwidth is not None:
+            self._tokens = context.RawValue("d", io_limits.burst)
+            self._last_refill = context.RawValue("d", time.monotonic())
+        else:
+            self._tokens = None
+
+    def __getstate__(self):
+        state = dict(self.__dict__)
+        state["_lock_fd"] = None
+        state["_lock_fd_pid"] = None
+        return state
+
+    def throttles(self, stage):
+        if self._stage_offsets:
+            return stage in self._stage_offsets
+        return self._tokens is not None
+
+    def remove(self):
+        """ Removes the lock file, once no workers are using the throttle.
+        """
+        try:
+            os.remove(self._lock_filename)
+        except FileNotFoundError:
+            pass
+
+    def _lock(self, offset, blocking=True):
+        """ Locks a byte of the lock file, returning whether it was locked.
+        """
+        if self._lock_fd_pid != os.getpid():
+            self._lock_fd = os.open(self._lock_filename, os.O_RDWR)
+            self._lock_fd_pid = os.getpid()
+        try:
+            fcntl.lockf(self._lock_fd, fcntl.LOCK_EX if blocking else fcntl.LOCK_EX | fcntl.LOCK_NB, 1, offset)
+        except (BlockingIOError, PermissionError):
+            return False
+        return True
+
+    def _unlock(self, offset):
+        fcntl.lockf(self._lock_fd, fcntl.LOCK_UN, 1, offset)
+
+    def _update_tokens(self, change=0.):
+        """ Refills the bucket for the time since it was last refilled, applies a change to it, and returns the
+            number of tokens in it.
+        """
+        self._lock(BUCKET_LOCK_OFFSET)
+        try:
+            now = time.monotonic()
+            tokens = min(self.io_limits.burst,
+                         self._tokens.value + (now - self._last_refill.value) * self.io_limits.bandwidth) + change
+            self._tokens.value = tokens
+            self._last_refill.value = now
+        finally:
+            self._unlock(BUCKET_LOCK_OFFSET)
+        return tokens
+
+    def _wait_for_tokens(self):
+        while True:
+            tokens = self._update_tokens()
+            if tokens > 0:
+                return
+            time.sleep(min(THROTTLE_POLL_INTERVAL, -tokens / self.io_limits.bandwidth + 0.001))
+
+    def _wait_for_place(self, stage):
+        """ Waits for a free place in a stage, returning the offset of the lock held on it.
+        """
+        first_offset = self._stage_offsets[stage]
+        while True:
+            for offset in range(first_offset, first_offset + self.io_limits.stage_concurrency[stage]):
+                if self._lock(offset, blocking=False):
+                    return offset
+            time.sleep(THROTTLE_POLL_INTERVAL)
+
+    @contextmanager
+    def stage(self, stage):
+        """ Waits until this worker may enter a stage, and holds its place in the stage within this context.
+        """
+
+        if not self.throttles(stage):
+            yield
+            return
+
+        wait_start = time.monotonic()
+
+        place_offset = None
+        if stage in self._stage_offsets:
+            place_offset = self._wait_for_place(stage)
+        try:
+            if self._tokens is not None:
+                self._wait_for_tokens()
+
+            wait_time = time.monotonic() - wait_start
+            if wait_time > 1.:
+                logger.info("Waited %.1fs for I/O throttling before stage %s.", wait_time, stage)
+
+            io_bytes_start = _read_storage_io_bytes()
+            try:
+                yield
+            finally:
+                if self._tokens is not None and io_bytes_start is not None:
+                    self._update_tokens(-(_read_storage_io_bytes() - io_bytes_start))
+        finally:
+            if place_offset is not None:
+                self._unlock(place_offset)
+
+
+# Throttle used by the stages run in this worker process
+_worker_io_throttle = None
+
+
+def install_io_throttle(io_throttle):
+    """ Sets the throttle used by stages run in this process (or None for no throttling).
+    """
+    global _worker_io_throttle
+    _worker_io_throttle = io_throttle
+
+
+@contextmanager
+def throttled_stage(stage):
+    """ Holds this worker's place in a stage within this context, waiting first if it's throttled. While waiting, the
+        worker reports to the scheduler that it's between stages, so that time spent waiting isn't counted towards
+        the stage's timeouts.
+    """
+
+    if _worker_io_throttle is None or not _worker_io_throttle.throttles(stage):
+        yield
+        return
+
+    report_stage(None)
+    with _worker_io_throttle.stage(stage):
+        yield
@@ -0,0 +1,238 @@
+""" @file memory_profiles.py
+
+    Created 19 October 2026
+
+    Memory-environment profiles for the workers of the parallel bias measurement pipeline, and measurement of the
+    memory behaviour of each stage under them.
+"""
+
+__updated__ = "2026-10-19"
+
+# Copyright (C) 2012-2020 Euclid Science Ground Segment
+#
+# This library is free software; you can redistribute it and/or modify it under the terms of the GNU Lesser General
+# Public License as published by the Free Software Foundation; either version 3.0 of the License, or (at your option)
+# any later version.
+#
+# This library is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY; without even the implied
+# warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU Lesser General Public License for more
+# details.
+#
+# You should have received a copy of the GNU Lesser General Public License along with this library; if not, write to
+# the Free Software Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA
+
+from collections import namedtuple
+from contextlib import contextmanager
+import ctypes
+import ctypes.util
+import json
+import os
+import resource
+import statistics
+import time
+
+from SHE_PPT.logging import getLogger
+
+memory_profile_tuple = namedtuple("MemoryProfile", "name environment thp_disable")
+
+# Profiles which can be selected by name. Environment values of None are removed from the environment, and
+# library names in LD_PRELOAD are resolved to the installed library when the profile is applied.
+BUILTIN_MEMORY_PROFILES = {
+    "default": memory_profile_tuple("default", {}, False),
+    # Transparent huge pages: glibc's malloc advises the kernel to back its heap with huge pages (glibc >= 2.35)
+    "thp": memory_profile_tuple("thp", {"GLIBC_TUNABLES": "glibc.malloc.hugetlb=1"}, False),
+    # Preallocated huge pages from hugetlbfs (glibc >= 2.35), which must be reserved on the node
+    "hugetlb": memory_profile_tuple("hugetlb", {"GLIBC_TUNABLES": "glibc.malloc.hugetlb=2"}, False),
+    # Transparent huge pages disabled for the worker processes
+    "no_thp": memory_profile_tuple("no_thp", {}, True),
+    # Fewer malloc arenas, reducing fragmentation at the cost of contention between threads
+    "arena2": memory_profile_tuple("arena2", {"MALLOC_ARENA_MAX": "2"}, False),
+    "jemalloc": memory_profile_tuple("jemalloc", {"LD_PRELOAD": "jemalloc"}, False),
+    "tcmalloc": memory_profile_tuple("tcmalloc", {"LD_PRELOAD": "tcmalloc"}, False),
+}
+
+MEMORY_PROFILE_REPORT_FILENAME = "memory_profile_report.json"
+
+# From linux/prctl.h
+PR_SET_THP_DISABLE = 41
+
+logger = getLogger(__name__)
+
+
+def read_memory_profiles(filename):
+    """ Reads memory profiles from a JSON file, containing a dict of profile name to a dict with an "environment"
+        dict and optionally "thp_disable".
+
+    @return: Profiles keyed by name
+    @rtype:  dict<str, memory_profile_tuple>
+    """
+
+    with open(filename, "r") as fi:
+        contents = json.load(fi)
+
+    profiles = {}
+    for name, profile in contents.items():
+        if not isinstance(profile, dict) or not isinstance(profile.get("environment", {}), dict):
+            raise ValueError(f"Invalid memory profile {name} in {filename}.")
+        profiles[name] = memory_profile_tuple(name, dict(profile.get("environment", {})),
+                                              bool(profile.get("thp_disable", False)))
+
+    return profiles
+
+
+def get_memory_profiles(names, filename=None):
+    """ Gets the named memory profiles, from those in the given file or the built-in profiles.
+
+    @return: Profiles, in the order named
+    @rtype:  list<memory_profile_tuple>
+    """
+
+    available_profiles = dict(BUILTIN_MEMORY_PROFILES)
+    if filename is not None:
+        available_profiles.update(read_memory_profiles(filename))
+
+    profiles = []
+    for name in names:
+        if name not in available_profiles:
+            raise ValueError(f"Unrecognised memory profile: {name}. Available profiles are: " +
+                             ", ".join(sorted(available_profiles)))
+        profiles.append(available_profiles[name])
+
+    return profiles
+
+
+def _resolve_preload(preload):
+    """ Resolves each short library name (e.g. "jemalloc") in an LD_PRELOAD value to the installed library.
+    """
+
+    resolved = []
+    for library in preload.split():
+        if "/" not in library and not library.endswith(".so") and ".so." not in library:
+            library_name = ctypes.util.find_library(library)
+            if library_name is None:
+                raise ValueError(f"Library {library} for LD_PRELOAD could not be found.")
+            library = library_name
+        resolved.append(library)
+
+    return " ".join(resolved)
+
+
+def get_profile_environment(profile):
+    """ Gets the environment variables set by a profile, with library names resolved.
+    """
+
+    environment = dict(profile.environment)
+    if environment.get("LD_PRELOAD"):
+        environment["LD_PRELOAD"] = _resolve_preload(environment["LD_PRELOAD"])
+
+    return environment
+
+
+@contextmanager
+def applied_environment(environment):
+    """ Applies environment variables within this context, so that processes started within it inherit them.
+        Values of None remove the variable.
+    """
+
+    previous_environment = {key: os.environ.get(key) for key in environment}
+
+    def apply(new_environment):
+        for key, value in new_environment.items():
+            if value is None:
+                os.environ.pop(key, None)
+            else:
+                os.environ[key] = str(value)
+
+    apply(environment)
+    try:
+        yield
+    finally:
+        apply(previous_environment)
+
+
+def disable_thp():
+    """ Disables transparent huge pages for this process and its children.
+
+    @return: Whether they could be disabled
+    @rtype:  bool
+    """
+
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+        return libc.prctl(PR_SET_THP_DISABLE, 1, 0, 0, 0) == 0
+    except (OSError, AttributeError, TypeError):
+        return False
+
+
+def _reset_peak_rss():
+    """ Resets the peak resident set size of this process, so that it can be measured for each stage. Returns False
+        if this isn't possible (requires Linux >= 4.0).
+    """
+    try:
+        with open("/proc/self/clear_refs", "w") as fo:
+            fo.write("5")
+    except OSError:
+        return False
+    return True
+
+
+def _read_peak_rss_kb():
+    try:
+        with open("/proc/self/status", "r") as fi:
+            for line in fi:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1])
+    except (OSError, ValueError, IndexError):
+        pass
+    # Peak over the lifetime of the process, in kB on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def start_resource_measurement():
+    """ Starts measuring the resources used by this process.
+
+    @return: Baseline to pass to finish_resource_measurement
+    """
+    _reset_peak_rss()
+    return time.perf_counter(), resource.getrusage(resource.RUSAGE_SELF)
+
+
+def finish_resource_measurement(baseline):
+    """ Gets the resources used by this process since a measurement was started.
+
+    @return: Wall time in seconds, minor and major page faults, and peak resident set size in kB
+    @rtype:  dict
+    """
+
+    start_time, start_usage = baseline
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+
+    return {"wall_time": time.perf_counter() - start_time,
+            "minor_faults": usage.ru_minflt - start_usage.ru_minflt,
+            "major_faults": usage.ru_majflt - start_usage.ru_majflt,
+            "peak_rss_kb": _read_peak_rss_kb(), }
+
+
+def summarise_stage_resources(stage_resources_list):
+    """ Summarises the resources used by each stage over a set of simulations.
+
+    @param stage_resources_list: For each simulation, a dict of stage to the resources it used
+    @return: For each stage, the number of simulations and the mean, median and maximum of each measurement
+    @rtype:  dict
+    """
+
+    measurements = {}
+    for stage_resources in stage_resources_list:
+        for stage, resources in stage_resources.items():
+            for key, value in resources.items():
+                measurements.setdefault(stage, {}).setdefault(key, []).append(value)
+
+    summary = {}
+    for stage, stage_measurements in measurements.items():
+        summary[stage] = {"number_simulations": max(len(values) for values in stage_measurements.values())}
+        for key, values in stage_measurements.items():
+            summary[stage][key] = {"mean": statistics.mean(values),
+                                   "median": statistics.median(values),
+                                   "max": max(values), }
+
+    return summary
@@ -0,0 +1,406 @@
+""" @file orchestration_benchmark.py
+
+    Created 19 October 2026
+
+    Benchmark of the overhead of the parallel bias runner itself (staging inputs, building arguments, symlinking,
+    merging outputs and rewriting listfiles), measured by running it with the science code of each stage replaced
+    by synthetic stand-ins which sleep, burn CPU, and write products with data files of a given size.
+"""
+
+__updated__ = "2026-10-19"
+
+# Copyright (C) 2012-2020 Euclid Science Ground Segment
+#
+# This library is free software; you can redistribute it and/or modify it under the terms of the GNU Lesser General
+# Public License as published by the Free Software Foundation; either version 3.0 of the License, or (at your option)
+# any later version.
+#
+# This library is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY; without even the implied
+# warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU Lesser General Public License for more
+# details.
+#
+# You should have received a copy of the GNU Lesser General Public License along with this library; if not, write to
+# the Free Software Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA
+
+from collections import namedtuple
+from contextlib import contextmanager
+import os
+import pickle
+import shutil
+import time
+import uuid
+
+from astropy.table import Table
+
+from SHE_PPT.file_io import write_listfile
+from SHE_PPT.logging import getLogger
+
+from . import pipeline_utilities as pu, run_bias_pipeline_parallel as rbpp
+from .RunBiasPipelineParallel import defineSpecificProgramOptions
+from .shared_inputs import SHARED_INPUT_PORTS
+
+# Executors which run the stages in this process or in forks of it, and so run the stand-ins installed here
+BENCHMARK_EXECUTORS = ("fork", "serial")
+
+# Stages of a simulation, whose science code is run in the workers
+SIMULATION_STAGES = rbpp.simulation_stages
+
+# All stages with science code, including those run once per run in the main process
+SCIENCE_STAGES = ("prepare_configs",) + SIMULATION_STAGES + ("measure_bias",)
+
+# The outputs of each stage, as the attributes of its parsed arguments holding their filenames
+STAGE_OUTPUT_PORTS = {"simulate_images": ("data_images", "stacked_data_image", "psf_images_and_tables",
+                                          "segmentation_images", "stacked_segmentation_image", "detections_tables",
+                                          "details_table"),
+                      "estimate_shear": ("shear_estimates_product", "she_lensmc_chains"),
+                      "measure_statistics": ("she_bias_statistics",),
+                      "cleanup_bias_measurement": ("shear_bias_statistics_out",),
+                      "measure_bias": ("she_bias_measurements",), }
+
+# What the stand-in for a stage does: sleep for a time (in seconds), burn CPU for a time, and write each of its
+# products with data files of a size (in bytes)
+synthetic_stage_tuple = namedtuple("synthetic_stage_tuple", "sleep cpu file_size")
+
+# A configuration to benchmark
+benchmark_case_tuple = namedtuple("benchmark_case_tuple", "number_simulations number_threads data_files_per_product")
+
+SCIENCE_TIMES_FILENAME = "science_times.txt"
+DEFAULT_RESULTS_FILENAME = "orchestration_benchmark.json"
+
+logger = getLogger(__name__)
+
+
+class SyntheticProduct(object):
+    """ Stand-in for a data product, which is pickled to its file (as read_xml_product allows) so that it can be
+        read back without data model bindings for its type.
+    """
+
+    def __init__(self, data_filenames):
+        self.data_filenames = list(data_filenames)
+
+    def get_all_filenames(self):
+        return self.data_filenames
+
+
+def burn_cpu(seconds):
+    """ Keeps the CPU busy for the given amount of CPU time.
+    """
+    end = time.process_time() + seconds
+    x = 0
+    while time.process_time() < end:
+        for i in range(1000):
+            x += i * i
+    return x
+
+
+def write_synthetic_product(filename, workdir, number_data_files, file_size):
+    """ Writes a synthetic product with its data files, each of the given size, with names unique to it in the
+        workdir's data directory. A listfile (.json) is written listing a single such product.
+    """
+
+    if filename.endswith(".json"):
+        product_filename = os.path.join("data", f"SYN-P-{uuid.uuid4().hex}.xml")
+        write_synthetic_product(product_filename, workdir, number_data_files, file_size)
+        write_listfile(os.path.join(workdir, filename), [product_filename])
+        return
+
+    data_filenames = []
+    block = b"\0" * min(file_size, 1024 ** 2)
+    for i in range(number_data_files):
+        data_filename = os.path.join("data", f"SYN-D-{uuid.uuid4().hex}-{i}.fits")
+        with open(os.path.join(workdir, data_filename), "wb") as fo:
+            remaining = file_size
+            while remaining > 0:
+                remaining -= fo.write(block[:remaining])
+        data_filenames.append(data_filename)
+
+    with open(os.path.join(workdir, filename), "wb") as fo:
+        pickle.dump(SyntheticProduct(data_filenames), fo)
+
+
+class SyntheticStages(object):
+    """ Stand-ins for the science code run by each stage of the bias runner. Each does what its stage's
+        synthetic_stage_tuple says, writes the products its stage would, and records the time it took in a file
+        shared by all workers, so that the time spent outside of the science code can be determined.
+    """
+
+    def __init__(self, stage_specs, number_simulations, data_files_per_product, science_times_filename):
+        """
+        @param stage_specs: synthetic_stage_tuple for each stage; stages not included do nothing but write their
+                            products
+        """
+        self.stage_specs = stage_specs
+        self.number_simulations = number_simulations
+        self.data_files_per_product = data_files_per_product
+        self.science_times_filename = science_times_filename
+
+    def run_stage(self, stage, workdir, output_filenames):
+
+        start = time.perf_counter()
+
+        spec = self.stage_specs.get(stage, synthetic_stage_tuple(0., 0., 0))
+        if spec.sleep > 0:
+            time.sleep(spec.sleep)
+        if spec.cpu > 0:
+            burn_cpu(spec.cpu)
+        for filename in output_filenames:
+            write_synthetic_product(filename, workdir, self.data_files_per_product, spec.file_size)
+
+        # A single short write in append mode, so lines from different workers don't interleave
+        fd = os.open(self.science_times_filename, os.O_WRONLY | os.O_APPEND | os.O_CREAT)
+        try:
+            os.write(fd, f"{stage} {time.perf_counter() - start}\n".encode())
+        finally:
+            os.close(fd)
+
+    def _run_stage_from_args(self, stage, args):
+        self.run_stage(stage, args.workdir, [getattr(args, port) for port in STAGE_OUTPUT_PORTS[stage]])
+
+    def write_configs_from_plan(self, plan_filename, template_filename, listfile_filename, workdir):
+        """ Stand-in for SHE_GST_PrepareConfigs, writing a configuration for each simulation.
+        """
+        config_filenames = [f"SYN-CONFIG-{i}.conf" for i in range(self.number_simulations)]
+        for config_filename in config_filenames:
+            with open(os.path.join(workdir, config_filename), "w") as fo:
+                fo.write(f"template={template_filename}\n")
+        write_listfile(os.path.join(workdir, listfile_filename), config_filenames)
+        self.run_stage("prepare_configs", workdir, [])
+
+    def run_from_args(self, function, args):
+        self._run_stage_from_args("simulate_images", args)
+
+    def estimate_shears_from_args(self, args):
+        self._run_stage_from_args("estimate_shear", args)
+
+    def measure_statistics_from_args(self, args):
+        self._run_stage_from_args("measure_statistics", args)
+
+    def cleanup_bias_measurement_from_args(self, args):
+        self._run_stage_from_args("cleanup_bias_measurement", args)
+
+    def measure_bias_from_args(self, args):
+        self._run_stage_from_args("measure_bias", args)
+
+    @contextmanager
+    def installed(self):
+        """ Replaces the science code called by the bias runner with these stand-ins within this context.
+        """
+
+        replacements = ((rbpp.gst_prep_conf, "write_configs_from_plan", self.write_configs_from_plan),
+                        (rbpp, "run_from_args", self.run_from_args),
+                        (rbpp, "estimate_shears_from_args", self.estimate_shears_from_args),
+                        (rbpp, "measure_statistics_from_args", self.measure_statistics_from_args),
+                        (rbpp.cleanup_bias, "cleanup_bias_measurement_from_args",
+                         self.cleanup_bias_measurement_from_args),
+                        (rbpp, "measure_bias_from_args", self.measure_bias_from_args),)
+
+        originals = [(module, name, getattr(module, name)) for module, name, _ in replacements]
+        try:
+            for module, name, replacement in replacements:
+                setattr(module, name, replacement)
+            yield self
+        finally:
+            for module, name, original in originals:
+                setattr(module, name, original)
+
+
+def get_stage_specs(stage_sleep=None, stage_cpu=None, stage_file_size=None):
+    """ Gets the synthetic_stage_tuple for each stage from lists of pairs of stage and value, as given on the command
+        line, with file sizes in MB.
+
+    @rtype: dict<str, synthetic_stage_tuple>
+    """
+
+    values = {}
+    for arg_name, pairs in (("stage_sleep", stage_sleep), ("stage_cpu", stage_cpu),
+                            ("stage_file_size", stage_file_size)):
+        pairs = pairs or []
+        if not len(pairs) % 2 == 0:
+            raise ValueError(f"Invalid values passed to '{arg_name}': Must be a set of paired arguments.")
+        for i in range(len(pairs) // 2):
+            stage = pairs[2 * i]
+            if stage not in SCIENCE_STAGES:
+                raise ValueError(f"Stage \"{stage}\" in '{arg_name}' not recognized. Allowed stages are: " +
+                                 ", ".join(SCIENCE_STAGES))
+            try:
+                value = float(pairs[2 * i + 1])
+            except ValueError:
+                raise ValueError(f"Invalid value for stage \"{stage}\" in '{arg_name}': Must be a number.")
+            if value < 0:
+                raise ValueError(f"Invalid value for stage \"{stage}\" in '{arg_name}': Must be non-negative.")
+            values.setdefault(stage, {})[arg_name] = value
+
+    return {stage: synthetic_stage_tuple(stage_values.get("stage_sleep", 0.),
+                                         stage_values.get("stage_cpu", 0.),
+                                         int(stage_values.get("stage_file_size", 0.) * 1024 ** 2))
+            for stage, stage_values in values.items()}
+
+
+def read_science_times(filename):
+    """ Reads the total time spent in the stand-ins for each stage.
+
+    @rtype: dict<str, float>
+    """
+
+    science_times = dict.fromkeys(SCIENCE_STAGES, 0.)
+    if not os.path.exists(filename):
+        return science_times
+    with open(filename) as fi:
+        for line in fi:
+            stage, duration = line.split()
+            science_times[stage] = science_times.get(stage, 0.) + float(duration)
+    return science_times
+
+
+def write_benchmark_inputs(workdir, number_simulations, data_files_per_product):
+    """ Writes the inputs of a run of the bias runner with synthetic stages: a simulation plan for the given number
+        of simulations, a configuration template, bins description, training data and MDB (the last as synthetic
+        products with data files to be symlinked into each simulation's workdir), and an ISF pointing to them.
+
+    @return: Filename of the ISF
+    @rtype:  str
+    """
+
+    os.makedirs(os.path.join(workdir, "data"), exist_ok=True)
+
+    Table(rows=[(1, number_simulations, 1, 1, number_simulations, 1, 16)],
+          names=("MSEED_MIN", "MSEED_MAX", "MSEED_STEP", "NSEED_MIN", "NSEED_MAX", "NSEED_STEP",
+                 "NUM_GALAXIES")).write(os.path.join(workdir, "SYN-PLAN.fits"), format="fits", overwrite=True)
+
+    with open(os.path.join(workdir, "SYN-TEMPLATE.conf"), "w") as fo:
+        fo.write("# Synthetic configuration template\n")
+
+    isf_lines = ["simulation_plan=SYN-PLAN.fits", "config_template=SYN-TEMPLATE.conf"]
+    for port in ("bins_description",) + SHARED_INPUT_PORTS:
+        filename = f"SYN-{port}.xml"
+        write_synthetic_product(filename, workdir, 0 if port == "bins_description" else data_files_per_product, 0)
+        isf_lines.append(f"{port}={filename}")
+
+    qualified_isf_filename = os.path.join(workdir, "SYN-ISF.txt")
+    with open(qualified_isf_filename, "w") as fo:
+        fo.write("\n".join(isf_lines) + "\n")
+
+    return qualified_isf_filename
+
+
+def run_benchmark_case(root_dir, case, stage_specs, executor="fork", run_args=(), keep_workdir=False):
+    """ Runs the bias runner with synthetic stages for one configuration, in a new workdir.
+
+    @param run_args: Further command-line arguments of SHE_Pipeline_RunBiasParallel to run it with
+
+    @return: The wall time of the run and the time spent in each stage's stand-ins, and from these, the time per
+             simulation spent in each worker outside the science code (including any time it was idle)
+    @rtype:  dict
+    """
+
+    if executor not in BENCHMARK_EXECUTORS:
+        raise ValueError(f"Unrecognised benchmark executor: {executor}. Allowed values are: {BENCHMARK_EXECUTORS}")
+
+    workdir = os.path.join(root_dir, f"bench_{case.number_simulations}sims_{case.number_threads}threads_" +
+                           f"{case.data_files_per_product}files_{uuid.uuid4().hex[:8]}")
+    os.makedirs(workdir)
+
+    try:
+        isf_filename = write_benchmark_inputs(workdir, case.number_simulations, case.data_files_per_product)
+        science_times_filename = os.path.join(workdir, SCIENCE_TIMES_FILENAME)
+
+        args = defineSpecificProgramOptions().parse_args(["--isf", isf_filename,
+                                                          "--workdir", workdir,
+                                                          "--number_threads", str(case.number_threads),
+                                                          "--executor", executor, ] + list(run_args))
+
+        synthetic_stages = SyntheticStages(stage_specs, case.number_simulations, case.data_files_per_product,
+                                           science_times_filename)
+
+        start = time.perf_counter()
+        with synthetic_stages.installed():
+            rbpp.run_pipeline_from_args(args)
+        wall_time = time.perf_counter() - start
+
+        science_times = read_science_times(science_times_filename)
+
+    finally:
+        if not keep_workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    return get_case_result(case, args.number_threads, wall_time, science_times)
+
+
+def get_case_result(case, number_workers, wall_time, science_times):
+    """ Summarises the timing of a run. The overhead per simulation is the time in worker-seconds (while the
+        simulations were running) not spent in the science code, divided by the number of simulations.
+
+    @rtype: dict
+    """
+
+    simulation_science_time = sum(science_times.get(stage, 0.) for stage in SIMULATION_STAGES)
+    serial_science_time = sum(duration for stage, duration in science_times.items() if stage not in SIMULATION_STAGES)
+
+    worker_time = (wall_time - serial_science_time) * number_workers
+
+    return {"number_simulations": case.number_simulations,
+            "number_threads": case.number_threads,
+            "number_workers": number_workers,
+            "data_files_per_product": case.data_files_per_product,
+            "wall_time": wall_time,
+            "science_times": science_times,
+            "ideal_wall_time": serial_science_time + simulation_science_time / number_workers,
+            "overhead_per_simulation": (worker_time - simulation_science_time) / case.number_simulations, }
+
+
+def add_scaling_efficiencies(results):
+    """ Adds the scaling efficiency of each result, relative to the mean wall time of the runs of the same number of
+        simulations and data files with the fewest workers: (base wall time * base workers) / (wall time * workers).
+    """
+
+    mean_wall_times = {}
+    for result in results:
+        key = (result["number_simulations"], result["data_files_per_product"], result["number_workers"])
+        mean_wall_times.setdefault(key, []).append(result["wall_time"])
+    mean_wall_times = {key: sum(wall_times) / len(wall_times) for key, wall_times in mean_wall_times.items()}
+
+    for result in results:
+        base_key = min(key for key in mean_wall_times
+                       if key[:2] == (result["number_simulations"], result["data_files_per_product"]))
+        result["scaling_efficiency"] = ((mean_wall_times[base_key] * base_key[2]) /
+                                        (result["wall_time"] * result["number_workers"]))
+
+    return results
+
+
+def run_benchmark(root_dir, number_simulations_list, number_threads_list, data_files_per_product_list, stage_specs,
+                  repeats=1, executor="fork", run_args=(), keep_workdirs=False,
+                  results_filename=DEFAULT_RESULTS_FILENAME):
+    """ Runs the bias runner with synthetic stages for every combination of the numbers of simulations, threads and
+        data files per product, and writes the results to a JSON file in the root directory.
+
+    @return: The result of each run
+    @rtype:  list<dict>
+    """
+
+    os.makedirs(root_dir, exist_ok=True)
+
+    results = []
+    for number_simulations in number_simulations_list:
+        for data_files_per_product in data_files_per_product_list:
+            for number_threads in number_threads_list:
+                case = benchmark_case_tuple(number_simulations, number_threads, data_files_per_product)
+                for repeat in range(repeats):
+                    result = run_benchmark_case(root_dir, case, stage_specs, executor=executor, run_args=run_args,
+                                                keep_workdir=keep_workdirs)
+                    result["repeat"] = repeat
+                    results.append(result)
+                    logger.info("%s simulations, %s workers, %s data files per product: %.2f s (ideal %.2f s), "
+                                "overhead %.3f s per simulation.", number_simulations, result["number_workers"],
+                                data_files_per_product, result["wall_time"], result["ideal_wall_time"],
+                                result["overhead_per_simulation"])
+
+    add_scaling_efficiencies(results)
+
+    pu.write_json_atomically(os.path.join(root_dir, results_filename),
+                             {"executor": executor,
+                              "run_args": list(run_args),
+                              "stage_specs": {stage: spec._asdict() for stage, spec in stage_specs.items()},
+                              "results": results, })
+
+    return results
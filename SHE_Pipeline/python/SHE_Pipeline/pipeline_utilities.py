@@ -5,7 +5,7 @@
     Utility functions for the parallel pipeline
 """
 
-__updated__ = "2021-08-18"
+__updated__ = "2026-10-19"
 
 # Copyright (C) 2012-2020 Euclid Science Ground Segment
 #
@@ -21,6 +21,9 @@ __updated__ = "2021-08-18"
 # the Free Software Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA
 
 from collections import namedtuple
+from contextlib import contextmanager
+import fcntl
+import json
 import os
 from subprocess import Popen, PIPE, STDOUT
 import time
@@ -51,6 +54,84 @@ def get_relpath(file_path, workdir):
         return os.path.relpath(file_path, workdir)
 
 
+def parse_walltime(walltime):
+    """ Parses a walltime in any of the formats accepted by sbatch's -t option: "minutes", "minutes:seconds",
+        "hours:minutes:seconds", "days-hours", "days-hours:minutes", or "days-hours:minutes:seconds".
+
+    @return: Walltime in seconds
+    @rtype:  int
+    """
+
+    try:
+        if "-" in walltime:
+            days_string, time_string = walltime.split("-", 1)
+            days = int(days_string)
+            # After days, the fields are hours[:minutes[:seconds]]
+            fields = [int(field) for field in time_string.split(":")]
+            fields += [0] * (3 - len(fields))
+        else:
+            days = 0
+            fields = [int(field) for field in walltime.split(":")]
+            # Without days, the fields are minutes, minutes:seconds, or hours:minutes:seconds
+            if len(fields) == 1:
+                fields = [0, fields[0], 0]
+            elif len(fields) == 2:
+                fields = [0] + fields
+        if len(fields) != 3 or min(fields + [days]) < 0:
+            raise ValueError()
+    except ValueError:
+        raise ValueError("Invalid walltime: " + str(walltime))
+
+    hours, minutes, seconds = fields
+
+    return ((days * 24 + hours) * 60 + minutes) * 60 + seconds
+
+
+def get_available_cpu_count():
+    """ Gets the number of CPUs this process may run on, which within a batch job or cpuset might be fewer than the
+        number in the machine.
+    """
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count()
+
+
+LOCK_TAIL = ".lock"
+
+
+@contextmanager
+def file_lock(filename):
+    """ Holds an exclusive lock on a companion lock file of the given file within this context, so that processes
+        sharing the file can modify it safely.
+    """
+
+    lock_filename = os.path.abspath(filename) + LOCK_TAIL
+    lock_dir = os.path.split(lock_filename)[0]
+    if not os.path.exists(lock_dir):
+        os.makedirs(lock_dir, exist_ok=True)
+
+    with open(lock_filename, "a") as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def write_json_atomically(filename, contents):
+    """ Writes contents to a JSON file through a temporary file which is renamed into place, so that readers always
+        see a complete file.
+    """
+
+    tmp_filename = f"{filename}.{os.getpid()}.tmp"
+    with open(tmp_filename, "w") as fo:
+        json.dump(contents, fo, indent=1, sort_keys=True)
+        fo.flush()
+        os.fsync(fo.fileno())
+    os.replace(tmp_filename, filename)
+
+
 def create_thread_dir_struct(args, workdir_root_list, number_threads, number_batches):
     """ Used in check_args to create thread directories based on number
     threads
@@ -119,57 +200,69 @@ def create_thread_dir_struct(args, workdir_root_list, number_threads, number_bat
             thread_dir_list = []
             for workdir_base in workdir_root_list:
                 workdir = os.path.join(workdir_base, 'thread%s_batch%s' % (thread_no, batch_no))
-                if not os.path.exists(workdir):
-                    try:
-                        os.mkdir(workdir)
-                    except Exception as e:
-                        logger.error(f"Workdir ({workdir}) does not exist and cannot be created.")
-                        raise e
-                if args.cluster:
-                    os.chmod(workdir, 0o777)
-
-                # Does the cache directory exist within the workdir?
-                cache_dir = os.path.join(workdir, "cache")
-                if not os.path.exists(cache_dir):
-                    # Can we create it?
-                    try:
-                        os.mkdir(cache_dir)
-                    except Exception as e:
-                        logger.error(f"Cache directory ({cache_dir}) does not exist and cannot be created.")
-                        raise e
-                if args.cluster:
-                    os.chmod(cache_dir, 0o777)
-
-                # Does the data directory exist within the workdir?
-                data_dir = os.path.join(workdir, "data")
-                if not os.path.exists(data_dir):
-                    # Can we create it?
-                    try:
-                        os.mkdir(data_dir)
-                    except Exception as e:
-                        logger.error(f"Data directory ({data_dir}) does not exist and cannot be created.")
-                        raise e
-                if args.cluster:
-                    os.chmod(data_dir, 0o777)
-
-                # Does the logdir exist?
-                qualified_logdir = os.path.join(workdir, args.logdir)
-                if not os.path.exists(qualified_logdir):
-                    # Can we create it?
-                    try:
-                        os.mkdir(qualified_logdir)
-                    except Exception as e:
-                        logger.error(f"logdir ({qualified_logdir}) does not exist and cannot be created.")
-                        raise e
-                if args.cluster:
-                    os.chmod(qualified_logdir, 0o777)
-                thread_dir_list.extend((workdir, qualified_logdir))
+                thread_dir_list.extend(create_dir_struct(args, workdir)[:2])
             if len(workdir_root_list) == 1:
                 thread_dir_list.extend((None, None))
             direct_str_list.append(dir_struct_tuple(*thread_dir_list))
     return direct_str_list
 
 
+def create_dir_struct(args, workdir):
+    """ Creates a single work directory, with data, cache and logdirs.
+
+    @return: Directory structure, with no app_workdir or app_logdir
+    @rtype:  namedtuple
+    """
+    logger = getLogger(__name__)
+
+    if not os.path.exists(workdir):
+        try:
+            os.mkdir(workdir)
+        except Exception as e:
+            logger.error(f"Workdir ({workdir}) does not exist and cannot be created.")
+            raise e
+    if args.cluster:
+        os.chmod(workdir, 0o777)
+
+    # Does the cache directory exist within the workdir?
+    cache_dir = os.path.join(workdir, "cache")
+    if not os.path.exists(cache_dir):
+        # Can we create it?
+        try:
+            os.mkdir(cache_dir)
+        except Exception as e:
+            logger.error(f"Cache directory ({cache_dir}) does not exist and cannot be created.")
+            raise e
+    if args.cluster:
+        os.chmod(cache_dir, 0o777)
+
+    # Does the data directory exist within the workdir?
+    data_dir = os.path.join(workdir, "data")
+    if not os.path.exists(data_dir):
+        # Can we create it?
+        try:
+            os.mkdir(data_dir)
+        except Exception as e:
+            logger.error(f"Data directory ({data_dir}) does not exist and cannot be created.")
+            raise e
+    if args.cluster:
+        os.chmod(data_dir, 0o777)
+
+    # Does the logdir exist?
+    qualified_logdir = os.path.join(workdir, args.logdir)
+    if not os.path.exists(qualified_logdir):
+        # Can we create it?
+        try:
+            os.mkdir(qualified_logdir)
+        except Exception as e:
+            logger.error(f"logdir ({qualified_logdir}) does not exist and cannot be created.")
+            raise e
+    if args.cluster:
+        os.chmod(qualified_logdir, 0o777)
+
+    return dir_struct_tuple(workdir, qualified_logdir, None, None)
+
+
 def cleanup(batch, workdir_list):
     """
     Remove sim links and batch setup files ready for the next batch.
@@ -373,16 +466,25 @@ def create_logs(log_directory, file_name, std_out, std_err):
     open(stderr_filename, 'w').writelines(stdout_lines)
 
 
+# Parsers set up by setup_function_args in this process, keyed by program module name
+_function_args_parsers = {}
+
+
 def setup_function_args(argv, command_line_int_ref, exec_name):
-    """
+    """ Parses the arguments for a function's program, reusing the program's parser if it has already been set up in
+        this process.
     """
     logger = getLogger(__name__)
 
-    estshr_args_parser = command_line_int_ref.defineSpecificProgramOptions()
+    estshr_args_parser = _function_args_parsers.get(command_line_int_ref.__name__)
+    if estshr_args_parser is None:
+        estshr_args_parser = command_line_int_ref.defineSpecificProgramOptions()
+
+        # add arg --log-file
+        estshr_args_parser.add_argument('--log-file', type=str,
+                                        help='XML data product to contain file links to the shear estimates tables.')
 
-    # add arg --log-file
-    estshr_args_parser.add_argument('--log-file', type=str,
-                                    help='XML data product to contain file links to the shear estimates tables.')
+        _function_args_parsers[command_line_int_ref.__name__] = estshr_args_parser
 
     estshr_args = estshr_args_parser.parse_args(argv)
     exec_cmd = get_arguments_string(estshr_args, cmd=exec_name,
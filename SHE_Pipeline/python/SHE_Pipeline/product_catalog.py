@@ -0,0 +1,309 @@
+""" @file product_catalog.py
+
+    Created 19 October 2026
+
+    Persistent catalogue of the data products in a directory, stored as an SQLite database alongside them and updated
+    incrementally, so that the product type, IDs and data files of each product can be looked up without parsing its
+    XML.
+"""
+
+__updated__ = "2026-10-19"
+
+# Copyright (C) 2012-2020 Euclid Science Ground Segment
+#
+# This library is free software; you can redistribute it and/or modify it under the terms of the GNU Lesser General
+# Public License as published by the Free Software Foundation; either version 3.0 of the License, or (at your option)
+# any later version.
+#
+# This library is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY; without even the implied
+# warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU Lesser General Public License for more
+# details.
+#
+# You should have received a copy of the GNU Lesser General Public License along with this library; if not, write to
+# the Free Software Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA
+
+from collections import namedtuple
+import multiprocessing
+import os
+import sqlite3
+
+from SHE_PPT.file_io import read_xml_product
+from SHE_PPT.logging import getLogger
+from SHE_PPT.mdb import Mdb
+from SHE_PPT.utility import get_nested_attr
+
+CATALOG_FILENAME = ".she_product_catalog.sqlite"
+
+# Version of the database schema, which is rebuilt from scratch if it doesn't match
+SCHEMA_VERSION = 1
+
+# Product types recorded for files which aren't data products
+MDB_PRODUCT_TYPE = "MDB"
+UNREADABLE_PRODUCT_TYPE = "unreadable"
+
+# Attributes giving the observation IDs, pointing IDs and tile index of a product, in the order they're tried, and
+# whether each is a list
+OBS_ID_ATTRS = (("Data.ObservationIdList", True),
+                ("Data.ObservationId", False),
+                ("Data.ObservationSequence.ObservationId", False),)
+POINTING_ID_ATTRS = (("Data.PointingIdList", True),
+                     ("Data.PointingId", False),
+                     ("Data.ObservationSequence.PointingId", False),
+                     ("Data.EuclidPointingId", False),)
+TILE_INDEX_ATTR = "Data.TileIndex"
+
+# Attributes of a product recorded in the catalogue. filename is relative to the catalogue's directory, and
+# product_type is the name of the product's class
+ProductRecord = namedtuple("ProductRecord", ["filename",
+                                             "mtime",
+                                             "size",
+                                             "product_type",
+                                             "obs_ids",
+                                             "pointing_ids",
+                                             "tile_index",
+                                             "data_filenames"])
+
+_SCHEMA = ("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)",
+           "CREATE TABLE IF NOT EXISTS products (filename TEXT PRIMARY KEY, mtime REAL, size INTEGER, "
+           "product_type TEXT, tile_index INTEGER)",
+           "CREATE TABLE IF NOT EXISTS observations (filename TEXT, obs_id INTEGER)",
+           "CREATE TABLE IF NOT EXISTS pointings (filename TEXT, pointing_id INTEGER)",
+           "CREATE TABLE IF NOT EXISTS data_files (filename TEXT, data_filename TEXT)",
+           "CREATE INDEX IF NOT EXISTS observations_filename ON observations (filename)",
+           "CREATE INDEX IF NOT EXISTS observations_obs_id ON observations (obs_id)",
+           "CREATE INDEX IF NOT EXISTS pointings_filename ON pointings (filename)",
+           "CREATE INDEX IF NOT EXISTS data_files_filename ON data_files (filename)",
+           "CREATE INDEX IF NOT EXISTS products_type ON products (product_type)",)
+
+_ID_TABLES = (("observations", "obs_id"), ("pointings", "pointing_id"), ("data_files", "data_filename"))
+
+logger = getLogger(__name__)
+
+
+def _get_first_attr(product, attrs):
+    """ Gets the IDs from the first of a list of attributes the product has, as a tuple.
+    """
+    for attr, is_list in attrs:
+        try:
+            value = get_nested_attr(product, attr)
+        except AttributeError:
+            continue
+        if value is None:
+            continue
+        if is_list:
+            return tuple(value)
+        return (value,)
+    return ()
+
+
+def read_product_record(directory, filename):
+    """ Reads a product and extracts the attributes recorded in the catalogue. Files which can't be read as
+        products are checked for being MDB files, and otherwise recorded as unreadable.
+
+    @rtype: ProductRecord
+    """
+
+    qualified_filename = os.path.join(directory, filename)
+    stat = os.stat(qualified_filename)
+
+    try:
+        product = read_xml_product(qualified_filename)
+    except Exception:
+        try:
+            Mdb(qualified_filename)
+            product_type = MDB_PRODUCT_TYPE
+        except Exception:
+            product_type = UNREADABLE_PRODUCT_TYPE
+        return ProductRecord(filename, stat.st_mtime, stat.st_size, product_type, (), (), None, ())
+
+    try:
+        tile_index = get_nested_attr(product, TILE_INDEX_ATTR)
+    except AttributeError:
+        tile_index = None
+
+    try:
+        data_filenames = tuple(data_filename for data_filename in product.get_all_filenames()
+                               if not (data_filename is None or data_filename in ("", "None", "data/None")))
+    except Exception:
+        data_filenames = ()
+
+    return ProductRecord(filename, stat.st_mtime, stat.st_size, type(product).__name__,
+                         _get_first_attr(product, OBS_ID_ATTRS), _get_first_attr(product, POINTING_ID_ATTRS),
+                         tile_index, data_filenames)
+
+
+def _read_product_record_mapped(args):
+    return read_product_record(*args)
+
+
+class ProductCatalog(object):
+    """ Catalogue of the XML files in a directory, stored in an SQLite database in that directory. Each file's
+        record is keyed by its filename, modification time and size, so that an update only parses files which are
+        new or have changed since the last.
+    """
+
+    def __init__(self, directory, catalog_filename=CATALOG_FILENAME):
+
+        self.directory = directory
+        self.qualified_catalog_filename = os.path.join(directory, catalog_filename)
+
+        self._connection = sqlite3.connect(self.qualified_catalog_filename)
+        self._check_schema()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_exc_info):
+        self.close()
+
+    def close(self):
+        self._connection.close()
+
+    def _check_schema(self):
+        with self._connection:
+            self._connection.execute(_SCHEMA[0])
+            row = self._connection.execute("SELECT value FROM meta WHERE key = 'schema_version'").fetchone()
+            if row is not None and int(row[0]) != SCHEMA_VERSION:
+                logger.info("Rebuilding product catalogue %s with a new schema.", self.qualified_catalog_filename)
+                for table in ("products",) + tuple(table for table, _ in _ID_TABLES):
+                    self._connection.execute(f"DROP TABLE IF EXISTS {table}")
+            for statement in _SCHEMA[1:]:
+                self._connection.execute(statement)
+            self._connection.execute("INSERT OR REPLACE INTO meta VALUES ('schema_version', ?)",
+                                     (str(SCHEMA_VERSION),))
+
+    def _delete_records(self, filenames):
+        for filename in filenames:
+            self._connection.execute("DELETE FROM products WHERE filename = ?", (filename,))
+            for table, _ in _ID_TABLES:
+                self._connection.execute(f"DELETE FROM {table} WHERE filename = ?", (filename,))
+
+    def _insert_record(self, record):
+        self._connection.execute("INSERT INTO products VALUES (?, ?, ?, ?, ?)",
+                                 (record.filename, record.mtime, record.size, record.product_type,
+                                  record.tile_index))
+        for (table, _), values in zip(_ID_TABLES, (record.obs_ids, record.pointing_ids, record.data_filenames)):
+            self._connection.executemany(f"INSERT INTO {table} VALUES (?, ?)",
+                                         [(record.filename, value) for value in values])
+
+    def update(self, number_processes=1):
+        """ Brings the catalogue up to date with the XML files in the directory, parsing only new and changed files
+            (in a process pool if number_processes > 1) and removing the records of files which no longer exist.
+
+        @return: Number of files parsed, and number of records removed
+        @rtype:  tuple(int, int)
+        """
+
+        current_files = {}
+        with os.scandir(self.directory) as entries:
+            for entry in entries:
+                if entry.name.endswith(".xml") and entry.is_file():
+                    stat = entry.stat()
+                    current_files[entry.name] = (stat.st_mtime, stat.st_size)
+
+        catalogued_files = {filename: (mtime, size) for filename, mtime, size in
+                            self._connection.execute("SELECT filename, mtime, size FROM products")}
+
+        filenames_to_parse = sorted(filename for filename, stat in current_files.items()
+                                    if catalogued_files.get(filename) != stat)
+        filenames_to_remove = [filename for filename in catalogued_files if filename not in current_files]
+
+        task_args = [(self.directory, filename) for filename in filenames_to_parse]
+        if number_processes > 1 and len(task_args) > 1:
+            chunksize = max(1, len(task_args) // (4 * number_processes))
+            with multiprocessing.Pool(number_processes) as pool:
+                records = pool.map(_read_product_record_mapped, task_args, chunksize=chunksize)
+        else:
+            records = [_read_product_record_mapped(args) for args in task_args]
+
+        with self._connection:
+            self._delete_records(filenames_to_parse + filenames_to_remove)
+            for record in records:
+                self._insert_record(record)
+
+        logger.info("Updated product catalogue %s: parsed %s new or changed files, removed %s records.",
+                    self.qualified_catalog_filename, len(filenames_to_parse), len(filenames_to_remove))
+
+        return len(filenames_to_parse), len(filenames_to_remove)
+
+    def _get_ids(self, table, column, filename):
+        return tuple(value for (value,) in
+                     self._connection.execute(f"SELECT {column} FROM {table} WHERE filename = ? ORDER BY rowid",
+                                              (filename,)))
+
+    def _make_record(self, row):
+        filename, mtime, size, product_type, tile_index = row
+        return ProductRecord(filename, mtime, size, product_type,
+                             *(self._get_ids(table, column, filename) for table, column in _ID_TABLES[:2]),
+                             tile_index, self._get_ids(*_ID_TABLES[2], filename))
+
+    def get_records(self, product_type=None, obs_id=None, tile_index=None):
+        """ Gets the records of the catalogued files, optionally only those of a product type (the name of its
+            class), for an observation ID, or for a tile, in order of filename.
+
+        @rtype: list<ProductRecord>
+        """
+
+        query = "SELECT filename, mtime, size, product_type, tile_index FROM products"
+        conditions = []
+        parameters = []
+        if product_type is not None:
+            conditions.append("product_type = ?")
+            parameters.append(product_type)
+        if obs_id is not None:
+            conditions.append("filename IN (SELECT filename FROM observations WHERE obs_id = ?)")
+            parameters.append(obs_id)
+        if tile_index is not None:
+            conditions.append("tile_index = ?")
+            parameters.append(tile_index)
+        if conditions:
+            query += " WHERE " + " AND ".join(conditions)
+        query += " ORDER BY filename"
+
+        return [self._make_record(row) for row in self._connection.execute(query, parameters).fetchall()]
+
+    def get_record(self, filename):
+        """ Gets the record of a file, if it's catalogued and hasn't changed since.
+
+        @return: The record, or None if it's not catalogued or out of date
+        @rtype:  ProductRecord
+        """
+
+        row = self._connection.execute("SELECT filename, mtime, size, product_type, tile_index FROM products "
+                                       "WHERE filename = ?", (filename,)).fetchone()
+        if row is None:
+            return None
+
+        try:
+            stat = os.stat(os.path.join(self.directory, filename))
+        except OSError:
+            return None
+        if (stat.st_mtime, stat.st_size) != (row[1], row[2]):
+            return None
+
+        return self._make_record(row)
+
+
+def get_catalogued_data_filenames(qualified_filename):
+    """ Gets the data files of a product from the catalogue of its directory, if there is one and its record of the
+        product is up to date, without parsing the product.
+
+    @return: The product's data filenames, or None if they aren't catalogued
+    @rtype:  list<str>
+    """
+
+    directory, filename = os.path.split(os.path.realpath(qualified_filename))
+    if not os.path.exists(os.path.join(directory, CATALOG_FILENAME)):
+        return None
+
+    try:
+        with ProductCatalog(directory) as catalog:
+            record = catalog.get_record(filename)
+    except sqlite3.Error as e:
+        logger.warning("Can't read product catalogue in %s: %s", directory, e)
+        return None
+
+    if record is None or record.product_type in (MDB_PRODUCT_TYPE, UNREADABLE_PRODUCT_TYPE):
+        return None
+
+    return list(record.data_filenames)
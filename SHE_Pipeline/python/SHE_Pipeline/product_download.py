@@ -0,0 +1,308 @@
+""" @file product_download.py
+
+    Created 19 October 2026
+
+    Concurrent, resumable download of data files from the DSS (or any HTTP(S) server), with persistent connections
+    per worker thread, HTTP Range resumption of partial files, size and checksum validation, and skipping of files
+    already present.
+"""
+
+__updated__ = "2026-10-19"
+
+# Copyright (C) 2012-2020 Euclid Science Ground Segment
+#
+# This library is free software; you can redistribute it and/or modify it under the terms of the GNU Lesser General
+# Public License as published by the Free Software Foundation; either version 3.0 of the License, or (at your option)
+# any later version.
+#
+# This library is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY; without even the implied
+# warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU Lesser General Public License for more
+# details.
+#
+# You should have received a copy of the GNU Lesser General Public License along with this library; if not, write to
+# the Free Software Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA
+
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+import base64
+import hashlib
+import http.client
+import os
+import threading
+import time
+
+from SHE_PPT.logging import getLogger
+
+DEFAULT_DOWNLOAD_THREADS = 8
+DEFAULT_MAX_RETRIES = 3
+DEFAULT_RETRY_BACKOFF = 2.
+
+CHUNK_SIZE = 1024 ** 2
+
+PARTIAL_SUFFIX = ".part"
+
+# A file to download: its path on the server, the local filename to write it to, and optionally its expected size
+# in bytes and checksum (as (algorithm, hex digest), e.g. ("md5", "d41d8cd9...")) to validate it against
+download_task_tuple = namedtuple("download_task_tuple", "path filename size checksum")
+
+# The outcome of downloading a file: "downloaded", "resumed", "skipped" (already present), or "failed"
+download_result_tuple = namedtuple("download_result_tuple", "task status bytes_transferred error")
+
+logger = getLogger(__name__)
+
+
+class DownloadError(Exception):
+    """ A download which failed in a way that retrying won't fix (e.g. the file doesn't exist).
+    """
+
+
+class AuthenticationError(DownloadError):
+    """ A download refused because the credentials supplied were wrong.
+    """
+
+
+def get_basic_auth_headers(username=None, password=None):
+    if not (username and password):
+        return {}
+    credentials = base64.b64encode(f"{username}:{password}".encode("utf-8")).decode("utf-8")
+    return {"Authorization": f"Basic {credentials}"}
+
+
+def get_file_checksum(filename, algorithm):
+    hasher = hashlib.new(algorithm)
+    with open(filename, "rb") as fi:
+        for chunk in iter(lambda: fi.read(CHUNK_SIZE), b""):
+            hasher.update(chunk)
+    return hasher.hexdigest()
+
+
+def is_file_valid(filename, size=None, checksum=None):
+    """ Checks whether a local file exists and matches its expected size and checksum, where known.
+    """
+
+    if not os.path.isfile(filename):
+        return False
+    if size is not None and os.path.getsize(filename) != size:
+        return False
+    if checksum is not None:
+        algorithm, expected_digest = checksum
+        if get_file_checksum(filename, algorithm) != expected_digest.lower():
+            return False
+    return True
+
+
+def _get_total_size(response, offset):
+    """ Gets the total size of a file from the headers of a response to a (possibly ranged) request for it, or None
+        if it isn't given.
+    """
+
+    content_range = response.getheader("Content-Range")
+    if content_range is not None and "/" in content_range:
+        total = content_range.rsplit("/", 1)[1].strip()
+        if total != "*":
+            return int(total)
+
+    content_length = response.getheader("Content-Length")
+    if content_length is not None:
+        return int(content_length) + offset
+
+    return None
+
+
+class DownloadEngine(object):
+    """ Downloads files from a server in a bounded pool of threads. Each thread keeps its own connection open for
+        all the files it downloads (HTTP keep-alive), re-opening it if the server closes it.
+
+        Each file is written to a partial file next to its destination, which is renamed into place once it's
+        complete and valid. If a download is interrupted, the next attempt (in this run or a later one) resumes from
+        the end of the partial file with an HTTP Range request.
+    """
+
+    def __init__(self, host, port=None, use_https=True, ssl_context=None, headers=None,
+                 number_threads=DEFAULT_DOWNLOAD_THREADS, max_retries=DEFAULT_MAX_RETRIES,
+                 retry_backoff=DEFAULT_RETRY_BACKOFF, timeout=60.):
+
+        self.host = host
+        self.port = port
+        self.use_https = use_https
+        self.ssl_context = ssl_context
+        self.headers = dict(headers or {})
+        self.number_threads = number_threads
+        self.max_retries = max_retries
+        self.retry_backoff = retry_backoff
+        self.timeout = timeout
+
+        self._local = threading.local()
+        self._connections = []
+        self._connections_lock = threading.Lock()
+
+    def _get_connection(self):
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            if self.use_https:
+                connection = http.client.HTTPSConnection(self.host, self.port, timeout=self.timeout,
+                                                         context=self.ssl_context)
+            else:
+                connection = http.client.HTTPConnection(self.host, self.port, timeout=self.timeout)
+            self._local.connection = connection
+            with self._connections_lock:
+                self._connections.append(connection)
+        return connection
+
+    def _close_connection(self):
+        connection = getattr(self._local, "connection", None)
+        if connection is not None:
+            connection.close()
+            self._local.connection = None
+
+    def _request(self, path, offset):
+        """ Requests a file, from an offset if resuming, on this thread's connection. If the server has closed the
+            connection since it was last used, it's re-opened once.
+        """
+
+        headers = dict(self.headers)
+        if offset > 0:
+            headers["Range"] = f"bytes={offset}-"
+
+        for attempt in range(2):
+            connection = self._get_connection()
+            try:
+                connection.request("GET", path, headers=headers)
+                return connection.getresponse()
+            except (http.client.RemoteDisconnected, BrokenPipeError, ConnectionResetError):
+                self._close_connection()
+                if attempt == 1:
+                    raise
+
+    def _download_once(self, task):
+        """ Makes one attempt to download a file, resuming any partial file.
+
+        @return: The download's status, and the number of bytes transferred
+        @rtype:  tuple(str, int)
+        """
+
+        partial_filename = task.filename + PARTIAL_SUFFIX
+
+        offset = 0
+        if os.path.isfile(partial_filename):
+            offset = os.path.getsize(partial_filename)
+            if task.size is not None and offset > task.size:
+                os.remove(partial_filename)
+                offset = 0
+
+        response = self._request(task.path, offset)
+
+        if response.status == 416 and offset > 0:
+            # The partial file already covers the whole range (or is invalid), so start again
+            response.read()
+            os.remove(partial_filename)
+            return self._download_once(task)
+        if response.status in (401, 403):
+            response.read()
+            raise AuthenticationError(f"Access to {task.path} refused ({response.status} {response.reason}).")
+        if response.status == 404:
+            response.read()
+            raise DownloadError(f"File {task.path} not found: {response.reason}")
+        if response.status not in (200, 206):
+            response.read()
+            raise IOError(f"File {task.path} can't be downloaded: {response.status} {response.reason}")
+
+        # A full response to a ranged request means the server doesn't support resuming, so start again
+        if response.status == 200:
+            offset = 0
+
+        total_size = _get_total_size(response, offset)
+        if task.size is not None and total_size is not None and total_size != task.size:
+            response.read()
+            raise DownloadError(f"Size of {task.path} on server ({total_size}) doesn't match expected size "
+                                f"({task.size}).")
+
+        bytes_transferred = 0
+        with open(partial_filename, "ab" if offset > 0 else "wb") as fo:
+            for chunk in iter(lambda: response.read(CHUNK_SIZE), b""):
+                fo.write(chunk)
+                bytes_transferred += len(chunk)
+
+        expected_size = task.size if task.size is not None else total_size
+        downloaded_size = offset + bytes_transferred
+        if expected_size is not None and downloaded_size != expected_size:
+            # Keep the partial file to resume from
+            raise IOError(f"Wrong size for file {task.path} - need {expected_size}, got {downloaded_size}.")
+
+        if task.checksum is not None and not is_file_valid(partial_filename, checksum=task.checksum):
+            os.remove(partial_filename)
+            raise IOError(f"Checksum of {task.path} doesn't match expected value.")
+
+        os.replace(partial_filename, task.filename)
+
+        return ("resumed" if offset > 0 else "downloaded"), bytes_transferred
+
+    def download(self, task):
+        """ Downloads a file, unless a valid copy is already present, retrying with backoff on transient errors.
+
+        @rtype: download_result_tuple
+        """
+
+        if is_file_valid(task.filename, task.size, task.checksum):
+            return download_result_tuple(task, "skipped", 0, None)
+
+        os.makedirs(os.path.dirname(os.path.abspath(task.filename)), exist_ok=True)
+
+        for attempt in range(self.max_retries + 1):
+            try:
+                start_time = time.monotonic()
+                status, bytes_transferred = self._download_once(task)
+                duration = time.monotonic() - start_time
+                logger.info("Retrieved %s (%.1f MB at %.1f MB/s).", task.path, bytes_transferred / 1024 ** 2,
+                            bytes_transferred / 1024 ** 2 / max(duration, 1e-6))
+                return download_result_tuple(task, status, bytes_transferred, None)
+            except AuthenticationError:
+                self._close_connection()
+                raise
+            except DownloadError as e:
+                logger.warning(str(e))
+                return download_result_tuple(task, "failed", 0, str(e))
+            except (IOError, http.client.HTTPException) as e:
+                self._close_connection()
+                if attempt == self.max_retries:
+                    logger.warning("Failed to retrieve %s after %s attempts: %s", task.path, attempt + 1, e)
+                    return download_result_tuple(task, "failed", 0, str(e))
+                logger.info("Retrying retrieval of %s after error: %s", task.path, e)
+                time.sleep(self.retry_backoff * 2 ** attempt)
+
+    def close(self):
+        """ Closes the connections opened by all threads.
+        """
+        with self._connections_lock:
+            for connection in self._connections:
+                connection.close()
+            self._connections = []
+        self._local = threading.local()
+
+    def download_all(self, tasks):
+        """ Downloads files in the pool of threads. Tasks with the same local filename are downloaded only once.
+
+        @return: The result of each (unique) task, in order
+        @rtype:  list<download_result_tuple>
+        """
+
+        unique_tasks = list({task.filename: task for task in tasks}.values())
+
+        try:
+            with ThreadPoolExecutor(max_workers=self.number_threads, thread_name_prefix="download") as executor:
+                futures = [executor.submit(self.download, task) for task in unique_tasks]
+                try:
+                    results = [future.result() for future in futures]
+                except AuthenticationError:
+                    for future in futures:
+                        future.cancel()
+                    raise
+        finally:
+            self.close()
+
+        number_by_status = {}
+        for result in results:
+            number_by_status[result.status] = number_by_status.get(result.status, 0) + 1
+        logger.info("Retrieved %s files: %s.", len(results), number_by_status)
+
+        return results
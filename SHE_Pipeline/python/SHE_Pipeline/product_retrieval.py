@@ -0,0 +1,273 @@
+""" @file product_retrieval.py
+
+    Created 19 October 2026
+
+    Batch retrieval of data products from the EAS and their data files from the DSS, for a set of product types and
+    observation or tile IDs at once.
+"""
+
+__updated__ = "2026-10-19"
+
+# Copyright (C) 2012-2020 Euclid Science Ground Segment
+#
+# This library is free software; you can redistribute it and/or modify it under the terms of the GNU Lesser General
+# Public License as published by the Free Software Foundation; either version 3.0 of the License, or (at your option)
+# any later version.
+#
+# This library is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY; without even the implied
+# warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU Lesser General Public License for more
+# details.
+#
+# You should have received a copy of the GNU Lesser General Public License along with this library; if not, write to
+# the Free Software Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA
+
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+import ast
+import hashlib
+import os
+import time
+import urllib.parse
+import urllib.request
+import xml.etree.ElementTree as etree
+
+from SHE_PPT.logging import getLogger
+
+from .product_download import (DEFAULT_DOWNLOAD_THREADS, DownloadEngine, download_task_tuple,
+                               get_basic_auth_headers)
+
+BASE_EAS_URL = "https://eas-dps-cps-ops.esac.esa.int/EuclidXML?class_name="
+BASE_DSS_HOST = "euclid-dss.roe.ac.uk"
+BASE_DSS_PORT = 443
+
+DEFAULT_PROJECT = "TEST"
+DEFAULT_DATASET_RELEASE = "SC8_MAIN_V0"
+DEFAULT_QUERY_THREADS = 4
+DEFAULT_POLL_INTERVAL = 1.
+
+BASE_QUERY = ("Header.ManualValidationStatus.ManualValidationStatus!=\"INVALID\""
+              "&&Header.DataSetRelease={dataset_release}")
+
+# How products of each type are queried: the attribute giving the observation or tile ID they're for, whether that
+# is a tile ID, and any other conditions to query them with
+product_query_tuple = namedtuple("product_query_tuple", "id_attr is_tile extra_query")
+
+PRODUCT_TYPE_QUERIES = {"DpdVisStackedFrame": product_query_tuple("Data.ObservationId", False, ""),
+                        "DpdVisCalibratedFrame": product_query_tuple("Data.ObservationSequence.ObservationId", False,
+                                                                     ""),
+                        "DpdSheValidatedMeasurements": product_query_tuple("Data.ObservationId", False, ""),
+                        "DpdSheLensMcChains": product_query_tuple("Data.ObservationId", False, ""),
+                        "DpdTrueUniverseOutput": product_query_tuple("Data.EuclidPointingId", False,
+                                                                     "Header.PipelineDefinitionId=='SIM-VIS'"),
+                        "DpdMerFinalCatalog": product_query_tuple("Data.TileIndex", True, ""),
+                        "DpdMerSegmentationMap": product_query_tuple("Data.TileIndex", True, ""),
+                        "DpdPhzPfOutputCatalog": product_query_tuple("Data.TileIndex", True, ""), }
+
+# Groups of product types which can be requested by name, as downloaded by the get_all_*_products.sh scripts
+PRODUCT_TYPE_GROUPS = {"vis": ("DpdVisStackedFrame", "DpdVisCalibratedFrame"),
+                       "mer": ("DpdMerFinalCatalog", "DpdMerSegmentationMap"),
+                       "she": ("DpdSheValidatedMeasurements", "DpdSheLensMcChains"),
+                       "phz": ("DpdPhzPfOutputCatalog",),
+                       "sim": ("DpdTrueUniverseOutput",), }
+
+# A metadata query: the product type, the observation or tile ID it's for (None for all), and the query string
+eas_query_tuple = namedtuple("eas_query_tuple", "product_type id query")
+
+logger = getLogger(__name__)
+
+
+class QueryError(Exception):
+    """ A metadata query which the EAS failed to execute.
+    """
+
+
+def get_product_types(names):
+    """ Expands a list of product types and names of groups of them into the unique product types, in order.
+    """
+
+    product_types = []
+    for name in names:
+        if name in PRODUCT_TYPE_GROUPS:
+            new_product_types = PRODUCT_TYPE_GROUPS[name]
+        elif name in PRODUCT_TYPE_QUERIES:
+            new_product_types = (name,)
+        else:
+            raise ValueError(f"Unrecognised product type {name}; allowed values are: "
+                             f"{list(PRODUCT_TYPE_GROUPS) + list(PRODUCT_TYPE_QUERIES)}")
+        product_types += [product_type for product_type in new_product_types if product_type not in product_types]
+    return product_types
+
+
+def get_queries(product_types, obs_ids=None, tile_ids=None, dataset_release=DEFAULT_DATASET_RELEASE):
+    """ Gets the metadata queries for the products of each type for each of the observation or tile IDs (whichever
+        applies to the type), or for all products of a type if no IDs of the applicable kind are given.
+
+    @rtype: list<eas_query_tuple>
+    """
+
+    base_query = BASE_QUERY.format(dataset_release=dataset_release)
+
+    queries = []
+    for product_type in product_types:
+        id_attr, is_tile, extra_query = PRODUCT_TYPE_QUERIES[product_type]
+        type_query = "&&".join(part for part in (base_query, extra_query) if part)
+        ids = sorted(set((tile_ids if is_tile else obs_ids) or ()))
+        if not ids:
+            queries.append(eas_query_tuple(product_type, None, type_query))
+        for id_ in ids:
+            queries.append(eas_query_tuple(product_type, id_, f"{type_query}&&{id_attr}=={id_}"))
+
+    return queries
+
+
+def _read_job_status(url):
+    """ Reads the URL and status of an asynchronous EAS job from the response to a request to the given URL.
+    """
+
+    with urllib.request.urlopen(url) as response:
+        contents = response.read().decode()
+    try:
+        job_status = ast.literal_eval(contents)
+    except (ValueError, SyntaxError):
+        raise QueryError(f"Can't decode EAS response: {contents}")
+    return job_status.get("url", ""), job_status.get("status", "")
+
+
+def split_products(contents):
+    """ Splits the response of the EAS to a query into the XML of each product.
+    """
+
+    xml_declaration = '<?xml version="1.0" encoding="UTF-8"?>\n'
+
+    products = []
+    for product in contents.split("\n\n"):
+        if not product.strip():
+            continue
+        if products and not product.lstrip().startswith("<?xml"):
+            product = xml_declaration + product
+        products.append(product)
+    return products
+
+
+def run_query(query, base_url=BASE_EAS_URL, project=DEFAULT_PROJECT, poll_interval=DEFAULT_POLL_INTERVAL):
+    """ Runs a metadata query as an asynchronous EAS job, and waits for its results.
+
+    @return: The XML of each product found
+    @rtype:  list<str>
+    """
+
+    query_url = (base_url + urllib.parse.quote(query.product_type) + "&" + query.query + "&make_asy=True&PROJECT=" +
+                 urllib.parse.quote(project))
+
+    url, status = _read_job_status(query_url)
+    while status not in ("FINISHED", "ERROR"):
+        time.sleep(poll_interval)
+        url, status = _read_job_status(url)
+
+    with urllib.request.urlopen(url) as response:
+        contents = response.read().decode()
+    if status != "FINISHED":
+        raise QueryError(f"Error executing query for {query.product_type}: {contents}")
+
+    products = split_products(contents)
+    logger.info("Found %s %s products for query %s.", len(products), query.product_type, query.query)
+    return products
+
+
+def get_data_file_tasks(root, datadir="data"):
+    """ Gets a download task for each data file listed in a product, with its size and checksum if these are given
+        alongside its filename.
+
+    @rtype: list<download_task_tuple>
+    """
+
+    tasks = []
+    for container in root.iter():
+        filename_elem = container.find("FileName")
+        if filename_elem is None or not filename_elem.text:
+            continue
+        filename = filename_elem.text.strip()
+
+        size = None
+        size_elem = container.find(".//FileSize")
+        if size_elem is not None and size_elem.text and size_elem.text.strip().isdigit():
+            size = int(size_elem.text.strip())
+
+        checksum = None
+        algorithm_elem = container.find(".//CheckSumAlgo")
+        value_elem = container.find(".//CheckSumValue")
+        if algorithm_elem is not None and value_elem is not None and algorithm_elem.text and value_elem.text:
+            algorithm = algorithm_elem.text.strip().lower().replace("-", "")
+            if algorithm in hashlib.algorithms_available:
+                checksum = (algorithm, value_elem.text.strip())
+
+        tasks.append(download_task_tuple("/" + filename, os.path.join(datadir, filename), size, checksum))
+
+    return tasks
+
+
+def get_product_filename(root):
+    """ Gets the filename a product is saved to, from its type and ID.
+    """
+    product_type = root.find(".//ProductType").text
+    product_id = root.find(".//ProductId").text
+    return product_type[0].upper() + product_type[1:] + "__" + product_id + ".xml"
+
+
+def save_products(products, product_dir=".", datadir="data"):
+    """ Saves each unique product (by filename), and gets the download tasks for all their data files.
+
+    @return: The filenames of the saved products, and the download tasks for their data files
+    @rtype:  tuple(list<str>, list<download_task_tuple>)
+    """
+
+    product_filenames = []
+    tasks = []
+    for product in products:
+        root = etree.XML(product)
+        product_filename = get_product_filename(root)
+        if product_filename in product_filenames:
+            continue
+        with open(os.path.join(product_dir, product_filename), "w") as fo:
+            fo.write(product)
+        product_filenames.append(product_filename)
+        tasks += get_data_file_tasks(root, datadir=os.path.join(product_dir, datadir))
+
+    return product_filenames, tasks
+
+
+def retrieve_products(queries, username=None, password=None, product_dir=".", datadir="data",
+                      base_url=BASE_EAS_URL, project=DEFAULT_PROJECT, dss_host=BASE_DSS_HOST, dss_port=BASE_DSS_PORT,
+                      use_https=True, ssl_context=None, query_threads=DEFAULT_QUERY_THREADS,
+                      download_threads=DEFAULT_DOWNLOAD_THREADS, poll_interval=DEFAULT_POLL_INTERVAL):
+    """ Runs a set of metadata queries concurrently, saves the unique products found, and downloads the unique data
+        files of all of them in a single pool of downloads.
+
+    @return: The filenames of the saved products, the queries which failed, and the result of each download
+    @rtype:  tuple(list<str>, list<eas_query_tuple>, list<download_result_tuple>)
+    """
+
+    def run_query_or_fail(query):
+        try:
+            return run_query(query, base_url=base_url, project=project, poll_interval=poll_interval)
+        except (QueryError, IOError) as e:
+            logger.warning("Query for %s failed: %s", query.product_type, e)
+            return None
+
+    with ThreadPoolExecutor(max_workers=query_threads, thread_name_prefix="query") as executor:
+        query_results = list(executor.map(run_query_or_fail, queries))
+
+    failed_queries = [query for query, result in zip(queries, query_results) if result is None]
+    products = [product for result in query_results if result is not None for product in result]
+
+    product_filenames, tasks = save_products(products, product_dir=product_dir, datadir=datadir)
+    logger.info("Saved %s unique products of %s found, with %s data files.", len(product_filenames), len(products),
+                len(set(task.filename for task in tasks)))
+
+    headers = get_basic_auth_headers(username, password)
+    headers["pragma"] = "DSSGET"
+    engine = DownloadEngine(dss_host, dss_port, use_https=use_https, ssl_context=ssl_context, headers=headers,
+                            number_threads=download_threads)
+    download_results = engine.download_all(tasks)
+
+    return product_filenames, failed_queries, download_results
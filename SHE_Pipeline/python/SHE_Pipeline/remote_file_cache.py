@@ -0,0 +1,183 @@
+""" @file remote_file_cache.py
+
+    Created 19 October 2026
+
+    Persistent cache of remote (WEB/) files, such as the MDB and the data files it points to, shared by all workers
+    and runs on a node, so that each file is fetched only once.
+"""
+
+__updated__ = "2026-10-19"
+
+# Copyright (C) 2012-2020 Euclid Science Ground Segment
+#
+# This library is free software; you can redistribute it and/or modify it under the terms of the GNU Lesser General
+# Public License as published by the Free Software Foundation; either version 3.0 of the License, or (at your option)
+# any later version.
+#
+# This library is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY; without even the implied
+# warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU Lesser General Public License for more
+# details.
+#
+# You should have received a copy of the GNU Lesser General Public License along with this library; if not, write to
+# the Free Software Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA
+
+import os
+import shutil
+import time
+
+from SHE_PPT.file_io import find_file
+from SHE_PPT.logging import getLogger
+
+from . import pipeline_utilities as pu
+
+REMOTE_PREFIX = "WEB/"
+
+# Files used more recently than this (in seconds) aren't evicted, so that a file isn't removed between being found
+# and being linked to by the worker which found it
+EVICTION_GRACE_PERIOD = 3600.
+
+logger = getLogger(__name__)
+
+
+def is_remote_filename(filename):
+    return filename is not None and filename[:len(REMOTE_PREFIX)] == REMOTE_PREFIX
+
+
+class RemoteFileCache(object):
+    """ Cache of remote files in a directory, at the same paths relative to it as they have remotely (so that an
+        MDB's data files are in the "data" directory next to it, as expected). Each file is fetched under a lock, to
+        a temporary file which is renamed into place, so concurrent workers fetch it only once and never see it
+        incomplete. A file's modification time is updated whenever it's used, and once the cache exceeds its maximum
+        size, the least recently used files are evicted.
+
+        In offline mode, files are only served from the cache, and never fetched.
+    """
+
+    def __init__(self, cache_dir, max_size, offline=False, fetch=find_file):
+        """
+        @param fetch: Function which fetches a remote file and returns the qualified filename of a local copy
+        """
+        self.cache_dir = cache_dir
+        self.max_size = max_size
+        self.offline = offline
+        self.fetch = fetch
+
+    def _get_cached_filename(self, filename):
+        return os.path.join(self.cache_dir, os.path.normpath(filename))
+
+    def get(self, filename):
+        """ Gets the qualified filename of the cached copy of a remote file, fetching it if it isn't cached.
+
+        @rtype: str
+        """
+
+        cached_filename = self._get_cached_filename(filename)
+
+        # Fast path, for files already cached
+        try:
+            os.utime(cached_filename)
+            return cached_filename
+        except OSError:
+            pass
+
+        with pu.file_lock(cached_filename):
+
+            # Check again, in case another worker fetched it while we waited for the lock
+            try:
+                os.utime(cached_filename)
+                return cached_filename
+            except OSError:
+                pass
+
+            if self.offline:
+                raise RuntimeError(f"Remote file {filename} is not in the cache at {self.cache_dir}, and can't be " +
+                                   "fetched in offline mode.")
+
+            start_time = time.monotonic()
+            fetched_filename = self.fetch(filename)
+
+            tmp_filename = f"{cached_filename}.{os.getpid()}.tmp"
+            shutil.copyfile(fetched_filename, tmp_filename)
+            os.replace(tmp_filename, cached_filename)
+
+            logger.info("Fetched remote file %s to cache in %.1f s.", filename, time.monotonic() - start_time)
+
+        self.evict()
+
+        return cached_filename
+
+    def _list_files(self):
+        """ Lists the files in the cache, as (time last used, size, qualified filename).
+        """
+
+        files = []
+        for dirpath, _, filenames in os.walk(self.cache_dir):
+            for filename in filenames:
+                if filename.endswith(".tmp") or filename.endswith(pu.LOCK_TAIL):
+                    continue
+                qualified_filename = os.path.join(dirpath, filename)
+                try:
+                    stat = os.stat(qualified_filename)
+                except OSError:
+                    continue
+                files.append((stat.st_mtime, stat.st_size, qualified_filename))
+
+        return files
+
+    def evict(self):
+        """ Removes the least recently used files, other than those used within the grace period, until the cache is
+            within its maximum size.
+
+        @return: Number of files evicted
+        @rtype:  int
+        """
+
+        with pu.file_lock(os.path.join(self.cache_dir, "cache")):
+
+            files = sorted(self._list_files())
+            total_size = sum(size for _, size, _ in files)
+
+            number_evicted = 0
+            for last_used, size, qualified_filename in files:
+                if total_size <= self.max_size or last_used > time.time() - EVICTION_GRACE_PERIOD:
+                    break
+                with pu.file_lock(qualified_filename):
+                    try:
+                        os.remove(qualified_filename)
+                    except OSError:
+                        continue
+                total_size -= size
+                number_evicted += 1
+
+        if number_evicted:
+            logger.debug("Evicted %s files from the remote file cache.", number_evicted)
+        if total_size > self.max_size:
+            logger.warning("Remote file cache at %s is over its maximum size, but all its files are in use.",
+                           self.cache_dir)
+
+        return number_evicted
+
+
+def create_remote_file_cache(args):
+    """ Creates the cache of remote input files requested by the 'remote_file_cache', 'remote_file_cache_size' and
+        'offline' arguments, in a directory relative to the workdir, or returns None if none was requested.
+    """
+    if args.remote_file_cache is None:
+        if args.offline:
+            raise ValueError("'offline' can only be used with 'remote_file_cache'.")
+        return None
+
+    if args.remote_file_cache_size <= 0:
+        raise ValueError("Invalid value passed to 'remote_file_cache_size': Must be positive.")
+    qualified_cache_dir = os.path.join(args.workdir, args.remote_file_cache)
+    os.makedirs(qualified_cache_dir, exist_ok=True)
+    return RemoteFileCache(qualified_cache_dir, int(args.remote_file_cache_size * 1024 ** 3), offline=args.offline)
+
+
+def find_input_file(filename, path=None, remote_file_cache=None):
+    """ Finds the qualified location of an input file, as find_file does, except that remote files are found through
+        the cache if one is given.
+    """
+    if remote_file_cache is not None and is_remote_filename(filename):
+        return remote_file_cache.get(filename)
+    return find_file(filename, path=path)
@@ -5,7 +5,7 @@
     Main executable for running bias pipeline in parallel
 """
 
-__updated__ = "2021-08-18"
+__updated__ = "2026-10-19"
 
 # Copyright (C) 2012-2020 Euclid Science Ground Segment
 #
@@ -20,12 +20,14 @@ __updated__ = "2021-08-18"
 # You should have received a copy of the GNU Lesser General Public License along with this library; if not, write to
 # the Free Software Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA
 
+import json
 import math
-import multiprocessing
 import os
+import socket
+import time
 from collections import namedtuple
-from pickle import UnpicklingError
-from xml.sax import SAXParseException
+from contextlib import contextmanager
+from datetime import datetime
 
 import SHE_CTE_BiasMeasurement.MeasureBias as meas_bias
 import SHE_CTE_BiasMeasurement.MeasureStatistics as meas_stats
@@ -42,12 +44,29 @@ from SHE_GST_GalaxyImageGeneration.generate_images import generate_images
 from SHE_GST_GalaxyImageGeneration.run_from_config import run_from_args
 from SHE_PPT.file_io import (find_file, get_allowed_filename, read_listfile, read_xml_product, write_listfile)
 from SHE_PPT.logging import getLogger
-from SHE_PPT.mdb import Mdb, mdb_keys
 from SHE_PPT.pipeline_utility import CalibrationConfigKeys
 from . import pipeline_utilities as pu, run_pipeline as rp
+from .bias_accumulator import BiasAccumulatorStore, read_bias_statistics_listfile_accumulators
 from .constants import ERun_CTE, ERun_GST
+from .intermediate_storage import (INTERMEDIATE_STORAGE_MODES, MEMORY_WORKDIR_PREFIX, check_memory_root,
+                                   get_memory_workdir_prefix, memory_workdir, move_product_to_workdir,
+                                   remove_memory_workdirs, )
+from .io_throttle import get_io_limits, read_io_limits, throttled_stage
+from .memory_profiles import (MEMORY_PROFILE_REPORT_FILENAME, applied_environment, finish_resource_measurement,
+                              get_memory_profiles, get_profile_environment, start_resource_measurement,
+                              summarise_stage_resources, )
 from .pipeline_info import pipeline_info_dict
 from .pipeline_utilities import get_relpath
+from .remote_file_cache import create_remote_file_cache, find_input_file
+from .shared_inputs import find_data_file, get_data_search_path, get_input_data_filenames
+from .shear_estimate_cache import ShearEstimateCache, estimate_shear_with_cache
+from .simulation_cost_model import SimulationCostModel, get_plan_row_config, get_plan_row_size
+from .simulation_executors import (EXECUTOR_BACKENDS, create_executor, get_mpi_comm, get_native_thread_config,
+                                   is_mpi_master, run_mpi_worker, )
+from .simulation_scheduler import (AdaptiveStopping, PartialTaskError, RetryPolicy, SimulationScheduler,
+                                   SimulationStageError, SimulationTask, StageTimeouts, WalltimeGuard,
+                                   install_drain_signal_handlers, report_stage, restore_signal_handlers, )
+from .worker_placement import PLACEMENT_MODES, get_placement_report
 
 MSG_EXEC_FINISHED_SUCCESS = "Finished command execution successfully."
 
@@ -59,6 +78,16 @@ default_cluster_workdir = "/workspace/lodeen/workdir"
 
 non_filename_args = ("workdir", "logdir", "pkgRepository", "pipelineDir")
 
+# Stages run for each simulation, each of which logs to she_<stage>.out
+simulation_stages = ("simulate_images", "estimate_shear", "measure_statistics", "cleanup_bias_measurement")
+
+plan_row_tuple = namedtuple("PlanRow", "row_index model_seed noise_seed")
+
+unfinished_simulations_filename = "unfinished_simulations.json"
+default_timing_records_filename = "simulation_timings.json"
+failure_manifest_filename = "failure_manifest.json"
+run_metadata_filename = "run_metadata.json"
+
 logger = getLogger(__name__)
 
 
@@ -363,18 +392,183 @@ def check_args(args):
         logger.info('No logdir supplied at command-line. Using default logdir: ' + args.logdir)
     qualified_logdir = os.path.join(args.workdir, args.logdir)
 
+    available_cpus = pu.get_available_cpu_count()
+
+    if args.threads_per_process is not None and args.threads_per_process < 1:
+        raise ValueError("Invalid value passed to 'threads_per_process': Must be positive.")
+
     if args.number_threads == 0:
-        args.number_threads = str(max((multiprocessing.cpu_count() - 1, 1)))
+        if args.threads_per_process is None:
+            args.number_threads = str(max((available_cpus - 1, 1)))
+        else:
+            args.number_threads = str(max(((available_cpus - 1) // args.threads_per_process, 1)))
     if not args.number_threads.isdigit():
         raise ValueError("Invalid values passed to 'number-threads': Must be an integer.")
 
-    args.number_threads = max(1, min(int(args.number_threads), multiprocessing.cpu_count()))
+    args.number_threads = max(1, min(int(args.number_threads), available_cpus))
+
+    # Check the executor, and set the number of threads to its number of workers if this is fixed
+    if args.executor not in EXECUTOR_BACKENDS:
+        raise ValueError(f"Invalid value passed to 'executor': Must be one of {EXECUTOR_BACKENDS}.")
+    if args.executor == "mpi":
+        args.number_threads = max(1, get_mpi_comm().Get_size() - 1)
+    elif args.executor == "serial":
+        args.number_threads = 1
+
+    if args.worker_placement not in PLACEMENT_MODES:
+        raise ValueError(f"Invalid value passed to 'worker_placement': Must be one of {PLACEMENT_MODES}.")
+
+    # Check that intermediate products can be held in memory, and fall back to disk if not
+    if args.intermediate_storage not in INTERMEDIATE_STORAGE_MODES:
+        raise ValueError(f"Invalid value passed to 'intermediate_storage': Must be one of "
+                         f"{INTERMEDIATE_STORAGE_MODES}.")
+    if args.intermediate_storage == "memory" and not check_memory_root(args.memory_root):
+        logger.warning("Intermediate products can't be held in memory in %s, so will be written to disk.",
+                       args.memory_root)
+        args.intermediate_storage = "disk"
+    args.memory_workdir_prefix = get_memory_workdir_prefix()
+
+    # Get the limits on I/O-heavy stages, from the site's file overridden by any given on the command line
+    if args.stage_concurrency is None:
+        args.stage_concurrency = []
+    if not len(args.stage_concurrency) % 2 == 0:
+        raise ValueError("Invalid values passed to 'stage_concurrency': Must be a set of paired arguments.")
+    stage_concurrency = {}
+    for i in range(len(args.stage_concurrency) // 2):
+        stage = args.stage_concurrency[2 * i]
+        if stage not in simulation_stages:
+            raise ValueError(f"Stage \"{stage}\" in 'stage_concurrency' not recognized. Allowed stages are: " +
+                             str(simulation_stages))
+        try:
+            stage_concurrency[stage] = int(args.stage_concurrency[2 * i + 1])
+        except ValueError:
+            raise ValueError(f"Invalid limit for stage \"{stage}\" in 'stage_concurrency': Must be an integer.")
+    site_io_limits = None
+    if args.io_limits is not None:
+        site_io_limits = read_io_limits(find_file(args.io_limits, path=args.workdir))
+    args.io_throttle_limits = get_io_limits(stage_concurrency=stage_concurrency,
+                                            bandwidth_mb_per_s=args.io_bandwidth, base_limits=site_io_limits)
+    if args.io_throttle_limits is not None and args.executor == "mpi":
+        raise ValueError("I/O limits can't be used with the mpi executor.")
+
+    # Set up the shear estimate cache, which is shared by all workers (and must be visible to all of them)
+    if args.shear_estimate_cache is not None:
+        if args.shear_estimate_cache_size <= 0:
+            raise ValueError("Invalid value passed to 'shear_estimate_cache_size': Must be positive.")
+        qualified_cache_dir = os.path.join(args.workdir, args.shear_estimate_cache)
+        os.makedirs(qualified_cache_dir, exist_ok=True)
+        args.shear_estimate_cache_store = ShearEstimateCache(qualified_cache_dir,
+                                                             int(args.shear_estimate_cache_size * 1024 ** 3))
+    else:
+        args.shear_estimate_cache_store = None
+
+    # Set up the cache of remote input files, which should be on storage local to the node
+    args.remote_file_cache_store = create_remote_file_cache(args)
+
+    # Check the memory profiles, and get their definitions. Simulations are shared between the profiles, or all run
+    # with the workers' environment unchanged (None) if there are none
+    if args.memory_profiles:
+        if args.executor in ("mpi", "serial"):
+            raise ValueError(f"Memory profiles can't be used with the {args.executor} executor.")
+        args.memory_profile_definitions = get_memory_profiles(args.memory_profiles, args.memory_profiles_file)
+    else:
+        args.memory_profile_definitions = [None]
+
+    # Share the available CPUs between the worker processes' native threads, unless set explicitly
+    if args.threads_per_process is None:
+        args.threads_per_process = max(1, available_cpus // args.number_threads)
+    elif args.executor != "mpi" and args.number_threads * args.threads_per_process > available_cpus:
+        logger.warning("%s processes with %s threads each will oversubscribe the %s available CPUs.",
+                       args.number_threads, args.threads_per_process, available_cpus)
 
     if args.est_shear_only:
         if not args.est_shear_only.isdigit() and int(args.est_shear_only) not in (0, 1):
             raise ValueError("Invalid value passes to est_shear_only must be 0,1")
         args.est_shear_only = int(args.est_shear_only) == 1
 
+    # Check the bias accumulator arguments are consistent
+    if args.bias_accumulator is not None:
+        if args.est_shear_only:
+            raise ValueError("bias_accumulator can't be used when the pipeline is curtailed with est_shear_only.")
+        if args.accumulator_tag is None:
+            raise ValueError("accumulator_tag must be supplied when bias_accumulator is used.")
+        if args.accumulator_batch_id is None:
+            args.accumulator_batch_id = os.path.basename(os.path.normpath(args.workdir))
+
+    # Check the adaptive stopping arguments are consistent
+    if args.target_m_precision is not None:
+        if args.est_shear_only:
+            raise ValueError("target_m_precision can't be used when the pipeline is curtailed with est_shear_only.")
+        if not args.target_m_precision > 0:
+            raise ValueError("Invalid value passed to 'target_m_precision': Must be positive.")
+        if args.target_c_precision is not None and not args.target_c_precision > 0:
+            raise ValueError("Invalid value passed to 'target_c_precision': Must be positive.")
+        if args.precision_check_interval is None:
+            args.precision_check_interval = args.number_threads
+    elif args.target_c_precision is not None or args.prioritise_bins:
+        raise ValueError("target_c_precision and prioritise_bins can only be used along with target_m_precision.")
+
+    # Check the failure handling arguments
+    if args.max_retries < 0:
+        raise ValueError("Invalid value passed to 'max_retries': Must be non-negative.")
+    if args.retry_backoff < 0:
+        raise ValueError("Invalid value passed to 'retry_backoff': Must be non-negative.")
+    if args.max_failures is not None and args.max_failures < 0:
+        raise ValueError("Invalid value passed to 'max_failures': Must be non-negative.")
+
+    # Check the task granularity
+    if args.seeds_per_task < 1:
+        raise ValueError("Invalid value passed to 'seeds_per_task': Must be positive.")
+
+    # Check the stage timeouts, and convert them to dicts of stage: seconds
+    for timeouts_arg in ("soft_timeouts", "hard_timeouts"):
+        timeouts = getattr(args, timeouts_arg)
+        if timeouts is None:
+            timeouts = []
+        if not len(timeouts) % 2 == 0:
+            raise ValueError(f"Invalid values passed to '{timeouts_arg}': Must be a set of paired arguments.")
+        timeouts_dict = {}
+        for i in range(len(timeouts) // 2):
+            stage = timeouts[2 * i]
+            if stage not in simulation_stages + ("default",):
+                raise ValueError(f"Stage \"{stage}\" in '{timeouts_arg}' not recognized. Allowed stages are: " +
+                                 ", ".join(simulation_stages + ("default",)))
+            try:
+                timeouts_dict[stage] = float(timeouts[2 * i + 1])
+            except ValueError:
+                raise ValueError(f"Invalid timeout for stage \"{stage}\" in '{timeouts_arg}': Must be a number.")
+        setattr(args, timeouts_arg, timeouts_dict)
+
+    # Use the default timing records file if necessary. This is only seen by reruns in the same workdir, so batches
+    # which should learn from each other's timings need to be given a shared file
+    if args.timing_records is None:
+        args.timing_records = os.path.join(args.workdir, default_timing_records_filename)
+        if args.task_ordering == "longest_first":
+            logger.info("No --timing_records file given, so simulation timings will only be shared with reruns in "
+                        "this workdir.")
+
+    # Determine the deadline, if any, as seconds since the epoch
+    if args.walltime is not None and args.deadline is not None:
+        raise ValueError("Only one of walltime and deadline may be supplied.")
+    args.deadline_time = None
+    if args.walltime is not None:
+        args.deadline_time = time.time() + pu.parse_walltime(args.walltime)
+    elif args.deadline is not None:
+        try:
+            args.deadline_time = float(args.deadline)
+        except ValueError:
+            try:
+                args.deadline_time = datetime.fromisoformat(args.deadline).timestamp()
+            except ValueError:
+                raise ValueError("Invalid value passed to 'deadline': Must be an ISO 8601 datetime or seconds " +
+                                 "since the epoch.")
+    if args.deadline_time is not None:
+        if args.deadline_reserve < 0:
+            raise ValueError("Invalid value passed to 'deadline_reserve': Must be non-negative.")
+        logger.info("Simulations will only be scheduled if expected to complete by %s, with %ss reserved.",
+                    datetime.fromtimestamp(args.deadline_time).isoformat(timespec="seconds"),
+                    args.deadline_reserve)
+
     # Create the base workdir
     if not os.path.exists(args.workdir):
         # Can we create it?
@@ -484,6 +678,111 @@ def create_batches(args, sim_config_list):
     return batch_list, workdir_list
 
 
+def get_simulation_groups(sim_plan_table, number_simulations):
+    """ Determines which row of the simulation plan each simulation was generated from, so that simulations
+        with the same properties can be grouped together when scheduling. If the simulations can't be matched to
+        rows of the plan, all are put in a single group.
+
+    @return: Group for each simulation number
+    @rtype:  list(int)
+    """
+
+    plan_rows = get_simulation_plan_rows(sim_plan_table, number_simulations)
+
+    if plan_rows is None:
+        logger.debug("Cannot match simulations to rows of the simulation plan; using a single group.")
+        return [0] * number_simulations
+
+    return [plan_row.row_index for plan_row in plan_rows]
+
+
+def get_simulation_sizes(sim_plan_table, number_simulations):
+    """ Determines the relative size of each simulation from the row of the simulation plan it was generated from,
+        for use by the cost model. If the simulations can't be matched to rows of the plan, all are given the same
+        size.
+
+    @return: Size of each simulation
+    @rtype:  list(float)
+    """
+
+    plan_rows = get_simulation_plan_rows(sim_plan_table, number_simulations)
+
+    if plan_rows is None:
+        return [1.] * number_simulations
+
+    row_sizes = [get_plan_row_size(row) for row in sim_plan_table]
+
+    return [row_sizes[plan_row.row_index] for plan_row in plan_rows]
+
+
+def get_simulation_cost_configs(sim_plan_table, number_simulations):
+    """ Determines the configuration of each simulation from the row of the simulation plan it was generated from,
+        for use by the cost model. If the simulations can't be matched to rows of the plan, none are given one.
+
+    @return: Configuration key of each simulation
+    @rtype:  list(str)
+    """
+
+    plan_rows = get_simulation_plan_rows(sim_plan_table, number_simulations)
+
+    if plan_rows is None:
+        return [None] * number_simulations
+
+    row_configs = [get_plan_row_config(row) for row in sim_plan_table]
+
+    return [row_configs[plan_row.row_index] for plan_row in plan_rows]
+
+
+def _get_seed_range(row, prefix):
+    step = int(row[prefix + "_STEP"]) if prefix + "_STEP" in row.colnames else 1
+    return list(range(int(row[prefix + "_MIN"]), int(row[prefix + "_MAX"]) + 1, max(step, 1)))
+
+
+def get_simulation_plan_rows(sim_plan_table, number_simulations):
+    """ Determines the row of the simulation plan and the model and noise seeds of each simulation. Each row is
+        expected to generate simulations in order, either pairing its model and noise seeds (if there are the same
+        number of each), or for every combination of them, with model seeds varying slowest.
+
+    @return: (row index, model seed, noise seed) for each simulation number, or None if they can't be matched to
+             the plan
+    @rtype:  list(namedtuple) or None
+    """
+
+    try:
+        seed_ranges = []
+        for row in sim_plan_table:
+            model_seeds = _get_seed_range(row, "MSEED")
+            noise_seeds = _get_seed_range(row, "NSEED") if "NSEED_MIN" in row.colnames else [None]
+            seed_ranges.append((model_seeds, noise_seeds))
+    except (KeyError, ValueError, TypeError, AttributeError):
+        return None
+
+    # Try pairing the seeds first, then all combinations of them
+    for pair_seeds in (True, False):
+
+        plan_rows = []
+        for row_index, (model_seeds, noise_seeds) in enumerate(seed_ranges):
+            if pair_seeds:
+                if len(noise_seeds) == len(model_seeds):
+                    seed_pairs = zip(model_seeds, noise_seeds)
+                else:
+                    seed_pairs = [(model_seed, None) for model_seed in model_seeds]
+            else:
+                seed_pairs = [(model_seed, noise_seed) for model_seed in model_seeds for noise_seed in noise_seeds]
+            plan_rows += [plan_row_tuple(row_index, model_seed, noise_seed) for model_seed, noise_seed in seed_pairs]
+
+        if len(plan_rows) == number_simulations:
+            return plan_rows
+
+    return None
+
+
+def get_bias_statistics_filename(simulation_number):
+    """ Gets the filename, relative to its thread's workdir, of the bias statistics output by a simulation.
+    """
+    return os.path.join('data', 'shear_bias_measurements_sim%s.xml' % simulation_number)
+
+
 def get_sim_number(thread_number, batch):
     """ Returns simulation number calculated from thread_number and batch tuple
     @return: simulation_number
@@ -571,7 +870,8 @@ def create_simulate_measure_inputs(args, config_filename, workdir, sim_config_li
 
         # Find the qualified location of the file
         try:
-            qualified_filename = find_file(filename, path=search_path)
+            qualified_filename = find_input_file(filename, path=search_path,
+                                                 remote_file_cache=args.remote_file_cache_store)
         except RuntimeError:
             raise RuntimeError("Input file " + filename + " cannot be found in path " + search_path)
 
@@ -597,37 +897,9 @@ def create_simulate_measure_inputs(args, config_filename, workdir, sim_config_li
 
         # Now, go through each data file of the product and symlink those from the workdir too
 
-        data_filenames = []
-        # Download MDB files if needed
-        if input_port_name == "mdb":
-            if filename[:4] == "WEB/":
-                qualified_filename = find_file(filename)
-                mdb_dict = Mdb(qualified_filename).get_all()
-                web_mdb_path = os.path.split(filename)[0]
-                for key in (mdb_keys.vis_gain_coeffs, mdb_keys.vis_readout_noise_table):
-                    for data_filename in mdb_dict[key]['Value']:
-                        web_data_filename = os.path.join(web_mdb_path, "data", data_filename)
-                        find_file(web_data_filename)
-                        data_filenames.append("data/" + data_filename)
-        # Get all data files this product points to and symlink them to the main data dir
-        elif qualified_filename[-4:] == ".xml":
-            try:
-                p = read_xml_product(qualified_filename)
-                data_filenames = p.get_all_filenames()
-            except (SAXParseException, UnpicklingError, UnicodeDecodeError):
-                logger.error("Cannot read file " + qualified_filename + ".")
-                raise
-        elif qualified_filename[-5:] == ".json":
-            subfilenames = read_listfile(qualified_filename)
-            for subfilename in subfilenames:
-                qualified_subfilename = find_file(subfilename, path=search_path)
-                try:
-                    p = read_xml_product(qualified_subfilename)
-                    data_filenames += p.get_all_filenames()
-                except (SAXParseException, UnpicklingError, UnicodeDecodeError):
-                    logger.error("Cannot read file " + qualified_filename + ".")
-                    raise
-        else:
+        data_filenames = get_input_data_filenames(input_port_name, filename, qualified_filename, search_path,
+                                                  remote_file_cache=args.remote_file_cache_store)
+        if data_filenames is None:
             logger.warn("Input file " + filename + " is not an XML data product.")
             continue
 
@@ -635,26 +907,13 @@ def create_simulate_measure_inputs(args, config_filename, workdir, sim_config_li
             continue
 
         # Set up the search path for data files
-        data_search_path = (os.path.split(qualified_filename)[0] + ":" +
-                            os.path.split(qualified_filename)[0] + "/data:" +
-                            os.path.split(qualified_filename)[0] + "/..:" +
-                            os.path.split(qualified_filename)[0] + "/../data:" + search_path)
+        data_search_path = get_data_search_path(qualified_filename, search_path)
 
         # Search for and symlink each data file
         for data_filename in data_filenames:
 
-            if data_filename is None or data_filename == "None" or data_filename == "data/None":
-                continue
-
             # Find the qualified location of the data file
-            try:
-                qualified_data_filename = find_file(data_filename, path=data_search_path)
-            except RuntimeError:
-                # Try searching for the file without the "data/" prefix
-                try:
-                    qualified_data_filename = find_file(data_filename.replace("data/", "", 1), path=data_search_path)
-                except RuntimeError:
-                    raise RuntimeError("Data file " + data_filename + " cannot be found in path " + data_search_path)
+            qualified_data_filename = find_data_file(data_filename, data_search_path)
 
             # Symlink the data file within the workdir
             if not os.path.abspath(qualified_data_filename) == os.path.abspath(
@@ -700,68 +959,178 @@ def create_simulate_measure_inputs(args, config_filename, workdir, sim_config_li
     return simulate_inputs
 
 
+@contextmanager
+def time_stage(stage_durations, stage, qualified_logdir, stage_resources=None):
+    """ Records the time taken within this context in the stage_durations dict, and reports the start of the stage
+        to the scheduler. If a stage_resources dict is given, the page faults and peak memory use of the stage are
+        also recorded in it. Any exception raised is converted to a SimulationStageError recording the stage and
+        its log file, which is named after the stage. If the stage is throttled in this worker, it first waits for
+        its turn, which isn't included in the time taken.
+    """
+    log_filename = os.path.join(qualified_logdir, f"she_{stage}.out")
+    with throttled_stage(stage):
+        report_stage(stage, log_filename)
+        start = time.perf_counter()
+        resource_baseline = start_resource_measurement() if stage_resources is not None else None
+        try:
+            yield
+        except Exception as e:
+            raise SimulationStageError.from_exception(stage, e, log_filename=log_filename)
+        stage_durations[stage] = time.perf_counter() - start
+        if stage_resources is not None:
+            stage_resources[stage] = finish_resource_measurement(resource_baseline)
+
+
+def get_stage_resources_filename(simulation_number):
+    """ Gets the name of the file, within a simulation's logdir, in which the resources used by its stages are
+        recorded.
+    """
+    return f"stage_resources_sim{simulation_number}.json"
+
+
+def write_stage_resources(qualified_logdir, simulation_number, stage_resources):
+    with open(os.path.join(qualified_logdir, get_stage_resources_filename(simulation_number)), "w") as fo:
+        json.dump(stage_resources, fo, indent=1)
+
+
+def get_intermediate_product_filenames(product_tag=""):
+    """ Gets the filenames, relative to the workdir, of the intermediate products of a simulation.
+
+    @return: Filename of each product
+    @rtype:  dict<str, str>
+    """
+
+    return {"data_images": os.path.join('data', f'data_images{product_tag}.json'),
+            "stacked_data_image": os.path.join('data', f'stacked_image{product_tag}.xml'),
+            "psf_images_and_tables": os.path.join('data', f'psf_images_and_tables{product_tag}.json'),
+            "segmentation_images": os.path.join('data', f'segmentation_images{product_tag}.json'),
+            "stacked_segmentation_image": os.path.join('data', f'stacked_segm_image{product_tag}.xml'),
+            "detections_tables": os.path.join('data', f'detections_tables{product_tag}.json'),
+            "details_table": os.path.join('data', f'details_table{product_tag}.xml'),
+            "shear_estimates_product": os.path.join('data', f'shear_estimates_product{product_tag}.xml'),
+            "she_lensmc_chains": os.path.join('data', f'she_lensmc_chains{product_tag}.xml'),
+            "she_bias_statistics": os.path.join('data', f'she_bias_statistics{product_tag}.xml'), }
+
+
 def she_simulate_and_measure_bias_statistics(simulation_config,
                                              ksb_training_data,
                                              lensmc_training_data, momentsml_training_data,
                                              regauss_training_data, pipeline_config, mdb,
                                              bins_description, workdirTuple,
-                                             simulation_number, logdir, est_shear_only):
-    """ Parallel processing parts of bias_measurement pipeline
-
+                                             simulation_number, logdir, est_shear_only, product_tag="",
+                                             memory_root=None, shear_estimate_cache=None,
+                                             memory_workdir_prefix=MEMORY_WORKDIR_PREFIX):
+    """ Parallel processing parts of bias_measurement pipeline. If product_tag is given, it's appended to the names
+    of the intermediate products, so that several simulations can be run in the same workdir. If memory_root is
+    given, the stages are run in a copy of the workdir in memory there (named with memory_workdir_prefix), so that
+    the intermediate products are handed between them without being written to disk, and only the final products
+    are moved to the workdir. If
+    shear_estimate_cache is given, the estimates of methods whose inputs are unchanged are taken from it rather than
+    recalculated.
+
+    @return: Time taken in seconds by each stage
+    @rtype:  dict
     """
     # several commands...
     # @FIXME: check None types.
 
+    if memory_root is not None:
+        intermediate_products = get_intermediate_product_filenames(product_tag)
+        with memory_workdir(workdirTuple.workdir, memory_root, products=list(intermediate_products.values()),
+                            prefix=memory_workdir_prefix) as scratch_workdir:
+            stage_durations = she_simulate_and_measure_bias_statistics(
+                simulation_config, ksb_training_data, lensmc_training_data, momentsml_training_data,
+                regauss_training_data, pipeline_config, mdb, bins_description,
+                workdirTuple._replace(workdir=scratch_workdir), simulation_number, logdir, est_shear_only,
+                product_tag=product_tag, shear_estimate_cache=shear_estimate_cache)
+
+            if est_shear_only:
+                final_products = (intermediate_products["shear_estimates_product"],
+                                  intermediate_products["she_lensmc_chains"])
+            else:
+                final_products = (get_bias_statistics_filename(simulation_number),)
+            for product in final_products:
+                move_product_to_workdir(product, scratch_workdir, workdirTuple.workdir)
+
+        return stage_durations
+
     workdir = workdirTuple.workdir
+    qualified_logdir = os.path.join(workdir, logdir)
 
-    data_image_list = os.path.join('data', 'data_images.json')
-    stacked_data_image = os.path.join('data', 'stacked_image.xml')
-    psf_images_and_tables = os.path.join('data', 'psf_images_and_tables.json')
-    segmentation_images = os.path.join('data', 'segmentation_images.json')
-    stacked_segmentation_image = os.path.join('data', 'stacked_segm_image.xml')
-    detections_tables = os.path.join('data', 'detections_tables.json')
-    details_table = os.path.join('data', 'details_table.xml')
+    stage_durations = {}
+    stage_resources = {}
 
-    she_simulate_images(simulation_config, pipeline_config, data_image_list,
-                        stacked_data_image, psf_images_and_tables, segmentation_images,
-                        stacked_segmentation_image, detections_tables, details_table,
-                        workdir, logdir, simulation_number)
-
-    shear_estimates_product = os.path.join('data', 'shear_estimates_product.xml')
-    she_lensmc_chains = os.path.join('data', 'she_lensmc_chains.xml')
-
-    she_estimate_shear(data_images=data_image_list,
-                       stacked_image=stacked_data_image,
-                       psf_images_and_tables=psf_images_and_tables,
-                       segmentation_images=segmentation_images,
-                       stacked_segmentation_image=stacked_segmentation_image,
-                       detections_tables=detections_tables,
-                       ksb_training_data=ksb_training_data,
-                       lensmc_training_data=lensmc_training_data,
-                       momentsml_training_data=momentsml_training_data,
-                       regauss_training_data=regauss_training_data,
-                       pipeline_config=pipeline_config,
-                       mdb=mdb,
-                       shear_estimates_product=shear_estimates_product,
-                       she_lensmc_chains=she_lensmc_chains,
-                       workdir=workdir, logdir=logdir, sim_number=simulation_number)
+    intermediate_products = get_intermediate_product_filenames(product_tag)
+
+    data_image_list = intermediate_products["data_images"]
+    stacked_data_image = intermediate_products["stacked_data_image"]
+    psf_images_and_tables = intermediate_products["psf_images_and_tables"]
+    segmentation_images = intermediate_products["segmentation_images"]
+    stacked_segmentation_image = intermediate_products["stacked_segmentation_image"]
+    detections_tables = intermediate_products["detections_tables"]
+    details_table = intermediate_products["details_table"]
+
+    with time_stage(stage_durations, "simulate_images", qualified_logdir, stage_resources):
+        she_simulate_images(simulation_config, pipeline_config, data_image_list,
+                            stacked_data_image, psf_images_and_tables, segmentation_images,
+                            stacked_segmentation_image, detections_tables, details_table,
+                            workdir, logdir, simulation_number)
+
+    shear_estimates_product = intermediate_products["shear_estimates_product"]
+    she_lensmc_chains = intermediate_products["she_lensmc_chains"]
+
+    estimate_shear_kwargs = dict(data_images=data_image_list,
+                                 stacked_image=stacked_data_image,
+                                 psf_images_and_tables=psf_images_and_tables,
+                                 segmentation_images=segmentation_images,
+                                 stacked_segmentation_image=stacked_segmentation_image,
+                                 detections_tables=detections_tables,
+                                 ksb_training_data=ksb_training_data,
+                                 lensmc_training_data=lensmc_training_data,
+                                 momentsml_training_data=momentsml_training_data,
+                                 regauss_training_data=regauss_training_data,
+                                 pipeline_config=pipeline_config,
+                                 mdb=mdb,
+                                 shear_estimates_product=shear_estimates_product,
+                                 she_lensmc_chains=she_lensmc_chains,
+                                 workdir=workdir, logdir=logdir, sim_number=simulation_number)
+
+    with time_stage(stage_durations, "estimate_shear", qualified_logdir, stage_resources):
+        if shear_estimate_cache is None:
+            she_estimate_shear(**estimate_shear_kwargs)
+        else:
+            estimate_shear_with_cache(
+                shear_estimate_cache,
+                lambda run_pipeline_config: she_estimate_shear(**dict(estimate_shear_kwargs,
+                                                                      pipeline_config=run_pipeline_config)),
+                workdir=workdir,
+                pipeline_config=pipeline_config,
+                shear_estimates_product=shear_estimates_product,
+                image_products=[data_image_list, stacked_data_image, psf_images_and_tables, segmentation_images,
+                                stacked_segmentation_image, detections_tables],
+                training_data={"KSB": ksb_training_data,
+                               "LensMC": lensmc_training_data,
+                               "MomentsML": momentsml_training_data,
+                               "REGAUSS": regauss_training_data, },
+                mdb=mdb)
 
     # Complete after shear only if option set.
     if est_shear_only:
         logger.info("Configuration set up to complete after shear measurement")
-        return
+        write_stage_resources(qualified_logdir, simulation_number, stage_resources)
+        return stage_durations
 
-    she_bias_statistics = os.path.join('data', 'she_bias_statistics.xml')
+    she_bias_statistics = intermediate_products["she_bias_statistics"]
 
-    she_measure_statistics(details_table=details_table,
-                           shear_estimates=shear_estimates_product,
-                           pipeline_config=pipeline_config,
-                           she_bias_statistics=she_bias_statistics,
-                           bins_description=bins_description,
-                           workdir=workdir, logdir=logdir, sim_number=simulation_number)
+    with time_stage(stage_durations, "measure_statistics", qualified_logdir, stage_resources):
+        she_measure_statistics(details_table=details_table,
+                               shear_estimates=shear_estimates_product,
+                               pipeline_config=pipeline_config,
+                               she_bias_statistics=she_bias_statistics,
+                               bins_description=bins_description,
+                               workdir=workdir, logdir=logdir, sim_number=simulation_number)
 
-    she_bias_measurements = os.path.join('data',
-                                         'shear_bias_measurements_sim%s.xml' % simulation_number)
+    she_bias_measurements = get_bias_statistics_filename(simulation_number)
 
     # ii=0
     # maxNTries=5
@@ -769,33 +1138,121 @@ def she_simulate_and_measure_bias_statistics(simulation_config,
     # while not hasRun and ii<maxNTries:
     #    if os.path.exists(she_bias_statistics):
 
-    she_cleanup_bias_measurement(simulation_config=simulation_config,
-                                 data_images=data_image_list, stacked_data_image=stacked_data_image,
-                                 psf_images_and_tables=psf_images_and_tables,
-                                 segmentation_images=segmentation_images,
-                                 stacked_segmentation_image=stacked_segmentation_image,
-                                 detections_tables=detections_tables,
-                                 details_table=details_table,
-                                 shear_estimates=shear_estimates_product,
-                                 shear_bias_statistics_in=she_bias_statistics,
-                                 pipeline_config=pipeline_config,
-                                 she_bias_measurements=she_bias_measurements,
-                                 workdir=workdir, logdir=logdir, sim_number=simulation_number)
+    with time_stage(stage_durations, "cleanup_bias_measurement", qualified_logdir, stage_resources):
+        she_cleanup_bias_measurement(simulation_config=simulation_config,
+                                     data_images=data_image_list, stacked_data_image=stacked_data_image,
+                                     psf_images_and_tables=psf_images_and_tables,
+                                     segmentation_images=segmentation_images,
+                                     stacked_segmentation_image=stacked_segmentation_image,
+                                     detections_tables=detections_tables,
+                                     details_table=details_table,
+                                     shear_estimates=shear_estimates_product,
+                                     shear_bias_statistics_in=she_bias_statistics,
+                                     pipeline_config=pipeline_config,
+                                     she_bias_measurements=she_bias_measurements,
+                                     workdir=workdir, logdir=logdir, sim_number=simulation_number)
 
     logger.info("Completed parallel pipeline stage, she_simulate_and_measure_bias_statistics")
 
+    write_stage_resources(qualified_logdir, simulation_number, stage_resources)
+
+    return stage_durations
+
+
+def get_simulate_and_measure_args(args, simulate_measure_inputs, workdir, simulation_number):
+    """ Gets the arguments to pass to simulate_and_measure_mapped for a simulation. When simulations are grouped into
+        multi-seed tasks, their intermediate products are tagged with the simulation number so that they don't
+        overwrite each other in the shared workdir.
+    """
+
+    if args.seeds_per_task > 1:
+        product_tag = f"_sim{simulation_number}"
+    else:
+        product_tag = ""
+
+    return (simulate_measure_inputs.simulation_config,
+            simulate_measure_inputs.ksb_training_data,
+            simulate_measure_inputs.lensmc_training_data,
+            simulate_measure_inputs.momentsml_training_data,
+            simulate_measure_inputs.regauss_training_data,
+            simulate_measure_inputs.pipeline_config,
+            simulate_measure_inputs.mdb,
+            simulate_measure_inputs.bins_description,
+            workdir, simulation_number, args.logdir, args.est_shear_only, product_tag,
+            args.memory_root if args.intermediate_storage == "memory" else None,
+            args.shear_estimate_cache_store,
+            args.memory_workdir_prefix)
+
 
 def simulate_and_measure_mapped(args):
     return she_simulate_and_measure_bias_statistics(*args)
 
 
+def simulate_and_measure_multiple_mapped(args_list):
+    """ Runs the simulations of a task in turn, in the same worker. A failed simulation doesn't stop the rest from
+        being run; if any fail, the first failure is raised if none completed, and otherwise a PartialTaskError
+        recording which did, so that only the failed simulations are retried.
+
+    @return: Total time taken in seconds by each stage
+    @rtype:  dict
+    """
+
+    stage_durations = {}
+    completed_indices = []
+    failures = {}
+    for index, args in enumerate(args_list):
+        try:
+            simulation_stage_durations = simulate_and_measure_mapped(args)
+        except Exception as e:
+            if len(args_list) == 1:
+                raise
+            logger.warning("Simulation %s of %s in this task failed; continuing with the rest.", index + 1,
+                           len(args_list))
+            failures[index] = e
+            continue
+        for stage, duration in simulation_stage_durations.items():
+            stage_durations[stage] = stage_durations.get(stage, 0.) + duration
+        completed_indices.append(index)
+
+    if failures:
+        if not completed_indices:
+            raise failures[min(failures)]
+        raise PartialTaskError(failures, completed_indices, result=stage_durations)
+
+    return stage_durations
+
+
+def get_task_simulation_numbers(simulation_groups, seeds_per_task):
+    """ Splits the simulations into tasks of up to seeds_per_task consecutive simulations, without mixing simulations
+        from different groups (rows of the simulation plan) in the same task.
+
+    @return: Simulation numbers of each task
+    @rtype:  list<list<int>>
+    """
+
+    task_simulation_numbers = []
+    for simulation_number, group in enumerate(simulation_groups):
+        if (len(task_simulation_numbers) > 0 and len(task_simulation_numbers[-1]) < seeds_per_task and
+                simulation_groups[task_simulation_numbers[-1][0]] == group):
+            task_simulation_numbers[-1].append(simulation_number)
+        else:
+            task_simulation_numbers.append([simulation_number])
+
+    return task_simulation_numbers
+
+
 def run_pipeline_from_args(args):
     """Main executable to run parallel pipeline.
     """
 
+    # With the mpi executor, every process of the MPI job runs this; all but the master serve tasks to it
+    if args.executor == "mpi" and not is_mpi_master():
+        run_mpi_worker()
+        return
+
     # Check the arguments
     chosen_pipeline_info = check_args(args)  # add argument there..
-    _sim_plan_table, sim_plan_tablename = rp.create_plan(args, return_table=True)
+    sim_plan_table, sim_plan_tablename = rp.create_plan(args, return_table=True)
 
     # Create the pipeline_config for this run
     config_filename = rp.create_config(args, config_keys=chosen_pipeline_info.config_keys)
@@ -842,60 +1299,131 @@ def run_pipeline_from_args(args):
 
     batches, workdir_list = create_batches(args, simulation_configs)
 
+    number_simulations = sum(batch.nThreads for batch in batches)
+    simulation_groups = get_simulation_groups(sim_plan_table, number_simulations=number_simulations)
+    simulation_sizes = get_simulation_sizes(sim_plan_table, number_simulations=number_simulations)
+    simulation_cost_configs = get_simulation_cost_configs(sim_plan_table, number_simulations=number_simulations)
+
     logger.info("Running parallel part of pipeline in %s batches and %s threads"
                 % (len(batches), args.number_threads))
 
-    pool = multiprocessing.Pool(processes=args.number_threads)
+    logger.info("Running simulations with the %s executor, with %s native threads per process.", args.executor,
+                args.threads_per_process)
+
+    write_run_metadata(args)
 
-    simulate_and_measure_args_list = []
+    simulation_tasks = []
 
-    for batch_number in range(len(batches)):
-        batch = batches[batch_number]
-        # Move data to threads
-        # insert_data_to_threads(args,batch,workdirList,sim_table)
-        # Update_isf_...
+    # Group the simulations into tasks, each of which is run in the workdir of its first simulation. The workdir
+    # list is ordered by simulation number, as batch.min_sim_number + thread_number
+    for task_simulation_numbers in get_task_simulation_numbers(simulation_groups, args.seeds_per_task):
 
-        # Create the pipeline_config for this run
-        # @TODO: Do we need multiple versions of this, one for each thread?
+        workdir = workdir_list[task_simulation_numbers[0]]
 
-        for thread_number in range(batch.nThreads):
-            workdir = workdir_list[thread_number + args.number_threads * batch_number]
-            # logdir?
-            simulation_number = get_sim_number(thread_number, batch)
+        simulate_and_measure_args = []
+        for simulation_number in task_simulation_numbers:
             # Create the ISF for this run
-            # @TODO:  do we need multiple versions of this, one for each thread
             # @FIXME: Don't really need ISF - that is for the pipeline runner..
             simulate_measure_inputs = create_simulate_measure_inputs(args,
                                                                      config_filename, workdir, simulation_configs,
                                                                      simulation_number)
 
-            simulate_and_measure_args_list.append((simulate_measure_inputs.simulation_config,
-                                                   simulate_measure_inputs.ksb_training_data,
-                                                   simulate_measure_inputs.lensmc_training_data,
-                                                   simulate_measure_inputs.momentsml_training_data,
-                                                   simulate_measure_inputs.regauss_training_data,
-                                                   simulate_measure_inputs.pipeline_config,
-                                                   simulate_measure_inputs.mdb,
-                                                   simulate_measure_inputs.bins_description,
-                                                   workdir, simulation_number, args.logdir, args.est_shear_only))
+            simulate_and_measure_args.append(get_simulate_and_measure_args(args, simulate_measure_inputs,
+                                                                           workdir, simulation_number))
+
+        simulation_tasks.append(SimulationTask(task_simulation_numbers[0], workdir, simulate_and_measure_args,
+                                               group=simulation_groups[task_simulation_numbers[0]],
+                                               simulation_numbers=task_simulation_numbers))
+
+    if args.seeds_per_task > 1:
+        logger.info("Grouped %s simulations into %s tasks of up to %s seeds each.", number_simulations,
+                    len(simulation_tasks), args.seeds_per_task)
+
+    profile_tasks = assign_memory_profiles(simulation_tasks, args.memory_profile_definitions)
+
+    # The scheduler is given the tasks of each memory profile in turn, with a pool of workers in that profile
+    retry_policy = RetryPolicy(max_retries=args.max_retries, backoff=args.retry_backoff,
+                               max_failures=args.max_failures)
+    stage_timeouts = StageTimeouts(soft=args.soft_timeouts, hard=args.hard_timeouts)
+    scheduler = SimulationScheduler(None, args.number_threads, [],
+                                    task_function=simulate_and_measure_multiple_mapped, retry_policy=retry_policy,
+                                    stage_timeouts=stage_timeouts)
+
+    # Set up the cost model from previously-recorded timings, and keep it updated with timings from this run
+    cost_model = SimulationCostModel()
+    cost_model.load(args.timing_records)
+
+    def get_task_size(task):
+        return sum(simulation_sizes[simulation_number] for simulation_number in task.simulation_numbers)
+
+    # The simulations of a task all come from the same row of the plan, so share its configuration
+    def get_task_cost_config(task):
+        return simulation_cost_configs[task.simulation_number]
+
+    def record_timing(_scheduler, task, result):
+        if isinstance(result, dict):
+            cost_model.add_timing(get_task_size(task), result, config=get_task_cost_config(task))
+
+    scheduler.add_completion_listener(record_timing)
+
+    if args.task_ordering == "longest_first":
+        scheduler.task_cost = lambda task: cost_model.predict(get_task_size(task), config=get_task_cost_config(task))
+
+    if args.speculative_execution:
+        def make_speculative_task(task):
+            return create_speculative_task(args, config_filename, simulation_configs, task)
 
-    if simulate_and_measure_args_list:
-        pool.map(simulate_and_measure_mapped, simulate_and_measure_args_list)
+        scheduler.make_speculative_task = make_speculative_task
+
+    if args.target_m_precision is not None:
+        adaptive_stopping = AdaptiveStopping(m_target=args.target_m_precision,
+                                             c_target=args.target_c_precision,
+                                             check_interval=args.precision_check_interval,
+                                             statistics_filename_function=get_bias_statistics_filename)
+        scheduler.add_completion_listener(adaptive_stopping.on_task_complete)
+        if args.prioritise_bins:
+            scheduler.group_priority = adaptive_stopping.get_group_priority
+
+    if args.deadline_time is not None:
+        walltime_guard = WalltimeGuard(deadline=args.deadline_time, reserve=args.deadline_reserve)
+        scheduler.add_completion_listener(walltime_guard.on_task_complete)
+        scheduler.add_dispatch_guard(walltime_guard.check_dispatch)
+
+    previous_signal_handlers = install_drain_signal_handlers(scheduler)
+    try:
+        for memory_profile, tasks in zip(args.memory_profile_definitions, profile_tasks):
+            # If scheduling has been stopped, this profile's tasks are left unscheduled
+            scheduler.pending += tasks
+            if not scheduler.stop_requested:
+                run_simulations_in_profile(args, scheduler, memory_profile)
+    finally:
+        restore_signal_handlers(previous_signal_handlers)
+
+    cost_model.save(args.timing_records)
+
+    if args.memory_profiles:
+        write_memory_profile_report(args, scheduler, profile_tasks)
+
+    write_unfinished_simulations(args, scheduler, sim_plan_table, simulation_configs, number_simulations)
+    write_failure_manifest(args, scheduler, sim_plan_table, simulation_configs, number_simulations)
 
     if args.est_shear_only:
         logger.info("Configuration set up to complete after shear estimated: will not merge shear measurement files.")
     else:
         # Clean up
         logger.info("Cleaning up batch files..")
+        merge_outputs(scheduler.completed, shear_bias_measurement_listfile, parent_workdir=args.workdir)
         for batch_number in range(len(batches)):
-            merge_outputs(workdir_list, batches[batch_number], shear_bias_measurement_listfile,
-                          parent_workdir=args.workdir)
             pu.cleanup(batches[batch_number], workdir_list)
 
     if args.est_shear_only:
         logger.info("Pipeline completed!")
         return
 
+    if len(scheduler.completed) == 0:
+        logger.error("No simulations were completed, so the final bias cannot be measured.")
+        return
+
     # Run final process
     shear_bias_measurement_final = os.path.join(args.workdir, 'shear_bias_measurements_final.xml')
 
@@ -910,49 +1438,320 @@ def run_pipeline_from_args(args):
                 "final shear: output in %s" % shear_bias_measurement_final)
     she_measure_bias(shear_bias_measurement_listfile, config_filename,
                      shear_bias_measurement_final, bins_desc, args.workdir, args.logdir)
+
+    if args.bias_accumulator is not None:
+        fold_into_accumulator(args, shear_bias_measurement_listfile)
+
     logger.info("Pipeline completed!")
 
 
-def merge_outputs(workdir_list, batch,
-                  shear_bias_measurement_listfile, parent_workdir):
-    """ Merge outputs from different threads at the end of each
-    batch. Updates .json file
+def assign_memory_profiles(simulation_tasks, memory_profiles):
+    """ Shares tasks between memory profiles, taking each profile in turn within each group (row of the simulation
+        plan), so that every profile runs a similar mix of simulations.
+
+    @return: Tasks for each profile
+    @rtype:  list<list<SimulationTask>>
+    """
+
+    profile_tasks = [[] for _ in memory_profiles]
+    group_counts = {}
+    for task in simulation_tasks:
+        profile_index = group_counts.get(task.group, 0) % len(memory_profiles)
+        profile_tasks[profile_index].append(task)
+        group_counts[task.group] = group_counts.get(task.group, 0) + 1
+
+    return profile_tasks
+
+
+def run_simulations_in_profile(args, scheduler, memory_profile):
+    """ Runs the scheduler's pending tasks with a new executor, whose workers are in the given memory profile (or
+        the unchanged environment if it's None).
+    """
+
+    if memory_profile is None:
+        environment = {}
+    else:
+        environment = get_profile_environment(memory_profile)
+        logger.info("Running %s simulation tasks in memory profile %s: %s%s", len(scheduler.pending),
+                    memory_profile.name, environment, " with transparent huge pages disabled"
+                    if memory_profile.thp_disable else "")
+
+    with applied_environment(environment):
+
+        executor = create_executor(args.executor, args.number_threads, threads_per_process=args.threads_per_process,
+                                   placement=args.worker_placement, memory_profile=memory_profile,
+                                   io_limits=args.io_throttle_limits)
+        scheduler.use_pool(executor, executor.number_workers, executor.progress_queue)
+
+        scheduler.run()
+
+        scheduler.shut_down_pool()
+
+    # Remove the workdir copies in memory of any simulations whose workers were killed (on this node only, with the
+    # mpi executor)
+    if args.intermediate_storage == "memory":
+        remove_memory_workdirs(args.memory_root, args.memory_workdir_prefix)
+
 
+def write_memory_profile_report(args, scheduler, profile_tasks):
+    """ Writes out a report comparing the wall time, page faults, and peak memory use of each stage under each
+        memory profile, measured from the completed simulations.
+    """
+
+    # Tasks of which only some simulations completed are split, so check each simulation
+    completed_simulations = {simulation_number for task in scheduler.completed
+                             for simulation_number in task.simulation_numbers}
+
+    report = {}
+    for memory_profile, tasks in zip(args.memory_profile_definitions, profile_tasks):
+
+        stage_resources_list = []
+        for task in tasks:
+            for simulation_number in task.simulation_numbers:
+                if simulation_number not in completed_simulations:
+                    continue
+                qualified_filename = os.path.join(task.workdir.workdir, args.logdir,
+                                                  get_stage_resources_filename(simulation_number))
+                if os.path.exists(qualified_filename):
+                    with open(qualified_filename, "r") as fi:
+                        stage_resources_list.append(json.load(fi))
+
+        stage_summary = summarise_stage_resources(stage_resources_list)
+        report[memory_profile.name] = {"environment": memory_profile.environment,
+                                       "thp_disable": memory_profile.thp_disable,
+                                       "number_simulations": len(stage_resources_list),
+                                       "stages": stage_summary, }
+
+        for stage, summary in stage_summary.items():
+            logger.info("Memory profile %s, stage %s: median wall time %.1fs, median peak RSS %.0f MB, median page "
+                        "faults %.0f minor / %.0f major", memory_profile.name, stage,
+                        summary["wall_time"]["median"], summary["peak_rss_kb"]["median"] / 1024,
+                        summary["minor_faults"]["median"], summary["major_faults"]["median"])
+
+    qualified_filename = os.path.join(args.workdir, MEMORY_PROFILE_REPORT_FILENAME)
+    pu.write_json_atomically(qualified_filename, {"profiles": report})
+    logger.info("Memory profile report written to %s.", qualified_filename)
+
+
+def write_run_metadata(args):
+    """ Writes out a description of how this run is configured to use the machine, so that the throughput of
+        different configurations can be compared.
+    """
+
+    run_metadata = {"version": SHE_Pipeline.__version__,
+                    "start_time": datetime.now().isoformat(timespec="seconds"),
+                    "hostname": socket.gethostname(),
+                    "available_cpus": pu.get_available_cpu_count(),
+                    "executor": args.executor,
+                    "number_processes": args.number_threads,
+                    "seeds_per_task": args.seeds_per_task,
+                    "native_threads": get_native_thread_config(args.threads_per_process),
+                    "worker_placement": args.worker_placement,
+                    "memory_profiles": args.memory_profiles,
+                    "intermediate_storage": args.intermediate_storage,
+                    "io_limits": args.io_throttle_limits._asdict() if args.io_throttle_limits else None,
+                    "shear_estimate_cache": args.shear_estimate_cache,
+                    "remote_file_cache": args.remote_file_cache,
+                    "offline": args.offline, }
+
+    if args.worker_placement != "none" and args.executor != "serial":
+        # For the mpi executor, this is the placement on this node only
+        run_metadata["worker_placement_plan"] = get_placement_report(args.number_threads, args.threads_per_process)
+
+    pu.write_json_atomically(os.path.join(args.workdir, run_metadata_filename), run_metadata)
+
+
+def fold_into_accumulator(args, shear_bias_measurement_listfile):
+    """ Folds the bias statistics of all simulations completed in this run into the persistent accumulator store,
+        bin by bin, so that the combined bias over all batches of this TAG is kept up to date.
+    """
+
+    accumulators = read_bias_statistics_listfile_accumulators(shear_bias_measurement_listfile,
+                                                              workdir=args.workdir)
+    if len(accumulators) == 0:
+        logger.warning("No valid bias statistics found in %s; nothing to fold into %s.",
+                       shear_bias_measurement_listfile, args.bias_accumulator)
+        return
 
+    store = BiasAccumulatorStore(args.bias_accumulator)
+    store.fold_in(args.accumulator_tag, accumulators, batch_id=args.accumulator_batch_id)
+
+
+def create_speculative_task(args, config_filename, simulation_configs, task):
+    """ Creates a copy of a simulation task to be run speculatively, in a fresh workdir so that it doesn't
+        interfere with the original.
+
+    @return: Speculative task, or None if it can't be created
+    @rtype:  SimulationTask
     """
 
+    speculative_workdir_name = os.path.join(args.workdir, f"speculative_sim{task.simulation_number}")
+
+    try:
+        speculative_workdir = pu.create_dir_struct(args, speculative_workdir_name)
+        simulate_and_measure_args = []
+        for simulation_number in task.simulation_numbers:
+            simulate_measure_inputs = create_simulate_measure_inputs(args, config_filename, speculative_workdir,
+                                                                     simulation_configs, simulation_number)
+            simulate_and_measure_args.append(get_simulate_and_measure_args(args, simulate_measure_inputs,
+                                                                           speculative_workdir, simulation_number))
+    except Exception as e:
+        logger.warning("Cannot create speculative copy of simulation %s: %s", task.simulation_number, e)
+        return None
+
+    return SimulationTask(task.simulation_number, speculative_workdir, simulate_and_measure_args,
+                          group=task.group, simulation_numbers=task.simulation_numbers)
+
+
+def get_simulation_description(task, simulation_number, sim_config_list, plan_rows):
+    """ Gets a dict describing one of the simulations of a task for the unfinished simulations list and failure
+        manifest.
+    """
+
+    simulation_description = {"simulation_number": simulation_number,
+                              "simulation_config": sim_config_list[simulation_number],
+                              "workdir": task.workdir.workdir, }
+    if plan_rows is not None:
+        plan_row = plan_rows[simulation_number]
+        simulation_description["plan_row"] = plan_row.row_index
+        simulation_description["model_seed"] = plan_row.model_seed
+        simulation_description["noise_seed"] = plan_row.noise_seed
+
+    return simulation_description
+
+
+def write_unfinished_simulations(args, scheduler, sim_plan_table, simulation_configs, number_simulations):
+    """ Writes out a list of the simulations which were not completed, along with their model seeds if these can be
+        determined from the simulation plan, so that they can be run in a later job. Any such list left over from a
+        previous run in this workdir is removed if all simulations completed.
+    """
+
+    qualified_filename = os.path.join(args.workdir, unfinished_simulations_filename)
+
+    unfinished_tasks = ([(task, "failed") for task in scheduler.quarantined] +
+                        [(task, "abandoned") for task in scheduler.abandoned] +
+                        [(task, "not_started") for task in scheduler.unscheduled])
+
+    if len(unfinished_tasks) == 0:
+        if os.path.exists(qualified_filename):
+            os.remove(qualified_filename)
+        return
+
+    sim_config_list = read_listfile(os.path.join(args.workdir, simulation_configs))
+    plan_rows = get_simulation_plan_rows(sim_plan_table, number_simulations)
+
+    unfinished_simulations = []
+    for task, status in sorted(unfinished_tasks, key=lambda task_and_status: task_and_status[0].simulation_number):
+        for simulation_number in task.simulation_numbers:
+            unfinished_simulation = get_simulation_description(task, simulation_number, sim_config_list, plan_rows)
+            unfinished_simulation["status"] = status
+            unfinished_simulations.append(unfinished_simulation)
+
+    with open(qualified_filename, "w") as fo:
+        json.dump({"stop_reason": scheduler.stop_reason,
+                   "number_simulations": number_simulations,
+                   "number_completed": sum(len(task.simulation_numbers) for task in scheduler.completed),
+                   "unfinished_simulations": unfinished_simulations, }, fo, indent=2)
+
+    logger.warning("%s of %s simulations were not completed; these are listed in %s.",
+                   len(unfinished_simulations), number_simulations, qualified_filename)
+
+
+def write_failure_manifest(args, scheduler, sim_plan_table, simulation_configs, number_simulations):
+    """ Writes out a manifest of every simulation which failed at least once, with the stage, exception, and log
+        file of each failed attempt, and whether it eventually succeeded. For multi-seed tasks, each simulation of the
+        task is listed with the task's attempts. Any such manifest left over from a previous run in this workdir is
+        removed if there were no failures.
+    """
+
+    qualified_filename = os.path.join(args.workdir, failure_manifest_filename)
+
+    if len(scheduler.failures) == 0:
+        if os.path.exists(qualified_filename):
+            os.remove(qualified_filename)
+        return
+
+    sim_config_list = read_listfile(os.path.join(args.workdir, simulation_configs))
+    plan_rows = get_simulation_plan_rows(sim_plan_table, number_simulations)
+
+    tasks = {task.simulation_number: task for task in (scheduler.completed + scheduler.quarantined +
+                                                       scheduler.abandoned + scheduler.unscheduled)}
+    completed_simulations = {task.simulation_number for task in scheduler.completed}
+    quarantined_simulations = {task.simulation_number for task in scheduler.quarantined}
+
+    failed_simulations = []
+    for task_number, exceptions in sorted(scheduler.failures.items()):
+
+        if task_number in completed_simulations:
+            status = "recovered"
+        elif task_number in quarantined_simulations:
+            status = "quarantined"
+        else:
+            status = "unfinished"
+
+        attempts = [{"stage": getattr(exception, "stage", None),
+                     "exception": getattr(exception, "message", repr(exception)),
+                     "log_file": getattr(exception, "log_filename", None),
+                     "traceback": getattr(exception, "traceback_text", None), }
+                    for exception in exceptions]
+
+        task = tasks[task_number]
+        for simulation_number in task.simulation_numbers:
+            failed_simulation = get_simulation_description(task, simulation_number, sim_config_list, plan_rows)
+            failed_simulation["status"] = status
+            failed_simulation["attempts"] = attempts
+            failed_simulations.append(failed_simulation)
+
+    number_quarantined = sum(len(task.simulation_numbers) for task in scheduler.quarantined)
+
+    with open(qualified_filename, "w") as fo:
+        json.dump({"number_simulations": number_simulations,
+                   "number_quarantined": number_quarantined,
+                   "failed_simulations": failed_simulations, }, fo, indent=2)
+
+    logger.warning("%s simulations failed at least once, of which %s could not be completed; see %s.",
+                   len(failed_simulations), number_quarantined, qualified_filename)
+
+
+def merge_outputs(simulation_tasks, shear_bias_measurement_listfile, parent_workdir):
+    """ Merge outputs of completed simulations, each from the workdir its task was run in (which for a speculatively
+    re-run simulation might not be its thread's workdir). Updates .json file
+
+
+    """
+
+    task_simulations = sorted(((simulation_number, task) for task in simulation_tasks
+                               for simulation_number in task.simulation_numbers), key=lambda pair: pair[0])
+
     new_list = []
-    for workdir in workdir_list:
-        thread_number = int(workdir.workdir.split('thread')[-1].split('_')[0])
-        if thread_number < batch.nThreads:
-            sim_number = get_sim_number(thread_number, batch)
-            # @TODO: root of this in one place
-            shear_bias_measurements_file = os.path.join('data', 'shear_bias_measurements_sim%s.xml' % sim_number)
-            qualified_shear_bias_measurements_file = os.path.join(workdir.workdir, shear_bias_measurements_file)
-            if os.path.exists(qualified_shear_bias_measurements_file):
-                new_list.append(qualified_shear_bias_measurements_file)
+    for simulation_number, task in task_simulations:
+        workdir = task.workdir
+        shear_bias_measurements_file = get_bias_statistics_filename(simulation_number)
+        qualified_shear_bias_measurements_file = os.path.join(workdir.workdir, shear_bias_measurements_file)
+        if os.path.exists(qualified_shear_bias_measurements_file):
+            new_list.append(qualified_shear_bias_measurements_file)
 
-                # Get all data files this product points to and symlink them to the main data dir
-                p = read_xml_product(shear_bias_measurements_file, workdir=workdir.workdir)
+            # Get all data files this product points to and symlink them to the main data dir
+            p = read_xml_product(shear_bias_measurements_file, workdir=workdir.workdir)
 
-                data_files = p.get_all_filenames()
+            data_files = p.get_all_filenames()
 
-                for data_file in data_files:
+            for data_file in data_files:
 
-                    if data_file is None or data_file == "None" or data_file == "data/None" or data_file == "" or \
-                            data_file == "data/":
-                        continue
+                if data_file is None or data_file == "None" or data_file == "data/None" or data_file == "" or \
+                        data_file == "data/":
+                    continue
 
-                    old_qualified_data_file_filename = os.path.join(workdir.workdir, data_file)
-                    new_qualified_data_file_filename = os.path.join(parent_workdir, data_file)
+                old_qualified_data_file_filename = os.path.join(workdir.workdir, data_file)
+                new_qualified_data_file_filename = os.path.join(parent_workdir, data_file)
 
-                    if not os.path.exists(old_qualified_data_file_filename):
-                        logger.warn("Expected file " + old_qualified_data_file_filename + " does not exist")
+                if not os.path.exists(old_qualified_data_file_filename):
+                    logger.warn("Expected file " + old_qualified_data_file_filename + " does not exist")
 
-                    new_subpath = os.path.split(new_qualified_data_file_filename)[0]
-                    if not os.path.exists(new_subpath):
-                        os.makedirs(new_subpath)
-                    os.symlink(old_qualified_data_file_filename, new_qualified_data_file_filename)
+                new_subpath = os.path.split(new_qualified_data_file_filename)[0]
+                if not os.path.exists(new_subpath):
+                    os.makedirs(new_subpath)
+                os.symlink(old_qualified_data_file_filename, new_qualified_data_file_filename)
 
     sbml_list = []
     if os.path.exists(shear_bias_measurement_listfile):
@@ -22,6 +22,11 @@ __updated__ = "2021-08-19"
 
 import os
 import subprocess as sbp
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from copy import copy
+from itertools import product
 from pickle import UnpicklingError
 from xml.sax import SAXParseException
 
@@ -35,6 +40,8 @@ from SHE_PPT.mdb import Mdb, mdb_keys
 from SHE_PPT.pipeline_utility import _check_key_is_valid, read_config, write_config
 from SHE_PPT.products.she_simulation_plan import create_dpd_she_simulation_plan
 from .pipeline_info import pipeline_info_dict
+from .product_catalog import get_catalogued_data_filenames
+from .remote_file_cache import create_remote_file_cache, find_input_file
 
 EXT_XML = ".xml"
 
@@ -66,6 +73,9 @@ pipeline_runner_exec = f"{pipeline_runner_path}/bin/python {pipeline_runner_path
 submit_command = "submit"
 localrun_command = "localrun"
 
+sweep_pipelines = ("scaling_experiments",)
+default_sweep_results = "scaling_experiments_sweep.ecsv"
+
 logger = getLogger(__name__)
 
 
@@ -212,6 +222,9 @@ def check_args(args):
     if args.cluster:
         os.chmod(qualified_logdir, 0o777)
 
+    # Set up the cache of remote input files, which should be on storage local to the node
+    args.remote_file_cache_store = create_remote_file_cache(args)
+
     # Check that pipeline specific args are only provided for the right pipeline
     if args.plan_args is None:
         args.plan_args = []
@@ -220,9 +233,62 @@ def check_args(args):
     if not len(args.plan_args) % 2 == 0:
         raise ValueError("Invalid values passed to 'plan_args': Must be a set of paired arguments.")
 
+    # Check the parameter sweep, which is only run locally, and for pipelines whose config only tunes the run
+    if args.sweep is None:
+        args.sweep = []
+    if len(args.sweep) > 0:
+        if args.pipeline not in sweep_pipelines:
+            raise ValueError("sweep can only be provided for the Scaling Experiments pipeline.")
+        if args.cluster:
+            raise ValueError("'sweep' can only be used for local runs, and not with 'cluster'.")
+        if args.sweep_concurrency < 1:
+            raise ValueError("Invalid value passed to 'sweep_concurrency': Must be positive.")
+        args.sweep_grid = get_sweep_grid(args.sweep, config_keys)
+        for key in args.config_args[::2]:
+            if key in args.sweep_grid:
+                raise ValueError("Config argument \"" + key + "\" cannot be both set with 'config_args' and swept "
+                                 "over with 'sweep'.")
+
     return chosen_pipeline_info
 
 
+def get_sweep_grid(sweep_args, config_keys):
+    """Parses the values passed to 'sweep' into a dict of the comma-separated values to be swept over for each
+       pipeline_config key.
+    """
+
+    if not len(sweep_args) % 2 == 0:
+        raise ValueError("Invalid values passed to 'sweep': Must be a set of paired arguments.")
+
+    sweep_grid = {}
+    for i in range(len(sweep_args) // 2):
+        key = sweep_args[2 * i]
+        if not config_keys.is_allowed_value(key):
+            err_string = ("Sweep argument \"" + key + "\" not recognized. Allowed arguments are: ")
+            for allowed_key in config_keys:
+                err_string += "\n  " + allowed_key.value
+            raise ValueError(err_string)
+        if key in sweep_grid:
+            raise ValueError("Invalid values passed to 'sweep': \"" + key + "\" is swept over more than once.")
+
+        values = [value.strip() for value in sweep_args[2 * i + 1].split(",") if value.strip() != ""]
+        if len(values) == 0:
+            raise ValueError("Invalid values passed to 'sweep': No values given for \"" + key + "\".")
+        sweep_grid[key] = values
+
+    return sweep_grid
+
+
+def get_sweep_points(sweep_grid):
+    """Gets the pipeline_config values to be set for each point of a parameter sweep, as the outer product of the
+       values of each swept key.
+    """
+
+    keys = list(sweep_grid)
+
+    return [dict(zip(keys, values)) for values in product(*[sweep_grid[key] for key in keys])]
+
+
 def create_plan(args, return_table=False):
     """Function to create a new simulation plan for this run.
     """
@@ -419,13 +485,13 @@ def create_isf(args,
             # Download MDB files if needed
             if input_port_name == "mdb":
                 if filename[:4] == "WEB/":
-                    qualified_filename = find_file(filename)
+                    qualified_filename = find_input_file(filename, remote_file_cache=args.remote_file_cache_store)
                     mdb_dict = Mdb(qualified_filename).get_all()
                     web_mdb_path = os.path.split(filename)[0]
                     for key in (mdb_keys.vis_gain_coeffs, mdb_keys.vis_readout_noise_table):
                         for data_filename in mdb_dict[key]['Value']:
                             web_data_filename = os.path.join(web_mdb_path, "data", data_filename)
-                            find_file(web_data_filename)
+                            find_input_file(web_data_filename, remote_file_cache=args.remote_file_cache_store)
                             data_filenames.append("data/" + data_filename)
                 else:
                     qualified_filename = find_file(filename, path=search_path)
@@ -461,20 +527,27 @@ def create_isf(args,
 
                 # Now, go through each data file of the product and symlink those from the workdir too
 
-                # Skip (but warn) if it's not an XML data product
+                # Skip (but warn) if it's not an XML data product. Products in a directory with a product catalogue
+                # are looked up in it rather than parsed
                 if qualified_filename[-4:] == EXT_XML:
-                    try:
-                        p = read_xml_product(qualified_filename)
-                        data_filenames = p.get_all_filenames()
-                    except (SAXParseException, UnpicklingError):
-                        logger.error("Cannot read file " + qualified_filename + ".")
-                        raise
+                    data_filenames = get_catalogued_data_filenames(qualified_filename)
+                    if data_filenames is None:
+                        try:
+                            p = read_xml_product(qualified_filename)
+                            data_filenames = p.get_all_filenames()
+                        except (SAXParseException, UnpicklingError):
+                            logger.error("Cannot read file " + qualified_filename + ".")
+                            raise
                 elif qualified_filename[-5:] == EXT_JSON:
                     subfilenames = read_listfile(qualified_filename)
                     for subfilename in subfilenames:
                         qualified_subfilename = find_file(subfilename, path=search_path)
                         _, ext = os.path.splitext(qualified_subfilename)
                         if ext.lower() == EXT_XML:
+                            catalogued_data_filenames = get_catalogued_data_filenames(qualified_subfilename)
+                            if catalogued_data_filenames is not None:
+                                data_filenames += catalogued_data_filenames
+                                continue
                             try:
                                 p = read_xml_product(qualified_subfilename)
                                 data_filenames += p.get_all_filenames()
@@ -568,8 +641,43 @@ def create_isf(args,
     return qualified_isf_filename
 
 
+def create_sweep_point_isf(qualified_isf_filename, workdir, point_workdir, point_logdir, config_filename):
+    """Function to create the ISF for one point of a parameter sweep from the ISF set up for the sweep, so that it
+       runs in its own workdir and logdir with the input files set up in the sweep's workdir.
+    """
+
+    # Read in the ISF set up for the sweep, which create_isf has written as one "arg=value" per line
+    args_to_set = {}
+    with open(qualified_isf_filename, 'r') as fi:
+        for line in fi:
+            arg, value = line.strip().split('=', 1)
+            args_to_set[arg] = value
+
+    args_to_set["workdir"] = point_workdir
+    args_to_set["logdir"] = point_logdir
+    args_to_set["pipeline_config"] = config_filename
+
+    # Link the data directory, and any input files at the top level of the workdir such as listfiles, rather than
+    # setting them up again
+    os.symlink(os.path.join(workdir, "data"), os.path.join(point_workdir, "data"))
+    for arg in args_to_set:
+        if arg in non_filename_args:
+            continue
+        filename = args_to_set[arg]
+        if os.path.split(filename)[0] == "" and os.path.isfile(os.path.join(workdir, filename)):
+            os.symlink(os.path.join(workdir, filename), os.path.join(point_workdir, filename))
+
+    qualified_point_isf_filename = os.path.join(point_workdir, os.path.split(qualified_isf_filename)[1])
+    with open(qualified_point_isf_filename, 'w') as fo:
+        for arg in args_to_set:
+            fo.write(arg + "=" + args_to_set[arg] + "\n")
+
+    return qualified_point_isf_filename
+
+
 def execute_pipeline(pipeline_info, isf, server_url, server_config, local_run=False, dry_run=False):
-    """Sets up and calls a command to execute the pipeline.
+    """Sets up and calls a command to execute the pipeline, returning the exit status of the pipeline runner, or
+       None for a dry run.
     """
 
     if local_run:
@@ -588,7 +696,116 @@ def execute_pipeline(pipeline_info, isf, server_url, server_config, local_run=Fa
         logger.info("If this were not a dry run, the following command would now be called:\n" + cmd)
     else:
         logger.info("Calling pipeline with command: '" + cmd + "'")
-        sbp.call(cmd, shell=True)
+        return sbp.call(cmd, shell=True)
+
+    return None
+
+
+def run_sweep_point(pipeline_info, isf, server_config, dry_run=False):
+    """Runs one point of a parameter sweep locally, returning the exit status of the pipeline runner and the wall
+       time it took.
+    """
+
+    start_time = time.monotonic()
+    exit_status = execute_pipeline(pipeline_info=pipeline_info,
+                                   isf=isf,
+                                   server_url=None,
+                                   server_config=server_config,
+                                   local_run=True,
+                                   dry_run=dry_run)
+
+    return exit_status, time.monotonic() - start_time
+
+
+def get_sweep_results_table(sweep_points, point_workdirs, point_results):
+    """Builds a table comparing the points of a parameter sweep, with a column for each swept key, and the
+       successful points first in order of their wall time.
+    """
+
+    results_table = Table()
+    results_table["point"] = list(range(len(sweep_points)))
+    for key in sweep_points[0]:
+        results_table[key] = [sweep_point[key] for sweep_point in sweep_points]
+    results_table["workdir"] = point_workdirs
+
+    status = []
+    for exit_status, _ in point_results:
+        if exit_status is None:
+            status.append("dry_run")
+        elif exit_status == 0:
+            status.append("success")
+        else:
+            status.append("failed (" + str(exit_status) + ")")
+    results_table["status"] = status
+    results_table["wall_time"] = [wall_time for _, wall_time in point_results]
+    results_table["wall_time"].unit = "s"
+
+    results_table["failed"] = [s.startswith("failed") for s in status]
+    results_table.sort(["failed", "wall_time"])
+    results_table.remove_column("failed")
+
+    return results_table
+
+
+def run_pipeline_sweep(args, chosen_pipeline_info, qualified_isf_filename, server_config):
+    """Runs each point of a parameter sweep locally in its own workdir, up to 'sweep_concurrency' at once, and writes
+       a table comparing their wall times.
+    """
+
+    sweep_points = get_sweep_points(args.sweep_grid)
+    logger.info("Running a sweep over %i points of %s, %i at a time.",
+                len(sweep_points), ", ".join(args.sweep_grid), args.sweep_concurrency)
+
+    # Each point reads the same base config, so find it here in case it's relative to the sweep's workdir
+    point_args = copy(args)
+    point_args.config = find_file(args.config, path=args.workdir)
+
+    # Set up a workdir, config and ISF for each point of the sweep
+    sweep_dir = tempfile.mkdtemp(prefix="sweep_", dir=args.workdir)
+    point_workdirs = []
+    point_isfs = []
+    for point_i, sweep_point in enumerate(sweep_points):
+
+        point_name = "point_%03d" % point_i
+        point_workdir = os.path.join(sweep_dir, point_name)
+
+        # A relative logdir is within each point's workdir, but an absolute one is shared, so give each point its own
+        # directory within it
+        if os.path.isabs(args.logdir):
+            point_logdir = os.path.join(args.logdir, os.path.split(sweep_dir)[1], point_name)
+        else:
+            point_logdir = args.logdir
+        for subdir in ("cache", point_logdir):
+            os.makedirs(os.path.join(point_workdir, subdir))
+
+        point_args.workdir = point_workdir
+        point_args.config_args = list(args.config_args)
+        for key in sweep_point:
+            point_args.config_args += [key, sweep_point[key]]
+        config_filename = create_config(point_args, config_keys=chosen_pipeline_info.config_keys)
+
+        point_workdirs.append(point_workdir)
+        point_isfs.append(create_sweep_point_isf(qualified_isf_filename, args.workdir, point_workdir, point_logdir,
+                                                 config_filename))
+
+    # Run the points, each of which waits on the pipeline runner in its own thread
+    with ThreadPoolExecutor(max_workers=args.sweep_concurrency) as executor:
+        futures = [executor.submit(run_sweep_point,
+                                   pipeline_info=chosen_pipeline_info,
+                                   isf=point_isf,
+                                   server_config=server_config,
+                                   dry_run=args.dry_run) for point_isf in point_isfs]
+        point_results = [future.result() for future in futures]
+
+    results_table = get_sweep_results_table(sweep_points, point_workdirs, point_results)
+
+    qualified_results_filename = os.path.join(args.workdir, args.sweep_results)
+    results_table.write(qualified_results_filename, format="ascii.ecsv", overwrite=True)
+
+    logger.info("Results of the sweep, written to %s:\n%s", qualified_results_filename,
+                "\n".join(results_table.pformat(max_lines=-1, max_width=-1)))
+
+    return results_table
 
 
 def run_pipeline_from_args(args):
@@ -629,8 +846,14 @@ def run_pipeline_from_args(args):
         if server_url is None:
             server_url = default_serverurl
 
-    # Try to call the pipeline
+    # Try to call the pipeline, or run each point of a parameter sweep
     try:
+        if len(args.sweep) > 0:
+            run_pipeline_sweep(args,
+                               chosen_pipeline_info=chosen_pipeline_info,
+                               qualified_isf_filename=qualified_isf_filename,
+                               server_config=server_config)
+            return
         execute_pipeline(pipeline_info=chosen_pipeline_info,
                          isf=qualified_isf_filename,
                          server_url=server_url,
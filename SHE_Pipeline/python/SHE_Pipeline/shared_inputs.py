@@ -0,0 +1,113 @@
+""" @file shared_inputs.py
+
+    Created 19 October 2026
+
+    Location of the data files of input products, including the read-only inputs shared by every simulation.
+"""
+
+__updated__ = "2026-10-19"
+
+# Copyright (C) 2012-2020 Euclid Science Ground Segment
+#
+# This library is free software; you can redistribute it and/or modify it under the terms of the GNU Lesser General
+# Public License as published by the Free Software Foundation; either version 3.0 of the License, or (at your option)
+# any later version.
+#
+# This library is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY; without even the implied
+# warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU Lesser General Public License for more
+# details.
+#
+# You should have received a copy of the GNU Lesser General Public License along with this library; if not, write to
+# the Free Software Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA
+
+import os
+from pickle import UnpicklingError
+from xml.sax import SAXParseException
+
+from SHE_PPT.file_io import find_file, read_listfile, read_xml_product
+from SHE_PPT.logging import getLogger
+from SHE_PPT.mdb import Mdb, mdb_keys
+
+from .product_catalog import get_catalogued_data_filenames
+from .remote_file_cache import find_input_file
+
+# Input ports of the ISF whose products (and their data files) are read, unchanged, by every simulation
+SHARED_INPUT_PORTS = ("ksb_training_data", "lensmc_training_data", "momentsml_training_data",
+                      "regauss_training_data", "mdb")
+
+logger = getLogger(__name__)
+
+
+def get_input_data_filenames(input_port_name, filename, qualified_filename, search_path, remote_file_cache=None):
+    """ Gets the data files pointed to by an input product, or by the products in an input listfile. Products in a
+        directory with a product catalogue are looked up in it rather than parsed, and remote MDB files are fetched
+        through the remote file cache, if one is given.
+
+    @return: Filenames of the data files, or None if the input isn't a product or listfile
+    @rtype:  list<str>
+    """
+
+    data_filenames = []
+    # Download MDB files if needed
+    if input_port_name == "mdb":
+        if filename[:4] == "WEB/":
+            qualified_filename = find_input_file(filename, remote_file_cache=remote_file_cache)
+            mdb_dict = Mdb(qualified_filename).get_all()
+            web_mdb_path = os.path.split(filename)[0]
+            for key in (mdb_keys.vis_gain_coeffs, mdb_keys.vis_readout_noise_table):
+                for data_filename in mdb_dict[key]['Value']:
+                    web_data_filename = os.path.join(web_mdb_path, "data", data_filename)
+                    find_input_file(web_data_filename, remote_file_cache=remote_file_cache)
+                    data_filenames.append("data/" + data_filename)
+    # Get all data files this product points to
+    elif qualified_filename[-4:] == ".xml":
+        data_filenames = get_catalogued_data_filenames(qualified_filename)
+        if data_filenames is None:
+            try:
+                p = read_xml_product(qualified_filename)
+                data_filenames = p.get_all_filenames()
+            except (SAXParseException, UnpicklingError, UnicodeDecodeError):
+                logger.error("Cannot read file " + qualified_filename + ".")
+                raise
+    elif qualified_filename[-5:] == ".json":
+        subfilenames = read_listfile(qualified_filename)
+        for subfilename in subfilenames:
+            qualified_subfilename = find_file(subfilename, path=search_path)
+            catalogued_data_filenames = get_catalogued_data_filenames(qualified_subfilename)
+            if catalogued_data_filenames is not None:
+                data_filenames += catalogued_data_filenames
+                continue
+            try:
+                p = read_xml_product(qualified_subfilename)
+                data_filenames += p.get_all_filenames()
+            except (SAXParseException, UnpicklingError, UnicodeDecodeError):
+                logger.error("Cannot read file " + qualified_filename + ".")
+                raise
+    else:
+        return None
+
+    return [data_filename for data_filename in data_filenames
+            if not (data_filename is None or data_filename == "None" or data_filename == "data/None")]
+
+
+def get_data_search_path(qualified_filename, search_path):
+    """ Gets the path to search for the data files of a product: around the product itself, then the search path.
+    """
+    return (os.path.split(qualified_filename)[0] + ":" +
+            os.path.split(qualified_filename)[0] + "/data:" +
+            os.path.split(qualified_filename)[0] + "/..:" +
+            os.path.split(qualified_filename)[0] + "/../data:" + search_path)
+
+
+def find_data_file(data_filename, data_search_path):
+    """ Finds the qualified location of the data file of a product.
+    """
+
+    try:
+        return find_file(data_filename, path=data_search_path)
+    except RuntimeError:
+        # Try searching for the file without the "data/" prefix
+        try:
+            return find_file(data_filename.replace("data/", "", 1), path=data_search_path)
+        except RuntimeError:
+            raise RuntimeError("Data file " + data_filename + " cannot be found in path " + data_search_path)
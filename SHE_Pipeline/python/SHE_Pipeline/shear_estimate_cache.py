@@ -0,0 +1,465 @@
+""" @file shear_estimate_cache.py
+
+    Created 19 October 2026
+
+    Cache of the shear estimates of each method, keyed by the content of their inputs, so that only methods whose
+    inputs have changed are re-run.
+"""
+
+__updated__ = "2026-10-19"
+
+# Copyright (C) 2012-2020 Euclid Science Ground Segment
+#
+# This library is free software; you can redistribute it and/or modify it under the terms of the GNU Lesser General
+# Public License as published by the Free Software Foundation; either version 3.0 of the License, or (at your option)
+# any later version.
+#
+# This library is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY; without even the implied
+# warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU Lesser General Public License for more
+# details.
+#
+# You should have received a copy of the GNU Lesser General Public License along with this library; if not, write to
+# the Free Software Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA
+
+import hashlib
+import importlib
+import json
+import os
+import shutil
+import time
+
+from SHE_PPT.file_io import read_listfile, read_xml_product, write_xml_product
+from SHE_PPT.logging import getLogger
+
+from . import pipeline_utilities as pu
+from .shared_inputs import find_data_file, get_data_search_path
+
+SHEAR_ESTIMATION_METHODS = ("KSB", "LensMC", "MomentsML", "REGAUSS")
+
+# Input port of the training data used by each method
+METHOD_TRAINING_DATA_PORTS = {"KSB": "ksb_training_data",
+                              "LensMC": "lensmc_training_data",
+                              "MomentsML": "momentsml_training_data",
+                              "REGAUSS": "regauss_training_data", }
+
+METHODS_CONFIG_KEY = "SHE_CTE_EstimateShear_methods"
+ESTIMATE_SHEAR_CONFIG_PREFIX = "SHE_CTE_EstimateShear_"
+
+# Pipeline config keys which apply to only one method, besides those whose names include the method's name (e.g.
+# SHE_LensMC_stamp_size)
+METHOD_CONFIG_KEYS = {"LensMC": ("SHE_CTE_EstimateShear_chains",), }
+
+# Packages whose versions are part of each key, so that estimates made by other versions aren't reused
+KEY_PACKAGES = ("SHE_CTE", "SHE_PPT")
+
+FITS_BLOCK_SIZE = 2880
+FITS_CARD_SIZE = 80
+
+# FITS header keywords which differ between files with otherwise identical contents
+VOLATILE_FITS_KEYWORDS = ("DATE", "CHECKSUM", "DATASUM")
+
+CACHE_ESTIMATES_FILENAME = "estimates.fits"
+CACHE_PRODUCT_FILENAME = "product.xml"
+CACHE_META_FILENAME = "meta.json"
+
+HASH_CHUNK_SIZE = 1024 ** 2
+
+logger = getLogger(__name__)
+
+
+def _parse_fits_header_value(card):
+    return card[10:].split(b"/")[0].strip().decode("ascii", "replace")
+
+
+def _update_hash_with_fits_file(hasher, fi):
+    """ Updates a hash with the contents of a FITS file, skipping header cards whose values are volatile (e.g. the
+        date the file was written).
+    """
+
+    while True:
+
+        # Read the header of the next HDU
+        cards = []
+        ended = False
+        while not ended:
+            block = fi.read(FITS_BLOCK_SIZE)
+            if not block:
+                return
+            for i in range(0, len(block), FITS_CARD_SIZE):
+                card = block[i:i + FITS_CARD_SIZE]
+                keyword = card[:8].decode("ascii", "replace").strip()
+                if keyword == "END":
+                    ended = True
+                    break
+                cards.append((keyword, card))
+
+        values = {}
+        for keyword, card in cards:
+            if card[8:10] == b"= ":
+                values[keyword] = _parse_fits_header_value(card)
+            if keyword not in VOLATILE_FITS_KEYWORDS:
+                hasher.update(card)
+
+        # Hash its data, of a size given by the header
+        naxis = int(values.get("NAXIS", 0))
+        if naxis > 0:
+            number_elements = 1
+            for axis in range(1, naxis + 1):
+                number_elements *= int(values[f"NAXIS{axis}"])
+            data_size = (abs(int(values.get("BITPIX", 8))) // 8 * int(values.get("GCOUNT", 1)) *
+                         (int(values.get("PCOUNT", 0)) + number_elements))
+        else:
+            data_size = 0
+        remaining = -(-data_size // FITS_BLOCK_SIZE) * FITS_BLOCK_SIZE
+        while remaining > 0:
+            chunk = fi.read(min(remaining, HASH_CHUNK_SIZE))
+            if not chunk:
+                return
+            hasher.update(chunk)
+            remaining -= len(chunk)
+
+
+def hash_data_file(qualified_filename):
+    """ Gets a hash of the contents of a data file. For FITS files, header cards with volatile values are skipped, so
+        that files with the same data and metadata written at different times have the same hash.
+
+    @rtype: str
+    """
+
+    hasher = hashlib.sha256()
+    with open(qualified_filename, "rb") as fi:
+        if fi.read(9) == b"SIMPLE  =":
+            fi.seek(0)
+            try:
+                _update_hash_with_fits_file(hasher, fi)
+                return hasher.hexdigest()
+            except (ValueError, KeyError):
+                # Not a FITS file we can parse, so hash it all
+                hasher = hashlib.sha256()
+        fi.seek(0)
+        for chunk in iter(lambda: fi.read(HASH_CHUNK_SIZE), b""):
+            hasher.update(chunk)
+
+    return hasher.hexdigest()
+
+
+def hash_input_products(filenames, workdir):
+    """ Gets a hash of the contents of the data files of input products (or listfiles of products). The product
+        files themselves aren't included, as they contain the (unique) names of their data files and the time they
+        were written.
+
+    @rtype: str
+    """
+
+    hasher = hashlib.sha256()
+    for filename in filenames:
+
+        hasher.update(b"input")
+        if filename is None or filename == "None":
+            continue
+
+        qualified_filename = os.path.join(workdir, filename)
+        if filename.endswith(".json"):
+            product_filenames = read_listfile(qualified_filename)
+        else:
+            product_filenames = [filename]
+
+        for product_filename in product_filenames:
+            hasher.update(b"product")
+            qualified_product_filename = os.path.join(workdir, product_filename)
+            if not product_filename.endswith(".xml"):
+                hasher.update(hash_data_file(qualified_product_filename).encode())
+                continue
+            data_search_path = get_data_search_path(qualified_product_filename, workdir)
+            for data_filename in read_xml_product(qualified_product_filename).get_all_filenames():
+                if data_filename is None or data_filename in ("", "None", "data/None"):
+                    continue
+                hasher.update(hash_data_file(find_data_file(data_filename, data_search_path)).encode())
+
+    return hasher.hexdigest()
+
+
+def read_pipeline_config_values(qualified_filename):
+    """ Reads the values in a pipeline config file, as strings keyed by the names of their keys.
+    """
+
+    values = {}
+    with open(qualified_filename, "r") as fi:
+        for line in fi:
+            line = line.split("#")[0].strip()
+            if "=" not in line:
+                continue
+            key, value = line.split("=", 1)
+            values[key.strip()] = value.strip()
+
+    return values
+
+
+def get_config_methods(config_values):
+    """ Gets the shear estimation methods run with a pipeline config, which is all of them by default.
+    """
+    methods = config_values.get(METHODS_CONFIG_KEY, "").split()
+    if not methods or methods == ["None"]:
+        return list(SHEAR_ESTIMATION_METHODS)
+    return methods
+
+
+def write_pipeline_config_with_methods(qualified_filename, methods, new_qualified_filename):
+    """ Writes a copy of a pipeline config which runs only the given shear estimation methods.
+    """
+
+    with open(qualified_filename, "r") as fi:
+        lines = [line for line in fi if line.split("=")[0].strip() != METHODS_CONFIG_KEY]
+
+    with open(new_qualified_filename, "w") as fo:
+        fo.writelines(lines)
+        if lines and not lines[-1].endswith("\n"):
+            fo.write("\n")
+        fo.write(f"{METHODS_CONFIG_KEY} = {' '.join(methods)}\n")
+
+
+def _get_config_key_method(key):
+    """ Gets the method a pipeline config key applies to only, or None if it isn't specific to one method.
+    """
+    for method in SHEAR_ESTIMATION_METHODS:
+        if method.lower() in key.lower() or key in METHOD_CONFIG_KEYS.get(method, ()):
+            return method
+    return None
+
+
+def get_method_config(config_values, method):
+    """ Gets the settings in a pipeline config which affect the shear estimates of a method: the estimate shear
+        settings which apply to all methods, other than which methods are run, and the settings specific to this
+        method.
+    """
+
+    method_config = {}
+    for key, value in config_values.items():
+        key_method = _get_config_key_method(key)
+        if key_method == method or (key_method is None and key.startswith(ESTIMATE_SHEAR_CONFIG_PREFIX) and
+                                    key != METHODS_CONFIG_KEY):
+            method_config[key] = value
+
+    return method_config
+
+
+def _get_package_versions():
+    versions = {}
+    for package in KEY_PACKAGES:
+        try:
+            versions[package] = getattr(importlib.import_module(package), "__version__", None)
+        except ImportError:
+            versions[package] = None
+    return versions
+
+
+def get_method_cache_keys(methods, workdir, pipeline_config, image_products, training_data, mdb):
+    """ Gets the cache key of the shear estimates of each method, as a hash of: the contents of the input images,
+        PSFs, segmentation maps and detections tables; the method's training data and the MDB; the settings in the
+        pipeline config which affect the method (see get_method_config); and the versions of the packages which
+        estimate shear.
+
+    @param image_products: Filenames of the image, PSF, segmentation and detections products and listfiles
+    @param training_data: Filename of the training data of each method, keyed by method
+
+    @return: Key of each method
+    @rtype:  dict<str, str>
+    """
+
+    config_values = read_pipeline_config_values(os.path.join(workdir, pipeline_config))
+
+    common_description = {"images": hash_input_products(image_products, workdir),
+                          "mdb": hash_input_products([mdb], workdir),
+                          "versions": _get_package_versions(), }
+
+    keys = {}
+    for method in methods:
+        description = dict(common_description,
+                           method=method,
+                           config=get_method_config(config_values, method),
+                           training_data=hash_input_products([training_data.get(method)], workdir))
+        keys[method] = hashlib.sha256(json.dumps(description, sort_keys=True).encode()).hexdigest()
+
+    return keys
+
+
+class ShearEstimateCache(object):
+    """ Cache of the shear estimates of individual methods in a directory, shared by all workers (and runs) which use
+        it. Each entry holds a method's estimates table, a copy of the shear estimates product it was made in, and
+        its metadata, whose modification time is updated whenever the entry is used. Once the cache exceeds its
+        maximum size, the least recently used entries are evicted.
+    """
+
+    def __init__(self, cache_dir, max_size):
+        self.cache_dir = cache_dir
+        self.max_size = max_size
+
+    def _get_entry_dir(self, key):
+        return os.path.join(self.cache_dir, key[:2], key)
+
+    def get(self, key):
+        """ Gets the entry for a key, marking it as used.
+
+        @return: Directory of the entry, or None if it's not cached
+        @rtype:  str
+        """
+
+        entry_dir = self._get_entry_dir(key)
+        meta_filename = os.path.join(entry_dir, CACHE_META_FILENAME)
+        try:
+            os.utime(meta_filename)
+        except OSError:
+            return None
+
+        return entry_dir
+
+    def put(self, key, method, qualified_estimates_filename, qualified_product_filename):
+        """ Adds a method's estimates to the cache, unless they're already there, then evicts the least recently used
+            entries if it's over its maximum size.
+        """
+
+        entry_dir = self._get_entry_dir(key)
+        if os.path.exists(entry_dir):
+            return
+
+        # Build the entry in a temporary directory which is moved into place, so it's only ever seen complete
+        os.makedirs(os.path.dirname(entry_dir), exist_ok=True)
+        tmp_entry_dir = f"{entry_dir}.{os.getpid()}.tmp"
+        shutil.rmtree(tmp_entry_dir, ignore_errors=True)
+        os.mkdir(tmp_entry_dir)
+        shutil.copyfile(qualified_estimates_filename, os.path.join(tmp_entry_dir, CACHE_ESTIMATES_FILENAME))
+        shutil.copyfile(qualified_product_filename, os.path.join(tmp_entry_dir, CACHE_PRODUCT_FILENAME))
+        with open(os.path.join(tmp_entry_dir, CACHE_META_FILENAME), "w") as fo:
+            json.dump({"method": method, "created": time.time()}, fo)
+
+        try:
+            os.rename(tmp_entry_dir, entry_dir)
+        except OSError:
+            # Added by another worker in the meantime
+            shutil.rmtree(tmp_entry_dir, ignore_errors=True)
+
+        self.evict()
+
+    def _list_entries(self):
+        """ Lists the entries in the cache, as (time last used, size, directory).
+        """
+
+        entries = []
+        for prefix in os.listdir(self.cache_dir):
+            prefix_dir = os.path.join(self.cache_dir, prefix)
+            if not os.path.isdir(prefix_dir):
+                continue
+            for key in os.listdir(prefix_dir):
+                entry_dir = os.path.join(prefix_dir, key)
+                if key.endswith(".tmp"):
+                    continue
+                try:
+                    last_used = os.path.getmtime(os.path.join(entry_dir, CACHE_META_FILENAME))
+                    size = sum(os.path.getsize(os.path.join(entry_dir, filename))
+                               for filename in os.listdir(entry_dir))
+                except OSError:
+                    continue
+                entries.append((last_used, size, entry_dir))
+
+        return entries
+
+    def evict(self):
+        """ Removes the least recently used entries until the cache is within its maximum size.
+
+        @return: Number of entries evicted
+        @rtype:  int
+        """
+
+        with pu.file_lock(os.path.join(self.cache_dir, "cache")):
+
+            entries = sorted(self._list_entries())
+            total_size = sum(size for _, size, _ in entries)
+
+            number_evicted = 0
+            for _, size, entry_dir in entries:
+                if total_size <= self.max_size:
+                    break
+                shutil.rmtree(entry_dir, ignore_errors=True)
+                total_size -= size
+                number_evicted += 1
+
+        if number_evicted:
+            logger.debug("Evicted %s entries from the shear estimate cache.", number_evicted)
+
+        return number_evicted
+
+
+def estimate_shear_with_cache(cache, estimate_shear, workdir, pipeline_config, shear_estimates_product,
+                              image_products, training_data, mdb):
+    """ Estimates shear through a cache: methods whose estimates are cached are taken from it, the others are run
+        with a copy of the pipeline config restricted to them, and the shear estimates product is assembled from
+        both. Newly estimated methods are added to the cache.
+
+    @param estimate_shear: Function which estimates shear when passed a pipeline config filename
+    @param pipeline_config: Filename of the pipeline config, relative to the workdir
+    @param shear_estimates_product: Filename of the shear estimates product to write, relative to the workdir
+
+    @return: Methods taken from the cache, and methods run
+    @rtype:  tuple(list<str>, list<str>)
+    """
+
+    qualified_pipeline_config = os.path.join(workdir, pipeline_config)
+    methods = get_config_methods(read_pipeline_config_values(qualified_pipeline_config))
+    keys = get_method_cache_keys(methods, workdir, pipeline_config, image_products, training_data, mdb)
+
+    # Copy the cached estimates into the workdir straight away. Another worker could evict an entry at any time, in
+    # which case its method is estimated instead
+    cached_estimates_filenames = {}
+    cached_product = None
+    for method in methods:
+        entry_dir = cache.get(keys[method])
+        if entry_dir is None:
+            continue
+        estimates_filename = os.path.join(os.path.dirname(shear_estimates_product),
+                                          f"cached_{method}_shear_estimates_{keys[method][:16]}.fits")
+        try:
+            shutil.copyfile(os.path.join(entry_dir, CACHE_ESTIMATES_FILENAME),
+                            os.path.join(workdir, estimates_filename))
+            if cached_product is None:
+                cached_product = read_xml_product(os.path.join(entry_dir, CACHE_PRODUCT_FILENAME))
+        except OSError as e:
+            logger.warning("Cached %s shear estimates were evicted while being read (%s); they will be estimated "
+                           "instead.", method, e)
+            continue
+        cached_estimates_filenames[method] = estimates_filename
+    methods_to_run = [method for method in methods if method not in cached_estimates_filenames]
+
+    qualified_product_filename = os.path.join(workdir, shear_estimates_product)
+
+    if methods_to_run:
+        if cached_estimates_filenames:
+            run_pipeline_config = os.path.splitext(shear_estimates_product)[0] + "_pipeline_config.txt"
+            write_pipeline_config_with_methods(qualified_pipeline_config, methods_to_run,
+                                               os.path.join(workdir, run_pipeline_config))
+        else:
+            run_pipeline_config = pipeline_config
+        estimate_shear(run_pipeline_config)
+        p = read_xml_product(qualified_product_filename)
+    else:
+        # Start from the product a cached method was estimated in
+        p = cached_product
+        for method in SHEAR_ESTIMATION_METHODS:
+            if method not in methods:
+                p.set_method_filename(method, None)
+
+    # Point the product to the cached estimates
+    for method, estimates_filename in cached_estimates_filenames.items():
+        p.set_method_filename(method, estimates_filename)
+
+    write_xml_product(p, qualified_product_filename)
+
+    for method in methods_to_run:
+        estimates_filename = p.get_method_filename(method)
+        if estimates_filename is None or estimates_filename == "None":
+            continue
+        cache.put(keys[method], method, os.path.join(workdir, estimates_filename), qualified_product_filename)
+
+    logger.info("Shear estimates for %s taken from the cache; %s estimated.",
+                list(cached_estimates_filenames) or "no methods", methods_to_run or "no methods")
+
+    return list(cached_estimates_filenames), methods_to_run
@@ -0,0 +1,228 @@
+""" @file simulation_cost_model.py
+
+    Created 19 October 2026
+
+    Model of the cost of each simulation in the parallel bias measurement pipeline, used to order simulations so
+    that the most expensive are run first.
+"""
+
+__updated__ = "2026-10-19"
+
+# Copyright (C) 2012-2020 Euclid Science Ground Segment
+#
+# This library is free software; you can redistribute it and/or modify it under the terms of the GNU Lesser General
+# Public License as published by the Free Software Foundation; either version 3.0 of the License, or (at your option)
+# any later version.
+#
+# This library is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY; without even the implied
+# warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU Lesser General Public License for more
+# details.
+#
+# You should have received a copy of the GNU Lesser General Public License along with this library; if not, write to
+# the Free Software Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA
+
+import json
+import os
+
+from SHE_PPT.logging import getLogger
+
+from .pipeline_utilities import file_lock, write_json_atomically
+
+TIMINGS_FORMAT_VERSION = 1
+
+# Columns of the simulation plan which the cost of a simulation is expected to scale with
+COST_FEATURE_COLUMNS = ("NUM_GALAXIES", "NUM_DETECTORS")
+
+# Prefixes of the columns of the simulation plan giving seed ranges, which differ between batches run from the same
+# configuration
+SEED_COLUMN_PREFIXES = ("MSEED_", "NSEED_")
+
+# Weight, in number of timings, given to the prior that a configuration costs what its size predicts, when
+# estimating how much more or less than this it actually costs
+CONFIG_PRIOR_TIMINGS = 1.
+
+# Maximum number of timing records kept in a timings file, with the oldest discarded first
+MAX_TIMING_RECORDS = 10000
+
+logger = getLogger(__name__)
+
+
+def get_plan_row_size(row):
+    """ Gets the size of simulations generated from a row of the simulation plan: the product of its cost feature
+        columns, ignoring any which are missing or invalid.
+    """
+
+    size = 1.
+    for column in COST_FEATURE_COLUMNS:
+        try:
+            size *= max(float(row[column]), 1.)
+        except (KeyError, ValueError, TypeError):
+            continue
+
+    return size
+
+
+def get_plan_row_config(row):
+    """ Gets a key identifying the configuration of simulations generated from a row of the simulation plan, so that
+        their timings can be matched in later batches: the row's values other than its seed ranges.
+    """
+
+    columns = row.colnames if hasattr(row, "colnames") else list(row)
+
+    return json.dumps({column: str(row[column]) for column in columns
+                       if not column.startswith(SEED_COLUMN_PREFIXES)}, sort_keys=True)
+
+
+def _fit_line(sizes, durations):
+    """ Fits duration = intercept + slope * size by least squares, falling back to a line through the origin if
+        there aren't enough distinct sizes or the fitted slope isn't positive.
+
+    @return: (intercept, slope)
+    @rtype:  tuple(float, float)
+    """
+
+    n = len(sizes)
+    mean_size = sum(sizes) / n
+    mean_duration = sum(durations) / n
+
+    size_var = sum((size - mean_size) ** 2 for size in sizes)
+    if size_var > 0:
+        slope = sum((size - mean_size) * (duration - mean_duration)
+                    for size, duration in zip(sizes, durations)) / size_var
+        intercept = mean_duration - slope * mean_size
+        if slope > 0 and intercept >= 0:
+            return intercept, slope
+
+    return 0., sum(durations) / sum(sizes)
+
+
+class SimulationCostModel(object):
+    """ Predicts the duration of a simulation from its size and configuration (see get_plan_row_config). Each
+        stage is modelled as a linear function of size fitted to all recorded timings, scaled by a factor for each
+        configuration which has been timed, measuring how much more or less than this that stage has taken for it.
+        Until any timings have been recorded, the size itself is used as the cost, which is enough to order
+        simulations.
+    """
+
+    def __init__(self):
+
+        # Recorded timings, as (size, {stage: duration}, config)
+        self.records = []
+        self._new_records = []
+
+        self._fits = None
+        self._config_factors = None
+
+    @property
+    def has_timings(self):
+        return len(self.records) > 0
+
+    def add_timing(self, size, stage_durations, config=None):
+        self.records.append((size, dict(stage_durations), config))
+        self._new_records.append((size, dict(stage_durations), config))
+        self._fits = None
+        self._config_factors = None
+
+    def _get_fits(self):
+
+        if self._fits is None:
+
+            stage_timings = {}
+            for size, stage_durations, _config in self.records:
+                for stage, duration in stage_durations.items():
+                    stage_timings.setdefault(stage, ([], []))
+                    stage_timings[stage][0].append(size)
+                    stage_timings[stage][1].append(duration)
+
+            self._fits = {stage: _fit_line(sizes, durations) for stage, (sizes, durations) in stage_timings.items()}
+
+        return self._fits
+
+    def _get_config_factors(self):
+        """ Gets the ratio of the recorded to the fitted duration of each stage for each configuration, shrunk
+            towards 1 for configurations with few timings.
+
+        @return: Factors keyed by (config, stage)
+        @rtype:  dict
+        """
+
+        if self._config_factors is None:
+
+            fits = self._get_fits()
+
+            # Total recorded and fitted durations, and number of timings, for each configuration and stage
+            totals = {}
+            for size, stage_durations, config in self.records:
+                if config is None:
+                    continue
+                for stage, duration in stage_durations.items():
+                    intercept, slope = fits[stage]
+                    total = totals.setdefault((config, stage), [0., 0., 0])
+                    total[0] += duration
+                    total[1] += intercept + slope * size
+                    total[2] += 1
+
+            self._config_factors = {}
+            for key, (recorded, fitted, number_timings) in totals.items():
+                if not fitted > 0:
+                    continue
+                self._config_factors[key] = ((number_timings * recorded / fitted + CONFIG_PRIOR_TIMINGS) /
+                                             (number_timings + CONFIG_PRIOR_TIMINGS))
+
+        return self._config_factors
+
+    def predict(self, size, config=None):
+        """ Predicts the duration in seconds of a simulation of the given size and configuration, or, if no timings
+            have been recorded, its relative cost.
+        """
+
+        if not self.has_timings:
+            return size
+
+        config_factors = self._get_config_factors()
+
+        return sum((intercept + slope * size) * config_factors.get((config, stage), 1.)
+                   for stage, (intercept, slope) in self._get_fits().items())
+
+    def load(self, filename):
+        """ Adds the timings recorded in a timings file, if it exists.
+        """
+
+        if not os.path.exists(filename):
+            return
+
+        with open(filename, "r") as fi:
+            contents = json.load(fi)
+        if contents.get("version") != TIMINGS_FORMAT_VERSION:
+            logger.warning("Timings file %s has unsupported format version %s; ignoring it.", filename,
+                           contents.get("version"))
+            return
+
+        self.records += [(record["size"], record["stage_durations"], record.get("config"))
+                         for record in contents["records"]]
+        self._fits = None
+        self._config_factors = None
+
+        logger.info("Loaded %s simulation timings from %s.", len(contents["records"]), filename)
+
+    def save(self, filename):
+        """ Appends the timings recorded since this model was created to a timings file, which may be shared with
+            other runs.
+        """
+
+        if not self._new_records:
+            return
+
+        with file_lock(filename):
+            records = []
+            if os.path.exists(filename):
+                with open(filename, "r") as fi:
+                    contents = json.load(fi)
+                if contents.get("version") == TIMINGS_FORMAT_VERSION:
+                    records = contents["records"]
+            records += [{"size": size, "stage_durations": stage_durations, "config": config}
+                        for size, stage_durations, config in self._new_records]
+            write_json_atomically(filename, {"version": TIMINGS_FORMAT_VERSION,
+                                             "records": records[-MAX_TIMING_RECORDS:]})
+
+        self._new_records = []
@@ -0,0 +1,481 @@
+""" @file simulation_executors.py
+
+    Created 19 October 2026
+
+    Interchangeable backends for running the tasks of the parallel bias measurement pipeline.
+"""
+
+__updated__ = "2026-10-19"
+
+# Copyright (C) 2012-2020 Euclid Science Ground Segment
+#
+# This library is free software; you can redistribute it and/or modify it under the terms of the GNU Lesser General
+# Public License as published by the Free Software Foundation; either version 3.0 of the License, or (at your option)
+# any later version.
+#
+# This library is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY; without even the implied
+# warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU Lesser General Public License for more
+# details.
+#
+# You should have received a copy of the GNU Lesser General Public License along with this library; if not, write to
+# the Free Software Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA
+
+from concurrent.futures import ProcessPoolExecutor
+import multiprocessing
+import os
+import pickle
+import queue
+import signal
+import threading
+import time
+
+from SHE_PPT.logging import getLogger
+
+from .io_throttle import IOThrottle, install_io_throttle
+from .memory_profiles import disable_thp
+from .simulation_scheduler import init_worker, init_worker_progress
+from .worker_placement import claim_placement_slot, place_worker
+
+EXECUTOR_BACKENDS = ("fork", "forkserver", "futures", "mpi", "serial")
+
+# Environment variables which limit the number of threads used by native libraries: OpenMP (including GalSim's
+# FFTW), MKL, OpenBLAS, BLIS, Accelerate, and numexpr
+NATIVE_THREAD_ENV_VARS = ("OMP_NUM_THREADS", "MKL_NUM_THREADS", "OPENBLAS_NUM_THREADS", "BLIS_NUM_THREADS",
+                          "VECLIB_MAXIMUM_THREADS", "NUMEXPR_NUM_THREADS")
+
+# Rank of the MPI process which runs the scheduler; all others are workers
+MPI_MASTER_RANK = 0
+
+# Tags of the messages passed between the MPI master and workers
+MPI_TASK_TAG = 1
+MPI_RESULT_TAG = 2
+MPI_PROGRESS_TAG = 3
+MPI_STOP_TAG = 4
+MPI_CONFIG_TAG = 5
+
+# Interval in seconds at which the MPI master checks for messages from workers when it has nothing else to do
+MPI_POLL_INTERVAL = 0.01
+
+logger = getLogger(__name__)
+
+
+def limit_native_threads(threads_per_process):
+    """ Limits the number of threads used by native libraries in this process. The environment variables read by
+        these libraries are set, which applies to any not yet loaded and to subprocesses, and if threadpoolctl is
+        available, it's used to limit the libraries which are already loaded.
+
+    @return: Whether threadpoolctl was used
+    @rtype:  bool
+    """
+
+    for env_var in NATIVE_THREAD_ENV_VARS:
+        os.environ[env_var] = str(threads_per_process)
+
+    try:
+        from threadpoolctl import threadpool_limits
+    except ImportError:
+        return False
+
+    threadpool_limits(limits=threads_per_process)
+    return True
+
+
+def get_native_thread_config(threads_per_process):
+    """ Gets a description of how native threads are limited in workers, for the run metadata.
+    """
+
+    try:
+        import threadpoolctl
+        threadpoolctl_version = threadpoolctl.__version__
+    except ImportError:
+        threadpoolctl_version = None
+
+    return {"threads_per_process": threads_per_process,
+            "environment": {env_var: str(threads_per_process) for env_var in NATIVE_THREAD_ENV_VARS},
+            "threadpoolctl_version": threadpoolctl_version, }
+
+
+def init_executor_worker(progress_queue, threads_per_process=None, placement_slots=None, thp_disable=False,
+                         io_throttle=None):
+    """ Initializer for the workers of an executor. If placement_slots (a shared array with an element for each
+        worker) is given, the worker is pinned to the CPUs and NUMA node planned for the slot it claims. If an
+        io_throttle (shared by all workers) is given, the stages the worker runs are throttled by it.
+    """
+    if thp_disable and not disable_thp():
+        logger.warning("Could not disable transparent huge pages for worker %s.", os.getpid())
+    if placement_slots is not None:
+        place_worker(claim_placement_slot(placement_slots), len(placement_slots), threads_per_process)
+    if threads_per_process is not None:
+        limit_native_threads(threads_per_process)
+    install_io_throttle(io_throttle)
+    init_worker(progress_queue)
+
+
+def _create_placement_slots(context, number_workers, placement):
+    if placement == "numa":
+        return context.Array("i", number_workers)
+    return None
+
+
+def _create_io_throttle(context, io_limits):
+    if io_limits is not None:
+        return IOThrottle(io_limits, context)
+    return None
+
+
+def _remove_io_throttle(io_throttle):
+    if io_throttle is not None:
+        io_throttle.remove()
+
+
+class PoolExecutor(object):
+    """ Executor which runs tasks in a multiprocessing pool, with worker processes started by the given method
+        (fork or forkserver).
+    """
+
+    def __init__(self, number_workers, start_method="fork", threads_per_process=None, placement="none",
+                 thp_disable=False, io_limits=None):
+
+        self.number_workers = number_workers
+
+        context = multiprocessing.get_context(start_method)
+        self.progress_queue = context.Queue()
+        self._io_throttle = _create_io_throttle(context, io_limits)
+        self._pool = context.Pool(processes=number_workers, initializer=init_executor_worker,
+                                  initargs=(self.progress_queue, threads_per_process,
+                                            _create_placement_slots(context, number_workers, placement),
+                                            thp_disable, self._io_throttle))
+
+    def apply_async(self, function, args, callback, error_callback):
+        self._pool.apply_async(function, args, callback=callback, error_callback=error_callback)
+
+    def kill_worker(self, pid):
+        """ Kills a worker process, which the pool replaces.
+        """
+        try:
+            os.kill(pid, signal.SIGKILL)
+        except ProcessLookupError:
+            pass
+        return True
+
+    def close(self):
+        self._pool.close()
+
+    def terminate(self):
+        self._pool.terminate()
+
+    def join(self):
+        self._pool.join()
+        _remove_io_throttle(self._io_throttle)
+
+
+class FuturesExecutor(object):
+    """ Executor which runs tasks in a concurrent.futures.ProcessPoolExecutor. Its workers can't be killed without
+        breaking the executor, so tasks which are cancelled (e.g. after a hard timeout) run to completion and their
+        results are ignored.
+    """
+
+    def __init__(self, number_workers, threads_per_process=None, placement="none", start_method=None,
+                 thp_disable=False, io_limits=None):
+
+        self.number_workers = number_workers
+
+        context = multiprocessing.get_context(start_method)
+        self.progress_queue = context.Queue()
+        self._io_throttle = _create_io_throttle(context, io_limits)
+        self._executor = ProcessPoolExecutor(max_workers=number_workers, mp_context=context,
+                                             initializer=init_executor_worker,
+                                             initargs=(self.progress_queue, threads_per_process,
+                                                       _create_placement_slots(context, number_workers, placement),
+                                                       thp_disable, self._io_throttle))
+
+    def apply_async(self, function, args, callback, error_callback):
+
+        def done_callback(future):
+            exception = future.exception()
+            if exception is None:
+                callback(future.result())
+            else:
+                error_callback(exception)
+
+        self._executor.submit(function, *args).add_done_callback(done_callback)
+
+    def kill_worker(self, _pid):
+        return False
+
+    def close(self):
+        self._executor.shutdown(wait=False)
+
+    def terminate(self):
+        # The executor has no way to stop running tasks, so its processes are terminated directly
+        processes = list(getattr(self._executor, "_processes", {}).values())
+        self._executor.shutdown(wait=False, cancel_futures=True)
+        for process in processes:
+            process.terminate()
+
+    def join(self):
+        self._executor.shutdown(wait=True)
+        _remove_io_throttle(self._io_throttle)
+
+
+class SerialExecutor(object):
+    """ Executor which runs each task in this process as soon as it's submitted, for debugging. Any limit on native
+        threads or I/O is applied to this process.
+    """
+
+    number_workers = 1
+
+    def __init__(self, threads_per_process=None, io_limits=None):
+        self.progress_queue = queue.Queue()
+        if threads_per_process is not None:
+            limit_native_threads(threads_per_process)
+        self._io_throttle = _create_io_throttle(multiprocessing, io_limits)
+        install_io_throttle(self._io_throttle)
+        init_worker_progress(self.progress_queue)
+
+    def apply_async(self, function, args, callback, error_callback):
+        try:
+            result = function(*args)
+        except Exception as e:
+            error_callback(e)
+        else:
+            callback(result)
+
+    def kill_worker(self, _pid):
+        return False
+
+    def close(self):
+        install_io_throttle(None)
+        init_worker_progress(None)
+        _remove_io_throttle(self._io_throttle)
+
+    def terminate(self):
+        self.close()
+
+    def join(self):
+        pass
+
+
+def get_mpi_comm():
+    """ Gets the MPI world communicator, raising an informative error if mpi4py isn't available.
+    """
+    try:
+        from mpi4py import MPI
+    except ImportError as e:
+        raise RuntimeError("The mpi executor requires mpi4py, which could not be imported: " + str(e))
+    return MPI.COMM_WORLD
+
+
+def is_mpi_master():
+    return get_mpi_comm().Get_rank() == MPI_MASTER_RANK
+
+
+class _MPIProgressSender(object):
+    """ Stands in for a progress queue in an MPI worker, forwarding progress reports to the master.
+    """
+
+    def __init__(self, comm):
+        self._comm = comm
+
+    def put(self, progress):
+        self._comm.send(progress, dest=MPI_MASTER_RANK, tag=MPI_PROGRESS_TAG)
+
+
+def _get_picklable_exception(exception):
+    """ Gets an exception which can be sent back to the MPI master, replacing it with a RuntimeError describing it
+        if it can't be pickled.
+    """
+    try:
+        pickle.dumps(exception)
+    except Exception:
+        return RuntimeError(repr(exception))
+    return exception
+
+
+def run_mpi_worker():
+    """ Runs tasks sent by the MPI master in this process, until told to stop. The master sends the limit on native
+        threads and the placement mode before any tasks. Workers are placed on each node according to their rank
+        among the MPI processes on that node.
+    """
+
+    from mpi4py import MPI
+
+    comm = get_mpi_comm()
+    threads_per_process, placement = comm.recv(source=MPI_MASTER_RANK, tag=MPI_CONFIG_TAG)
+
+    if placement == "numa":
+        node_comm = comm.Split_type(MPI.COMM_TYPE_SHARED)
+        place_worker(node_comm.Get_rank(), node_comm.Get_size(), threads_per_process)
+    init_executor_worker(_MPIProgressSender(comm), threads_per_process)
+
+    logger.info("MPI worker %s of %s ready on %s.", comm.Get_rank(), comm.Get_size() - 1, MPI.Get_processor_name())
+
+    status = MPI.Status()
+    while True:
+
+        message = comm.recv(source=MPI_MASTER_RANK, tag=MPI.ANY_TAG, status=status)
+        if status.Get_tag() == MPI_STOP_TAG:
+            break
+
+        task_id, function, args = message
+        try:
+            result, exception = function(*args), None
+        except Exception as e:
+            result, exception = None, _get_picklable_exception(e)
+
+        comm.send((task_id, result, exception), dest=MPI_MASTER_RANK, tag=MPI_RESULT_TAG)
+
+
+class MPIExecutor(object):
+    """ Executor which runs tasks on the other processes of an MPI job, which must be running run_mpi_worker. This
+        allows a run to span the nodes of a multi-node allocation. All communication with the workers is done from a
+        background thread of the master. Workers on other nodes can't be killed, so tasks which are cancelled run to
+        completion and their results are ignored.
+    """
+
+    def __init__(self, threads_per_process=None, placement="none"):
+
+        from mpi4py import MPI
+
+        self._mpi = MPI
+        self._comm = get_mpi_comm()
+
+        if self._comm.Get_rank() != MPI_MASTER_RANK:
+            raise RuntimeError("MPIExecutor must be created on the master rank.")
+
+        worker_ranks = [rank for rank in range(self._comm.Get_size()) if rank != MPI_MASTER_RANK]
+        if not worker_ranks:
+            raise ValueError("The mpi executor requires at least two MPI processes: one master and one worker.")
+
+        self.number_workers = len(worker_ranks)
+        self.progress_queue = queue.Queue()
+
+        self._worker_ranks = worker_ranks
+        self._idle_ranks = list(reversed(worker_ranks))
+        self._busy_ranks = {}
+
+        self._submitted = queue.Queue()
+        self._callbacks = {}
+        self._next_task_id = 0
+
+        # Set to "close" to stop once all submitted tasks are done, or "terminate" to stop straight away
+        self._shutdown = None
+
+        for rank in worker_ranks:
+            self._comm.send((threads_per_process, placement), dest=rank, tag=MPI_CONFIG_TAG)
+
+        self._thread = threading.Thread(target=self._serve, name="MPIExecutor", daemon=True)
+        self._thread.start()
+
+    def apply_async(self, function, args, callback, error_callback):
+        task_id = self._next_task_id
+        self._next_task_id += 1
+        self._callbacks[task_id] = (callback, error_callback)
+        self._submitted.put((task_id, function, args))
+
+    def kill_worker(self, _pid):
+        return False
+
+    def _send_tasks(self):
+        while self._idle_ranks and self._shutdown != "terminate":
+            try:
+                task = self._submitted.get_nowait()
+            except queue.Empty:
+                return
+            rank = self._idle_ranks.pop()
+            self._comm.send(task, dest=rank, tag=MPI_TASK_TAG)
+            self._busy_ranks[rank] = task[0]
+
+    def _receive(self, status):
+
+        if not self._comm.Iprobe(source=self._mpi.ANY_SOURCE, tag=self._mpi.ANY_TAG, status=status):
+            return False
+
+        rank = status.Get_source()
+        tag = status.Get_tag()
+        message = self._comm.recv(source=rank, tag=tag)
+
+        if tag == MPI_PROGRESS_TAG:
+            self.progress_queue.put(message)
+        elif tag == MPI_RESULT_TAG:
+            task_id, result, exception = message
+            del self._busy_ranks[rank]
+            self._idle_ranks.append(rank)
+            callback, error_callback = self._callbacks.pop(task_id)
+            if exception is None:
+                callback(result)
+            else:
+                error_callback(exception)
+
+        return True
+
+    def _serve(self):
+
+        status = self._mpi.Status()
+
+        while True:
+
+            self._send_tasks()
+
+            if self._shutdown == "terminate" or (self._shutdown == "close" and self._submitted.empty() and
+                                                 not self._busy_ranks):
+                break
+
+            if not self._receive(status):
+                time.sleep(MPI_POLL_INTERVAL)
+
+        # Workers which are still busy will receive this once they've finished their current task
+        for rank in self._worker_ranks:
+            self._comm.send(None, dest=rank, tag=MPI_STOP_TAG)
+
+    def close(self):
+        self._shutdown = "close"
+
+    def terminate(self):
+        if self._busy_ranks:
+            logger.warning("%s MPI workers will finish their current simulations before stopping.",
+                           len(self._busy_ranks))
+        self._shutdown = "terminate"
+
+    def join(self):
+        self._thread.join()
+
+
+def create_executor(backend, number_workers, threads_per_process=None, placement="none", memory_profile=None,
+                    io_limits=None):
+    """ Creates an executor of the given backend (one of EXECUTOR_BACKENDS), whose workers report their progress
+        through its progress_queue and, if threads_per_process is given, limit their native threads to it. For the
+        mpi and serial backends, number_workers is ignored, and the number of workers is set by the size of the MPI
+        job or is one respectively. If placement is "numa", workers are pinned to CPUs and NUMA nodes; this is
+        ignored by the serial backend, which runs tasks in this process.
+
+        If a memory profile is given, which only the fork, forkserver and futures backends support, its workers are
+        spawned as fresh processes, so that the profile's environment (which the caller must apply while the
+        executor is in use, e.g. with memory_profiles.applied_environment) takes effect from their start. This is
+        done for every profile, including those which leave the environment unchanged, so that all the profiles
+        compared in a run start their workers the same way.
+
+        If io_limits are given, which all but the mpi backend support, the stages run by the workers are throttled
+        by an io_throttle.IOThrottle shared between them.
+    """
+
+    thp_disable = memory_profile is not None and memory_profile.thp_disable
+    start_method = "spawn" if memory_profile is not None else None
+
+    if backend in ("fork", "forkserver"):
+        return PoolExecutor(number_workers, start_method=start_method or backend,
+                            threads_per_process=threads_per_process, placement=placement, thp_disable=thp_disable,
+                            io_limits=io_limits)
+    if backend == "futures":
+        return FuturesExecutor(number_workers, threads_per_process=threads_per_process, placement=placement,
+                               start_method=start_method, thp_disable=thp_disable, io_limits=io_limits)
+    if memory_profile is not None:
+        raise ValueError(f"Memory profiles aren't supported by the {backend} executor.")
+    if backend == "mpi":
+        if io_limits is not None:
+            raise ValueError("I/O limits aren't supported by the mpi executor.")
+        return MPIExecutor(threads_per_process=threads_per_process, placement=placement)
+    if backend == "serial":
+        return SerialExecutor(threads_per_process=threads_per_process, io_limits=io_limits)
+
+    raise ValueError(f"Unrecognised executor backend: {backend}. Allowed values are: {EXECUTOR_BACKENDS}")
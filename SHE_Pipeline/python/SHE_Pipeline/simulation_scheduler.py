@@ -0,0 +1,848 @@
+""" @file simulation_scheduler.py
+
+    Created 19 October 2026
+
+    Dynamic scheduling of simulations for the parallel bias measurement pipeline.
+"""
+
+__updated__ = "2026-10-19"
+
+# Copyright (C) 2012-2020 Euclid Science Ground Segment
+#
+# This library is free software; you can redistribute it and/or modify it under the terms of the GNU Lesser General
+# Public License as published by the Free Software Foundation; either version 3.0 of the License, or (at your option)
+# any later version.
+#
+# This library is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY; without even the implied
+# warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU Lesser General Public License for more
+# details.
+#
+# You should have received a copy of the GNU Lesser General Public License along with this library; if not, write to
+# the Free Software Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA
+
+import math
+import os
+import queue
+import signal
+import statistics
+import threading
+import time
+import traceback
+
+from SHE_PPT.logging import getLogger
+
+from .bias_accumulator import (BiasPrecisionMonitor, combine_accumulator_dicts, read_bias_statistics_accumulators, )
+
+DEFAULT_POLL_INTERVAL = 5.
+
+logger = getLogger(__name__)
+
+
+class SimulationTask(object):
+    """ One or more simulations to be run in turn by a worker in a shared workdir, along with the information needed
+        to schedule them. The task is identified by the number of its first simulation. For a task of several
+        simulations, task_args should be a list of the args of each simulation, in the same order.
+    """
+
+    def __init__(self, simulation_number, workdir, task_args, group=0, simulation_numbers=None):
+        self.simulation_number = simulation_number
+        self.workdir = workdir
+        self.task_args = task_args
+        self.group = group
+        if simulation_numbers is None:
+            simulation_numbers = [simulation_number]
+        self.simulation_numbers = list(simulation_numbers)
+
+    def split(self, indices):
+        """ Creates a task of some of the simulations of this one, given by their indices within it, to be run in
+            the same workdir.
+        """
+        simulation_numbers = [self.simulation_numbers[index] for index in indices]
+        return SimulationTask(simulation_numbers[0], self.workdir, [self.task_args[index] for index in indices],
+                              group=self.group, simulation_numbers=simulation_numbers)
+
+    def __repr__(self):
+        return f"SimulationTask({self.simulation_number})"
+
+
+class SimulationStageError(Exception):
+    """ Exception raised by a worker when a stage of a simulation fails, recording which stage failed and where its
+        log can be found. This is picklable, so it can be passed back from worker processes.
+    """
+
+    def __init__(self, stage, message, log_filename=None, traceback_text=None):
+        super().__init__(stage, message, log_filename, traceback_text)
+        self.stage = stage
+        self.message = message
+        self.log_filename = log_filename
+        self.traceback_text = traceback_text
+
+    def __str__(self):
+        return f"{self.stage} failed: {self.message}"
+
+    @classmethod
+    def from_exception(cls, stage, exception, log_filename=None):
+        return cls(stage, f"{type(exception).__name__}: {exception}", log_filename=log_filename,
+                   traceback_text=traceback.format_exc())
+
+
+class PartialTaskError(SimulationStageError):
+    """ Exception raised by a worker when some, but not all, of the simulations of a task fail. It records the
+        exception raised by each failed simulation and the indices within the task of those which completed, along
+        with their combined result, so that only the failed simulations need to be retried. Its stage, message, and
+        log are those of the first failure.
+    """
+
+    def __init__(self, failures, completed_indices, result=None):
+        first_failure = failures[min(failures)]
+        super().__init__(getattr(first_failure, "stage", None),
+                         f"{len(failures)} of {len(failures) + len(completed_indices)} simulations failed, the "
+                         f"first with {getattr(first_failure, 'message', repr(first_failure))}",
+                         log_filename=getattr(first_failure, "log_filename", None),
+                         traceback_text=getattr(first_failure, "traceback_text", None))
+        # Pickled exceptions are recreated from their args
+        self.args = (failures, completed_indices, result)
+        self.failures = failures
+        self.completed_indices = list(completed_indices)
+        self.result = result
+
+
+class RetryPolicy(object):
+    """ How failed simulations are handled: each is retried up to max_retries times, waiting backoff seconds before
+        the first retry and doubling this for each subsequent one, after which it is quarantined (never run
+        again). If max_failures is set, scheduling is stopped once more than this many simulations are quarantined.
+    """
+
+    def __init__(self, max_retries=0, backoff=0., max_failures=None):
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_failures = max_failures
+
+    def get_retry_delay(self, attempt):
+        """ Gets the delay before retrying after the given (1-indexed) failed attempt, or None if it shouldn't be
+            retried.
+        """
+        if attempt > self.max_retries:
+            return None
+        return self.backoff * 2 ** (attempt - 1)
+
+
+class StageTimeouts(object):
+    """ Soft and hard time limits in seconds for each stage of a simulation, as dicts keyed by stage name. The key
+        "default" gives a limit for any stage without its own.
+
+        When a stage passes its soft limit, a warning is logged and the simulation becomes a candidate for
+        speculative re-execution. When it passes its hard limit, its worker is killed and the simulation is treated
+        as having failed.
+    """
+
+    def __init__(self, soft=None, hard=None):
+        self.soft = soft if soft is not None else {}
+        self.hard = hard if hard is not None else {}
+
+    @staticmethod
+    def _get_limit(limits, stage):
+        return limits.get(stage, limits.get("default"))
+
+    def get_soft_limit(self, stage):
+        return self._get_limit(self.soft, stage)
+
+    def get_hard_limit(self, stage):
+        return self._get_limit(self.hard, stage)
+
+
+class TaskAttempt(object):
+    """ A single attempt at running a task on a worker, along with the progress it has reported.
+    """
+
+    def __init__(self, attempt_id, task, speculative=False):
+        self.attempt_id = attempt_id
+        self.task = task
+        self.speculative = speculative
+        self.dispatch_time = time.time()
+
+        self.pid = None
+        self.stage = None
+        self.stage_start_time = None
+        self.log_filename = None
+
+        # The stage, if any, which has passed its soft time limit
+        self.straggling_stage = None
+
+    @property
+    def elapsed(self):
+        return time.time() - self.dispatch_time
+
+
+class SimulationScheduler(object):
+    """ Dispatches simulation tasks to a worker pool, keeping at most max_running in flight at once. The pool can be
+        a multiprocessing pool or one of the executors in simulation_executors.
+
+        Unlike a single pool.map call, tasks are only handed to the pool as workers become free, so the scheduler
+        can inspect results as they arrive and decide what (or whether) to run next. Completion listeners are
+        called in the main process with (scheduler, task, result) after each task finishes.
+
+        A failed task doesn't affect any others: it's retried or quarantined according to the retry policy, and
+        every exception it raised is recorded in self.failures. If only some of a task's simulations fail (raising
+        a PartialTaskError), the others are completed and only the failed ones are retried.
+
+        If workers report their progress through progress_queue (see init_worker and report_stage), stages which
+        overrun their time limits are detected, and once no tasks remain to be dispatched, idle workers can run
+        speculative copies of the slowest running tasks, created by the make_speculative_task callable. Whichever
+        copy of a task finishes first is used, and the others are cancelled.
+    """
+
+    def __init__(self, pool, max_running, tasks, task_function, poll_interval=DEFAULT_POLL_INTERVAL,
+                 retry_policy=None, progress_queue=None, stage_timeouts=None):
+
+        self.pool = pool
+        self.max_running = max(1, max_running)
+        self.task_function = task_function
+        self.poll_interval = poll_interval
+        self.retry_policy = retry_policy if retry_policy is not None else RetryPolicy()
+        self.progress_queue = progress_queue
+        self.stage_timeouts = stage_timeouts if stage_timeouts is not None else StageTimeouts()
+
+        self.pending = list(tasks)
+        self.running = {}
+        self.completed = []
+
+        # Failed tasks waiting to be retried, as (time they can be retried, task)
+        self.delayed = []
+
+        # Exceptions raised by each task, keyed by simulation number, and tasks which won't be retried again
+        self.failures = {}
+        self.quarantined = []
+
+        self.abandoned = []
+
+        self.stop_reason = None
+        self.abandon_running = False
+
+        # Optional callable giving a priority score for each task group; higher scores are run first
+        self.group_priority = None
+
+        # Optional callable giving the expected cost of each task; within a group, the most expensive are run first,
+        # so that the longest tasks don't extend the run by starting last
+        self.task_cost = None
+
+        # Optional callable which creates a copy of a task to be run speculatively (e.g. in a fresh workdir), or
+        # returns None if it can't be
+        self.make_speculative_task = None
+
+        self._completion_listeners = []
+        self._dispatch_guards = []
+        self._done_queue = queue.Queue()
+
+        # Attempts which are running, keyed by attempt ID, those which have been cancelled but might still be
+        # running, and those whose workers have been killed
+        self._attempts = {}
+        self._cancelled = {}
+        self._killed = []
+        self._next_attempt_id = 0
+
+        # Durations of completed attempts, and simulation numbers which have been run speculatively
+        self._durations = []
+        self._speculated = set()
+
+        # Stop requested from a signal handler, which is acted on from the main loop
+        self._signalled_stop = None
+
+    def add_completion_listener(self, listener):
+        self._completion_listeners.append(listener)
+
+    def use_pool(self, pool, max_running, progress_queue=None):
+        """ Switches to a new pool once the previous one has been shut down, so that run can be called again (e.g.
+            with a new set of pending tasks) with different workers.
+        """
+        self.pool = pool
+        self.max_running = max(1, max_running)
+        self.progress_queue = progress_queue
+        self._cancelled = {}
+        self._killed = []
+
+    def add_dispatch_guard(self, guard):
+        """ Adds a callable which is passed each task before it is dispatched. If it returns a reason (string), the
+            task is not dispatched and scheduling is stopped.
+        """
+        self._dispatch_guards.append(guard)
+
+    def request_stop(self, reason, abandon_running=False):
+        """ Stops any further tasks being dispatched. Tasks already running will still be completed, unless
+            abandon_running is set, in which case the scheduler will stop waiting for them.
+        """
+        if self.stop_reason is None:
+            logger.info("No further simulations will be scheduled: %s", reason)
+            self.stop_reason = reason
+        if abandon_running and not self.abandon_running:
+            logger.warning("Abandoning %s running simulations.", len(self.running))
+            self.abandon_running = True
+
+    def signal_stop(self, reason, abandon_running=False):
+        """ Version of request_stop which is safe to call from a signal handler.
+        """
+        self._signalled_stop = (reason, abandon_running)
+
+    @property
+    def stop_requested(self):
+        return self.stop_reason is not None
+
+    @property
+    def unscheduled(self):
+        """ Tasks which were never dispatched (or are awaiting retry), because scheduling was stopped early.
+        """
+        return list(self.pending) + [task for _ready_time, task in self.delayed]
+
+    @property
+    def number_busy_workers(self):
+        return len(self._attempts) + len(self._cancelled)
+
+    def _pop_next_task(self):
+
+        candidate_indices = list(range(len(self.pending)))
+
+        # Restrict to the pending tasks of the highest-priority group
+        if self.group_priority is not None:
+            group_priorities = {}
+            best_group = None
+            for task in self.pending:
+                if task.group not in group_priorities:
+                    group_priorities[task.group] = self.group_priority(task.group)
+                    if best_group is None or group_priorities[task.group] > group_priorities[best_group]:
+                        best_group = task.group
+            candidate_indices = [index for index in candidate_indices if self.pending[index].group == best_group]
+
+        # Pick the most expensive candidate, or the first if there's no cost model
+        if self.task_cost is None:
+            best_index = candidate_indices[0]
+        else:
+            best_index = max(candidate_indices, key=lambda index: self.task_cost(self.pending[index]))
+
+        return self.pending.pop(best_index)
+
+    def _check_signalled_stop(self):
+        if self._signalled_stop is not None:
+            self.request_stop(*self._signalled_stop)
+            self._signalled_stop = None
+
+    def _requeue_delayed(self):
+        """ Moves failed tasks which are ready to be retried to the front of the pending list.
+        """
+        now = time.time()
+        ready = [task for ready_time, task in self.delayed if ready_time <= now]
+        if ready:
+            self.delayed = [(ready_time, task) for ready_time, task in self.delayed if ready_time > now]
+            self.pending = ready + self.pending
+
+    def _get_wait_time(self):
+        if self.delayed and self.number_busy_workers < self.max_running and not self.stop_requested:
+            next_ready_time = min(ready_time for ready_time, _task in self.delayed)
+            return max(0., min(self.poll_interval, next_ready_time - time.time()))
+        return self.poll_interval
+
+    def _get_attempts(self, simulation_number):
+        return [attempt for attempt in self._attempts.values() if attempt.task.simulation_number == simulation_number]
+
+    def _kill(self, attempt):
+        """ Kills the worker running an attempt. Returns False if this isn't possible, because its process isn't
+            known yet, it's running in this process, or the pool's workers can't be killed.
+        """
+        if attempt.pid is None or attempt.pid == os.getpid():
+            return False
+        kill_worker = getattr(self.pool, "kill_worker", None)
+        if kill_worker is not None:
+            if not kill_worker(attempt.pid):
+                return False
+        else:
+            try:
+                os.kill(attempt.pid, signal.SIGKILL)
+            except ProcessLookupError:
+                pass
+        # The pool loses track of the job its worker was running, so it can no longer be joined
+        self._killed.append(attempt)
+        return True
+
+    def _cancel(self, attempt):
+        """ Cancels an attempt, killing its worker if possible, and otherwise ignoring its result when it arrives.
+        """
+        self._attempts.pop(attempt.attempt_id, None)
+        if not self._kill(attempt):
+            self._cancelled[attempt.attempt_id] = attempt
+
+    def _read_progress(self):
+        """ Reads all progress reported by workers since the last call.
+        """
+
+        if self.progress_queue is None:
+            return
+
+        while True:
+            try:
+                attempt_id, pid, stage, stage_start_time, log_filename = self.progress_queue.get_nowait()
+            except queue.Empty:
+                return
+
+            if attempt_id in self._cancelled:
+                attempt = self._cancelled[attempt_id]
+                attempt.pid = pid
+                if self._kill(attempt):
+                    del self._cancelled[attempt_id]
+                continue
+
+            attempt = self._attempts.get(attempt_id)
+            if attempt is None:
+                continue
+            attempt.pid = pid
+
+            # A stage of None means the worker is between stages (e.g. waiting for I/O throttling), which isn't
+            # counted towards any stage's timeouts. The last stage's log is kept for any failure
+            attempt.stage = stage
+            attempt.stage_start_time = stage_start_time
+            if stage is not None:
+                attempt.log_filename = log_filename
+
+    def _check_timeouts(self):
+
+        now = time.time()
+
+        for attempt in list(self._attempts.values()):
+
+            if attempt.stage is None:
+                continue
+            stage_elapsed = now - attempt.stage_start_time
+
+            hard_limit = self.stage_timeouts.get_hard_limit(attempt.stage)
+            if hard_limit is not None and stage_elapsed > hard_limit:
+                logger.error("Stage %s of simulation %s exceeded its hard time limit of %ss; killing it.",
+                             attempt.stage, attempt.task.simulation_number, hard_limit)
+                self._cancel(attempt)
+                self._fail(attempt, SimulationStageError(attempt.stage, f"timed out after {hard_limit}s",
+                                                         log_filename=attempt.log_filename))
+                continue
+
+            soft_limit = self.stage_timeouts.get_soft_limit(attempt.stage)
+            if soft_limit is not None and stage_elapsed > soft_limit and attempt.straggling_stage != attempt.stage:
+                logger.warning("Stage %s of simulation %s has exceeded its soft time limit of %ss.",
+                               attempt.stage, attempt.task.simulation_number, soft_limit)
+                attempt.straggling_stage = attempt.stage
+
+    def _handle_failure(self, task):
+
+        failures = self.failures[task.simulation_number]
+
+        retry_delay = self.retry_policy.get_retry_delay(len(failures))
+        if retry_delay is not None:
+            logger.warning("Simulation %s failed with error: %s. Retrying (attempt %s of %s) in %ss.",
+                           task.simulation_number, failures[-1], len(failures) + 1,
+                           self.retry_policy.max_retries + 1, retry_delay)
+            self.delayed.append((time.time() + retry_delay, task))
+            return
+
+        logger.error("Simulation %s failed with error: %s. It will not be retried.", task.simulation_number,
+                     failures[-1])
+        self.quarantined.append(task)
+
+        if self.retry_policy.max_failures is not None and len(self.quarantined) > self.retry_policy.max_failures:
+            self.request_stop(f"more than {self.retry_policy.max_failures} simulations failed")
+
+    def _fail(self, attempt, exception):
+
+        simulation_number = attempt.task.simulation_number
+        self.failures.setdefault(simulation_number, []).append(exception)
+
+        # If another copy is still running, wait for that instead
+        if self._get_attempts(simulation_number):
+            logger.warning("A copy of simulation %s failed with error: %s. Another copy is still running.",
+                           simulation_number, exception)
+            return
+
+        task = self.running.pop(simulation_number)
+        if isinstance(exception, PartialTaskError) and exception.completed_indices:
+            task = self._complete_partial(attempt, task, exception)
+
+        self._handle_failure(task)
+
+    def _complete_partial(self, attempt, task, exception):
+        """ Completes the simulations of a task which succeeded in an attempt which raised a PartialTaskError, and
+            returns a task of the failed simulations, to be retried in the task's own workdir. This is identified
+            by the first of its simulations, and takes over the failures recorded for the task.
+        """
+
+        completed_indices = set(exception.completed_indices)
+        failed_indices = [index for index in range(len(task.simulation_numbers)) if index not in completed_indices]
+
+        # The completed simulations' outputs are in the workdir of the attempt, which might be a speculative copy
+        completed_task = attempt.task.split(sorted(completed_indices))
+        failed_task = task.split(failed_indices)
+
+        logger.warning("Simulations %s of task %s completed, but simulations %s failed.",
+                       completed_task.simulation_numbers, task.simulation_number, failed_task.simulation_numbers)
+
+        self.failures[failed_task.simulation_number] = self.failures.pop(task.simulation_number)
+        self._complete_task(completed_task, exception.result)
+
+        return failed_task
+
+    def _complete(self, attempt, result):
+
+        simulation_number = attempt.task.simulation_number
+
+        for other_attempt in self._get_attempts(simulation_number):
+            self._cancel(other_attempt)
+
+        if attempt.speculative:
+            logger.info("Speculative copy of simulation %s finished first.", simulation_number)
+
+        self.running.pop(simulation_number)
+        self._durations.append(attempt.elapsed)
+
+        self._complete_task(attempt.task, result)
+
+    def _complete_task(self, task, result):
+        self.completed.append(task)
+        for listener in self._completion_listeners:
+            listener(self, task, result)
+
+    def _check_guards(self, task):
+        for guard in self._dispatch_guards:
+            refusal = guard(task)
+            if refusal is not None:
+                return refusal
+        return None
+
+    def _launch(self, task, speculative=False):
+
+        attempt = TaskAttempt(self._next_attempt_id, task, speculative=speculative)
+        self._next_attempt_id += 1
+
+        def callback(result, attempt_id=attempt.attempt_id):
+            self._done_queue.put((attempt_id, result, None))
+
+        def error_callback(exception, attempt_id=attempt.attempt_id):
+            self._done_queue.put((attempt_id, None, exception))
+
+        self._attempts[attempt.attempt_id] = attempt
+        if not speculative:
+            self.running[task.simulation_number] = task
+        self.pool.apply_async(run_task_attempt, (self.task_function, attempt.attempt_id, task.task_args),
+                              callback=callback, error_callback=error_callback)
+
+    def _get_straggler(self):
+        """ Gets the slowest running attempt which is a candidate for speculative re-execution: one which has
+            passed a soft time limit, or has been running for longer than the median completed attempt.
+        """
+
+        median_duration = statistics.median(self._durations) if self._durations else None
+
+        candidates = [attempt for attempt in self._attempts.values()
+                      if not attempt.speculative and attempt.task.simulation_number not in self._speculated and
+                      (attempt.straggling_stage is not None or
+                       (median_duration is not None and attempt.elapsed > median_duration))]
+
+        if not candidates:
+            return None
+
+        return max(candidates, key=lambda attempt: attempt.elapsed)
+
+    def _dispatch(self):
+
+        self._check_signalled_stop()
+        self._requeue_delayed()
+
+        while self.pending and self.number_busy_workers < self.max_running and not self.stop_requested:
+
+            task = self._pop_next_task()
+
+            refusal = self._check_guards(task)
+            if refusal is not None:
+                self.pending.insert(0, task)
+                self.request_stop(refusal)
+                break
+
+            self._launch(task)
+
+        # Once nothing remains to be dispatched, use any idle workers to run copies of stragglers
+        if self.make_speculative_task is None or self.pending or self.delayed or self.stop_requested:
+            return
+
+        while self.number_busy_workers < self.max_running:
+
+            straggler = self._get_straggler()
+            if straggler is None:
+                break
+            self._speculated.add(straggler.task.simulation_number)
+
+            speculative_task = self.make_speculative_task(straggler.task)
+            if speculative_task is None or self._check_guards(speculative_task) is not None:
+                continue
+
+            logger.info("Running a speculative copy of simulation %s, which has been running for %.0fs.",
+                        straggler.task.simulation_number, straggler.elapsed)
+            self._launch(speculative_task, speculative=True)
+
+    def run(self):
+        """ Runs tasks until all are complete, or until scheduling is stopped and the running tasks are complete.
+            If running tasks are abandoned, they are moved to self.abandoned. It can be called again with new pending
+            tasks, after use_pool if the pool has been shut down.
+
+        @return: Completed tasks
+        @rtype:  list(SimulationTask)
+        """
+
+        self._dispatch()
+
+        while self._attempts or (self.delayed and not self.stop_requested):
+
+            self._check_signalled_stop()
+            if self.abandon_running:
+                self.abandoned += list(self.running.values())
+                self.running = {}
+                self._attempts = {}
+                break
+
+            self._read_progress()
+            self._check_timeouts()
+
+            try:
+                attempt_id, result, exception = self._done_queue.get(timeout=self._get_wait_time())
+            except queue.Empty:
+                self._dispatch()
+                continue
+
+            if attempt_id in self._cancelled:
+                del self._cancelled[attempt_id]
+            elif attempt_id in self._attempts:
+                attempt = self._attempts.pop(attempt_id)
+                if exception is not None:
+                    self._fail(attempt, exception)
+                else:
+                    self._complete(attempt, result)
+
+            self._dispatch()
+
+        # Kill any cancelled attempts which have reported their process since the last check
+        self._read_progress()
+
+        return self.completed
+
+    @property
+    def workers_left_running(self):
+        """ Whether any workers may still be running tasks which were abandoned or cancelled, or any workers were
+            killed (which leaves a multiprocessing pool waiting forever for the jobs they were running), in which
+            case the pool should be terminated rather than joined.
+        """
+        return bool(self.abandoned) or bool(self._cancelled) or bool(self._killed)
+
+    def shut_down_pool(self):
+        """ Shuts down the pool once run has returned, terminating it if workers were left running or killed, and
+            otherwise letting its workers finish, then waits for them to exit.
+        """
+        if self.workers_left_running:
+            self.pool.terminate()
+        else:
+            self.pool.close()
+        self.pool.join()
+
+
+class AdaptiveStopping(object):
+    """ Tracks the precision of the bias measured from the simulations completed so far, and stops the scheduler
+        once the target precision has been reached for every method, shear component, and bin.
+
+        It also learns how much statistical weight each task group contributes to each bin, so that (if used as
+        the scheduler's group_priority) groups which feed the bins furthest from the target are run first.
+    """
+
+    def __init__(self, m_target, c_target=None, check_interval=1, statistics_filename_function=None):
+
+        self.monitor = BiasPrecisionMonitor(m_target=m_target, c_target=c_target)
+        self.check_interval = max(1, check_interval)
+        self.statistics_filename_function = statistics_filename_function
+
+        self._completed_since_check = 0
+        self._group_counts = {}
+        self._group_weights = {}
+
+    def on_task_complete(self, scheduler, task, _result):
+
+        for simulation_number in task.simulation_numbers:
+
+            statistics_filename = self.statistics_filename_function(simulation_number)
+            if not os.path.exists(os.path.join(task.workdir.workdir, statistics_filename)):
+                logger.warning("Expected bias statistics %s not found for simulation %s.", statistics_filename,
+                               simulation_number)
+                continue
+
+            accumulators = read_bias_statistics_accumulators(statistics_filename, workdir=task.workdir.workdir)
+            self.monitor.add(accumulators)
+
+            self._group_counts[task.group] = self._group_counts.get(task.group, 0) + 1
+            combine_accumulator_dicts(self._group_weights.setdefault(task.group, {}), accumulators)
+
+            self._completed_since_check += 1
+
+        if self._completed_since_check < self.check_interval:
+            return
+        self._completed_since_check = 0
+
+        shortfalls = self.monitor.get_precision_shortfalls()
+        logger.info("Interim bias precision after %s simulations, as a fraction of target: %s",
+                    len(scheduler.completed),
+                    ", ".join(f"{key}={shortfall:.3f}" for key, shortfall in sorted(shortfalls.items())))
+
+        # Don't stop until every group has been sampled, since unsampled groups might feed bins not yet seen
+        unsampled_groups = {t.group for t in scheduler.pending + list(scheduler.running.values())
+                            if t.group not in self._group_counts}
+
+        if self.monitor.target_met() and not unsampled_groups:
+            scheduler.request_stop("target bias precision reached")
+
+    def get_group_priority(self, group):
+        """ Gets the priority for a task group: the expected reduction in the precision shortfall summed over all
+            bins, using the mean weight per simulation each bin has received from this group so far. Groups which
+            haven't been run yet are given top priority, so that their contributions can be learnt.
+        """
+
+        if group not in self._group_counts:
+            return math.inf
+
+        shortfalls = self.monitor.get_precision_shortfalls()
+        group_count = self._group_counts[group]
+
+        priority = 0.
+        for key, accumulator in self._group_weights[group].items():
+            need = max(shortfalls.get(key, 0.) ** 2 - 1., 0.)
+            if need > 0 and key in self.monitor.accumulators and self.monitor.accumulators[key].w > 0:
+                priority += need * accumulator.w / group_count / self.monitor.accumulators[key].w
+
+        return priority
+
+
+class WalltimeGuard(object):
+    """ Prevents simulations being dispatched if they aren't expected to complete before a deadline, leaving a
+        reserve of time for the outputs to be merged and the final bias measured.
+
+        The expected duration of a simulation is estimated from the per-stage durations of those completed so far,
+        which workers return as a dict of stage name to seconds. The longest observed duration of each stage is
+        used, so that the estimate errs on the side of caution.
+    """
+
+    def __init__(self, deadline, reserve=0.):
+
+        self.deadline = deadline
+        self.reserve = reserve
+
+        self.max_stage_durations = {}
+
+    def on_task_complete(self, _scheduler, task, result):
+
+        if not isinstance(result, dict):
+            return
+
+        logger.debug("Stage durations for simulation %s: %s", task.simulation_number,
+                     ", ".join(f"{stage}={duration:.1f}s" for stage, duration in result.items()))
+
+        for stage, duration in result.items():
+            self.max_stage_durations[stage] = max(duration, self.max_stage_durations.get(stage, 0.))
+
+    def get_expected_duration(self):
+        """ Gets the expected duration of a simulation in seconds, or None if no simulations have completed yet.
+        """
+        if not self.max_stage_durations:
+            return None
+        return sum(self.max_stage_durations.values())
+
+    def get_time_remaining(self):
+        return self.deadline - self.reserve - time.time()
+
+    def check_dispatch(self, _task):
+        """ Dispatch guard for the scheduler, returning a reason not to dispatch if there isn't time.
+        """
+
+        time_remaining = self.get_time_remaining()
+        if time_remaining <= 0:
+            return "deadline reached"
+
+        expected_duration = self.get_expected_duration()
+        if expected_duration is not None and expected_duration > time_remaining:
+            return (f"insufficient time remaining before deadline ({time_remaining:.0f}s) for a simulation to "
+                    f"complete (expected {expected_duration:.0f}s)")
+
+        return None
+
+
+# Signals which trigger a graceful drain, and whether running simulations are abandoned on receipt of them
+DRAIN_SIGNALS = {signal.SIGUSR1: False,
+                 signal.SIGTERM: True, }
+
+
+def install_drain_signal_handlers(scheduler):
+    """ Installs signal handlers which stop the scheduler. On SIGUSR1, running simulations are allowed to complete;
+        on SIGTERM, the process is expected to be killed soon, so running simulations are abandoned so that the
+        completed ones can be merged as quickly as possible.
+
+    @return: Previous signal handlers, to be passed to restore_signal_handlers
+    @rtype:  dict
+    """
+
+    previous_handlers = {}
+
+    for signum, abandon_running in DRAIN_SIGNALS.items():
+        def handler(received_signum, _frame, abandon_running=abandon_running):
+            scheduler.signal_stop(f"received signal {signal.Signals(received_signum).name}",
+                                  abandon_running=abandon_running)
+
+        previous_handlers[signum] = signal.signal(signum, handler)
+
+    return previous_handlers
+
+
+def restore_signal_handlers(previous_handlers):
+    for signum, handler in previous_handlers.items():
+        signal.signal(signum, handler)
+
+
+def init_worker_signals():
+    """ Sets up signal handling in a worker process, so that it isn't killed by SIGUSR1 and doesn't inherit the
+        parent's drain handlers.
+    """
+    signal.signal(signal.SIGUSR1, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+
+
+# State of the task attempt being run by this worker
+_worker_state = threading.local()
+
+
+def init_worker_progress(progress_queue):
+    """ Pool initializer which sets the queue through which a worker reports its progress to the scheduler.
+    """
+    _worker_state.progress_queue = progress_queue
+
+
+def init_worker(progress_queue=None):
+    """ Pool initializer for worker processes.
+    """
+    init_worker_signals()
+    init_worker_progress(progress_queue)
+
+
+def report_stage(stage, log_filename=None):
+    """ Reports to the scheduler that the task attempt being run by this worker has started a new stage, or if stage
+        is None, that it's between stages.
+    """
+    progress_queue = getattr(_worker_state, "progress_queue", None)
+    attempt_id = getattr(_worker_state, "attempt_id", None)
+    if progress_queue is None or attempt_id is None:
+        return
+    progress_queue.put((attempt_id, os.getpid(), stage, time.time(), log_filename))
+
+
+def run_task_attempt(task_function, attempt_id, task_args):
+    """ Runs a task attempt in a worker, first reporting which process it's running in.
+    """
+    _worker_state.attempt_id = attempt_id
+    report_stage(None)
+    try:
+        return task_function(task_args)
+    finally:
+        _worker_state.attempt_id = None
@@ -0,0 +1,144 @@
+""" @file tile_overlaps.py
+
+    Created 19 October 2026
+
+    Search for the tiles which overlap a set of observations, from the Observation IDs of the MER products for each
+    tile in a product catalogue.
+"""
+
+__updated__ = "2026-10-19"
+
+# Copyright (C) 2012-2020 Euclid Science Ground Segment
+#
+# This library is free software; you can redistribute it and/or modify it under the terms of the GNU Lesser General
+# Public License as published by the Free Software Foundation; either version 3.0 of the License, or (at your option)
+# any later version.
+#
+# This library is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY; without even the implied
+# warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU Lesser General Public License for more
+# details.
+#
+# You should have received a copy of the GNU Lesser General Public License along with this library; if not, write to
+# the Free Software Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA
+
+from collections import namedtuple
+import json
+
+import numpy as np
+
+from SHE_PPT.logging import getLogger
+
+from . import pipeline_utilities as pu
+
+# Product types which are for a single tile, and list the observations which overlap it
+TILE_PRODUCT_TYPES = ("dpdMerFinalCatalog", "dpdMerSegmentationMap")
+
+# The overlap of tiles and observations: the sorted, unique tile indices and observation IDs, and a boolean matrix
+# of which tiles (rows) overlap which observations (columns)
+tile_overlaps_tuple = namedtuple("tile_overlaps_tuple", "tile_ids obs_ids overlap_matrix")
+
+logger = getLogger(__name__)
+
+
+def read_obs_ids(filename=None, obs_id_range=None, obs_ids=None):
+    """ Gets the set of observation IDs to search for, from any combination of a file, an inclusive range, and a list.
+        The file may be a JSON list, or IDs separated by whitespace or commas, with # comments.
+
+    @rtype: np.ndarray
+    """
+
+    all_obs_ids = list(obs_ids or [])
+
+    if filename is not None:
+        with open(filename, "r") as fi:
+            contents = fi.read()
+        try:
+            file_obs_ids = json.loads(contents)
+        except ValueError:
+            file_obs_ids = None
+        if isinstance(file_obs_ids, list):
+            all_obs_ids += file_obs_ids
+        else:
+            for line in contents.splitlines():
+                all_obs_ids += line.split("#")[0].replace(",", " ").split()
+
+    if obs_id_range is not None:
+        first_obs_id, last_obs_id = obs_id_range
+        if last_obs_id < first_obs_id:
+            raise ValueError(f"Invalid observation ID range {first_obs_id} to {last_obs_id}.")
+        all_obs_ids += range(first_obs_id, last_obs_id + 1)
+
+    return np.unique(np.asarray(all_obs_ids, dtype=np.int64))
+
+
+def get_tile_obs_pairs(records):
+    """ Gets the (tile index, observation ID) pairs of each tile and an observation which overlaps it, from the
+        catalogue records of the tiles' MER products.
+
+    @return: Arrays of the tile index and observation ID of each pair
+    @rtype:  tuple(np.ndarray, np.ndarray)
+    """
+
+    tile_records = [record for record in records
+                    if record.product_type in TILE_PRODUCT_TYPES and record.tile_index is not None]
+
+    pair_tile_ids = np.fromiter((record.tile_index for record in tile_records for _ in record.obs_ids),
+                                dtype=np.int64)
+    pair_obs_ids = np.fromiter((obs_id for record in tile_records for obs_id in record.obs_ids), dtype=np.int64)
+
+    return pair_tile_ids, pair_obs_ids
+
+
+def get_tile_overlaps(pair_tile_ids, pair_obs_ids, obs_ids):
+    """ Computes the matrix of which tiles overlap which of a set of observations, from the (tile index,
+        observation ID) pairs of the tiles.
+
+    @rtype: tile_overlaps_tuple
+    """
+
+    obs_ids = np.unique(obs_ids)
+    tile_ids, pair_tile_rows = np.unique(pair_tile_ids, return_inverse=True)
+
+    # Keep only the pairs for observations being searched for, and find the column of each
+    in_search = np.isin(pair_obs_ids, obs_ids)
+    pair_obs_columns = np.searchsorted(obs_ids, pair_obs_ids[in_search])
+
+    overlap_matrix = np.zeros((len(tile_ids), len(obs_ids)), dtype=bool)
+    overlap_matrix[pair_tile_rows[in_search], pair_obs_columns] = True
+
+    return tile_overlaps_tuple(tile_ids, obs_ids, overlap_matrix)
+
+
+def get_overlap_report(tile_overlaps):
+    """ Gets a machine-readable report of the overlaps: the observation IDs searched for, the tiles which overlap
+        any of them, the observations which overlap each of those tiles, the tiles which overlap each observation,
+        and the observations which don't overlap any tile.
+
+    @rtype: dict
+    """
+
+    tile_ids, obs_ids, overlap_matrix = tile_overlaps
+
+    overlapping_tile_rows = np.flatnonzero(overlap_matrix.any(axis=1))
+    overlapping_obs_columns = overlap_matrix.any(axis=0)
+
+    return {"obs_ids": obs_ids.tolist(),
+            "overlapping_tile_ids": tile_ids[overlapping_tile_rows].tolist(),
+            "tile_obs_ids": {str(tile_ids[row]): obs_ids[overlap_matrix[row]].tolist()
+                             for row in overlapping_tile_rows},
+            "obs_tile_ids": {str(obs_ids[column]): tile_ids[overlap_matrix[:, column]].tolist()
+                             for column in np.flatnonzero(overlapping_obs_columns)},
+            "non_overlapping_obs_ids": obs_ids[~overlapping_obs_columns].tolist(), }
+
+
+def write_overlap_report(filename, tile_overlaps):
+    """ Writes the report of the overlaps to a JSON file.
+    """
+
+    report = get_overlap_report(tile_overlaps)
+    pu.write_json_atomically(filename, report)
+
+    logger.info("%s of %s tiles overlap %s of %s observations; written to %s.", len(report["overlapping_tile_ids"]),
+                len(tile_overlaps.tile_ids), len(report["obs_tile_ids"]), len(tile_overlaps.obs_ids), filename)
+
+    return report
@@ -0,0 +1,228 @@
+""" @file worker_placement.py
+
+    Created 19 October 2026
+
+    Placement of worker processes on the CPUs and NUMA nodes of a machine.
+"""
+
+__updated__ = "2026-10-19"
+
+# Copyright (C) 2012-2020 Euclid Science Ground Segment
+#
+# This library is free software; you can redistribute it and/or modify it under the terms of the GNU Lesser General
+# Public License as published by the Free Software Foundation; either version 3.0 of the License, or (at your option)
+# any later version.
+#
+# This library is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY; without even the implied
+# warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU Lesser General Public License for more
+# details.
+#
+# You should have received a copy of the GNU Lesser General Public License along with this library; if not, write to
+# the Free Software Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA
+
+from collections import namedtuple
+import ctypes
+import ctypes.util
+import os
+import re
+
+from SHE_PPT.logging import getLogger
+
+from .pipeline_utilities import get_available_cpu_count
+
+PLACEMENT_MODES = ("none", "numa")
+
+DEFAULT_SYS_ROOT = "/sys"
+
+worker_placement_tuple = namedtuple("WorkerPlacement", "numa_node cpus")
+
+logger = getLogger(__name__)
+
+
+def parse_cpu_list(cpu_list):
+    """ Parses a list of CPUs in the format used in /sys, e.g. "0-3,8-11".
+
+    @return: CPUs in the list
+    @rtype:  list<int>
+    """
+
+    cpus = []
+    for cpu_range in cpu_list.strip().split(","):
+        if not cpu_range:
+            continue
+        if "-" in cpu_range:
+            first, last = cpu_range.split("-")
+            cpus += range(int(first), int(last) + 1)
+        else:
+            cpus.append(int(cpu_range))
+
+    return cpus
+
+
+def get_available_cpus():
+    try:
+        return set(os.sched_getaffinity(0))
+    except AttributeError:
+        return set(range(get_available_cpu_count()))
+
+
+def read_numa_topology(sys_root=DEFAULT_SYS_ROOT):
+    """ Reads which of the CPUs available to this process are on each NUMA node. If the topology can't be read, all
+        available CPUs are treated as being on node 0.
+
+    @return: Sorted available CPUs on each NUMA node which has any
+    @rtype:  dict<int, list<int>>
+    """
+
+    available_cpus = get_available_cpus()
+    node_dir = os.path.join(sys_root, "devices", "system", "node")
+
+    topology = {}
+    if os.path.isdir(node_dir):
+        for entry in os.listdir(node_dir):
+            match = re.match(r"^node(\d+)$", entry)
+            if match is None:
+                continue
+            try:
+                with open(os.path.join(node_dir, entry, "cpulist"), "r") as fi:
+                    node_cpus = parse_cpu_list(fi.read())
+            except (OSError, ValueError):
+                continue
+            node_cpus = sorted(available_cpus.intersection(node_cpus))
+            if node_cpus:
+                topology[int(match.group(1))] = node_cpus
+
+    if not topology:
+        topology = {0: sorted(available_cpus)}
+
+    return topology
+
+
+def plan_worker_placement(topology, number_workers, threads_per_process=None):
+    """ Plans the placement of workers on a machine. Workers are spread across NUMA nodes so that each node has as
+        many free CPUs as possible, and each is given threads_per_process CPUs of its node. CPUs are only shared
+        between workers if a node doesn't have enough for all of its workers.
+
+    @return: Placement of each worker
+    @rtype:  list<worker_placement_tuple>
+    """
+
+    if threads_per_process is None:
+        threads_per_process = max(1, sum(len(cpus) for cpus in topology.values()) // number_workers)
+
+    workers_per_node = {node: 0 for node in topology}
+    worker_nodes = []
+    for _ in range(number_workers):
+        node = max(sorted(topology),
+                   key=lambda node: len(topology[node]) - workers_per_node[node] * threads_per_process)
+        worker_nodes.append(node)
+        workers_per_node[node] += 1
+
+    placements = []
+    workers_placed_per_node = {node: 0 for node in topology}
+    for node in worker_nodes:
+        node_cpus = topology[node]
+        first_cpu_index = workers_placed_per_node[node] * threads_per_process
+        cpus = sorted({node_cpus[(first_cpu_index + i) % len(node_cpus)]
+                       for i in range(min(threads_per_process, len(node_cpus)))})
+        placements.append(worker_placement_tuple(node, cpus))
+        workers_placed_per_node[node] += 1
+
+    return placements
+
+
+def bind_memory_to_node(numa_node):
+    """ Binds the memory of this process to a NUMA node through libnuma, so that it's never allocated on a remote
+        node.
+
+    @return: Whether the memory could be bound. If not (e.g. because libnuma isn't installed), memory will still
+             usually be allocated on the local node of a pinned process, as this is the default policy.
+    @rtype:  bool
+    """
+
+    library_name = ctypes.util.find_library("numa")
+    if library_name is None:
+        return False
+
+    try:
+        libnuma = ctypes.CDLL(library_name)
+        if libnuma.numa_available() < 0:
+            return False
+
+        libnuma.numa_parse_nodestring.restype = ctypes.c_void_p
+        libnuma.numa_parse_nodestring.argtypes = [ctypes.c_char_p]
+        libnuma.numa_set_membind.argtypes = [ctypes.c_void_p]
+        libnuma.numa_bitmask_free.argtypes = [ctypes.c_void_p]
+
+        nodemask = libnuma.numa_parse_nodestring(str(numa_node).encode())
+        if not nodemask:
+            return False
+        libnuma.numa_set_membind(nodemask)
+        libnuma.numa_bitmask_free(nodemask)
+    except (OSError, AttributeError):
+        return False
+
+    return True
+
+
+def claim_placement_slot(placement_slots):
+    """ Claims a slot in a shared array of worker process IDs for this process: the first slot which is empty or
+        whose process no longer exists, so that a worker replacing one which was killed takes its place.
+
+    @return: Index of the claimed slot
+    @rtype:  int
+    """
+
+    with placement_slots.get_lock():
+        for slot, pid in enumerate(placement_slots):
+            if pid == 0 or not _process_exists(pid):
+                placement_slots[slot] = os.getpid()
+                return slot
+
+    # More workers than slots, which shouldn't happen, but share the first slot if it does
+    return 0
+
+
+def _process_exists(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def place_worker(slot, number_workers, threads_per_process=None, sys_root=DEFAULT_SYS_ROOT):
+    """ Pins this worker process to the CPUs planned for its slot, and binds its memory to their NUMA node.
+
+    @return: Placement used, and whether its memory was bound
+    @rtype:  tuple(worker_placement_tuple, bool)
+    """
+
+    placement = plan_worker_placement(read_numa_topology(sys_root), number_workers, threads_per_process)[slot]
+
+    try:
+        os.sched_setaffinity(0, placement.cpus)
+    except (AttributeError, OSError) as e:
+        logger.warning("Could not pin worker %s to CPUs %s: %s", os.getpid(), placement.cpus, e)
+        return placement, False
+
+    memory_bound = bind_memory_to_node(placement.numa_node)
+
+    logger.info("Worker %s pinned to CPUs %s on NUMA node %s, %s.", os.getpid(), placement.cpus,
+                placement.numa_node, "with memory bound to it" if memory_bound else "without memory binding")
+
+    return placement, memory_bound
+
+
+def get_placement_report(number_workers, threads_per_process=None, sys_root=DEFAULT_SYS_ROOT):
+    """ Gets a description of the planned placement of workers on this machine, for the run metadata.
+    """
+
+    topology = read_numa_topology(sys_root)
+
+    return {"numa_nodes": {str(node): cpus for node, cpus in topology.items()},
+            "libnuma": ctypes.util.find_library("numa") is not None,
+            "workers": [{"numa_node": placement.numa_node, "cpus": placement.cpus}
+                        for placement in plan_worker_placement(topology, number_workers, threads_per_process)], }
@@ -1,18 +1,33 @@
 #/bin/bash
 
 DATASETRELEASE=SC8_MAIN_V0
-# TILE_ID=90346 # When called at command-line, preface with TILE_ID=... to just query for a specific tile
-TILE_ID=90346
-QUERY="Header.ManualValidationStatus.ManualValidationStatus!=\"INVALID\"&&Header.DataSetRelease=$DATASETRELEASE"
+# TILE_ID=90346 # When called at command-line, preface with TILE_ID=... to just query for specific tiles
 
-if [ ! -z ${TILE_ID+x} ]
-then
-  QUERY=$QUERY"&&Data.TileIndex==$TILE_ID"
+if [ -z ${TILE_ID+x} ] || [ "$TILE_ID" == all ]; then
+  TILE_ID_ARGS=""
+else
+  TILE_ID_ARGS="--tile_ids $TILE_ID"
 fi
 
-echo "Query: $QUERY"
+PRODUCT_TYPES=phz
 
-# Get the DpdPhzpfOutputCatalog product and fits files
-CMD='python $HOME/Work/Projects/SHE_Pipeline/SHE_Pipeline/scripts/dataProductRetrieval_SC8.py --username '`cat $HOME/.username.txt`' --password '`cat $HOME/.password.txt`' --project TEST --data_product DpdPhzPfOutputCatalog --query "'$QUERY'"'
+RETRIEVAL_SCRIPT=retrieve_products
+
+# Check some common locations
+if [ -f "$(dirname $(realpath "$0"))/$RETRIEVAL_SCRIPT" ]; then
+  BASEDIR=$(dirname $(realpath "$0"))
+elif [ -f "$HOME/Work/Projects/SHE_Pipeline/SHE_Pipeline/scripts/$RETRIEVAL_SCRIPT" ]; then
+  BASEDIR=$HOME/Work/Projects/SHE_Pipeline/SHE_Pipeline/scripts
+elif [ -f "$HOME/bin/$RETRIEVAL_SCRIPT" ]; then
+  BASEDIR=$HOME/bin
+else
+  echo Could not find retrieval script.
+  exit 1
+fi
+
+RETRIEVAL_SCRIPT=$BASEDIR/$RETRIEVAL_SCRIPT
+
+# Get the DpdPhzPfOutputCatalog products and fits files for all tiles at once
+CMD='python "'$RETRIEVAL_SCRIPT'" --product_types '$PRODUCT_TYPES' --dataset_release '$DATASETRELEASE' '$TILE_ID_ARGS
 echo "Command: $CMD"
 eval $CMD
@@ -1,42 +1,31 @@
 #/bin/bash
 
 DATASETRELEASE=SC8_MAIN_V0
-# OBS_ID=10351 # When called at command-line, preface with OBS_ID=... to just query for a specific observation
+# OBS_ID=10351 # When called at command-line, preface with OBS_ID=... to just query for specific observations
 
-QUERY="Header.ManualValidationStatus.ManualValidationStatus!=\"INVALID\"&&Header.PipelineDefinitionId=='SIM-VIS'&&Header.DataSetRelease=$DATASETRELEASE"
-
-if [ -z ${OBS_ID+x} ]; then
-  OBS_ID=all
+if [ -z ${OBS_ID+x} ] || [ "$OBS_ID" == all ]; then
+  OBS_ID_ARGS=""
+else
+  OBS_ID_ARGS="--obs_ids $OBS_ID"
 fi
 
-DATAPROD_RETRIEVAL_SCRIPT=dataProductRetrieval_SC8.py
+RETRIEVAL_SCRIPT=retrieve_products
 
 # Check some common locations
-if [ -f "$(dirname $(realpath "$0"))/$DATAPROD_RETRIEVAL_SCRIPT" ]; then
+if [ -f "$(dirname $(realpath "$0"))/$RETRIEVAL_SCRIPT" ]; then
   BASEDIR=$(dirname $(realpath "$0"))
-elif [ -f "$HOME/Work/Projects/SHE_Pipeline/SHE_Pipeline/scripts/$DATAPROD_RETRIEVAL_SCRIPT" ]; then
+elif [ -f "$HOME/Work/Projects/SHE_Pipeline/SHE_Pipeline/scripts/$RETRIEVAL_SCRIPT" ]; then
   BASEDIR=$HOME/Work/Projects/SHE_Pipeline/SHE_Pipeline/scripts
-elif [ -f "$HOME/bin/$DATAPROD_RETRIEVAL_SCRIPT" ]; then
+elif [ -f "$HOME/bin/$RETRIEVAL_SCRIPT" ]; then
   BASEDIR=$HOME/bin
-else:
+else
   echo Could not find retrieval script.
   exit 1
 fi
 
-DATAPROD_RETRIEVAL_SCRIPT=$BASEDIR/$DATAPROD_RETRIEVAL_SCRIPT
-
-# Iterate over observation IDs
-for PICKED_OBS_ID in $OBS_ID; do
-
-  if [ $OBS_ID != all ]; then
-    QUERY=$QUERY"&&Data.EuclidPointingId==$PICKED_OBS_ID"
-  fi
-
-  echo "Query: $QUERY"
-
-  # Get the DpdTrueUniverseOutput product and fits files
-  CMD='python "'$DATAPROD_RETRIEVAL_SCRIPT'" --username '`cat $HOME/.username.txt`' --password '`cat $HOME/.password.txt`' --project TEST --data_product DpdTrueUniverseOutput --query "'$QUERY'"'
-  echo "Command: $CMD"
-  eval $CMD
+RETRIEVAL_SCRIPT=$BASEDIR/$RETRIEVAL_SCRIPT
 
-done
+# Get the DpdTrueUniverseOutput products and fits files for all observations at once
+CMD='python "'$RETRIEVAL_SCRIPT'" --product_types sim --dataset_release '$DATASETRELEASE' '$OBS_ID_ARGS
+echo "Command: $CMD"
+eval $CMD
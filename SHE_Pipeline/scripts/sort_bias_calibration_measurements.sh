@@ -1,36 +1,20 @@
 #!/bin/bash
 
-TAR_STRING="tar cvzf shear_bias_residuals_measurements.tar.gz data "
+# Packages the shear_bias_residuals_measurements.xml of each TAG directory here, and the data files they point to, into
+# shear_bias_residuals_measurements.tar.gz, storing files shared between TAGs once
 
-for TAG in Ep0Pp0Sp0 Em2Pp0Sp0 Em1Pp0Sp0 Ep1Pp0Sp0 Ep2Pp0Sp0 Ep0Pp0Sm2 Ep0Pp0Sm1 Ep0Pp0Sp1 Ep0Pp0Sp2
-do
-  NEW_TAG=${TAG}Tp0
-  cp $TAG/shear_bias_residuals_measurements.xml shear_bias_residuals_measurements_${NEW_TAG}.xml
-  cp -r $TAG/data .
-  TAR_STRING=$TAR_STRING"shear_bias_residuals_measurements_"$NEW_TAG".xml "
-done
+PACKAGING_SCRIPT=package_bias_measurements
 
-for TAG in Ep0Pm2Sp0 Ep0Pm1Sp0 Ep0Pp1Sp0 Ep0Pp2Sp0
-do
-  NEW_TAG=${TAG}Tp0
-  cp Ep0Pp0Sp0/shear_bias_residuals_measurements.xml shear_bias_residuals_measurements_${NEW_TAG}.xml
-  TAR_STRING=$TAR_STRING"shear_bias_residuals_measurements_"$NEW_TAG".xml "
-done
+# Check some common locations
+if [ -f "$(dirname $(realpath "$0"))/$PACKAGING_SCRIPT" ]; then
+  BASEDIR=$(dirname $(realpath "$0"))
+elif [ -f "$HOME/Work/Projects/SHE_Pipeline/SHE_Pipeline/scripts/$PACKAGING_SCRIPT" ]; then
+  BASEDIR=$HOME/Work/Projects/SHE_Pipeline/SHE_Pipeline/scripts
+elif [ -f "$HOME/bin/$PACKAGING_SCRIPT" ]; then
+  BASEDIR=$HOME/bin
+else
+  echo Could not find packaging script.
+  exit 1
+fi
 
-for TAG in Tm2 Tm1 Tp1 Tp2
-do
-  NEW_TAG=Ep0Pp0Sp0${TAG}
-  cp $TAG/shear_bias_residuals_measurements.xml shear_bias_residuals_measurements_${NEW_TAG}.xml
-  cp -r $TAG/data .
-  TAR_STRING=$TAR_STRING"shear_bias_residuals_measurements_"$NEW_TAG".xml "
-done
-
-for TAG in CO WB COWB
-do
-  NEW_TAG=$TAG
-  cp $TAG/shear_bias_residuals_measurements.xml shear_bias_residuals_measurements_${NEW_TAG}.xml
-  cp -r $TAG/data .
-  TAR_STRING=$TAR_STRING"shear_bias_residuals_measurements_"$NEW_TAG".xml "
-done
-
-eval $TAR_STRING
\ No newline at end of file
+python "$BASEDIR/$PACKAGING_SCRIPT" --product_filename shear_bias_residuals_measurements.xml --output shear_bias_residuals_measurements.tar.gz "$@"
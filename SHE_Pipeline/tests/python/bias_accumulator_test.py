@@ -0,0 +1,158 @@
+""" @file bias_accumulator_test.py
+
+    Created 19 October 2026
+
+    Unit tests of the bias accumulator store.
+"""
+
+__updated__ = "2026-10-19"
+
+# Copyright (C) 2012-2020 Euclid Science Ground Segment
+#
+# This library is free software; you can redistribute it and/or modify it under the terms of the GNU Lesser General
+# Public License as published by the Free Software Foundation; either version 3.0 of the License, or (at your option)
+# any later version.
+#
+# This library is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY; without even the implied
+# warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU Lesser General Public License for more
+# details.
+#
+# You should have received a copy of the GNU Lesser General Public License along with this library; if not, write to
+# the Free Software Foundation, Inc., 51 Franklin Street, Fifth Floor,
+# Boston, MA 02110-1301 USA
+
+import os
+from collections import namedtuple
+
+import pytest
+
+from SHE_Pipeline import bias_accumulator as ba
+from SHE_Pipeline.bias_accumulator import (BiasAccumulatorStore, LinregressAccumulator, get_accumulator_key,
+                                           read_bias_statistics_listfile_accumulators, )
+
+
+def make_accumulator(lx, ly, ly_err):
+    """ Creates an accumulator from a set of points.
+    """
+    accumulator = LinregressAccumulator()
+    for x, y, y_err in zip(lx, ly, ly_err):
+        w = y_err ** -2
+        accumulator.add_statistics(w, x, x ** 2, y, x * y)
+    return accumulator
+
+
+class TestBiasAccumulator:
+    """ Unit tests for the bias accumulator.
+    """
+
+    lx1 = (-0.1, -0.05, 0., 0.04, 0.1)
+    ly1 = (-0.102, -0.049, 0.001, 0.0405, 0.1013)
+    ly_err1 = (0.01, 0.02, 0.01, 0.015, 0.01)
+
+    lx2 = (-0.08, 0.02, 0.07)
+    ly2 = (-0.0796, 0.0211, 0.0705)
+    ly_err2 = (0.02, 0.01, 0.01)
+
+    def test_merge_is_exact(self):
+        """ Test that merging accumulators gives the same result as accumulating all points together.
+        """
+
+        combined = make_accumulator(self.lx1 + self.lx2, self.ly1 + self.ly2, self.ly_err1 + self.ly_err2)
+        merged = make_accumulator(self.lx1, self.ly1, self.ly_err1)
+        merged += make_accumulator(self.lx2, self.ly2, self.ly_err2)
+
+        combined_estimate = combined.get_bias_estimate()
+        merged_estimate = merged.get_bias_estimate()
+
+        for attr in ("m", "m_err", "c", "c_err", "mc_covar"):
+            assert getattr(merged_estimate, attr) == pytest.approx(getattr(combined_estimate, attr))
+
+    def test_read_statistics_listfile(self, monkeypatch):
+        """ Test that the bias statistics products in a listfile are combined exactly, keeping each bin separate.
+        """
+
+        statistics_products = {"stats_1.xml": (self.lx1, self.ly1, self.ly_err1),
+                               "stats_2.xml": (self.lx2, self.ly2, self.ly_err2), }
+
+        MockStatistics = namedtuple("MockStatistics", "w xm x2m ym xym")
+
+        class MockProduct:
+            def __init__(self, lx, ly, ly_err):
+                self.points = lx, ly, ly_err
+
+            def get_method_bias_statistics(self, method, workdir):
+                if method != "KSB":
+                    return None
+                lx, ly, ly_err = self.points
+                # Put the points into two bins, with g2 the mirror image of g1
+                binned_statistics = {}
+                for bin_label, points in (("bin1", slice(None, 2)), ("bin2", slice(2, None))):
+                    statistics = []
+                    for sign in (1, -1):
+                        accumulator = make_accumulator([sign * x for x in lx[points]],
+                                                       [sign * y for y in ly[points]], ly_err[points])
+                        statistics.append(MockStatistics(w=accumulator.w,
+                                                         xm=accumulator.wx / accumulator.w,
+                                                         x2m=accumulator.wx2 / accumulator.w,
+                                                         ym=accumulator.wy / accumulator.w,
+                                                         xym=accumulator.wxy / accumulator.w))
+                    binned_statistics[bin_label] = tuple(statistics)
+                return binned_statistics
+
+        monkeypatch.setattr(ba, "read_listfile", lambda listfile: list(statistics_products))
+        monkeypatch.setattr(ba, "read_xml_product",
+                            lambda filename, workdir: MockProduct(*statistics_products[filename]))
+
+        accumulators = read_bias_statistics_listfile_accumulators("list.json")
+
+        assert sorted(accumulators) == sorted(get_accumulator_key("KSB", component, bin_label)
+                                              for component in ("g1", "g2") for bin_label in ("bin1", "bin2"))
+
+        for bin_label, points in (("bin1", slice(None, 2)), ("bin2", slice(2, None))):
+            expected = make_accumulator(self.lx1[points] + self.lx2[points], self.ly1[points] + self.ly2[points],
+                                        self.ly_err1[points] + self.ly_err2[points]).get_bias_estimate()
+            for component in ("g1", "g2"):
+                estimate = accumulators[get_accumulator_key("KSB", component, bin_label)].get_bias_estimate()
+                for attr in ("m", "m_err", "c_err", "weight"):
+                    assert getattr(estimate, attr) == pytest.approx(getattr(expected, attr))
+
+    def test_store_fold_in(self, tmpdir):
+        """ Test folding batches into a store, and that a batch can't be folded in twice.
+        """
+
+        store = BiasAccumulatorStore(os.path.join(tmpdir, "accumulator.json"))
+        key = get_accumulator_key("KSB", "g1")
+
+        assert store.fold_in("Ep0Pp0Sp0", {key: make_accumulator(self.lx1, self.ly1, self.ly_err1)}, batch_id=1)
+        assert store.fold_in("Ep0Pp0Sp0", {key: make_accumulator(self.lx2, self.ly2, self.ly_err2)}, batch_id=2)
+        assert not store.fold_in("Ep0Pp0Sp0", {key: make_accumulator(self.lx2, self.ly2, self.ly_err2)},
+                                 batch_id=2)
+
+        assert store.get_batches("Ep0Pp0Sp0") == ["1", "2"]
+
+        expected = make_accumulator(self.lx1 + self.lx2, self.ly1 + self.ly2,
+                                    self.ly_err1 + self.ly_err2).get_bias_estimate()
+        estimate = store.get_bias_estimates("Ep0Pp0Sp0")[key]
+        assert estimate.m == pytest.approx(expected.m)
+        assert estimate.m_err == pytest.approx(expected.m_err)
+
+    def test_store_merge(self, tmpdir):
+        """ Test merging two stores, and that overlapping batches are refused.
+        """
+
+        key = get_accumulator_key("LensMC", "g2")
+
+        store1 = BiasAccumulatorStore(os.path.join(tmpdir, "accumulator1.json"))
+        store1.fold_in("CO", {key: make_accumulator(self.lx1, self.ly1, self.ly_err1)}, batch_id=1)
+
+        store2 = BiasAccumulatorStore(os.path.join(tmpdir, "accumulator2.json"))
+        store2.fold_in("CO", {key: make_accumulator(self.lx2, self.ly2, self.ly_err2)}, batch_id=2)
+        store2.fold_in("WB", {key: make_accumulator(self.lx2, self.ly2, self.ly_err2)}, batch_id=2)
+
+        store1.merge_from(store2.filename)
+
+        assert store1.get_tags() == ["CO", "WB"]
+        assert store1.get_batches("CO") == ["1", "2"]
+
+        with pytest.raises(ValueError):
+            store1.merge_from(store2.filename)
@@ -0,0 +1,179 @@
+""" @file bias_packaging_test.py
+
+    Created 19 October 2026
+
+    Unit tests of the packaging of bias measurements into a compressed archive.
+"""
+
+__updated__ = "2026-10-19"
+
+# Copyright (C) 2012-2020 Euclid Science Ground Segment
+#
+# This library is free software; you can redistribute it and/or modify it under the terms of the GNU Lesser General
+# Public License as published by the Free Software Foundation; either version 3.0 of the License, or (at your option)
+# any later version.
+#
+# This library is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY; without even the implied
+# warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU Lesser General Public License for more
+# details.
+#
+# You should have received a copy of the GNU Lesser General Public License along with this library; if not, write to
+# the Free Software Foundation, Inc., 51 Franklin Street, Fifth Floor,
+# Boston, MA 02110-1301 USA
+
+import gzip
+import io
+import json
+import os
+import random
+import tarfile
+
+import pytest
+
+import SHE_Pipeline.bias_packaging as bp
+
+
+TAG_RENAMES = (("Ep0Pp0Sp0", "Ep0Pp0Sp0Tp0"),
+               ("Ep0Pp0Sp0", "Ep0Pm1Sp0Tp0"),
+               ("Tm1", "Ep0Pp0Sp0Tm1"),
+               ("CO", "CO"),)
+
+
+class MockProduct(object):
+
+    def __init__(self, filenames):
+        self.filenames = filenames
+
+    def get_all_filenames(self):
+        return self.filenames
+
+
+def read_mock_product(filename):
+    with open(filename) as fi:
+        return MockProduct(json.load(fi))
+
+
+def write_tag(root_dir, tag, data_files):
+    os.makedirs(os.path.join(root_dir, tag, "data"))
+    for filename, contents in data_files.items():
+        with open(os.path.join(root_dir, tag, "data", filename), "w") as fo:
+            fo.write(contents)
+    with open(os.path.join(root_dir, tag, bp.DEFAULT_PRODUCT_FILENAME), "w") as fo:
+        json.dump(["data/" + filename for filename in data_files] + ["None"], fo)
+
+
+class TestBiasPackaging:
+    """ Unit tests for packaging bias measurements.
+    """
+
+    def test_parallel_gzip_writer(self):
+        """ Test that data compressed in parallel blocks decompresses to what was written.
+        """
+
+        rng = random.Random(1)
+        data = b"".join(bytes(rng.choice(b"ab") for _ in range(rng.randrange(1, 200))) * rng.randrange(1, 50)
+                        for _ in range(500))
+
+        fo = io.BytesIO()
+        with bp.ParallelGzipWriter(fo, number_threads=3, block_size=16 * 1024) as writer:
+            for i in range(0, len(data), 10000):
+                writer.write(data[i:i + 10000])
+
+        assert len(data) > 4 * 16 * 1024
+        assert len(fo.getvalue()) < len(data)
+        assert gzip.decompress(fo.getvalue()) == data
+
+        fo = io.BytesIO()
+        bp.ParallelGzipWriter(fo).close()
+        assert gzip.decompress(fo.getvalue()) == b""
+
+    def test_package(self, tmpdir, monkeypatch):
+        """ Test that each TAG's product and data files are archived, with duplicated files stored once.
+        """
+
+        monkeypatch.setattr(bp, "read_xml_product", read_mock_product)
+
+        root_dir = os.path.join(tmpdir, "archive")
+        write_tag(root_dir, "Ep0Pp0Sp0", {"a.fits": "a", "shared.fits": "shared"})
+        write_tag(root_dir, "Tm1", {"b.fits": "a", "shared.fits": "shared", "c.fits": "c"})
+
+        output_filename = os.path.join(tmpdir, "shear_bias_measurements.tar.gz")
+        manifest = bp.package_bias_measurements(root_dir, output_filename, tag_renames=TAG_RENAMES,
+                                                number_threads=2)
+
+        links = {file["name"]: file["link"] for file in manifest["files"]}
+        assert links == {"shear_bias_measurements_Ep0Pp0Sp0Tp0.xml": None,
+                         "data/a.fits": None,
+                         "data/shared.fits": None,
+                         "shear_bias_measurements_Ep0Pm1Sp0Tp0.xml": "shear_bias_measurements_Ep0Pp0Sp0Tp0.xml",
+                         "shear_bias_measurements_Ep0Pp0Sp0Tm1.xml": None,
+                         "data/b.fits": "data/a.fits",
+                         "data/c.fits": None}
+        assert manifest["number_stored"] == 5
+
+        with open(bp.get_manifest_filename(output_filename)) as fi:
+            assert json.load(fi) == manifest
+
+        extract_dir = os.path.join(tmpdir, "extracted")
+        with tarfile.open(output_filename, "r:gz") as tar:
+            assert tar.getmember("data/b.fits").islnk()
+            tar.extractall(extract_dir)
+
+        for filename, contents in (("data/a.fits", "a"), ("data/b.fits", "a"), ("data/shared.fits", "shared"),
+                                   ("data/c.fits", "c")):
+            with open(os.path.join(extract_dir, filename)) as fi:
+                assert fi.read() == contents
+        with open(os.path.join(extract_dir, bp.MANIFEST_ARCNAME)) as fi:
+            assert json.load(fi) == manifest
+        assert not [filename for filename in os.listdir(tmpdir) if filename.endswith(".tmp")]
+
+    def test_symlinked_files(self, tmpdir, monkeypatch):
+        """ Test that data files which are symlinks are archived with the contents of the files they point to.
+        """
+
+        monkeypatch.setattr(bp, "read_xml_product", read_mock_product)
+
+        root_dir = os.path.join(tmpdir, "archive")
+        write_tag(root_dir, "Ep0Pp0Sp0", {"a.fits": "a"})
+        write_tag(root_dir, "Tm1", {})
+
+        # Link one data file to a file outside the archived directory, and another to a copy of it
+        real_filename = os.path.join(tmpdir, "real.fits")
+        with open(real_filename, "w") as fo:
+            fo.write("real")
+        for filename in ("d.fits", "e.fits"):
+            os.symlink(real_filename, os.path.join(root_dir, "Tm1", "data", filename))
+        with open(os.path.join(root_dir, "Tm1", bp.DEFAULT_PRODUCT_FILENAME), "w") as fo:
+            json.dump(["data/d.fits", "data/e.fits"], fo)
+
+        output_filename = os.path.join(tmpdir, "shear_bias_measurements.tar.gz")
+        manifest = bp.package_bias_measurements(root_dir, output_filename, tag_renames=TAG_RENAMES)
+
+        files = {file["name"]: file for file in manifest["files"]}
+        assert files["data/d.fits"]["size"] == 4
+        assert files["data/e.fits"]["link"] == "data/d.fits"
+
+        extract_dir = os.path.join(tmpdir, "extracted")
+        with tarfile.open(output_filename, "r:gz") as tar:
+            member = tar.getmember("data/d.fits")
+            assert member.isfile()
+            assert member.size == 4
+            tar.extractall(extract_dir)
+
+        for filename in ("data/d.fits", "data/e.fits"):
+            assert not os.path.islink(os.path.join(extract_dir, filename))
+            with open(os.path.join(extract_dir, filename)) as fi:
+                assert fi.read() == "real"
+
+    def test_conflicting_files(self, tmpdir, monkeypatch):
+        """ Test that files with different contents aren't archived under the same name.
+        """
+
+        monkeypatch.setattr(bp, "read_xml_product", read_mock_product)
+
+        root_dir = os.path.join(tmpdir, "archive")
+        write_tag(root_dir, "Ep0Pp0Sp0", {"shared.fits": "shared"})
+        write_tag(root_dir, "Tm1", {"shared.fits": "changed"})
+
+        with pytest.raises(ValueError):
+            bp.package_bias_measurements(root_dir, os.path.join(tmpdir, "out.tar.gz"), tag_renames=TAG_RENAMES)
@@ -0,0 +1,128 @@
+""" @file campaign_scheduler_test.py
+
+    Created 19 October 2026
+
+    Unit tests of the scheduler for campaigns of sensitivity-testing jobs.
+"""
+
+__updated__ = "2026-10-19"
+
+# Copyright (C) 2012-2020 Euclid Science Ground Segment
+#
+# This library is free software; you can redistribute it and/or modify it under the terms of the GNU Lesser General
+# Public License as published by the Free Software Foundation; either version 3.0 of the License, or (at your option)
+# any later version.
+#
+# This library is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY; without even the implied
+# warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU Lesser General Public License for more
+# details.
+#
+# You should have received a copy of the GNU Lesser General Public License along with this library; if not, write to
+# the Free Software Foundation, Inc., 51 Franklin Street, Fifth Floor,
+# Boston, MA 02110-1301 USA
+
+import json
+import os
+import shutil
+
+import pytest
+
+import SHE_Pipeline.campaign_scheduler as cs
+
+
+def write_config(tmpdir, **kwargs):
+    contents = {"archive_dir": os.path.join(tmpdir, "archive"),
+                "workspace_root": os.path.join(tmpdir, "workdirs", "sens_"),
+                "logdir": os.path.join(tmpdir, "logs"),
+                "scriptdir": os.path.join(tmpdir, "scripts"),
+                "batch_start": 10,
+                "batch_end": 12,
+                "tags": ["Ep0Pp0Sp0", "Ep1Pp0Sp0"],
+                "poll_interval": 0.,
+                "retry_interval": 0.,
+                **kwargs}
+    filename = os.path.join(tmpdir, "campaign.json")
+    with open(filename, "w") as fo:
+        json.dump(contents, fo)
+    return filename
+
+
+def complete(config, tag, batch):
+    completion_filename = cs.get_completion_filename(config, tag, batch)
+    os.makedirs(os.path.dirname(completion_filename), exist_ok=True)
+    open(completion_filename, "w").close()
+
+
+class TestCampaignScheduler:
+    """ Unit tests for the campaign scheduler.
+    """
+
+    def test_read_config(self, tmpdir):
+        """ Test reading a campaign config, and the seed range of each batch.
+        """
+
+        config = cs.read_campaign_config(write_config(tmpdir, job_limit=4))
+
+        assert config.job_limit == 4
+        assert config.seeds_per_batch == cs.DEFAULT_CAMPAIGN_CONFIG["seeds_per_batch"]
+        assert cs.get_seed_range(config, 0) == (1, 96)
+        assert cs.get_seed_range(config, 2) == (193, 288)
+        assert cs.get_job_command(config, "CO", 2)[1:7] == ["1", "96", "16", "CO", "2", "8"]
+
+        with pytest.raises(ValueError):
+            cs.read_campaign_config(write_config(tmpdir, job_limt=4))
+        with pytest.raises(ValueError):
+            cs.read_campaign_config(write_config(tmpdir, batch_end=9))
+
+    def test_run(self, tmpdir):
+        """ Test that all jobs not already complete are submitted within the job limit, failed jobs are
+            resubmitted, and completion is remembered in the state.
+        """
+
+        config = cs.read_campaign_config(write_config(tmpdir, job_limit=2))
+        complete(config, "Ep0Pp0Sp0", 10)
+
+        attempts = {}
+
+        def run_job(command):
+            tag, batch = command[4], int(command[5])
+            attempts[(tag, batch)] = attempts.get((tag, batch), 0) + 1
+            # Fail the first attempt of one job
+            if (tag, batch) != ("Ep1Pp0Sp0", 11) or attempts[(tag, batch)] > 1:
+                complete(config, tag, batch)
+
+        backend = cs.StubBackend(job_duration=2, run_job=run_job)
+        state_filename = os.path.join(tmpdir, "state.json")
+        scheduler = cs.CampaignScheduler(config, backend, state_filename, sleep=lambda _: None)
+
+        assert scheduler.run()
+
+        assert backend.max_active <= 2
+        assert ("Ep0Pp0Sp0", 10) not in attempts
+        assert attempts.pop(("Ep1Pp0Sp0", 11)) == 2
+        assert set(attempts.values()) == {1}
+        assert len(attempts) == 4
+        assert scheduler.number_failed == 1
+
+        # Completion is read from the state, without needing the archive
+        shutil.rmtree(config.archive_dir)
+        scheduler = cs.CampaignScheduler(config, cs.StubBackend(), state_filename, sleep=lambda _: None)
+        assert scheduler.get_remaining() == []
+        with open(state_filename) as fi:
+            assert json.load(fi)["completed"] == {"Ep0Pp0Sp0": [[10, 12]], "Ep1Pp0Sp0": [[10, 12]]}
+
+    def test_killfile(self, tmpdir):
+        """ Test that the scheduler stops once its killfile is deleted.
+        """
+
+        killfile = os.path.join(tmpdir, "DELETE_ME_TO_STOP")
+        config = cs.read_campaign_config(write_config(tmpdir, job_limit=1, killfile=killfile))
+
+        backend = cs.StubBackend(job_duration=10, run_job=lambda command: complete(config, command[4],
+                                                                                   int(command[5])))
+        scheduler = cs.CampaignScheduler(config, backend, os.path.join(tmpdir, "state.json"),
+                                         sleep=lambda _: os.remove(killfile))
+
+        assert not scheduler.run()
+        assert len(backend.submitted) == 1
+        assert len(scheduler.state.jobs) == 1
@@ -0,0 +1,120 @@
+""" @file intermediate_storage_test.py
+
+    Created 19 October 2026
+
+    Unit tests of holding the intermediate products of simulations in memory.
+"""
+
+__updated__ = "2026-10-19"
+
+# Copyright (C) 2012-2020 Euclid Science Ground Segment
+#
+# This library is free software; you can redistribute it and/or modify it under the terms of the GNU Lesser General
+# Public License as published by the Free Software Foundation; either version 3.0 of the License, or (at your option)
+# any later version.
+#
+# This library is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY; without even the implied
+# warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU Lesser General Public License for more
+# details.
+#
+# You should have received a copy of the GNU Lesser General Public License along with this library; if not, write to
+# the Free Software Foundation, Inc., 51 Franklin Street, Fifth Floor,
+# Boston, MA 02110-1301 USA
+
+import os
+
+import SHE_Pipeline.intermediate_storage as ist
+
+
+class MockProduct():
+
+    def __init__(self, filenames):
+        self.filenames = filenames
+
+    def get_all_filenames(self):
+        return self.filenames
+
+
+def write_file(qualified_filename, contents=""):
+    with open(qualified_filename, "w") as fo:
+        fo.write(contents)
+
+
+class TestIntermediateStorage:
+    """ Unit tests for intermediate storage.
+    """
+
+    def test_memory_workdir(self, tmpdir):
+        """ Test that products written in the memory workdir stay there, while inputs and logs are in the workdir.
+        """
+
+        workdir = os.path.join(tmpdir, "workdir")
+        memory_root = os.path.join(tmpdir, "shm")
+        for directory in (workdir, memory_root, os.path.join(workdir, "data"), os.path.join(workdir, "logs")):
+            os.mkdir(directory)
+        write_file(os.path.join(workdir, "data", "config.txt"), "config")
+        write_file(os.path.join(workdir, "data", "data_images.json"), "left over")
+
+        with ist.memory_workdir(workdir, memory_root, products=["data/data_images.json"]) as scratch_workdir:
+
+            assert scratch_workdir.startswith(memory_root)
+            with open(os.path.join(scratch_workdir, "data", "config.txt")) as fi:
+                assert fi.read() == "config"
+
+            write_file(os.path.join(scratch_workdir, "data", "data_images.json"), "new")
+            write_file(os.path.join(scratch_workdir, "logs", "she_simulate_images.out"), "log")
+
+        assert not os.path.exists(scratch_workdir)
+        with open(os.path.join(workdir, "data", "data_images.json")) as fi:
+            assert fi.read() == "left over"
+        assert os.path.exists(os.path.join(workdir, "logs", "she_simulate_images.out"))
+
+    def test_move_product_to_workdir(self, tmpdir, monkeypatch):
+        """ Test that a product and its data files are moved to the workdir, but not files symlinked from it.
+        """
+
+        workdir = os.path.join(tmpdir, "workdir")
+        os.makedirs(os.path.join(workdir, "data"))
+        write_file(os.path.join(workdir, "data", "input.fits"), "input")
+        write_file(os.path.join(workdir, "data", "output.fits"), "old output")
+
+        monkeypatch.setattr(ist, "read_xml_product",
+                            lambda filename, workdir: MockProduct(["data/output.fits", "data/input.fits", "None"]))
+
+        with ist.memory_workdir(workdir, str(tmpdir)) as scratch_workdir:
+            write_file(os.path.join(scratch_workdir, "data", "product.xml"), "product")
+            os.remove(os.path.join(scratch_workdir, "data", "output.fits"))
+            write_file(os.path.join(scratch_workdir, "data", "output.fits"), "new output")
+
+            ist.move_product_to_workdir("data/product.xml", scratch_workdir, workdir)
+            ist.move_product_to_workdir("data/missing.xml", scratch_workdir, workdir)
+
+        for filename, contents in (("product.xml", "product"), ("output.fits", "new output"), ("input.fits", "input")):
+            qualified_filename = os.path.join(workdir, "data", filename)
+            assert not os.path.islink(qualified_filename)
+            with open(qualified_filename) as fi:
+                assert fi.read() == contents
+        assert not os.path.exists(os.path.join(workdir, "data", "missing.xml"))
+
+    def test_remove_memory_workdirs(self, tmpdir):
+        """ Test that copies left by killed workers of this run are removed, but not those of other runs.
+        """
+
+        workdir = os.path.join(tmpdir, "workdir")
+        memory_root = os.path.join(tmpdir, "shm")
+        for directory in (workdir, memory_root, os.path.join(workdir, "data")):
+            os.mkdir(directory)
+
+        prefix = ist.get_memory_workdir_prefix()
+        other_run_dir = os.path.join(memory_root, ist.MEMORY_WORKDIR_PREFIX + "0_abc")
+        os.mkdir(other_run_dir)
+
+        # Leave a copy behind, as a killed worker would
+        context = ist.memory_workdir(workdir, memory_root, prefix=prefix)
+        scratch_workdir = context.__enter__()
+        write_file(os.path.join(scratch_workdir, "data", "data_images.json"), "new")
+
+        assert ist.remove_memory_workdirs(memory_root, prefix) == 1
+        assert not os.path.exists(scratch_workdir)
+        assert os.path.exists(other_run_dir)
+        assert os.path.exists(os.path.join(workdir, "data"))
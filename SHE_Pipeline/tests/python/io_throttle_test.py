@@ -0,0 +1,160 @@
+""" @file io_throttle_test.py
+
+    Created 19 October 2026
+
+    Unit tests of the throttling of I/O-heavy stages.
+"""
+
+__updated__ = "2026-10-19"
+
+# Copyright (C) 2012-2020 Euclid Science Ground Segment
+#
+# This library is free software; you can redistribute it and/or modify it under the terms of the GNU Lesser General
+# Public License as published by the Free Software Foundation; either version 3.0 of the License, or (at your option)
+# any later version.
+#
+# This library is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY; without even the implied
+# warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU Lesser General Public License for more
+# details.
+#
+# You should have received a copy of the GNU Lesser General Public License along with this library; if not, write to
+# the Free Software Foundation, Inc., 51 Franklin Street, Fifth Floor,
+# Boston, MA 02110-1301 USA
+
+from collections import namedtuple
+import json
+import multiprocessing
+import os
+import signal
+import threading
+import time
+
+import pytest
+
+import SHE_Pipeline.io_throttle as it
+import SHE_Pipeline.simulation_executors as se
+import SHE_Pipeline.simulation_scheduler as ss
+
+MockWorkdir = namedtuple("MockWorkdir", "workdir logdir app_workdir app_logdir")
+
+
+def run_throttled_stages(_task_args):
+    """ Runs an unthrottled stage and a throttled stage, returning the times each was in.
+    """
+    stage_times = {}
+    for stage in ("estimate_shear", "simulate_images"):
+        with it.throttled_stage(stage):
+            start = time.time()
+            time.sleep(0.2)
+            stage_times[stage] = (start, time.time())
+    return stage_times
+
+
+def hold_throttle(throttle, held_event):
+    """ Holds a place in a throttled stage and the token bucket until killed.
+    """
+    with throttle.stage("simulate_images"):
+        throttle._lock(it.BUCKET_LOCK_OFFSET)
+        held_event.set()
+        time.sleep(60.)
+
+
+def get_max_overlap(intervals):
+    events = sorted([(start, 1) for start, _ in intervals] + [(end, -1) for _, end in intervals])
+    overlap = max_overlap = 0
+    for _, change in events:
+        overlap += change
+        max_overlap = max(max_overlap, overlap)
+    return max_overlap
+
+
+class TestIOThrottle:
+    """ Unit tests for I/O throttling.
+    """
+
+    def test_get_io_limits(self, tmpdir):
+
+        qualified_filename = os.path.join(tmpdir, "io_limits.json")
+        with open(qualified_filename, "w") as fo:
+            json.dump({"stage_concurrency": {"simulate_images": 4}, "bandwidth_mb_per_s": 100}, fo)
+
+        site_limits = it.read_io_limits(qualified_filename)
+        assert site_limits == it.io_limits_tuple({"simulate_images": 4}, 100 * it.MB, 100 * it.MB)
+
+        limits = it.get_io_limits(stage_concurrency={"estimate_shear": 2}, base_limits=site_limits)
+        assert limits.stage_concurrency == {"simulate_images": 4, "estimate_shear": 2}
+        assert limits.bandwidth == 100 * it.MB
+
+        assert it.get_io_limits() is None
+        with pytest.raises(ValueError):
+            it.get_io_limits(stage_concurrency={"simulate_images": 0})
+
+    def test_stage_concurrency(self, tmpdir):
+        """ Test that no more workers than the limit are in a throttled stage at once, while other stages aren't
+            throttled.
+        """
+
+        limits = it.io_limits_tuple({"simulate_images": 2}, None, None)
+        executor = se.create_executor("fork", 4, io_limits=limits)
+
+        results = []
+        tasks = [ss.SimulationTask(i, MockWorkdir(str(tmpdir), "logs", None, None), None) for i in range(8)]
+        scheduler = ss.SimulationScheduler(executor, 4, tasks, task_function=run_throttled_stages,
+                                           poll_interval=0.05, progress_queue=executor.progress_queue)
+        scheduler.add_completion_listener(lambda _scheduler, _task, result: results.append(result))
+        scheduler.run()
+        executor.close()
+        executor.join()
+
+        assert len(results) == 8
+        assert get_max_overlap([result["simulate_images"] for result in results]) == 2
+        assert get_max_overlap([result["estimate_shear"] for result in results]) > 2
+
+    def test_token_bucket(self, monkeypatch):
+        """ Test that a worker waits for the bucket to refill once it's in debt, and is charged for its I/O.
+        """
+
+        throttle = it.IOThrottle(it.io_limits_tuple({}, it.MB, 0.1 * it.MB))
+        assert throttle.throttles("estimate_shear")
+
+        # Put the bucket 0.3 MB in debt, which takes 0.3s to pay off
+        throttle._update_tokens(-0.4 * it.MB)
+        start = time.monotonic()
+        with throttle.stage("estimate_shear"):
+            wait_time = time.monotonic() - start
+        assert 0.2 < wait_time < 1.
+
+        io_bytes = iter([0, 0.5 * it.MB])
+        monkeypatch.setattr(it, "_read_storage_io_bytes", lambda: next(io_bytes))
+        with throttle.stage("estimate_shear"):
+            pass
+        assert throttle._update_tokens() < -0.3 * it.MB
+        throttle.remove()
+
+    def test_killed_worker(self):
+        """ Test that a worker killed while in a throttled stage and updating the token bucket doesn't keep its
+            place or block the bucket.
+        """
+
+        context = multiprocessing.get_context("fork")
+        throttle = it.IOThrottle(it.io_limits_tuple({"simulate_images": 1}, it.MB, it.MB), context)
+
+        held_event = context.Event()
+        process = context.Process(target=hold_throttle, args=(throttle, held_event))
+        process.start()
+        assert held_event.wait(10.)
+        os.kill(process.pid, signal.SIGKILL)
+        process.join()
+
+        def enter_stage():
+            with throttle.stage("simulate_images"):
+                pass
+
+        # The stage's only place would otherwise never be freed, so run in a thread which can be abandoned
+        entry_thread = threading.Thread(target=enter_stage, daemon=True)
+        entry_thread.start()
+        entry_thread.join(timeout=10.)
+        assert not entry_thread.is_alive()
+
+        throttle.remove()
+        assert not os.path.exists(throttle._lock_filename)
@@ -0,0 +1,131 @@
+""" @file memory_profiles_test.py
+
+    Created 19 October 2026
+
+    Unit tests of the memory profiles of workers and the measurement of their memory behaviour.
+"""
+
+__updated__ = "2026-10-19"
+
+# Copyright (C) 2012-2020 Euclid Science Ground Segment
+#
+# This library is free software; you can redistribute it and/or modify it under the terms of the GNU Lesser General
+# Public License as published by the Free Software Foundation; either version 3.0 of the License, or (at your option)
+# any later version.
+#
+# This library is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY; without even the implied
+# warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU Lesser General Public License for more
+# details.
+#
+# You should have received a copy of the GNU Lesser General Public License along with this library; if not, write to
+# the Free Software Foundation, Inc., 51 Franklin Street, Fifth Floor,
+# Boston, MA 02110-1301 USA
+
+from collections import namedtuple
+import json
+import os
+
+import pytest
+
+import SHE_Pipeline.memory_profiles as mp
+import SHE_Pipeline.simulation_executors as se
+import SHE_Pipeline.simulation_scheduler as ss
+
+MockWorkdir = namedtuple("MockWorkdir", "workdir logdir app_workdir app_logdir")
+
+TEST_ENV_VAR = "SHE_PIPELINE_TEST_MEMORY_PROFILE"
+
+
+def get_profile_env_var(_task_args):
+    return os.environ.get(TEST_ENV_VAR)
+
+
+class TestMemoryProfiles:
+    """ Unit tests for memory profiles.
+    """
+
+    def test_get_memory_profiles(self, tmpdir):
+
+        profiles = mp.get_memory_profiles(["default", "no_thp"])
+        assert [profile.name for profile in profiles] == ["default", "no_thp"]
+        assert profiles[1].thp_disable
+
+        qualified_filename = os.path.join(tmpdir, "memory_profiles.json")
+        with open(qualified_filename, "w") as fo:
+            json.dump({"arena1": {"environment": {"MALLOC_ARENA_MAX": "1"}},
+                       "thp": {"environment": {"GLIBC_TUNABLES": "glibc.malloc.hugetlb=1"}, "thp_disable": False}},
+                      fo)
+
+        profiles = mp.get_memory_profiles(["arena1", "arena2"], qualified_filename)
+        assert profiles[0] == mp.memory_profile_tuple("arena1", {"MALLOC_ARENA_MAX": "1"}, False)
+        assert profiles[1] == mp.BUILTIN_MEMORY_PROFILES["arena2"]
+
+        with pytest.raises(ValueError):
+            mp.get_memory_profiles(["arena3"], qualified_filename)
+
+    def test_applied_environment(self, monkeypatch):
+
+        monkeypatch.setenv(TEST_ENV_VAR, "original")
+        monkeypatch.delenv(TEST_ENV_VAR + "_2", raising=False)
+
+        with mp.applied_environment({TEST_ENV_VAR: None, TEST_ENV_VAR + "_2": 2}):
+            assert TEST_ENV_VAR not in os.environ
+            assert os.environ[TEST_ENV_VAR + "_2"] == "2"
+
+        assert os.environ[TEST_ENV_VAR] == "original"
+        assert TEST_ENV_VAR + "_2" not in os.environ
+
+    def test_resource_measurement(self):
+        """ Test that page faults and peak memory are measured over a stage which allocates memory.
+        """
+
+        baseline = mp.start_resource_measurement()
+        data = bytearray(64 * 1024 * 1024)
+        for i in range(0, len(data), 4096):
+            data[i] = 1
+        resources = mp.finish_resource_measurement(baseline)
+
+        assert resources["wall_time"] > 0
+        assert resources["minor_faults"] > 0
+        assert resources["peak_rss_kb"] >= 64 * 1024
+
+    def test_summarise_stage_resources(self):
+
+        summary = mp.summarise_stage_resources([{"simulate": {"wall_time": 1., "peak_rss_kb": 100}},
+                                                {"simulate": {"wall_time": 3., "peak_rss_kb": 300},
+                                                 "estimate": {"wall_time": 2., "peak_rss_kb": 50}},
+                                                {"simulate": {"wall_time": 5., "peak_rss_kb": 200}}])
+
+        assert summary["simulate"]["number_simulations"] == 3
+        assert summary["simulate"]["wall_time"] == {"mean": 3., "median": 3., "max": 5.}
+        assert summary["simulate"]["peak_rss_kb"]["median"] == 200
+        assert summary["estimate"]["number_simulations"] == 1
+
+    def test_profile_executors(self, tmpdir):
+        """ Test that workers of executors for each profile in turn are started in the profile's environment.
+        """
+
+        profiles = [mp.memory_profile_tuple("a", {TEST_ENV_VAR: "a"}, False),
+                    mp.memory_profile_tuple("b", {TEST_ENV_VAR: "b"}, True)]
+
+        results = {}
+        scheduler = ss.SimulationScheduler(None, 2, [], task_function=get_profile_env_var, poll_interval=0.05)
+        scheduler.add_completion_listener(lambda _scheduler, task, result:
+                                          results.update({task.simulation_number: result}))
+
+        for profile_number, profile in enumerate(profiles):
+            scheduler.pending += [ss.SimulationTask(2 * profile_number + i, MockWorkdir(str(tmpdir), "logs", None,
+                                                                                        None), None)
+                                  for i in range(2)]
+            with mp.applied_environment(mp.get_profile_environment(profile)):
+                executor = se.create_executor("fork", 2, memory_profile=profile)
+                scheduler.use_pool(executor, executor.number_workers, executor.progress_queue)
+                scheduler.run()
+                executor.close()
+                executor.join()
+
+        assert results == {0: "a", 1: "a", 2: "b", 3: "b"}
+        assert len(scheduler.completed) == 4
+
+        with pytest.raises(ValueError):
+            se.create_executor("serial", 1, memory_profile=profiles[0])
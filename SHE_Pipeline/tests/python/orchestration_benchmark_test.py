@@ -0,0 +1,111 @@
+""" @file orchestration_benchmark_test.py
+
+    Created 19 October 2026
+
+    Unit tests of the benchmark of the bias runner's orchestration overhead.
+"""
+
+__updated__ = "2026-10-19"
+
+# Copyright (C) 2012-2020 Euclid Science Ground Segment
+#
+# This library is free software; you can redistribute it and/or modify it under the terms of the GNU Lesser General
+# Public License as published by the Free Software Foundation; either version 3.0 of the License, or (at your option)
+# any later version.
+#
+# This library is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY; without even the implied
+# warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU Lesser General Public License for more
+# details.
+#
+# You should have received a copy of the GNU Lesser General Public License along with this library; if not, write to
+# the Free Software Foundation, Inc., 51 Franklin Street, Fifth Floor,
+# Boston, MA 02110-1301 USA
+
+from argparse import Namespace
+import os
+import pickle
+
+import pytest
+
+import SHE_Pipeline.orchestration_benchmark as ob
+import SHE_Pipeline.run_bias_pipeline_parallel as rbpp
+from SHE_PPT.file_io import read_listfile
+
+
+class TestOrchestrationBenchmark:
+    """ Unit tests for the orchestration benchmark.
+    """
+
+    def test_get_stage_specs(self):
+        """ Test reading the synthetic stages from pairs of arguments.
+        """
+
+        stage_specs = ob.get_stage_specs(stage_sleep=["simulate_images", "0.5"],
+                                         stage_cpu=["simulate_images", "1", "measure_bias", "2"],
+                                         stage_file_size=["estimate_shear", "0.5"])
+
+        assert stage_specs == {"simulate_images": ob.synthetic_stage_tuple(0.5, 1., 0),
+                               "measure_bias": ob.synthetic_stage_tuple(0., 2., 0),
+                               "estimate_shear": ob.synthetic_stage_tuple(0., 0., 512 * 1024)}
+
+        with pytest.raises(ValueError):
+            ob.get_stage_specs(stage_sleep=["simulate_images"])
+        with pytest.raises(ValueError):
+            ob.get_stage_specs(stage_cpu=["simulate_everything", "1"])
+        with pytest.raises(ValueError):
+            ob.get_stage_specs(stage_file_size=["estimate_shear", "-1"])
+
+    def test_synthetic_stages(self, tmpdir):
+        """ Test that the stand-ins write their stage's products and data files, and record their time, and that
+            they replace the science code only while installed.
+        """
+
+        workdir = str(tmpdir)
+        os.makedirs(os.path.join(workdir, "data"))
+        science_times_filename = os.path.join(workdir, ob.SCIENCE_TIMES_FILENAME)
+
+        synthetic_stages = ob.SyntheticStages({"estimate_shear": ob.synthetic_stage_tuple(0.01, 0.01, 1000)},
+                                              number_simulations=3, data_files_per_product=2,
+                                              science_times_filename=science_times_filename)
+
+        original = rbpp.estimate_shears_from_args
+        with synthetic_stages.installed():
+            assert rbpp.estimate_shears_from_args == synthetic_stages.estimate_shears_from_args
+            rbpp.estimate_shears_from_args(Namespace(workdir=workdir,
+                                                     shear_estimates_product="data/shear_estimates.xml",
+                                                     she_lensmc_chains="data/chains.json"))
+        assert rbpp.estimate_shears_from_args == original
+
+        with open(os.path.join(workdir, "data", "shear_estimates.xml"), "rb") as fi:
+            data_filenames = pickle.load(fi).get_all_filenames()
+        assert len(data_filenames) == 2
+        for data_filename in data_filenames:
+            assert os.path.getsize(os.path.join(workdir, data_filename)) == 1000
+
+        chains_product_filename, = read_listfile(os.path.join(workdir, "data", "chains.json"))
+        assert os.path.exists(os.path.join(workdir, chains_product_filename))
+
+        synthetic_stages.write_configs_from_plan("plan.xml", "template.conf", "data/sim_configs.json", workdir)
+        assert len(read_listfile(os.path.join(workdir, "data", "sim_configs.json"))) == 3
+
+        science_times = ob.read_science_times(science_times_filename)
+        assert science_times["estimate_shear"] >= 0.02
+        assert science_times["simulate_images"] == 0.
+
+    def test_results(self):
+        """ Test the overhead per simulation and scaling efficiency calculated from the timings of runs.
+        """
+
+        science_times = dict.fromkeys(ob.SCIENCE_STAGES, 0.)
+        science_times.update(prepare_configs=1., simulate_images=16.)
+
+        results = [ob.get_case_result(ob.benchmark_case_tuple(8, 1, 1), 1, 19., science_times),
+                   ob.get_case_result(ob.benchmark_case_tuple(8, 4, 1), 4, 6., science_times),
+                   ob.get_case_result(ob.benchmark_case_tuple(8, 4, 2), 4, 10., science_times)]
+        ob.add_scaling_efficiencies(results)
+
+        assert results[0]["overhead_per_simulation"] == pytest.approx(0.25)
+        assert results[1]["overhead_per_simulation"] == pytest.approx(0.5)
+        assert results[1]["ideal_wall_time"] == pytest.approx(5.)
+        assert results[1]["scaling_efficiency"] == pytest.approx(19. / 24.)
+        assert results[2]["scaling_efficiency"] == pytest.approx(1.)
@@ -24,6 +24,8 @@ __updated__ = "2021-08-18"
 import multiprocessing
 import os
 
+import pytest
+
 import SHE_Pipeline.pipeline_utilities as pu
 
 
@@ -117,3 +119,19 @@ class TestPipelineUtilities:
                 # But still seems to do it...
                 if '<ERROR>' in e:
                     assert True
+
+    def test_parse_walltime(self):
+        """ Test parsing walltimes in the formats accepted by sbatch.
+        """
+
+        assert pu.parse_walltime("30") == 30 * 60
+        assert pu.parse_walltime("30:15") == 30 * 60 + 15
+        assert pu.parse_walltime("8:00:00") == 8 * 3600
+        assert pu.parse_walltime("0-8:0:0") == 8 * 3600
+        assert pu.parse_walltime("1-2") == 26 * 3600
+        assert pu.parse_walltime("1-2:30") == 26 * 3600 + 30 * 60
+
+        with pytest.raises(ValueError):
+            pu.parse_walltime("8h")
+        with pytest.raises(ValueError):
+            pu.parse_walltime("1:2:3:4")
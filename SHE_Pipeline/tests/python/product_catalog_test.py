@@ -0,0 +1,113 @@
+""" @file product_catalog_test.py
+
+    Created 19 October 2026
+
+    Unit tests of the persistent catalogue of data products in a directory.
+"""
+
+__updated__ = "2026-10-19"
+
+# Copyright (C) 2012-2020 Euclid Science Ground Segment
+#
+# This library is free software; you can redistribute it and/or modify it under the terms of the GNU Lesser General
+# Public License as published by the Free Software Foundation; either version 3.0 of the License, or (at your option)
+# any later version.
+#
+# This library is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY; without even the implied
+# warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU Lesser General Public License for more
+# details.
+#
+# You should have received a copy of the GNU Lesser General Public License along with this library; if not, write to
+# the Free Software Foundation, Inc., 51 Franklin Street, Fifth Floor,
+# Boston, MA 02110-1301 USA
+
+import json
+import os
+from types import SimpleNamespace
+
+import SHE_Pipeline.product_catalog as pc
+
+
+class dpdMockCatalog():
+    """ Mock product, written to and read from JSON.
+    """
+
+    def __init__(self, data):
+        self.Data = data
+
+    def get_all_filenames(self):
+        return [self.Data.DataFile, None]
+
+
+def read_mock_product(qualified_filename):
+    with open(qualified_filename) as fi:
+        return dpdMockCatalog(json.load(fi, object_hook=lambda d: SimpleNamespace(**d)))
+
+
+class MockMdb():
+
+    def __init__(self, qualified_filename):
+        if "mdb" not in qualified_filename:
+            raise ValueError("Not an MDB file")
+
+
+def write_product(qualified_filename, **data):
+    with open(qualified_filename, "w") as fo:
+        json.dump(data, fo)
+
+
+class TestProductCatalog:
+    """ Unit tests for the product catalogue.
+    """
+
+    def test_update_and_query(self, tmpdir, monkeypatch):
+        """ Test that products are catalogued with their IDs and data files, and that updates only parse new and
+            changed files.
+        """
+
+        monkeypatch.setattr(pc, "read_xml_product", read_mock_product)
+        monkeypatch.setattr(pc, "Mdb", MockMdb)
+
+        directory = str(tmpdir)
+        write_product(os.path.join(directory, "mfc_1.xml"), TileIndex=101, ObservationIdList=[1, 2],
+                      DataFile="data/mfc_1.fits")
+        write_product(os.path.join(directory, "vcf_1.xml"), DataFile="data/vcf_1.fits",
+                      ObservationSequence={"ObservationId": 1, "PointingId": 7})
+        with open(os.path.join(directory, "sample_mdb.xml"), "w") as fo:
+            fo.write("<mdb/>")
+        with open(os.path.join(directory, "notes.txt"), "w") as fo:
+            fo.write("Not a product")
+
+        with pc.ProductCatalog(directory) as catalog:
+            assert catalog.update(number_processes=2) == (3, 0)
+            assert catalog.update() == (0, 0)
+
+            mfc_record = catalog.get_record("mfc_1.xml")
+            assert mfc_record.product_type == "dpdMockCatalog"
+            assert mfc_record.obs_ids == (1, 2)
+            assert mfc_record.tile_index == 101
+            assert mfc_record.data_filenames == ("data/mfc_1.fits",)
+
+            vcf_record = catalog.get_record("vcf_1.xml")
+            assert (vcf_record.obs_ids, vcf_record.pointing_ids, vcf_record.tile_index) == ((1,), (7,), None)
+
+            assert catalog.get_record("sample_mdb.xml").product_type == pc.MDB_PRODUCT_TYPE
+            assert [record.filename for record in catalog.get_records(obs_id=1)] == ["mfc_1.xml", "vcf_1.xml"]
+            assert [record.filename for record in catalog.get_records(tile_index=101)] == ["mfc_1.xml"]
+
+        # Change one product and remove another, and check that only the changed one is parsed again
+        write_product(os.path.join(directory, "mfc_1.xml"), TileIndex=102, ObservationIdList=[3],
+                      DataFile="data/mfc_1_new.fits")
+        os.utime(os.path.join(directory, "mfc_1.xml"), (0, 0))
+        os.remove(os.path.join(directory, "vcf_1.xml"))
+
+        with pc.ProductCatalog(directory) as catalog:
+            assert catalog.get_record("mfc_1.xml") is None
+            assert catalog.update() == (1, 1)
+            assert catalog.get_record("mfc_1.xml").obs_ids == (3,)
+            assert catalog.get_records(obs_id=1) == []
+
+        # Data files can be looked up without parsing the product
+        monkeypatch.setattr(pc, "read_xml_product", None)
+        assert pc.get_catalogued_data_filenames(os.path.join(directory, "mfc_1.xml")) == ["data/mfc_1_new.fits"]
+        assert pc.get_catalogued_data_filenames(os.path.join(directory, "sample_mdb.xml")) is None
@@ -0,0 +1,169 @@
+""" @file product_download_test.py
+
+    Created 19 October 2026
+
+    Unit tests of concurrent, resumable product downloads, against a local HTTP server.
+"""
+
+__updated__ = "2026-10-19"
+
+# Copyright (C) 2012-2020 Euclid Science Ground Segment
+#
+# This library is free software; you can redistribute it and/or modify it under the terms of the GNU Lesser General
+# Public License as published by the Free Software Foundation; either version 3.0 of the License, or (at your option)
+# any later version.
+#
+# This library is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY; without even the implied
+# warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU Lesser General Public License for more
+# details.
+#
+# You should have received a copy of the GNU Lesser General Public License along with this library; if not, write to
+# the Free Software Foundation, Inc., 51 Franklin Street, Fifth Floor,
+# Boston, MA 02110-1301 USA
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import hashlib
+import os
+import threading
+
+import pytest
+
+import SHE_Pipeline.product_download as pd
+
+FILES = {"/EUC_VIS_A.fits": os.urandom(3 * 1024 ** 2 + 17),
+         "/EUC_VIS_B.fits": os.urandom(1024),
+         "/EUC_MER_C.fits": b"", }
+
+AUTH_HEADERS = pd.get_basic_auth_headers("user", "password")
+
+
+class MockDssHandler(BaseHTTPRequestHandler):
+    """ Serves FILES over HTTP/1.1 with keep-alive and Range support. Paths listed in the server's truncate set are
+        cut short the first time they're requested.
+    """
+
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+
+        self.server.connections.add(self.client_address)
+        self.server.requests.append((self.path, self.headers.get("Range")))
+
+        if self.headers.get("Authorization") != AUTH_HEADERS["Authorization"]:
+            self.send_response(403)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        if self.path not in FILES:
+            self.send_response(404)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+
+        data = FILES[self.path]
+        start = 0
+        if self.headers.get("Range"):
+            start = int(self.headers["Range"].split("=")[1].rstrip("-"))
+            self.send_response(206)
+            self.send_header("Content-Range", f"bytes {start}-{len(data) - 1}/{len(data)}")
+        else:
+            self.send_response(200)
+        self.send_header("Content-Length", str(len(data) - start))
+        self.end_headers()
+
+        if self.path in self.server.truncate:
+            self.server.truncate.remove(self.path)
+            self.wfile.write(data[start:start + 1024 ** 2])
+            self.close_connection = True
+            return
+
+        self.wfile.write(data[start:])
+
+
+@pytest.fixture
+def dss_server():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), MockDssHandler)
+    server.connections = set()
+    server.requests = []
+    server.truncate = set()
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def get_engine(server, **kwargs):
+    return pd.DownloadEngine("127.0.0.1", server.server_address[1], use_https=False, headers=AUTH_HEADERS,
+                             retry_backoff=0., **kwargs)
+
+
+def get_tasks(datadir, with_checksums=False):
+    return [pd.download_task_tuple(path, os.path.join(datadir, path[1:]), len(data),
+                                   ("md5", hashlib.md5(data).hexdigest()) if with_checksums else None)
+            for path, data in FILES.items()]
+
+
+class TestProductDownload:
+    """ Unit tests for the download engine.
+    """
+
+    def test_download_all(self, tmpdir, dss_server):
+        """ Test that files are downloaded concurrently on reused connections, and skipped once present.
+        """
+
+        datadir = os.path.join(tmpdir, "data")
+        tasks = get_tasks(datadir, with_checksums=True) * 2
+
+        results = get_engine(dss_server, number_threads=2).download_all(tasks)
+
+        assert [result.status for result in results] == ["downloaded"] * 3
+        for path, data in FILES.items():
+            with open(os.path.join(datadir, path[1:]), "rb") as fi:
+                assert fi.read() == data
+        assert len(dss_server.requests) == 3
+        assert len(dss_server.connections) <= 2
+
+        results = get_engine(dss_server).download_all(tasks)
+        assert [result.status for result in results] == ["skipped"] * 3
+        assert len(dss_server.requests) == 3
+
+    def test_resume(self, tmpdir, dss_server):
+        """ Test that an interrupted download is resumed from where it stopped.
+        """
+
+        datadir = str(tmpdir)
+        dss_server.truncate.add("/EUC_VIS_A.fits")
+        task = get_tasks(datadir)[0]
+
+        result = get_engine(dss_server, max_retries=1).download(task)
+
+        assert result.status == "resumed"
+        assert result.bytes_transferred == len(FILES["/EUC_VIS_A.fits"]) - 1024 ** 2
+        assert dss_server.requests == [("/EUC_VIS_A.fits", None), ("/EUC_VIS_A.fits", f"bytes={1024 ** 2}-")]
+        with open(task.filename, "rb") as fi:
+            assert fi.read() == FILES["/EUC_VIS_A.fits"]
+        assert not os.path.exists(task.filename + pd.PARTIAL_SUFFIX)
+
+    def test_failures(self, tmpdir, dss_server):
+        """ Test that missing files and bad checksums fail without a valid-looking file being left, and that wrong
+            credentials stop the downloads.
+        """
+
+        datadir = str(tmpdir)
+        engine = get_engine(dss_server, max_retries=1)
+
+        missing_task = pd.download_task_tuple("/missing.fits", os.path.join(datadir, "missing.fits"), None, None)
+        assert engine.download(missing_task).status == "failed"
+
+        bad_checksum_task = get_tasks(datadir)[1]._replace(checksum=("md5", "0" * 32))
+        result = engine.download(bad_checksum_task)
+        assert result.status == "failed"
+        assert not os.path.exists(bad_checksum_task.filename)
+
+        engine.headers = pd.get_basic_auth_headers("user", "wrong")
+        with pytest.raises(pd.AuthenticationError):
+            engine.download_all(get_tasks(datadir))
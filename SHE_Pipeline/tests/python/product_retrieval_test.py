@@ -0,0 +1,144 @@
+""" @file product_retrieval_test.py
+
+    Created 19 October 2026
+
+    Unit tests of batch product retrieval, against a local HTTP server standing in for the EAS and DSS.
+"""
+
+__updated__ = "2026-10-19"
+
+# Copyright (C) 2012-2020 Euclid Science Ground Segment
+#
+# This library is free software; you can redistribute it and/or modify it under the terms of the GNU Lesser General
+# Public License as published by the Free Software Foundation; either version 3.0 of the License, or (at your option)
+# any later version.
+#
+# This library is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY; without even the implied
+# warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU Lesser General Public License for more
+# details.
+#
+# You should have received a copy of the GNU Lesser General Public License along with this library; if not, write to
+# the Free Software Foundation, Inc., 51 Franklin Street, Fifth Floor,
+# Boston, MA 02110-1301 USA
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import os
+import threading
+import urllib.parse
+
+import pytest
+
+import SHE_Pipeline.product_retrieval as pr
+
+PRODUCT_TEMPLATE = """<?xml version="1.0" encoding="UTF-8"?>
+<DpdVisCalibratedFrame><Header><ProductId>{product_id}</ProductId><ProductType>dpdVisCalibratedFrame</ProductType>
+</Header><Data><DataStorage><DataContainer><FileName>{filename}</FileName></DataContainer></DataStorage>
+</Data></DpdVisCalibratedFrame>"""
+
+# The products found for each observation, with one shared between observations
+OBS_PRODUCTS = {"1": [("P1", "EUC_VIS_1.fits"), ("P12", "EUC_VIS_12.fits")],
+                "2": [("P12", "EUC_VIS_12.fits"), ("P2", "EUC_VIS_2.fits")], }
+
+
+class MockArchiveHandler(BaseHTTPRequestHandler):
+    """ Serves asynchronous metadata queries for the products in OBS_PRODUCTS, and the data files they list.
+    """
+
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, *args):
+        pass
+
+    def send(self, status, contents):
+        contents = contents.encode()
+        self.send_response(status)
+        self.send_header("Content-Length", str(len(contents)))
+        self.end_headers()
+        self.wfile.write(contents)
+
+    def do_GET(self):
+
+        url = urllib.parse.urlsplit(self.path)
+        base_url = f"http://127.0.0.1:{self.server.server_address[1]}"
+
+        if url.path == "/EuclidXML":
+            self.server.queries.append(url.query)
+            obs_id = url.query.split("ObservationId==")[1].split("&")[0]
+            self.send(200, str({"url": f"{base_url}/job/{obs_id}", "status": "PENDING"}))
+        elif url.path.startswith("/job/"):
+            obs_id = url.path.split("/")[-1]
+            status = "FINISHED" if obs_id in OBS_PRODUCTS else "ERROR"
+            self.send(200, str({"url": f"{base_url}/result/{obs_id}", "status": status}))
+        elif url.path.startswith("/result/"):
+            obs_id = url.path.split("/")[-1]
+            products = [PRODUCT_TEMPLATE.format(product_id=product_id, filename=filename)
+                        for product_id, filename in OBS_PRODUCTS.get(obs_id, [])]
+            # The EAS strips the XML declaration from all but the first product
+            self.send(200, "\n\n".join(products[:1] + [product.split("\n", 1)[1] for product in products[1:]]))
+        else:
+            self.server.downloads.append(url.path)
+            self.send(200, f"data for {url.path}")
+
+
+@pytest.fixture
+def archive_server():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), MockArchiveHandler)
+    server.queries = []
+    server.downloads = []
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+class TestProductRetrieval:
+    """ Unit tests for batch product retrieval.
+    """
+
+    def test_get_queries(self):
+        """ Test that a query is made for each ID of the applicable kind for each type, or one for all if none are
+            given.
+        """
+
+        product_types = pr.get_product_types(["vis", "DpdMerFinalCatalog", "DpdVisStackedFrame"])
+        assert product_types == ["DpdVisStackedFrame", "DpdVisCalibratedFrame", "DpdMerFinalCatalog"]
+
+        with pytest.raises(ValueError):
+            pr.get_product_types(["DpdUnknown"])
+
+        queries = pr.get_queries(product_types, obs_ids=[2, 1, 2], dataset_release="TEST_RELEASE")
+
+        assert [(query.product_type, query.id) for query in queries] == [("DpdVisStackedFrame", 1),
+                                                                         ("DpdVisStackedFrame", 2),
+                                                                         ("DpdVisCalibratedFrame", 1),
+                                                                         ("DpdVisCalibratedFrame", 2),
+                                                                         ("DpdMerFinalCatalog", None)]
+        assert queries[2].query.endswith("&&Data.ObservationSequence.ObservationId==1")
+        assert "Header.DataSetRelease=TEST_RELEASE" in queries[4].query
+        assert "TileIndex" not in queries[4].query
+
+    def test_retrieve_products(self, tmpdir, archive_server):
+        """ Test that products found by several queries are saved, and their data files downloaded, only once, and
+            that failed queries are reported.
+        """
+
+        queries = pr.get_queries(["DpdVisCalibratedFrame"], obs_ids=[1, 2, 3])
+        base_url = f"http://127.0.0.1:{archive_server.server_address[1]}/EuclidXML?class_name="
+
+        product_filenames, failed_queries, download_results = pr.retrieve_products(
+            queries, product_dir=str(tmpdir), base_url=base_url, dss_host="127.0.0.1",
+            dss_port=archive_server.server_address[1], use_https=False, poll_interval=0.)
+
+        assert len(archive_server.queries) == 3
+        assert [query.id for query in failed_queries] == [3]
+
+        assert sorted(product_filenames) == ["DpdVisCalibratedFrame__P1.xml", "DpdVisCalibratedFrame__P12.xml",
+                                             "DpdVisCalibratedFrame__P2.xml"]
+        for product_filename in product_filenames:
+            assert os.path.isfile(os.path.join(tmpdir, product_filename))
+
+        assert sorted(archive_server.downloads) == ["/EUC_VIS_1.fits", "/EUC_VIS_12.fits", "/EUC_VIS_2.fits"]
+        assert [result.status for result in download_results] == ["downloaded"] * 3
+        with open(os.path.join(tmpdir, "data", "EUC_VIS_12.fits")) as fi:
+            assert fi.read() == "data for /EUC_VIS_12.fits"
@@ -0,0 +1,144 @@
+""" @file remote_file_cache_test.py
+
+    Created 19 October 2026
+
+    Unit tests of the cache of remote files.
+"""
+
+__updated__ = "2026-10-19"
+
+# Copyright (C) 2012-2020 Euclid Science Ground Segment
+#
+# This library is free software; you can redistribute it and/or modify it under the terms of the GNU Lesser General
+# Public License as published by the Free Software Foundation; either version 3.0 of the License, or (at your option)
+# any later version.
+#
+# This library is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY; without even the implied
+# warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU Lesser General Public License for more
+# details.
+#
+# You should have received a copy of the GNU Lesser General Public License along with this library; if not, write to
+# the Free Software Foundation, Inc., 51 Franklin Street, Fifth Floor,
+# Boston, MA 02110-1301 USA
+
+from argparse import Namespace
+from concurrent.futures import ThreadPoolExecutor
+import os
+import threading
+import time
+
+import pytest
+
+import SHE_Pipeline.remote_file_cache as rfc
+
+
+class MockRemote():
+    """ Stands in for fetching remote files, writing each to a local directory and counting the fetches.
+    """
+
+    def __init__(self, local_dir, delay=0.):
+        self.local_dir = local_dir
+        self.delay = delay
+        self.fetched = []
+        self._lock = threading.Lock()
+
+    def fetch(self, filename):
+        with self._lock:
+            self.fetched.append(filename)
+        time.sleep(self.delay)
+        qualified_filename = os.path.join(self.local_dir, filename)
+        os.makedirs(os.path.dirname(qualified_filename), exist_ok=True)
+        with open(qualified_filename, "w") as fo:
+            fo.write("x" * 1000)
+        return qualified_filename
+
+
+class TestRemoteFileCache:
+    """ Unit tests for the remote file cache.
+    """
+
+    def test_fetch_once(self, tmpdir):
+        """ Test that concurrent workers fetch a file only once, and that it's cached at its remote path.
+        """
+
+        remote = MockRemote(os.path.join(tmpdir, "fetched"), delay=0.2)
+        cache_dir = os.path.join(tmpdir, "cache")
+        caches = [rfc.RemoteFileCache(cache_dir, 10 ** 6, fetch=remote.fetch) for _ in range(4)]
+
+        with ThreadPoolExecutor(4) as executor:
+            cached_filenames = list(executor.map(lambda cache: cache.get("WEB/SHE/mdb.xml"), caches))
+
+        assert remote.fetched == ["WEB/SHE/mdb.xml"]
+        assert cached_filenames == [os.path.join(cache_dir, "WEB", "SHE", "mdb.xml")] * 4
+
+        # Data files of the MDB are cached next to it
+        assert (caches[0].get("WEB/SHE/data/gain.fits") ==
+                os.path.join(os.path.dirname(cached_filenames[0]), "data", "gain.fits"))
+
+    def test_offline(self, tmpdir):
+        """ Test that in offline mode, cached files are served but others aren't fetched.
+        """
+
+        remote = MockRemote(os.path.join(tmpdir, "fetched"))
+        cache_dir = os.path.join(tmpdir, "cache")
+        rfc.RemoteFileCache(cache_dir, 10 ** 6, fetch=remote.fetch).get("WEB/SHE/mdb.xml")
+
+        offline_cache = rfc.RemoteFileCache(cache_dir, 10 ** 6, offline=True, fetch=remote.fetch)
+        assert offline_cache.get("WEB/SHE/mdb.xml") == os.path.join(cache_dir, "WEB", "SHE", "mdb.xml")
+        with pytest.raises(RuntimeError):
+            offline_cache.get("WEB/SHE/other_mdb.xml")
+        assert remote.fetched == ["WEB/SHE/mdb.xml"]
+
+        # Remote files are found through the cache, and others as usual
+        local_dir = os.path.join(tmpdir, "fetched", "WEB")
+        assert (rfc.find_input_file("WEB/SHE/mdb.xml", path=local_dir, remote_file_cache=offline_cache) ==
+                os.path.join(cache_dir, "WEB", "SHE", "mdb.xml"))
+        assert (rfc.find_input_file("SHE/mdb.xml", path=local_dir, remote_file_cache=offline_cache) ==
+                os.path.join(local_dir, "SHE", "mdb.xml"))
+
+    def test_lru_eviction(self, tmpdir, monkeypatch):
+        """ Test that the least recently used files are evicted once the cache is over its maximum size, except for
+            those used within the grace period.
+        """
+
+        remote = MockRemote(os.path.join(tmpdir, "fetched"))
+        cache = rfc.RemoteFileCache(os.path.join(tmpdir, "cache"), 2500, fetch=remote.fetch)
+
+        for i, filename in enumerate(("WEB/a.fits", "WEB/b.fits")):
+            os.utime(cache.get(filename), (time.time() - 1000 + i, time.time() - 1000 + i))
+
+        # Use the first file, so the second is the least recently used
+        cache.get("WEB/a.fits")
+
+        # Within the grace period, nothing is evicted
+        cache.get("WEB/c.fits")
+        assert len(cache._list_files()) == 3
+
+        monkeypatch.setattr(rfc, "EVICTION_GRACE_PERIOD", 100.)
+        assert cache.evict() == 1
+        assert sorted(os.path.basename(filename) for _, _, filename in cache._list_files()) == ["a.fits", "c.fits"]
+
+        # An evicted file is fetched again when needed
+        cache.get("WEB/b.fits")
+        assert remote.fetched.count("WEB/b.fits") == 2
+
+    def test_create_from_args(self, tmpdir):
+        """ Test that the cache is created from the arguments only when requested, and that invalid ones are rejected.
+        """
+
+        args = Namespace(workdir=str(tmpdir), remote_file_cache=None, remote_file_cache_size=1., offline=False)
+        assert rfc.create_remote_file_cache(args) is None
+
+        args.offline = True
+        with pytest.raises(ValueError):
+            rfc.create_remote_file_cache(args)
+
+        args.remote_file_cache = "cache"
+        cache = rfc.create_remote_file_cache(args)
+        assert cache.cache_dir == os.path.join(tmpdir, "cache")
+        assert os.path.isdir(cache.cache_dir)
+        assert cache.offline
+
+        args.remote_file_cache_size = 0.
+        with pytest.raises(ValueError):
+            rfc.create_remote_file_cache(args)
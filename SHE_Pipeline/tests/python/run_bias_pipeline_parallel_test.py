@@ -20,6 +20,10 @@
 # the Free Software Foundation, Inc., 51 Franklin Street, Fifth Floor,
 # Boston, MA 02110-1301 USA
 
+from astropy.table import Table
+
+import SHE_Pipeline.run_bias_pipeline_parallel as rbpp
+
 
 class TestRunBiasPipelineParallel:
     """ Unit tests for functions in run_bias_parallel
@@ -34,3 +38,38 @@ class TestRunBiasPipelineParallel:
         """
 
         assert True
+
+    def test_get_simulation_plan_rows(self):
+        """ Test matching simulations to the rows of a simulation plan.
+        """
+
+        plan_table = Table(rows=[(1, 5, 2, 11, 13, 1, 16, 1),
+                                 (100, 101, 1, 200, 201, 1, 64, 4)],
+                           names=("MSEED_MIN", "MSEED_MAX", "MSEED_STEP", "NSEED_MIN", "NSEED_MAX", "NSEED_STEP",
+                                  "NUM_GALAXIES", "NUM_DETECTORS"))
+
+        # Model and noise seeds paired
+        plan_rows = rbpp.get_simulation_plan_rows(plan_table, 5)
+        assert [tuple(plan_row) for plan_row in plan_rows] == [(0, 1, 11), (0, 3, 12), (0, 5, 13),
+                                                                (1, 100, 200), (1, 101, 201)]
+
+        # Every combination of model and noise seeds
+        plan_rows = rbpp.get_simulation_plan_rows(plan_table, 13)
+        assert plan_rows[:4] == [(0, 1, 11), (0, 1, 12), (0, 1, 13), (0, 3, 11)]
+
+        # Can't be matched
+        assert rbpp.get_simulation_plan_rows(plan_table, 7) is None
+        assert rbpp.get_simulation_groups(plan_table, 7) == [0] * 7
+
+        assert rbpp.get_simulation_groups(plan_table, 5) == [0, 0, 0, 1, 1]
+        assert rbpp.get_simulation_sizes(plan_table, 5) == [16., 16., 16., 256., 256.]
+
+    def test_get_task_simulation_numbers(self):
+        """ Test grouping simulations into multi-seed tasks.
+        """
+
+        simulation_groups = [0, 0, 0, 0, 0, 1, 1, 2]
+
+        assert rbpp.get_task_simulation_numbers(simulation_groups, 1) == [[i] for i in range(8)]
+        assert rbpp.get_task_simulation_numbers(simulation_groups, 2) == [[0, 1], [2, 3], [4], [5, 6], [7]]
+        assert rbpp.get_task_simulation_numbers(simulation_groups, 8) == [[0, 1, 2, 3, 4], [5, 6], [7]]
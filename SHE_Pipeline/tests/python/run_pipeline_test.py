@@ -27,8 +27,11 @@ import pytest
 
 from ElementsServices.DataSync import DataSync
 from SHE_PPT.constants.test_data import MDB_PRODUCT_FILENAME, SYNC_CONF, SYNC_LOCATION
+from SHE_PPT.pipeline_utility import ScalingExperimentsConfigKeys
 from SHE_Pipeline.pipeline_info import pipeline_info_dict
-from SHE_Pipeline.run_pipeline import run_pipeline_from_args
+import SHE_Pipeline.run_pipeline
+from SHE_Pipeline.run_pipeline import (create_sweep_point_isf, get_sweep_grid, get_sweep_points,
+                                       get_sweep_results_table, run_pipeline_from_args, run_pipeline_sweep, )
 
 test_data_location = "/tmp"
 
@@ -52,6 +55,12 @@ class MockArgs(object):
                  dry_run=False,
                  skip_file_setup=False,
                  plan_args=None,
+                 remote_file_cache=None,
+                 remote_file_cache_size=10.,
+                 offline=False,
+                 sweep=None,
+                 sweep_concurrency=1,
+                 sweep_results="scaling_experiments_sweep.ecsv",
                  ):
 
         self.pipeline = pipeline
@@ -65,6 +74,12 @@ class MockArgs(object):
         self.cluster = cluster
         self.dry_run = dry_run
         self.skip_file_setup = skip_file_setup
+        self.remote_file_cache = remote_file_cache
+        self.remote_file_cache_size = remote_file_cache_size
+        self.offline = offline
+        self.sweep = sweep
+        self.sweep_concurrency = sweep_concurrency
+        self.sweep_results = sweep_results
 
         if isf_args is None:
             self.isf_args = []
@@ -116,3 +131,102 @@ class TestRunPipeline():
                                  skip_file_setup=skip_file_setup)
 
             run_pipeline_from_args(test_args)
+
+
+class TestSweep():
+    """ Tests of setting up a parameter sweep of the Scaling Experiments pipeline.
+    """
+
+    def test_get_sweep_grid(self):
+
+        sweep_grid = get_sweep_grid(["HDF5", "0,1", "batchsize", "10, 20,40"], ScalingExperimentsConfigKeys)
+        assert sweep_grid == {"HDF5": ["0", "1"], "batchsize": ["10", "20", "40"]}
+
+        sweep_points = get_sweep_points(sweep_grid)
+        assert len(sweep_points) == 6
+        assert sweep_points[0] == {"HDF5": "0", "batchsize": "10"}
+        assert sweep_points[-1] == {"HDF5": "1", "batchsize": "40"}
+
+        with pytest.raises(ValueError):
+            get_sweep_grid(["HDF5", "0,1", "batchsize"], ScalingExperimentsConfigKeys)
+        with pytest.raises(ValueError):
+            get_sweep_grid(["not_a_key", "0,1"], ScalingExperimentsConfigKeys)
+        with pytest.raises(ValueError):
+            get_sweep_grid(["HDF5", "0", "HDF5", "1"], ScalingExperimentsConfigKeys)
+        with pytest.raises(ValueError):
+            get_sweep_grid(["HDF5", ","], ScalingExperimentsConfigKeys)
+
+    def test_create_sweep_point_isf(self, tmpdir):
+
+        workdir = str(tmpdir)
+        os.mkdir(os.path.join(workdir, "data"))
+        with open(os.path.join(workdir, "catalogue_listfile.json"), "w") as fo:
+            fo.write("[]")
+        qualified_isf_filename = os.path.join(workdir, "ISF.txt")
+        with open(qualified_isf_filename, "w") as fo:
+            fo.write(f"workdir={workdir}\nlogdir=logs\npipeline_config=PIPELINE-CFG.txt\n"
+                     "catalogue_listfile=catalogue_listfile.json\nstacked_image=data/stacked_image.fits\n")
+
+        point_workdir = os.path.join(workdir, "point_000")
+        os.mkdir(point_workdir)
+        qualified_point_isf_filename = create_sweep_point_isf(qualified_isf_filename, workdir, point_workdir,
+                                                              "/logs/point_000", "PIPELINE-CFG-POINT.txt")
+
+        with open(qualified_point_isf_filename, "r") as fi:
+            point_isf_lines = fi.read().splitlines()
+        assert f"workdir={point_workdir}" in point_isf_lines
+        assert "logdir=/logs/point_000" in point_isf_lines
+        assert "pipeline_config=PIPELINE-CFG-POINT.txt" in point_isf_lines
+        assert "stacked_image=data/stacked_image.fits" in point_isf_lines
+
+        # Input files are linked from the sweep's workdir
+        assert os.path.islink(os.path.join(point_workdir, "data"))
+        assert os.path.islink(os.path.join(point_workdir, "catalogue_listfile.json"))
+        assert not os.path.exists(os.path.join(point_workdir, "PIPELINE-CFG.txt"))
+
+    def test_get_sweep_results_table(self):
+
+        sweep_points = get_sweep_points({"HDF5": ["0", "1"], "memmap": ["1"]})
+        results_table = get_sweep_results_table(sweep_points, ["point_000", "point_001"], [(1, 5.), (0, 10.)])
+
+        # Successful points come first
+        assert list(results_table["point"]) == [1, 0]
+        assert list(results_table["HDF5"]) == ["1", "0"]
+        assert list(results_table["status"]) == ["success", "failed (1)"]
+
+    @pytest.mark.parametrize("absolute_logdir", [False, True])
+    def test_sweep_logdirs(self, tmpdir, monkeypatch, absolute_logdir):
+        """ Test that each point of a sweep gets its own logdir, whether the logdir is relative to the workdir or
+            absolute.
+        """
+
+        workdir = os.path.join(tmpdir, "workdir")
+        os.makedirs(os.path.join(workdir, "data"))
+        with open(os.path.join(workdir, "base_config.txt"), "w") as fo:
+            fo.write("")
+        qualified_isf_filename = os.path.join(workdir, "ISF.txt")
+        with open(qualified_isf_filename, "w") as fo:
+            fo.write(f"workdir={workdir}\nlogdir=logs\npipeline_config=PIPELINE-CFG.txt\n")
+
+        if absolute_logdir:
+            logdir = os.path.join(tmpdir, "logs")
+        else:
+            logdir = "logs"
+
+        monkeypatch.setattr(SHE_Pipeline.run_pipeline, "create_config", lambda args, config_keys: "PIPELINE-CFG.txt")
+        args = MockArgs(pipeline="scaling_experiments", workdir=workdir, logdir=logdir, config="base_config.txt",
+                        dry_run=True, sweep_concurrency=2)
+        args.sweep_grid = {"HDF5": ["0", "1"]}
+
+        results_table = run_pipeline_sweep(args, pipeline_info_dict["scaling_experiments"], qualified_isf_filename,
+                                           server_config=None)
+
+        point_logdirs = []
+        for point_workdir in results_table["workdir"]:
+            with open(os.path.join(point_workdir, "ISF.txt"), "r") as fi:
+                point_args = dict(line.split("=", 1) for line in fi.read().splitlines())
+            point_logdir = os.path.join(point_workdir, point_args["logdir"])
+            assert os.path.isdir(point_logdir)
+            assert point_logdir.startswith(os.path.join(logdir if absolute_logdir else point_workdir, ""))
+            point_logdirs.append(point_logdir)
+        assert len(set(point_logdirs)) == 2
@@ -0,0 +1,243 @@
+""" @file shear_estimate_cache_test.py
+
+    Created 19 October 2026
+
+    Unit tests of the cache of shear estimates.
+"""
+
+__updated__ = "2026-10-19"
+
+# Copyright (C) 2012-2020 Euclid Science Ground Segment
+#
+# This library is free software; you can redistribute it and/or modify it under the terms of the GNU Lesser General
+# Public License as published by the Free Software Foundation; either version 3.0 of the License, or (at your option)
+# any later version.
+#
+# This library is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY; without even the implied
+# warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU Lesser General Public License for more
+# details.
+#
+# You should have received a copy of the GNU Lesser General Public License along with this library; if not, write to
+# the Free Software Foundation, Inc., 51 Franklin Street, Fifth Floor,
+# Boston, MA 02110-1301 USA
+
+import os
+import shutil
+import time
+
+import SHE_Pipeline.shear_estimate_cache as sec
+
+
+def fits_card(keyword, value=None):
+    if value is None:
+        card = keyword
+    else:
+        card = f"{keyword:<8}= {value:>20}"
+    return card.ljust(sec.FITS_CARD_SIZE).encode()
+
+
+def write_fits(qualified_filename, data, date="2026-10-19T00:00:00"):
+    """ Writes a minimal FITS file with a 1D array of bytes, followed by junk which isn't part of it.
+    """
+    header = b"".join([fits_card("SIMPLE", "T"), fits_card("BITPIX", "8"), fits_card("NAXIS", "1"),
+                       fits_card("NAXIS1", str(len(data))), fits_card("DATE", f"'{date}'"), fits_card("END")])
+    header += b" " * (-len(header) % sec.FITS_BLOCK_SIZE)
+    padded_data = data + b"\0" * (-len(data) % sec.FITS_BLOCK_SIZE)
+    with open(qualified_filename, "wb") as fo:
+        fo.write(header + padded_data)
+
+
+def write_file(qualified_filename, contents):
+    os.makedirs(os.path.dirname(qualified_filename), exist_ok=True)
+    with open(qualified_filename, "w") as fo:
+        fo.write(contents)
+
+
+class MockProduct():
+
+    def __init__(self, method_filenames=None):
+        self.method_filenames = dict(method_filenames or {})
+
+    def get_all_filenames(self):
+        return list(self.method_filenames.values())
+
+    def get_method_filename(self, method):
+        return self.method_filenames.get(method)
+
+    def set_method_filename(self, method, filename):
+        self.method_filenames[method] = filename
+
+
+class TestShearEstimateCache:
+    """ Unit tests for the shear estimate cache.
+    """
+
+    def test_hash_fits_file(self, tmpdir):
+        """ Test that FITS files which differ only in when they were written have the same hash.
+        """
+
+        write_fits(os.path.join(tmpdir, "a.fits"), b"image data", date="2026-10-19T00:00:00")
+        write_fits(os.path.join(tmpdir, "b.fits"), b"image data", date="2026-10-20T12:34:56")
+        write_fits(os.path.join(tmpdir, "c.fits"), b"other data")
+
+        assert (sec.hash_data_file(os.path.join(tmpdir, "a.fits")) ==
+                sec.hash_data_file(os.path.join(tmpdir, "b.fits")))
+        assert (sec.hash_data_file(os.path.join(tmpdir, "a.fits")) !=
+                sec.hash_data_file(os.path.join(tmpdir, "c.fits")))
+
+    def test_method_cache_keys(self, tmpdir, monkeypatch):
+        """ Test that a method's key changes with its own training data and the estimation settings, but not with
+            the training data of other methods.
+        """
+
+        workdir = str(tmpdir)
+        write_file(os.path.join(workdir, "data", "image.fits"), "image")
+        write_file(os.path.join(workdir, "data", "ksb_training.fits"), "ksb training")
+        write_file(os.path.join(workdir, "data", "config.txt"),
+                   "# Config\nSHE_CTE_EstimateShear_methods = KSB REGAUSS\nSHE_CTE_EstimateShear_fast_mode = True\n")
+
+        monkeypatch.setattr(sec, "read_xml_product",
+                            lambda filename: MockProduct({"data": "data/" + os.path.basename(filename)[:-4] + ".fits"}))
+
+        def get_keys():
+            return sec.get_method_cache_keys(["KSB", "REGAUSS"], workdir, "data/config.txt", ["data/image.xml"],
+                                             {"KSB": "data/ksb_training.xml", "REGAUSS": None}, None)
+
+        keys = get_keys()
+        assert keys["KSB"] != keys["REGAUSS"]
+        assert get_keys() == keys
+
+        write_file(os.path.join(workdir, "data", "ksb_training.fits"), "new ksb training")
+        new_keys = get_keys()
+        assert new_keys["KSB"] != keys["KSB"]
+        assert new_keys["REGAUSS"] == keys["REGAUSS"]
+
+        # Changing which methods are run doesn't change the keys, but changing their settings does
+        write_file(os.path.join(workdir, "data", "config.txt"),
+                   "SHE_CTE_EstimateShear_methods = KSB\nSHE_CTE_EstimateShear_fast_mode = True\n")
+        assert get_keys() == new_keys
+        write_file(os.path.join(workdir, "data", "config.txt"), "SHE_CTE_EstimateShear_fast_mode = False\n")
+        assert get_keys()["REGAUSS"] != new_keys["REGAUSS"]
+
+    def test_method_specific_config(self, tmpdir, monkeypatch):
+        """ Test that changing a setting which applies only to LensMC changes LensMC's key, but not those of the
+            other methods, so that their cache entries are reused.
+        """
+
+        workdir = str(tmpdir)
+        write_file(os.path.join(workdir, "data", "image.fits"), "image")
+
+        monkeypatch.setattr(sec, "read_xml_product",
+                            lambda filename: MockProduct({"data": "data/" + os.path.basename(filename)[:-4] + ".fits"}))
+
+        methods = ["KSB", "LensMC", "MomentsML", "REGAUSS"]
+
+        def get_keys(config):
+            write_file(os.path.join(workdir, "data", "config.txt"), config)
+            return sec.get_method_cache_keys(methods, workdir, "data/config.txt", ["data/image.xml"], {}, None)
+
+        keys = get_keys("SHE_CTE_EstimateShear_chains = False\nSHE_LensMC_stamp_size = 384\n")
+
+        for config in ("SHE_CTE_EstimateShear_chains = True\nSHE_LensMC_stamp_size = 384\n",
+                       "SHE_CTE_EstimateShear_chains = False\nSHE_LensMC_stamp_size = 256\n"):
+            new_keys = get_keys(config)
+            assert new_keys["LensMC"] != keys["LensMC"]
+            for method in ("KSB", "MomentsML", "REGAUSS"):
+                assert new_keys[method] == keys[method]
+
+    def test_lru_eviction(self, tmpdir):
+        """ Test that the least recently used entries are evicted once the cache is over its maximum size.
+        """
+
+        cache_dir = os.path.join(tmpdir, "cache")
+        os.mkdir(cache_dir)
+        cache = sec.ShearEstimateCache(cache_dir, max_size=3000)
+
+        write_file(os.path.join(tmpdir, "estimates.fits"), "x" * 1000)
+        write_file(os.path.join(tmpdir, "product.xml"), "product")
+
+        for key in ("aa1", "bb2"):
+            cache.put(key, "KSB", os.path.join(tmpdir, "estimates.fits"), os.path.join(tmpdir, "product.xml"))
+            os.utime(os.path.join(cache._get_entry_dir(key), sec.CACHE_META_FILENAME),
+                     (time.time() - 100, time.time() - 100))
+
+        # Use the first entry, so the second is the least recently used
+        assert cache.get("aa1") == cache._get_entry_dir("aa1")
+        assert cache.get("cc3") is None
+
+        cache.put("cc3", "KSB", os.path.join(tmpdir, "estimates.fits"), os.path.join(tmpdir, "product.xml"))
+
+        assert cache.get("aa1") is not None
+        assert cache.get("bb2") is None
+        assert cache.get("cc3") is not None
+
+    def test_estimate_shear_with_cache(self, tmpdir, monkeypatch):
+        """ Test that only methods which aren't cached (or are evicted while being read) are run, and that the product
+            points to estimates for all.
+        """
+
+        workdir = str(tmpdir)
+        cache_dir = os.path.join(workdir, "cache")
+        os.mkdir(cache_dir)
+        cache = sec.ShearEstimateCache(cache_dir, max_size=10 ** 6)
+
+        write_file(os.path.join(workdir, "data", "image.fits"), "image")
+        write_file(os.path.join(workdir, "data", "config.txt"), "SHE_CTE_EstimateShear_methods = KSB REGAUSS\n")
+
+        products = {}
+        monkeypatch.setattr(sec, "read_xml_product",
+                            lambda filename: MockProduct(products.get(filename, {"data": "data/image.fits"})))
+        monkeypatch.setattr(sec, "write_xml_product",
+                            lambda p, filename: products.update({filename: p.method_filenames}) or
+                            write_file(filename, "product"))
+
+        methods_run = []
+
+        def estimate_shear(pipeline_config):
+            methods = sec.get_config_methods(sec.read_pipeline_config_values(os.path.join(workdir, pipeline_config)))
+            methods_run.append(methods)
+            p = MockProduct()
+            for method in methods:
+                write_file(os.path.join(workdir, "data", f"{method}.fits"), f"{method} estimates")
+                p.set_method_filename(method, f"data/{method}.fits")
+            sec.write_xml_product(p, os.path.join(workdir, "data", "shear_estimates.xml"))
+
+        def run():
+            return sec.estimate_shear_with_cache(cache, estimate_shear, workdir, "data/config.txt",
+                                                 "data/shear_estimates.xml", ["data/image.xml"], {}, None)
+
+        assert run() == ([], ["KSB", "REGAUSS"])
+
+        # Evict REGAUSS, so only it is run again
+        keys = sec.get_method_cache_keys(["KSB", "REGAUSS"], workdir, "data/config.txt", ["data/image.xml"], {}, None)
+        os.utime(os.path.join(cache._get_entry_dir(keys["REGAUSS"]), sec.CACHE_META_FILENAME), (0, 0))
+        cache.max_size = max(size for _, size, _ in cache._list_entries())
+        assert cache.evict() == 1
+        cache.max_size = 10 ** 6
+
+        assert run() == (["KSB"], ["REGAUSS"])
+        assert methods_run[-1] == ["REGAUSS"]
+
+        method_filenames = products[os.path.join(workdir, "data", "shear_estimates.xml")]
+        with open(os.path.join(workdir, method_filenames["KSB"])) as fi:
+            assert fi.read() == "KSB estimates"
+        assert method_filenames["REGAUSS"] == "data/REGAUSS.fits"
+
+        # Now both are cached, so nothing is run
+        assert run() == (["KSB", "REGAUSS"], [])
+        assert len(methods_run) == 2
+
+        # If KSB's entry is evicted by another worker between being found and being copied, it's run again
+        get = cache.get
+
+        def get_and_evict(key):
+            entry_dir = get(key)
+            if key == keys["KSB"]:
+                shutil.rmtree(entry_dir)
+            return entry_dir
+
+        monkeypatch.setattr(cache, "get", get_and_evict)
+
+        assert run() == (["REGAUSS"], ["KSB"])
+        assert methods_run[-1] == ["KSB"]
+        assert products[os.path.join(workdir, "data", "shear_estimates.xml")]["KSB"] == "data/KSB.fits"
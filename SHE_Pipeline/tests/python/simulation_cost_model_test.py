@@ -0,0 +1,111 @@
+""" @file simulation_cost_model_test.py
+
+    Created 19 October 2026
+
+    Unit tests of the simulation cost model.
+"""
+
+__updated__ = "2026-10-19"
+
+# Copyright (C) 2012-2020 Euclid Science Ground Segment
+#
+# This library is free software; you can redistribute it and/or modify it under the terms of the GNU Lesser General
+# Public License as published by the Free Software Foundation; either version 3.0 of the License, or (at your option)
+# any later version.
+#
+# This library is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY; without even the implied
+# warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU Lesser General Public License for more
+# details.
+#
+# You should have received a copy of the GNU Lesser General Public License along with this library; if not, write to
+# the Free Software Foundation, Inc., 51 Franklin Street, Fifth Floor,
+# Boston, MA 02110-1301 USA
+
+import os
+
+import pytest
+
+from SHE_Pipeline.simulation_cost_model import SimulationCostModel, get_plan_row_config, get_plan_row_size
+
+
+class TestSimulationCostModel:
+    """ Unit tests for the simulation cost model.
+    """
+
+    def test_plan_row_size(self):
+        """ Test that the size of a plan row is the product of its cost feature columns.
+        """
+
+        assert get_plan_row_size({"NUM_GALAXIES": 64, "NUM_DETECTORS": 4}) == 256
+        assert get_plan_row_size({"NUM_GALAXIES": 64}) == 64
+        assert get_plan_row_size({"NUM_GALAXIES": "invalid", "NUM_DETECTORS": 4}) == 4
+
+    def test_plan_row_config(self):
+        """ Test that the configuration of a plan row ignores its seed ranges.
+        """
+
+        row = {"TAG": "Ep0Pp0Sp0", "MSEED_MIN": 1, "MSEED_MAX": 400, "NUM_GALAXIES": 64, "RENDER_BKG": False}
+
+        assert get_plan_row_config(row) == get_plan_row_config(dict(row, MSEED_MIN=401, MSEED_MAX=800))
+        assert get_plan_row_config(row) != get_plan_row_config(dict(row, RENDER_BKG=True))
+
+    def test_predict(self):
+        """ Test that the model uses size as the cost until timings are recorded, and then fits each stage.
+        """
+
+        cost_model = SimulationCostModel()
+        assert cost_model.predict(10.) == 10.
+
+        # simulate: 5 + 2 * size; estimate: 3 * size
+        for size in (10., 20., 40.):
+            cost_model.add_timing(size, {"simulate": 5. + 2. * size, "estimate": 3. * size})
+
+        assert cost_model.predict(30.) == pytest.approx(5. + 2. * 30. + 3. * 30.)
+
+    def test_predict_single_size(self):
+        """ Test that the model scales timings in proportion to size if only one size has been timed.
+        """
+
+        cost_model = SimulationCostModel()
+        cost_model.add_timing(10., {"simulate": 20.})
+        cost_model.add_timing(10., {"simulate": 30.})
+
+        assert cost_model.predict(20.) == pytest.approx(50.)
+
+    def test_predict_config(self):
+        """ Test that recorded timings can reorder simulations of the same size with different configurations, and
+            of different sizes, when a stage takes longer for one configuration than its size suggests.
+        """
+
+        cost_model = SimulationCostModel()
+
+        # The "slow" configuration takes three times as long to simulate as the "fast" one of the same size
+        for _ in range(4):
+            for size in (10., 20.):
+                cost_model.add_timing(size, {"simulate": size, "estimate": size}, config="fast")
+                cost_model.add_timing(size, {"simulate": 3. * size, "estimate": size}, config="slow")
+
+        assert cost_model.predict(20., config="slow") > cost_model.predict(20., config="fast")
+        assert cost_model.predict(10., config="slow") > cost_model.predict(15., config="fast")
+
+        # A configuration with no timings is predicted from its size alone
+        assert cost_model.predict(20., config="new") == pytest.approx(cost_model.predict(20.))
+
+    def test_save_and_load(self, tmpdir):
+        """ Test that timings saved by several runs to a shared file are all loaded.
+        """
+
+        filename = os.path.join(tmpdir, "timings.json")
+
+        for size in (10., 20.):
+            cost_model = SimulationCostModel()
+            cost_model.load(filename)
+            cost_model.add_timing(size, {"simulate": size}, config="fast")
+            cost_model.save(filename)
+
+        cost_model = SimulationCostModel()
+        cost_model.load(filename)
+
+        assert sorted(size for size, _stage_durations, _config in cost_model.records) == [10., 20.]
+        assert all(config == "fast" for _size, _stage_durations, config in cost_model.records)
+        assert cost_model.predict(40.) == pytest.approx(40.)
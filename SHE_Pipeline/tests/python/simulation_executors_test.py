@@ -0,0 +1,185 @@
+""" @file simulation_executors_test.py
+
+    Created 19 October 2026
+
+    Unit tests of the executor backends for the parallel bias measurement pipeline. The MPI executor is only tested
+    when run under MPI with at least two processes, e.g. with:
+
+        mpirun -n 4 python -m pytest simulation_executors_test.py
+"""
+
+__updated__ = "2026-10-19"
+
+# Copyright (C) 2012-2020 Euclid Science Ground Segment
+#
+# This library is free software; you can redistribute it and/or modify it under the terms of the GNU Lesser General
+# Public License as published by the Free Software Foundation; either version 3.0 of the License, or (at your option)
+# any later version.
+#
+# This library is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY; without even the implied
+# warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU Lesser General Public License for more
+# details.
+#
+# You should have received a copy of the GNU Lesser General Public License along with this library; if not, write to
+# the Free Software Foundation, Inc., 51 Franklin Street, Fifth Floor,
+# Boston, MA 02110-1301 USA
+
+import os
+import time
+from collections import namedtuple
+
+import pytest
+
+import SHE_Pipeline.simulation_executors as se
+import SHE_Pipeline.simulation_scheduler as ss
+from SHE_Pipeline.memory_profiles import BUILTIN_MEMORY_PROFILES
+
+MockWorkdir = namedtuple("MockWorkdir", "workdir logdir app_workdir app_logdir")
+
+
+def staged_square(task_args):
+    simulation_number, duration = task_args
+    ss.report_stage("square", log_filename=f"she_square_{simulation_number}.out")
+    time.sleep(duration)
+    if simulation_number == 3:
+        raise ss.SimulationStageError("square", f"bad seed {simulation_number}")
+    return {"square": simulation_number ** 2}
+
+
+def get_native_thread_limits(_task_args):
+    return {env_var: os.environ.get(env_var) for env_var in se.NATIVE_THREAD_ENV_VARS}
+
+
+def run_tasks(executor, tmpdir, number_tasks=6, duration=0.05):
+
+    tasks = [ss.SimulationTask(i, MockWorkdir(str(tmpdir), "logs", None, None), (i, duration))
+             for i in range(number_tasks)]
+
+    results = {}
+
+    def record_result(_scheduler, task, result):
+        results[task.simulation_number] = result
+
+    scheduler = ss.SimulationScheduler(executor, executor.number_workers, tasks, task_function=staged_square,
+                                       poll_interval=0.05, progress_queue=executor.progress_queue)
+    scheduler.add_completion_listener(record_result)
+    scheduler.run()
+
+    if scheduler.workers_left_running:
+        executor.terminate()
+    else:
+        executor.close()
+    executor.join()
+
+    return scheduler, results
+
+
+def mpi_size():
+    try:
+        return se.get_mpi_comm().Get_size()
+    except RuntimeError:
+        return 1
+
+
+class TestSimulationExecutors:
+    """ Unit tests for the executor backends.
+    """
+
+    @pytest.mark.parametrize("backend", ["serial", "fork", "forkserver", "futures"])
+    def test_run_tasks(self, tmpdir, backend):
+        """ Test that the same tasks give the same results on each local backend, with failures isolated.
+        """
+
+        executor = se.create_executor(backend, 2)
+        scheduler, results = run_tasks(executor, tmpdir)
+
+        assert results == {i: {"square": i ** 2} for i in (0, 1, 2, 4, 5)}
+        assert [task.simulation_number for task in scheduler.quarantined] == [3]
+        assert scheduler.failures[3][0].stage == "square"
+
+    def test_hard_timeout_without_kill(self, tmpdir):
+        """ Test that a task which exceeds its hard time limit on a backend whose workers can't be killed is failed,
+            and its result ignored when it arrives.
+        """
+
+        executor = se.create_executor("futures", 2)
+        assert not executor.kill_worker(0)
+
+        tasks = [ss.SimulationTask(i, MockWorkdir(str(tmpdir), "logs", None, None), (i, 2. if i == 1 else 0.05))
+                 for i in range(3)]
+
+        scheduler = ss.SimulationScheduler(executor, 2, tasks, task_function=staged_square, poll_interval=0.05,
+                                           progress_queue=executor.progress_queue,
+                                           stage_timeouts=ss.StageTimeouts(hard={"square": 0.5}))
+        completed = scheduler.run()
+        executor.terminate()
+        executor.join()
+
+        assert sorted(task.simulation_number for task in completed) == [0, 2]
+        assert [task.simulation_number for task in scheduler.quarantined] == [1]
+        assert "timed out" in scheduler.failures[1][0].message
+
+    @pytest.mark.parametrize("backend", ["forkserver", "futures"])
+    def test_threads_per_process(self, tmpdir, backend):
+        """ Test that native thread limits are applied in the workers.
+        """
+
+        executor = se.create_executor(backend, 2, threads_per_process=3)
+
+        results = []
+        tasks = [ss.SimulationTask(i, MockWorkdir(str(tmpdir), "logs", None, None), None) for i in range(2)]
+        scheduler = ss.SimulationScheduler(executor, 2, tasks, task_function=get_native_thread_limits,
+                                           poll_interval=0.05, progress_queue=executor.progress_queue)
+        scheduler.add_completion_listener(lambda _scheduler, _task, result: results.append(result))
+        scheduler.run()
+        executor.close()
+        executor.join()
+
+        assert results == [{env_var: "3" for env_var in se.NATIVE_THREAD_ENV_VARS}] * 2
+
+        config = se.get_native_thread_config(3)
+        assert config["threads_per_process"] == 3
+        assert config["environment"]["OMP_NUM_THREADS"] == "3"
+
+    def test_memory_profile_start_method(self, monkeypatch):
+        """ Test that the workers of every memory profile are started the same way, whether or not the profile
+            changes their environment.
+        """
+
+        start_methods = []
+
+        class MockPoolExecutor:
+            def __init__(self, number_workers, start_method, **_kwargs):
+                start_methods.append(start_method)
+
+        monkeypatch.setattr(se, "PoolExecutor", MockPoolExecutor)
+
+        for memory_profile in (BUILTIN_MEMORY_PROFILES["default"], BUILTIN_MEMORY_PROFILES["thp"],
+                               BUILTIN_MEMORY_PROFILES["no_thp"]):
+            se.create_executor("fork", 2, memory_profile=memory_profile)
+        assert start_methods == ["spawn", "spawn", "spawn"]
+
+        se.create_executor("fork", 2)
+        assert start_methods[-1] == "fork"
+
+    def test_unrecognised_backend(self):
+
+        with pytest.raises(ValueError):
+            se.create_executor("threads", 2)
+
+    @pytest.mark.skipif(mpi_size() < 2, reason="Requires running under MPI with at least two processes")
+    def test_mpi(self, tmpdir):
+        """ Test that tasks are run on the MPI workers, and give the same results as on the local backends.
+        """
+
+        if not se.is_mpi_master():
+            se.run_mpi_worker()
+            return
+
+        executor = se.create_executor("mpi", 2)
+        assert executor.number_workers == mpi_size() - 1
+
+        scheduler, results = run_tasks(executor, tmpdir, number_tasks=12)
+
+        assert results == {i: {"square": i ** 2} for i in range(12) if i != 3}
+        assert [task.simulation_number for task in scheduler.quarantined] == [3]
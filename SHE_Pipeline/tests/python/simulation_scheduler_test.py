@@ -0,0 +1,446 @@
+""" @file simulation_scheduler_test.py
+
+    Created 19 October 2026
+
+    Unit tests of the dynamic simulation scheduler.
+"""
+
+__updated__ = "2026-10-19"
+
+# Copyright (C) 2012-2020 Euclid Science Ground Segment
+#
+# This library is free software; you can redistribute it and/or modify it under the terms of the GNU Lesser General
+# Public License as published by the Free Software Foundation; either version 3.0 of the License, or (at your option)
+# any later version.
+#
+# This library is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY; without even the implied
+# warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU Lesser General Public License for more
+# details.
+#
+# You should have received a copy of the GNU Lesser General Public License along with this library; if not, write to
+# the Free Software Foundation, Inc., 51 Franklin Street, Fifth Floor,
+# Boston, MA 02110-1301 USA
+
+import os
+import pickle
+import queue
+import signal
+import threading
+import time
+from collections import namedtuple
+from multiprocessing.pool import ThreadPool
+
+import SHE_Pipeline.simulation_scheduler as ss
+from SHE_Pipeline.simulation_executors import PoolExecutor
+from SHE_Pipeline.bias_accumulator import LinregressAccumulator, get_accumulator_key
+
+MockWorkdir = namedtuple("MockWorkdir", "workdir logdir app_workdir app_logdir")
+
+
+def square(task_args):
+    return task_args ** 2
+
+
+def fail_on_odd(task_args):
+    simulation_number, failures_file = task_args
+    if simulation_number % 2 == 1:
+        # Record the attempt, so we can check how many times it's retried
+        with open(failures_file, "a") as fo:
+            fo.write(f"{simulation_number}\n")
+        try:
+            raise RuntimeError(f"bad seed {simulation_number}")
+        except RuntimeError as e:
+            raise ss.SimulationStageError.from_exception("estimate_shear", e, log_filename="she_estimate_shear.out")
+    return simulation_number
+
+
+def fail_on_odd_seeds(task_args_list):
+    completed_indices = []
+    failures = {}
+    for index, task_args in enumerate(task_args_list):
+        try:
+            fail_on_odd(task_args)
+        except ss.SimulationStageError as e:
+            failures[index] = e
+            continue
+        completed_indices.append(index)
+    if failures:
+        if not completed_indices:
+            raise failures[min(failures)]
+        raise ss.PartialTaskError(failures, completed_indices, result=[task_args_list[index][0]
+                                                                       for index in completed_indices])
+    return [task_args[0] for task_args in task_args_list]
+
+
+def staged_sleep(task_args):
+    simulation_number, duration = task_args
+    ss.report_stage("sleep", log_filename=f"she_sleep_{simulation_number}.out")
+    time.sleep(duration)
+    return simulation_number
+
+
+def wait_between_stages(task_args):
+    stage_duration, wait_duration = task_args
+    ss.report_stage("sleep")
+    time.sleep(stage_duration)
+    ss.report_stage(None)
+    time.sleep(wait_duration)
+    ss.report_stage("sleep")
+    time.sleep(stage_duration)
+    return task_args
+
+
+def timed_sleep(duration):
+    time.sleep(duration)
+    return {"sleep": duration}
+
+
+def make_tasks(number_tasks, workdir, groups=None):
+    if groups is None:
+        groups = [0] * number_tasks
+    return [ss.SimulationTask(i, MockWorkdir(workdir, "logs", None, None), i, group=groups[i])
+            for i in range(number_tasks)]
+
+
+class TestSimulationScheduler:
+    """ Unit tests for the simulation scheduler.
+    """
+
+    def test_run_all(self, tmpdir):
+        """ Test that all tasks are run and their results passed to listeners.
+        """
+
+        results = {}
+
+        pool = ThreadPool(3)
+        scheduler = ss.SimulationScheduler(pool, 3, make_tasks(10, str(tmpdir)), task_function=square,
+                                           poll_interval=0.1)
+        scheduler.add_completion_listener(lambda _s, task, result: results.update({task.simulation_number: result}))
+        completed = scheduler.run()
+        pool.close()
+
+        assert len(completed) == 10
+        assert results == {i: i ** 2 for i in range(10)}
+        assert scheduler.unscheduled == []
+
+    def test_stop(self, tmpdir):
+        """ Test that requesting a stop prevents further tasks being scheduled, but completes running ones.
+        """
+
+        def listener(scheduler, task, _result):
+            if len(scheduler.completed) == 2:
+                scheduler.request_stop("test")
+
+        pool = ThreadPool(1)
+        scheduler = ss.SimulationScheduler(pool, 1, make_tasks(10, str(tmpdir)), task_function=square,
+                                           poll_interval=0.1)
+        scheduler.add_completion_listener(listener)
+        completed = scheduler.run()
+        pool.close()
+
+        assert [task.simulation_number for task in completed] == [0, 1]
+        assert [task.simulation_number for task in scheduler.unscheduled] == list(range(2, 10))
+        assert scheduler.stop_reason == "test"
+
+    def test_adaptive_stopping(self, tmpdir, monkeypatch):
+        """ Test that adaptive stopping stops scheduling once the target precision is reached, and that groups
+            which feed under-sampled bins are prioritised.
+        """
+
+        key_bin1 = get_accumulator_key("KSB", "g1", "bin1")
+        key_bin2 = get_accumulator_key("KSB", "g1", "bin2")
+
+        def mock_read(filename, workdir):
+            # Group 0 feeds bin1 only; group 1 feeds both bins, but bin2 only weakly
+            simulation_number = int(filename)
+            accumulators = {}
+            if simulation_number % 2 == 0:
+                bins_and_weights = ((key_bin1, 1e4),)
+            else:
+                bins_and_weights = ((key_bin1, 1e4), (key_bin2, 2e3))
+            for key, w in bins_and_weights:
+                accumulator = LinregressAccumulator()
+                for x in (-0.1, 0.1):
+                    accumulator.add_statistics(w / 2, x, x ** 2, x, x ** 2)
+                accumulators[key] = accumulator
+            return accumulators
+
+        monkeypatch.setattr(ss, "read_bias_statistics_accumulators", mock_read)
+
+        tasks = make_tasks(40, str(tmpdir), groups=[0, 1] * 20)
+        for task in tasks:
+            open(os.path.join(tmpdir, str(task.simulation_number)), "w").close()
+
+        adaptive_stopping = ss.AdaptiveStopping(m_target=0.1, check_interval=1,
+                                                statistics_filename_function=str)
+
+        pool = ThreadPool(1)
+        scheduler = ss.SimulationScheduler(pool, 1, tasks, task_function=square, poll_interval=0.1)
+        scheduler.add_completion_listener(adaptive_stopping.on_task_complete)
+        scheduler.group_priority = adaptive_stopping.get_group_priority
+        completed = scheduler.run()
+        pool.close()
+
+        assert scheduler.stop_reason is not None
+        assert len(scheduler.unscheduled) > 0
+        assert adaptive_stopping.monitor.target_met()
+
+        # After the first of each group has run, only group 1 feeds bin2, which is the limiting bin
+        assert [task.group for task in completed] == [0, 1, 1, 1, 1, 1]
+
+    def test_walltime_guard(self, tmpdir):
+        """ Test that simulations aren't dispatched once there isn't time for them to complete before the deadline.
+        """
+
+        tasks = [ss.SimulationTask(i, MockWorkdir(str(tmpdir), "logs", None, None), 0.2) for i in range(10)]
+
+        walltime_guard = ss.WalltimeGuard(deadline=time.time() + 1.0, reserve=0.3)
+
+        pool = ThreadPool(1)
+        scheduler = ss.SimulationScheduler(pool, 1, tasks, task_function=timed_sleep, poll_interval=0.05)
+        scheduler.add_completion_listener(walltime_guard.on_task_complete)
+        scheduler.add_dispatch_guard(walltime_guard.check_dispatch)
+        completed = scheduler.run()
+        pool.close()
+
+        # 0.7s is available, so at most three 0.2s simulations can be run
+        assert 1 <= len(completed) <= 3
+        assert len(completed) + len(scheduler.unscheduled) == 10
+        assert walltime_guard.get_expected_duration() >= 0.2
+        assert scheduler.stop_reason is not None
+
+    def test_signal_drain(self, tmpdir):
+        """ Test that SIGUSR1 lets running simulations complete, and SIGTERM abandons them.
+        """
+
+        for signum, abandon in ((signal.SIGUSR1, False), (signal.SIGTERM, True)):
+
+            tasks = [ss.SimulationTask(i, MockWorkdir(str(tmpdir), "logs", None, None), 0.1 if i == 0 else 0.5)
+                     for i in range(4)]
+
+            def listener(scheduler, task, _result, signum=signum):
+                if task.simulation_number == 0:
+                    os.kill(os.getpid(), signum)
+
+            pool = ThreadPool(2)
+            scheduler = ss.SimulationScheduler(pool, 2, tasks, task_function=timed_sleep, poll_interval=0.05)
+            scheduler.add_completion_listener(listener)
+
+            previous_handlers = ss.install_drain_signal_handlers(scheduler)
+            try:
+                completed = scheduler.run()
+            finally:
+                ss.restore_signal_handlers(previous_handlers)
+            pool.terminate()
+
+            assert scheduler.stop_reason == f"received signal {signal.Signals(signum).name}"
+            if abandon:
+                assert [task.simulation_number for task in scheduler.abandoned] == [1]
+                assert len(completed) == 1
+            else:
+                assert scheduler.abandoned == []
+                assert [task.simulation_number for task in completed] == [0, 1]
+            assert len(scheduler.unscheduled) == 2
+
+    def test_failure_isolation(self, tmpdir):
+        """ Test that failed simulations are retried and quarantined without affecting the others.
+        """
+
+        failures_file = os.path.join(tmpdir, "failures.txt")
+        tasks = [ss.SimulationTask(i, MockWorkdir(str(tmpdir), "logs", None, None), (i, failures_file))
+                 for i in range(6)]
+
+        pool = ThreadPool(2)
+        scheduler = ss.SimulationScheduler(pool, 2, tasks, task_function=fail_on_odd, poll_interval=0.05,
+                                           retry_policy=ss.RetryPolicy(max_retries=2, backoff=0.01))
+        completed = scheduler.run()
+        pool.close()
+
+        assert sorted(task.simulation_number for task in completed) == [0, 2, 4]
+        assert sorted(task.simulation_number for task in scheduler.quarantined) == [1, 3, 5]
+        assert scheduler.unscheduled == []
+
+        # Each failing simulation should have been attempted three times
+        with open(failures_file) as fi:
+            assert sorted(int(line) for line in fi) == [1, 1, 1, 3, 3, 3, 5, 5, 5]
+
+        exception = scheduler.failures[3][0]
+        assert exception.stage == "estimate_shear"
+        assert exception.log_filename == "she_estimate_shear.out"
+        assert "bad seed 3" in exception.message
+
+        # The exception must survive being passed back from a worker process
+        unpickled_exception = pickle.loads(pickle.dumps(exception))
+        assert unpickled_exception.stage == exception.stage
+        assert str(unpickled_exception) == str(exception)
+
+    def test_partial_failure(self, tmpdir):
+        """ Test that when some simulations of a multi-simulation task fail, the others are completed and only the
+            failed ones are retried.
+        """
+
+        failures_file = os.path.join(tmpdir, "failures.txt")
+        tasks = [ss.SimulationTask(i, MockWorkdir(str(tmpdir), "logs", None, None),
+                                   [(j, failures_file) for j in range(i, i + 4)], simulation_numbers=range(i, i + 4))
+                 for i in (0, 4)]
+
+        results = {}
+
+        def record_result(_scheduler, task, result):
+            results[task.simulation_number] = result
+
+        pool = ThreadPool(2)
+        scheduler = ss.SimulationScheduler(pool, 2, tasks, task_function=fail_on_odd_seeds, poll_interval=0.05,
+                                           retry_policy=ss.RetryPolicy(max_retries=1, backoff=0.01))
+        scheduler.add_completion_listener(record_result)
+        completed = scheduler.run()
+        pool.close()
+
+        assert sorted(task.simulation_numbers for task in completed) == [[0, 2], [4, 6]]
+        assert results == {0: [0, 2], 4: [4, 6]}
+        assert sorted(task.simulation_numbers for task in scheduler.quarantined) == [[1, 3], [5, 7]]
+        assert [task.task_args for task in scheduler.quarantined if task.simulation_number == 1] == \
+            [[(1, failures_file), (3, failures_file)]]
+
+        # Only the failed simulations should have been retried
+        with open(failures_file) as fi:
+            assert sorted(int(line) for line in fi) == [1, 1, 3, 3, 5, 5, 7, 7]
+
+        # The failures are recorded under the ID of the task of the failed simulations
+        assert sorted(scheduler.failures) == [1, 5]
+        assert len(scheduler.failures[1]) == 2
+        exception = scheduler.failures[1][0]
+        assert isinstance(exception, ss.PartialTaskError)
+        assert exception.stage == "estimate_shear"
+        assert exception.completed_indices == [0, 2]
+
+        # The exception must survive being passed back from a worker process
+        unpickled_exception = pickle.loads(pickle.dumps(exception))
+        assert unpickled_exception.completed_indices == exception.completed_indices
+        assert unpickled_exception.result == exception.result
+        assert str(unpickled_exception) == str(exception)
+
+    def test_max_failures(self, tmpdir):
+        """ Test that scheduling is stopped once too many simulations have been quarantined.
+        """
+
+        failures_file = os.path.join(tmpdir, "failures.txt")
+        tasks = [ss.SimulationTask(i, MockWorkdir(str(tmpdir), "logs", None, None), (i, failures_file))
+                 for i in range(10)]
+
+        pool = ThreadPool(1)
+        scheduler = ss.SimulationScheduler(pool, 1, tasks, task_function=fail_on_odd, poll_interval=0.05,
+                                           retry_policy=ss.RetryPolicy(max_failures=1))
+        completed = scheduler.run()
+        pool.close()
+
+        assert [task.simulation_number for task in completed] == [0, 2]
+        assert [task.simulation_number for task in scheduler.quarantined] == [1, 3]
+        assert len(scheduler.unscheduled) == 6
+
+    def test_hard_timeout(self, tmpdir):
+        """ Test that a worker whose stage exceeds its hard time limit is killed and treated as failed, and that the
+            pool can still be shut down afterwards.
+        """
+
+        tasks = [ss.SimulationTask(i, MockWorkdir(str(tmpdir), "logs", None, None), (i, 60. if i == 1 else 0.1))
+                 for i in range(4)]
+
+        executor = PoolExecutor(2, start_method="fork")
+
+        scheduler = ss.SimulationScheduler(executor, 2, tasks, task_function=staged_sleep, poll_interval=0.05,
+                                           progress_queue=executor.progress_queue,
+                                           stage_timeouts=ss.StageTimeouts(soft={"default": 0.2},
+                                                                           hard={"sleep": 1.}))
+        start = time.time()
+        completed = scheduler.run()
+
+        # The killed worker's job is lost, so joining the pool without terminating it would never return
+        assert scheduler.workers_left_running
+        shutdown_thread = threading.Thread(target=scheduler.shut_down_pool, daemon=True)
+        shutdown_thread.start()
+        shutdown_thread.join(timeout=10.)
+        assert not shutdown_thread.is_alive()
+
+        assert time.time() - start < 20.
+        assert sorted(task.simulation_number for task in completed) == [0, 2, 3]
+        assert [task.simulation_number for task in scheduler.quarantined] == [1]
+
+        exception = scheduler.failures[1][0]
+        assert exception.stage == "sleep"
+        assert "timed out" in exception.message
+        assert exception.log_filename == "she_sleep_1.out"
+
+    def test_time_between_stages(self, tmpdir):
+        """ Test that time a worker spends between stages (e.g. waiting for I/O throttling) isn't counted towards
+            the previous stage's timeouts.
+        """
+
+        tasks = [ss.SimulationTask(0, MockWorkdir(str(tmpdir), "logs", None, None), (0.2, 1.))]
+
+        progress_queue = queue.Queue()
+        pool = ThreadPool(1, initializer=ss.init_worker_progress, initargs=(progress_queue,))
+
+        scheduler = ss.SimulationScheduler(pool, 1, tasks, task_function=wait_between_stages, poll_interval=0.02,
+                                           progress_queue=progress_queue,
+                                           stage_timeouts=ss.StageTimeouts(hard={"sleep": 0.6}))
+        completed = scheduler.run()
+        pool.close()
+
+        assert [task.simulation_number for task in completed] == [0]
+        assert scheduler.failures == {}
+
+    def test_speculative_execution(self, tmpdir):
+        """ Test that once all tasks are dispatched, a copy of a straggler is run, and the first copy to finish
+            is used.
+        """
+
+        workdir = MockWorkdir(str(tmpdir), "logs", None, None)
+        speculative_workdir = MockWorkdir(os.path.join(tmpdir, "speculative"), "logs", None, None)
+
+        tasks = [ss.SimulationTask(i, workdir, (i, 1. if i == 2 else 0.05)) for i in range(3)]
+
+        def make_speculative_task(task):
+            return ss.SimulationTask(task.simulation_number, speculative_workdir, (task.simulation_number, 0.05))
+
+        progress_queue = queue.Queue()
+        pool = ThreadPool(2, initializer=ss.init_worker_progress, initargs=(progress_queue,))
+
+        scheduler = ss.SimulationScheduler(pool, 2, tasks, task_function=staged_sleep, poll_interval=0.02,
+                                           progress_queue=progress_queue)
+        scheduler.make_speculative_task = make_speculative_task
+        start = time.time()
+        completed = scheduler.run()
+        duration = time.time() - start
+        pool.terminate()
+
+        assert duration < 0.8
+        assert sorted(task.simulation_number for task in completed) == [0, 1, 2]
+        assert [task.workdir for task in completed if task.simulation_number == 2] == [speculative_workdir]
+        assert scheduler.workers_left_running
+
+    def test_task_cost_ordering(self, tmpdir):
+        """ Test that the most expensive tasks are run first, within the highest-priority group.
+        """
+
+        costs = [3., 1., 4., 1., 5., 9., 2., 6.]
+        groups = [0, 0, 0, 0, 1, 1, 1, 1]
+        tasks = make_tasks(len(costs), str(tmpdir), groups=groups)
+
+        pool = ThreadPool(1)
+        scheduler = ss.SimulationScheduler(pool, 1, tasks, task_function=square, poll_interval=0.1)
+        scheduler.task_cost = lambda task: costs[task.simulation_number]
+        completed = scheduler.run()
+        pool.close()
+
+        assert [task.simulation_number for task in completed] == [5, 7, 4, 2, 0, 6, 1, 3]
+
+        pool = ThreadPool(1)
+        scheduler = ss.SimulationScheduler(pool, 1, make_tasks(len(costs), str(tmpdir), groups=groups),
+                                           task_function=square, poll_interval=0.1)
+        scheduler.task_cost = lambda task: costs[task.simulation_number]
+        scheduler.group_priority = lambda group: -group
+        completed = scheduler.run()
+        pool.close()
+
+        assert [task.simulation_number for task in completed] == [2, 0, 1, 3, 5, 7, 4, 6]
@@ -0,0 +1,84 @@
+""" @file tile_overlaps_test.py
+
+    Created 19 October 2026
+
+    Unit tests of the search for tiles which overlap observations.
+"""
+
+__updated__ = "2026-10-19"
+
+# Copyright (C) 2012-2020 Euclid Science Ground Segment
+#
+# This library is free software; you can redistribute it and/or modify it under the terms of the GNU Lesser General
+# Public License as published by the Free Software Foundation; either version 3.0 of the License, or (at your option)
+# any later version.
+#
+# This library is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY; without even the implied
+# warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU Lesser General Public License for more
+# details.
+#
+# You should have received a copy of the GNU Lesser General Public License along with this library; if not, write to
+# the Free Software Foundation, Inc., 51 Franklin Street, Fifth Floor,
+# Boston, MA 02110-1301 USA
+
+import json
+import os
+
+import numpy as np
+import pytest
+
+import SHE_Pipeline.tile_overlaps as to
+from SHE_Pipeline.product_catalog import ProductRecord
+
+
+def make_record(filename, product_type, obs_ids, tile_index):
+    return ProductRecord(filename, 0., 0, product_type, tuple(obs_ids), (), tile_index, ())
+
+
+class TestTileOverlaps:
+    """ Unit tests for the tile overlap search.
+    """
+
+    def test_read_obs_ids(self, tmpdir):
+
+        qualified_filename = os.path.join(tmpdir, "obs_ids.txt")
+        with open(qualified_filename, "w") as fo:
+            fo.write("# Observations to search for\n10351, 10352\n10352 10360\n")
+
+        obs_ids = to.read_obs_ids(filename=qualified_filename, obs_id_range=(20, 22), obs_ids=[5])
+        assert obs_ids.tolist() == [5, 20, 21, 22, 10351, 10352, 10360]
+
+        with open(qualified_filename, "w") as fo:
+            json.dump([3, 1], fo)
+        assert to.read_obs_ids(filename=qualified_filename).tolist() == [1, 3]
+
+        with pytest.raises(ValueError):
+            to.read_obs_ids(obs_id_range=(3, 1))
+
+    def test_tile_overlaps(self, tmpdir):
+        """ Test that the overlap matrix and report match those found by checking each tile in turn.
+        """
+
+        records = [make_record("mfc_1.xml", "dpdMerFinalCatalog", [1, 2], 101),
+                   make_record("mseg_1.xml", "dpdMerSegmentationMap", [1, 2], 101),
+                   make_record("mfc_2.xml", "dpdMerFinalCatalog", [2, 3], 102),
+                   make_record("mfc_3.xml", "dpdMerFinalCatalog", [4], 103),
+                   make_record("vcf_1.xml", "dpdVisCalibratedFrame", [1], None), ]
+
+        tile_overlaps = to.get_tile_overlaps(*to.get_tile_obs_pairs(records), np.array([3, 2, 5]))
+
+        assert tile_overlaps.tile_ids.tolist() == [101, 102, 103]
+        assert tile_overlaps.obs_ids.tolist() == [2, 3, 5]
+        assert tile_overlaps.overlap_matrix.tolist() == [[True, False, False],
+                                                         [True, True, False],
+                                                         [False, False, False]]
+
+        qualified_filename = os.path.join(tmpdir, "overlaps.json")
+        to.write_overlap_report(qualified_filename, tile_overlaps)
+        with open(qualified_filename) as fi:
+            report = json.load(fi)
+
+        assert report["overlapping_tile_ids"] == [101, 102]
+        assert report["tile_obs_ids"] == {"101": [2], "102": [2, 3]}
+        assert report["obs_tile_ids"] == {"2": [101, 102], "3": [102]}
+        assert report["non_overlapping_obs_ids"] == [5]
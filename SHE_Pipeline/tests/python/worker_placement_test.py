@@ -0,0 +1,118 @@
+""" @file worker_placement_test.py
+
+    Created 19 October 2026
+
+    Unit tests of the placement of worker processes on CPUs and NUMA nodes.
+"""
+
+__updated__ = "2026-10-19"
+
+# Copyright (C) 2012-2020 Euclid Science Ground Segment
+#
+# This library is free software; you can redistribute it and/or modify it under the terms of the GNU Lesser General
+# Public License as published by the Free Software Foundation; either version 3.0 of the License, or (at your option)
+# any later version.
+#
+# This library is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY; without even the implied
+# warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU Lesser General Public License for more
+# details.
+#
+# You should have received a copy of the GNU Lesser General Public License along with this library; if not, write to
+# the Free Software Foundation, Inc., 51 Franklin Street, Fifth Floor,
+# Boston, MA 02110-1301 USA
+
+import multiprocessing
+import os
+
+import SHE_Pipeline.worker_placement as wp
+
+
+def write_sys_tree(sys_root, node_cpu_lists):
+    for node, cpu_list in node_cpu_lists.items():
+        node_dir = os.path.join(sys_root, "devices", "system", "node", f"node{node}")
+        os.makedirs(node_dir)
+        with open(os.path.join(node_dir, "cpulist"), "w") as fo:
+            fo.write(cpu_list + "\n")
+
+
+def get_affinity(_args):
+    return sorted(os.sched_getaffinity(0))
+
+
+class TestWorkerPlacement:
+    """ Unit tests for worker placement.
+    """
+
+    def test_parse_cpu_list(self):
+
+        assert wp.parse_cpu_list("0-3,8-11\n") == [0, 1, 2, 3, 8, 9, 10, 11]
+        assert wp.parse_cpu_list("5") == [5]
+        assert wp.parse_cpu_list("") == []
+
+    def test_read_numa_topology(self, tmpdir, monkeypatch):
+        """ Test reading the topology from /sys, restricted to the CPUs available to this process.
+        """
+
+        write_sys_tree(str(tmpdir), {0: "0-7", 1: "8-15", 2: ""})
+        monkeypatch.setattr(wp, "get_available_cpus", lambda: set(range(2, 12)))
+
+        assert wp.read_numa_topology(str(tmpdir)) == {0: [2, 3, 4, 5, 6, 7], 1: [8, 9, 10, 11]}
+
+        # Fall back to a single node if the topology can't be read
+        assert wp.read_numa_topology(os.path.join(tmpdir, "missing")) == {0: list(range(2, 12))}
+
+    def test_plan_worker_placement(self):
+        """ Test that workers are spread across nodes, with CPUs only shared when there aren't enough.
+        """
+
+        topology = {0: [0, 1, 2, 3], 1: [4, 5, 6, 7]}
+
+        placements = wp.plan_worker_placement(topology, 4, threads_per_process=2)
+        assert placements == [(0, [0, 1]), (1, [4, 5]), (0, [2, 3]), (1, [6, 7])]
+
+        placements = wp.plan_worker_placement(topology, 3, threads_per_process=2)
+        assert placements == [(0, [0, 1]), (1, [4, 5]), (0, [2, 3])]
+
+        # Oversubscribed, so CPUs are shared
+        placements = wp.plan_worker_placement(topology, 6, threads_per_process=2)
+        assert [placement.numa_node for placement in placements] == [0, 1, 0, 1, 0, 1]
+        assert placements[4] == (0, [0, 1])
+
+        # Uneven nodes
+        placements = wp.plan_worker_placement({0: [0, 1, 2, 3, 4, 5], 1: [6, 7]}, 4, threads_per_process=2)
+        assert [placement.numa_node for placement in placements] == [0, 0, 0, 1]
+
+    def test_claim_placement_slot(self):
+        """ Test that a worker claims a free slot, or the slot of a process which no longer exists.
+        """
+
+        process = multiprocessing.get_context("fork").Process(target=os.getpid)
+        process.start()
+        process.join()
+
+        placement_slots = multiprocessing.Array("i", [os.getppid(), process.pid, 0])
+
+        assert wp.claim_placement_slot(placement_slots) == 1
+        assert placement_slots[1] == os.getpid()
+
+    def test_place_worker(self):
+        """ Test that worker processes are pinned to the CPUs planned for them.
+        """
+
+        topology = wp.read_numa_topology()
+        placements = wp.plan_worker_placement(topology, 2, threads_per_process=1)
+
+        context = multiprocessing.get_context("fork")
+        placement_slots = context.Array("i", 2)
+
+        def init(slots):
+            wp.place_worker(wp.claim_placement_slot(slots), len(slots), threads_per_process=1)
+
+        with context.Pool(2, initializer=init, initargs=(placement_slots,)) as pool:
+            affinities = pool.map(get_affinity, range(8))
+
+        assert {tuple(affinity) for affinity in affinities} <= {tuple(placement.cpus) for placement in placements}
+
+        report = wp.get_placement_report(2, threads_per_process=1)
+        assert report["workers"] == [{"numa_node": placement.numa_node, "cpus": placement.cpus}
+                                     for placement in placements]